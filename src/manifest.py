@@ -0,0 +1,15 @@
+# Manifest to freeze the app's modules into a MicroPython firmware for the Pico W (see 'make
+# firmware'), so they're neither compiled nor loaded into the heap at boot, but run from flash.
+#
+# The native module (WAVBuffer.mpy) can't be frozen, so it's still flashed as a file, as is the
+# web app. Modules on the filesystem take precedence over frozen ones, so remove any '.py' or
+# '.mpy' copies of these from the Pico W when flashing this firmware.
+
+include("$(BOARD_DIR)/manifest.py")
+
+module("PicoWebRadio.py", base_path="mpy")
+module("Si4730.py", base_path="mpy")
+module("NetworkUtil.py", base_path="mpy")
+module("HTTPUtil.py", base_path="mpy")
+module("StationDB.py", base_path="mpy")
+module("AssetCache.py", base_path="mpy")
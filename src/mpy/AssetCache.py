@@ -0,0 +1,157 @@
+# In-memory cache of the static files served, so that the files every client fetches on every
+# page load (the page, its script and stylesheet) are answered straight from RAM, instead of
+# opening and reading them from flash each time.
+#
+# Each file is cached as what's sent for it: its headers (all but the status line and
+# Connection, which depend on the request) and body in one piece, keyed by the path requested
+# and whether the client accepts gzip (so a gzipped copy of the file is sent). A file without a
+# gzipped copy is sent the same to all clients, so it's cached once for both.
+#
+# A hit doesn't touch the filesystem: an entry is only checked against its file (that it still
+# has the size and modification time it was read with, which its ETag is made of, and for one
+# cached for both, still no gzipped copy) at most every FILE_CHECK_MS, so a file that changes
+# (e.g. flashed again while running) is read again soon after, rather than served stale for
+# good. Call 'clear' when replacing files, for them to be read again straight away.
+#
+# The cache holds at most 'budget' bytes, and only while the heap keeps 'reserve' bytes free
+# besides (e.g. for the audio streams, which need it more), evicting the least recently used
+# files to stay within both.
+#
+# Written to also run under CPython, so it can be tested on a host (see 'test/host').
+
+import gc
+import os
+import time
+
+# how often (in ms) the free heap is checked when the cache is only being read from, and at most
+# how often each cached file is checked for changes
+HEAP_CHECK_MS = const(1000)
+FILE_CHECK_MS = const(1000)
+
+# A cached file ('shared' if it has no gzipped copy, so is sent the same to all clients).
+class Asset:
+    def __init__(self, file, stat, etag, not_modified, response, shared):
+        self.file = file                  # the file read (e.g. '<path>.gz')
+        self.size = stat[6]
+        self.mtime = stat[8]
+        self.etag = etag
+        self.not_modified = not_modified  # the headers of a 304 for it
+        self.response = response          # headers and body of a 200
+        self.shared = shared
+        self.used = 0                     # when last used (see 'AssetCache.get')
+        self.checked = time.ticks_ms()    # when last checked against its file
+
+    # whether the file is as it was read
+    def unchanged(self):
+        try:
+            stat = os.stat(self.file)
+        except OSError:
+            return False
+        if ((stat[6] != self.size) or (stat[8] != self.mtime)):
+            return False
+
+        if (self.shared):
+            try:
+                os.stat(self.file + '.gz')
+                return False
+            except OSError:
+                pass
+        return True
+
+class AssetCache:
+    # Files of up to 'max_size' bytes are cached, up to 'budget' bytes in all, while at least
+    # 'reserve' bytes of heap are free besides.
+    def __init__(self, budget, reserve, max_size):
+        self.budget = budget
+        self.reserve = reserve
+        self.max_size = max_size
+
+        # path -> [asset sent as is, asset sent gzipped] (either None if not cached, or both the
+        # same asset if shared)
+        self.__assets = {}
+        self.bytes = 0
+        self.entries = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        # counts the uses of the cache, to tell the least recently used asset
+        self.__uses = 0
+        self.__heap_checked = time.ticks_ms()
+
+    # The asset cached for 'path' (for clients accepting gzip if 'gzip'), if its file hasn't
+    # changed since, or None.
+    def get(self, path, gzip):
+        now = time.ticks_ms()
+        if (time.ticks_diff(now, self.__heap_checked) > HEAP_CHECK_MS):
+            self.__heap_checked = now
+            self.__evict(self.reserve - gc.mem_free())
+
+        slots = self.__assets.get(path)
+        asset = slots[1 if (gzip) else 0] if (slots is not None) else None
+        if ((asset is not None) and (time.ticks_diff(now, asset.checked) > FILE_CHECK_MS)):
+            asset.checked = now
+            if (not asset.unchanged()):
+                self.__remove(slots, asset)
+                asset = None
+
+        if (asset is None):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.__uses += 1
+        asset.used = self.__uses
+        return asset
+
+    # Whether 'size' bytes more can be cached, evicting what's least recently used to make room.
+    def admits(self, size):
+        if ((size > self.max_size) or (size > self.budget)):
+            return False
+
+        self.__evict(self.bytes + size - self.budget)
+        return (self.bytes + size <= self.budget) and (gc.mem_free() - size >= self.reserve)
+
+    # cache 'asset' for 'path' (for clients accepting gzip if 'gzip', or all if it's shared)
+    def put(self, path, gzip, asset):
+        slots = self.__assets.get(path)
+        if (slots is None):
+            slots = [None, None]
+            self.__assets[path] = slots
+        for i in ((0, 1) if (asset.shared) else ((1,) if (gzip) else (0,))):
+            if (slots[i] is not None):
+                self.__remove(slots, slots[i])
+            slots[i] = asset
+
+        self.__uses += 1
+        asset.used = self.__uses
+        self.bytes += len(asset.response)
+        self.entries += 1
+
+    # drop everything cached (e.g. once the files have been replaced)
+    def clear(self):
+        self.__assets = {}
+        self.bytes = 0
+        self.entries = 0
+
+    def __remove(self, slots, asset):
+        for i in (0, 1):
+            if (slots[i] is asset):
+                slots[i] = None
+        self.bytes -= len(asset.response)
+        self.entries -= 1
+
+    # Evict the least recently used assets until at least 'nbytes' are freed (once collected).
+    def __evict(self, nbytes):
+        while ((nbytes > 0) and (self.entries > 0)):
+            oldest = None
+            for slots in self.__assets.values():
+                for asset in slots:
+                    if ((asset is not None) and ((oldest is None) or (asset.used < oldest.used))):
+                        oldest = asset
+                        oldest_slots = slots
+
+            nbytes -= len(oldest.response)
+            self.__remove(oldest_slots, oldest)
+            self.evictions += 1
@@ -0,0 +1,387 @@
+# Incremental HTTP/1.1 request parsing shared by the PicoWebRadio servers.
+#
+# Requests are parsed from whatever has been read from the socket so far, so a request split
+# across several reads (or several requests arriving in one read, e.g. pipelined requests on a
+# keep-alive connection) is handled properly.
+#
+# Each connection reads into a buffer of its own, allocated once, and requests are parsed from it
+# byte by byte without decoding it, into an HTTPRequest that's reused for each request. Only the
+# headers the servers look at are kept (as offsets into the buffer), so the only objects made per
+# request are its path (and query, if any). Responses are put together the same way, in a
+# ResponseHead. This keeps the request path from churning the heap, where every collection is a
+# pause for the audio streams too.
+#
+# Written to also run under CPython, so it can be tested on a host (see 'test/host').
+
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+
+# max. size of the request line and headers (bodies are only expected for small requests)
+MAX_HEADER_SIZE = 2048
+MAX_BODY_SIZE = 1024
+
+# max. number of header lines in a request
+MAX_HEADERS = 32
+
+# methods recognised (any other is left as None, for the server to refuse)
+METHODS = ('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS')
+METHOD_BYTES = tuple(method.encode() for method in METHODS)
+
+HTTP_1_1 = b'HTTP/1.1'
+
+# the headers kept from a request (see 'HTTPRequest.header_equals'), by index
+HEADER_NAMES = (b'connection', b'content-length', b'accept-encoding', b'if-none-match')
+CONNECTION = 0
+CONTENT_LENGTH = 1
+ACCEPT_ENCODING = 2
+IF_NONE_MATCH = 3
+
+# size of the buffer responses are put together in (see 'ResponseHead')
+HEAD_SIZE = 512
+
+CR = const(13)
+LF = const(10)
+SP = const(32)
+TAB = const(9)
+COLON = const(58)
+SLASH = const(47)
+QUESTION = const(63)
+
+# A request parsed by an HTTPParser, valid until the parser is asked for the next one.
+class HTTPRequest:
+    def __init__(self, buf, mv):
+        self.__buf = buf
+        self.__mv = mv
+
+        self.method = None
+        self.version = 'HTTP/1.1'
+
+        # the path without its leading (and trailing) '/' or query, and the query
+        self.path = ''
+        self.query = ''
+
+        self.__keep_alive = True
+
+        # the start and end of each kept header's value (or -1), see HEADER_NAMES
+        self.values = [-1] * (2 * len(HEADER_NAMES))
+
+        # the start and end of the path and body
+        self.path_start = 0
+        self.path_end = 0
+        self.body_start = 0
+        self.body_end = 0
+
+    # HTTP/1.1 connections are persistent unless the client says otherwise
+    def keep_alive(self):
+        return self.__keep_alive
+
+    # whether the header 'index' (see HEADER_NAMES) is 'value' (in lowercase if 'lower')
+    def header_equals(self, index, value, lower=False):
+        start = self.values[2 * index]
+        end = self.values[2 * index + 1]
+        if ((start < 0) or (end - start != len(value))):
+            return False
+
+        buf = self.__buf
+        for i in range(end - start):
+            c = buf[start + i]
+            if (lower):
+                c |= 0x20
+            if (c != value[i]):
+                return False
+        return True
+
+    # whether the header 'index' (see HEADER_NAMES) contains 'value'
+    def header_contains(self, index, value):
+        start = self.values[2 * index]
+        end = self.values[2 * index + 1]
+        buf = self.__buf
+        n = len(value)
+        for i in range(start, end - n + 1):
+            j = 0
+            while ((j < n) and (buf[i + j] == value[j])):
+                j += 1
+            if (j == n):
+                return True
+        return False
+
+    # the path as requested (without its leading '/' or query), e.g. to write into a response
+    def raw_path(self):
+        return self.__mv[self.path_start:self.path_end]
+
+    def body(self):
+        return self.__mv[self.body_start:self.body_end]
+
+    def _set_connection(self):
+        if (self.header_equals(CONNECTION, b'close', True)):
+            self.__keep_alive = False
+        elif (self.version == 'HTTP/1.1'):
+            self.__keep_alive = True
+        else:
+            self.__keep_alive = self.header_equals(CONNECTION, b'keep-alive', True)
+
+class HTTPParser:
+    def __init__(self):
+        self.buf = bytearray(MAX_HEADER_SIZE + MAX_BODY_SIZE)
+        self.mv = memoryview(self.buf)
+
+        # the start of the request being parsed, the end of what's been read, and where the
+        # search for the end of the headers resumes (with the start of each line found so far)
+        self.__start = 0
+        self.__end = 0
+        self.__scan = 0
+        self.__lines = [0] * (MAX_HEADERS + 2)
+        self.__nlines = 0
+
+        self.__req = HTTPRequest(self.buf, self.mv)
+
+    # forget whatever was read (e.g. to reuse the parser for another connection)
+    def reset(self):
+        self.__start = self.__end = self.__scan = 0
+        self.__nlines = 0
+
+    # the free space at the end of the buffer, for the next read to go into
+    def space(self):
+        start = self.__start
+        end = self.__end
+        if (start == end):
+            self.__start = self.__end = self.__scan = 0
+            self.__nlines = 0
+        elif ((end == len(self.buf)) and (start > 0)):
+            # (only when a request is split across reads after others in the same read)
+            n = end - start
+            self.buf[:n] = bytes(self.mv[start:end])
+            self.__scan -= start
+            for i in range(self.__nlines):
+                self.__lines[i] -= start
+            self.__start = 0
+            self.__end = n
+
+        if (self.__end == len(self.buf)):
+            raise ValueError('Request too large')
+        return self.mv[self.__end:]
+
+    # count 'n' bytes read into 'space()'
+    def filled(self, n):
+        self.__end += n
+
+    # returns the next complete request, or None if more data is needed
+    def next(self):
+        buf = self.buf
+        lines = self.__lines
+        start = self.__start
+        end = self.__end
+
+        # look for the empty line at the end of the headers, noting where each line starts
+        i = self.__scan
+        nlines = self.__nlines
+        header_end = -1
+        while (i < end):
+            if (buf[i] == LF):
+                line_start = lines[nlines - 1] if (nlines > 0) else start
+                if ((i - line_start == 1) and (buf[line_start] == CR)):
+                    header_end = line_start
+                    i += 1
+                    break
+                if (nlines == len(lines) - 1):
+                    raise ValueError('Too many headers')
+                lines[nlines] = i + 1
+                nlines += 1
+            i += 1
+
+        self.__scan = i
+        self.__nlines = nlines
+        if (header_end < 0):
+            if (end - start > MAX_HEADER_SIZE):
+                raise ValueError('Request headers too large')
+            return None
+
+        if (nlines == 0):
+            raise ValueError('Invalid request line')
+        req = self.__req
+        self.__parse_request_line(req, start, lines[0] - 2)
+
+        values = req.values
+        for k in range(len(values)):
+            values[k] = -1
+        for k in range(1, nlines):
+            self.__parse_header(req, lines[k - 1], lines[k] - 2)
+        req._set_connection()
+
+        # the body, if any, is the Content-Length after the headers
+        body_start = header_end + 2
+        body_len = 0
+        for k in range(values[2 * CONTENT_LENGTH], values[2 * CONTENT_LENGTH + 1]):
+            c = buf[k] - 48
+            if ((c < 0) or (c > 9)):
+                raise ValueError('Invalid Content-Length')
+            body_len = 10 * body_len + c
+            if (body_len > MAX_BODY_SIZE):
+                raise ValueError('Invalid Content-Length')
+        if (end < body_start + body_len):
+            # (the headers are parsed again once the whole body is in)
+            self.__scan = start
+            self.__nlines = 0
+            return None
+
+        req.body_start = body_start
+        req.body_end = body_start + body_len
+
+        # the next request starts after this one
+        self.__start = self.__scan = body_start + body_len
+        self.__nlines = 0
+        return req
+
+    # whether the bytes from 'start' to 'end' are 'value'
+    def __equals(self, start, end, value):
+        if (end - start != len(value)):
+            return False
+        buf = self.buf
+        for i in range(end - start):
+            if (buf[start + i] != value[i]):
+                return False
+        return True
+
+    def __parse_request_line(self, req, start, end):
+        buf = self.buf
+
+        # 'method target version', separated by single spaces
+        sp1 = start
+        while ((sp1 < end) and (buf[sp1] != SP)):
+            sp1 += 1
+        sp2 = sp1 + 1
+        while ((sp2 < end) and (buf[sp2] != SP)):
+            sp2 += 1
+        if ((sp2 >= end) or (sp1 == start) or (sp2 == sp1 + 1)):
+            raise ValueError('Invalid request line')
+        for i in range(sp2 + 1, end):
+            if (buf[i] == SP):
+                raise ValueError('Invalid request line')
+
+        req.method = None
+        for i in range(len(METHODS)):
+            if (self.__equals(start, sp1, METHOD_BYTES[i])):
+                req.method = METHODS[i]
+                break
+
+        req.version = 'HTTP/1.1' if (self.__equals(sp2 + 1, end, HTTP_1_1)) else 'HTTP/1.0'
+
+        # the path, without slashes around it, then the query
+        path_start = sp1 + 1
+        while ((path_start < sp2) and (buf[path_start] == SLASH)):
+            path_start += 1
+        path_end = path_start
+        while ((path_end < sp2) and (buf[path_end] != QUESTION)):
+            path_end += 1
+        query_start = path_end + 1
+        while ((path_end > path_start) and (buf[path_end - 1] == SLASH)):
+            path_end -= 1
+
+        req.path_start = path_start
+        req.path_end = path_end
+        req.path = str(self.mv[path_start:path_end], 'utf-8') if (path_end > path_start) else ''
+        req.query = str(self.mv[query_start:sp2], 'utf-8') if (query_start < sp2) else ''
+
+    def __parse_header(self, req, start, end):
+        buf = self.buf
+
+        colon = start
+        while ((colon < end) and (buf[colon] != COLON)):
+            colon += 1
+        if (colon == end):
+            raise ValueError('Invalid header')
+
+        # (names are matched in lowercase, and '|' 0x20 doesn't change ':' or '-')
+        for index in range(len(HEADER_NAMES)):
+            name = HEADER_NAMES[index]
+            if (colon - start != len(name)):
+                continue
+            i = 0
+            while ((i < len(name)) and ((buf[start + i] | 0x20) == name[i])):
+                i += 1
+            if (i < len(name)):
+                continue
+
+            value_start = colon + 1
+            while ((value_start < end) and ((buf[value_start] == SP) or
+                                            (buf[value_start] == TAB))):
+                value_start += 1
+            value_end = end
+            while ((value_end > value_start) and ((buf[value_end - 1] == SP) or
+                                                  (buf[value_end - 1] == TAB))):
+                value_end -= 1
+            req.values[2 * index] = value_start
+            req.values[2 * index + 1] = value_end
+            return
+
+# The status line and headers of a response, put together in a buffer allocated once and written
+# out in one piece (the stream copies it, or sends it, on write, so the buffer can be reused for
+# the next response straight away).
+class ResponseHead:
+    def __init__(self, size=HEAD_SIZE):
+        self.__buf = bytearray(size)
+        self.__mv = memoryview(self.__buf)
+        self.__len = 0
+
+    def start(self, status):
+        self.__len = 0
+        self.add(b'HTTP/1.1 ')
+        self.add(status)
+        self.add(b'\r\n')
+
+    # add bytes (e.g. whole header lines, with their CRLF)
+    def add(self, data):
+        n = self.__len
+        if (n + len(data) > len(self.__buf)):
+            raise ValueError('Response head too large')
+        self.__buf[n:n + len(data)] = data
+        self.__len = n + len(data)
+
+    # add the digits of 'value' (not negative) in 'base'
+    def add_int(self, value, base=10):
+        buf = self.__buf
+        n = self.__len
+        digits = 1
+        scale = base
+        while (scale <= value):
+            digits += 1
+            scale *= base
+        if (n + digits > len(buf)):
+            raise ValueError('Response head too large')
+
+        for i in range(n + digits - 1, n - 1, -1):
+            digit = value % base
+            buf[i] = digit + (48 if (digit < 10) else 87)
+            value //= base
+        self.__len = n + digits
+
+    def add_length(self, length):
+        self.add(b'Content-Length: ')
+        self.add_int(length)
+        self.add(b'\r\n')
+
+    # end the head, saying whether the connection is kept open after the response, and write it
+    # (unless not 'end', leaving the rest of the headers and the empty line to be written next)
+    def write(self, swriter, keep_alive, end=True):
+        if (keep_alive):
+            self.add(b'Connection: keep-alive\r\n')
+        else:
+            self.add(b'Connection: close\r\n')
+        if (end):
+            self.add(b'\r\n')
+        swriter.write(self.__mv[:self.__len])
+
+# Read the next request on a connection, returning None if the client closed it first.
+async def read_request(sreader, parser, timeout):
+    while True:
+        req = parser.next()
+        if (req is not None):
+            return req
+
+        n = await asyncio.wait_for(sreader.readinto(parser.space()), timeout)
+        if (not n):
+            return None
+
+        parser.filled(n)
@@ -17,98 +17,409 @@ import time
 import usocket as socket
 import uasyncio as asyncio
 import os
+import io
+import errno
+import json
+import gc
+import random
+import rp2
 
 import NetworkUtil
+import HTTPUtil
+from AssetCache import Asset, AssetCache
 from Si4730 import Si4730
+from StationDB import StationDB
 import WAVBuffer
 
 # Set the desired channel for acquiring mono audio from the Si4730.
 ADC_CHAN = const(2)
 
+# Capture profiles, as the (sample rate, samples per buffer, buffers in the ring) to give
+# 'WAVBuffer.init' (or () for the native module's defaults, which suit DMA_RING_MODE too), all at
+# the default 30 kHz. A buffer is only sent out once it's complete, so its length adds to the
+# audio's latency, but shorter buffers mean more DMA interrupts and more (smaller) sends per
+# second; the ring sets how far behind a listener can fall before buffers are dropped for it. The
+# ring takes a byte per sample from the heap (up to the 72K the native module allows, see
+# 'ADC_DMA.h'), so a shallower ring leaves more of it free. With DMA_RING_MODE the ring must also
+# be a power of 2 of up to 32K, which 'robust' isn't, so 'run' falls back to the defaults for a
+# profile the native module can't capture (or find the heap for), saying why.
+AUDIO_PROFILES = {
+    'low-latency': (30000, 256, 64),    # 8.5 ms buffers, 0.55 s ring (16K)
+    'default': (),                      # 100 ms buffers, 1.6 s ring (48K)
+    'robust': (30000, 3000, 24),        # 100 ms buffers, 2.4 s ring (72K)
+}
+AUDIO_PROFILE = 'default'
+
 # Configure the Si4730 parameters here.
 SI4730_I2C_DEV = I2C(0, scl=Pin(9), sda=Pin(8), freq=400000)
 SI4730_RESET_PIN = const(22)
 SI4730_I2C_ADDR = const(0x63)
-SI4730_RADIO = Si4730(i2c=SI4730_I2C_DEV, rst_pin=SI4730_RESET_PIN, addr=SI4730_I2C_ADDR)
-
-# Audio server to stream the audio buffer (currently encoded as a WAV file).
+# GPIO wired to the Si4730's GPO2/INT pin, to be signalled when commands complete instead of
+# polling over I2C (or None if not wired)
+SI4730_INT_PIN = None
+# ITU region to set up the AM/FM bands for (1: Europe/Africa, 2: Americas, 3: Asia/Pacific)
+SI4730_REGION = const(2)
+SI4730_RADIO = Si4730(i2c=SI4730_I2C_DEV, rst_pin=SI4730_RESET_PIN, addr=SI4730_I2C_ADDR,
+                      int_pin=SI4730_INT_PIN, region=SI4730_REGION)
+
+# Counters of times (in us) and bytes are totalled modulo this, like 'time.ticks_us()' wraps
+# around, so they stay small ints and updating them on the hot paths never allocates. Scrapers
+# of '/metrics' see a wrap as the counter being reset.
+STATS_WRAP = const(0x3fffffff)
+
+# Add a send (of 'nbytes' in 'nbufs' buffers, taking 'elapsed' us to drain) to a list of [bytes,
+# buffers, total us, max us], in place.
+def stats_add(stats, nbytes, nbufs, elapsed):
+    stats[0] = (stats[0] + nbytes) & STATS_WRAP
+    stats[1] += nbufs
+    stats[2] = (stats[2] + elapsed) & STATS_WRAP
+    if (elapsed > stats[3]):
+        stats[3] = elapsed
+
+# Readiness flag for an audio stream, following the same approach as uasyncio's ThreadSafeFlag.
+# The DMA interrupt publishes buffers to the WAVBuffer ring (and signals an event to wake the core),
+# and the poller in the uasyncio loop checks 'ioctl' to only resume the waiting stream once its
+# listener actually has a buffer waiting, instead of waking up every millisecond to check.
+class AudioEvent(io.IOBase):
+    def __init__(self, stream_id):
+        self.stream_id = stream_id
+
+    def ioctl(self, req, flags):
+        if (req == 3): # MP_STREAM_POLL
+            if (WAVBuffer.pending(self.stream_id) > 0):
+                return flags
+            return 0
+        # (any other request is unsupported, like ThreadSafeFlag's)
+        return -1
+
+    async def wait(self):
+        if (WAVBuffer.pending(self.stream_id) == 0):
+            yield asyncio.core._io_queue.queue_read(self)
+
+# ADPCM streams adapt their sample rate to the listener's link: a listener falling behind (with
+# TIER_DOWN_BACKLOG_MS of buffers or more waiting for it after a send, or a send taking longer
+# than TIER_DOWN_DRAIN_US to drain) is served at half the rate, then a quarter (see
+# 'AUDIO_FACTORS' and 'WAVBuffer.set_decimation'), and stepped back up after keeping up for
+# TIER_UP_MS of buffers in a row. A new tier starts with its own WAV header in the stream, at a
+# block boundary (which can't be mistaken for a block, see 'adpcm.h'). Another step down waits
+# for the TIER_HOLD_MS of buffers after a switch, for the backlog from before it to clear.
+# (Counted in buffers of the capture profile's length, see 'AudioServer'.)
+AUDIO_FACTORS = (1, 2, 4)
+TIER_DOWN_BACKLOG_MS = const(300)
+TIER_DOWN_DRAIN_US = const(50000)
+TIER_UP_MS = const(5000)
+TIER_HOLD_MS = const(500)
+
+# How an audio stream copes with a listener that can't keep up, as a tuple of:
+#   - coalesce bytes: the buffers waiting for the stream are written back to back, up to (about)
+#     this many bytes, and drained once, instead of a drain per buffer,
+#   - catch-up ms: once this much audio is waiting for the listener after a send (which the ring
+#     could otherwise only drop oldest first, leaving the listener on stale audio), it's skipped
+#     to the live edge, with a block of silence sent in place of what was skipped; 0 to never
+#     catch up,
+#   - max. catch-ups: a listener needing more than this many catch-ups in SLOW_WINDOW_MS, with
+#     its stream's rate as low as it goes (see 'AUDIO_FACTORS'), is disconnected; 0 to never
+#     disconnect it for that,
+#   - drain timeout ms: a listener taking longer than this to take a send (e.g. a stalled link)
+#     is disconnected (checked every DRAIN_CHECK_MS, see 'AudioServer.run').
+# The catch-up is well above TIER_DOWN_BACKLOG_MS, so an ADPCM stream's rate is stepped down
+# first. STREAM_POLICY is used unless the request asks for another (e.g. with
+# 'audio.wav?policy=buffered').
+STREAM_POLICIES = {
+    'live': (6000, 1000, 3, 5000),
+    'buffered': (6000, 0, 0, 20000),
+}
+STREAM_POLICY = 'live'
+SLOW_WINDOW_MS = const(30000)
+DRAIN_CHECK_MS = const(1000)
+
+# Audio server to stream the audio buffer (currently encoded as a WAV file), on the connections
+# the web server hands over to it (see 'HTMLServer'), so both share one listening socket.
+# Streams 'audio.wav' as PCM for simple clients, 'audio.adpcm' as IMA-ADPCM (in a WAV
+# container), which the web app decodes itself (at a rate adapted to the listener, see above), or
+# 'audio.ulaw' as mu-law. Neither is a smaller stream at the quality of 8-bit PCM: ADPCM takes
+# half its bytes or less, but is worse than it on all but quiet audio (see 'adpcm_test.c' in
+# 'test/natmod'), and mu-law takes as many bytes as it, only doing better on quiet audio when
+# capturing at 12 bits (see 'ADC_DMA.h').
 # TODO: Note that iOS/Safari doesn't support WAV files, so look into some other
 #       format (e.g. try to build an MP3Buffer encoder to run on core 1 of the RP2040).
 #       This may require an external DSP to do the encoding...
 class AudioServer:
-    def __init__(self, host='0.0.0.0', port=1234, backlog=5, timeout=20):
-        self.host = host
-        self.port = port
-        self.backlog = backlog
-        self.timeout = timeout
+    def __init__(self):
+        # count how often streams are woken up vs. buffers sent (ideally one wake per buffer)
+        self.wakes = 0
+        self.buffers = 0
+
+        # [bytes, buffers, total us, max us] sent and spent draining them, by all streams, and
+        # by each open stream (by its listener ID)
+        self.stats = [0, 0, 0, 0]
+        self.streams = {}
+
+        # decimation factor of each open stream (by its listener ID), and switches between them
+        self.factors = {}
+        self.rate_switches = 0
+
+        # catch-ups to the live edge and listeners disconnected, by all streams (see
+        # 'STREAM_POLICIES'), and the [task, ticks_ms the current drain started or None,
+        # drain timeout ms, whether it was cancelled for stalling] of each open stream, for 'run'
+        # to check on
+        self.catch_ups = 0
+        self.disconnects = 0
+        self.drains = {}
+
+        # silence blocks, by (format, bytes), sent in place of what a catch-up skips
+        self.silence = {}
+
+        # the thresholds for switching (see 'AUDIO_FACTORS') in buffers of the capture's length
+        sample_rate, nsamples, _ = WAVBuffer.geometry()
+        buf_ms = max(nsamples * 1000 // sample_rate, 1)
+        self.tier_down_pending = max(TIER_DOWN_BACKLOG_MS // buf_ms, 1)
+        self.tier_up_buffers = TIER_UP_MS // buf_ms
+        self.tier_hold = TIER_HOLD_MS // buf_ms
+
+        # the policies, with catch-ups in buffers (before the ring starts dropping, at
+        # nbufs - 3 waiting, see 'RING_GUARD' in 'ADC_DMA.h')
+        _, _, nbufs = WAVBuffer.geometry()
+        self.policies = {}
+        for name, (coalesce, catch_up_ms, max_catch_ups, drain_timeout) in STREAM_POLICIES.items():
+            catch_up = max(min(catch_up_ms // buf_ms, nbufs - 4), 1) if (catch_up_ms) else 0
+            self.policies[name] = (coalesce, catch_up, max_catch_ups, drain_timeout)
 
     async def run(self):
-        self.cid = -1
-        self.server = await asyncio.start_server(self.audio_stream, self.host, self.port, self.backlog)
         while True:
-            await asyncio.sleep(100)
-
-    async def audio_stream(self, sreader, swriter):
-        self.cid += 1
-        stream_id = self.cid
+            await asyncio.sleep_ms(DRAIN_CHECK_MS)
+            self.check_drains()
+
+    # Disconnect the listeners whose current send has taken longer than their drain timeout, by
+    # cancelling their stream's task (which is waiting on the drain).
+    def check_drains(self):
+        now = time.ticks_ms()
+        for drain in self.drains.values():
+            if ((drain[1] is not None) and (time.ticks_diff(now, drain[1]) > drain[2])):
+                drain[0].cancel()
+                drain[1] = None
+                drain[3] = True
+                self.disconnects += 1
+
+    # a block of silence of 'nbytes' in the given format: mid-scale 8-bit PCM, mu-law zeros (see
+    # 'ulaw.h'), or an ADPCM block starting (and staying) at zero (see 'adpcm.h')
+    def silence_block(self, req_format, nbytes):
+        key = (req_format, nbytes)
+        if (key not in self.silence):
+            if (req_format == WAVBuffer.PCM):
+                self.silence[key] = b'\x80' * nbytes
+            elif (req_format == WAVBuffer.ULAW):
+                self.silence[key] = b'\xff' * nbytes
+            else:
+                self.silence[key] = bytes(nbytes)
+        return self.silence[key]
+
+    # The policy asked for in a request's query (e.g. 'policy=buffered'), or STREAM_POLICY if
+    # none is, or None if it's not one of STREAM_POLICIES.
+    def stream_policy(self, query):
+        policy = STREAM_POLICY
+        for param in query.split('&'):
+            key, _, value = param.partition('=')
+            if (key == 'policy'):
+                policy = value
+
+        return policy if (policy in self.policies) else None
+
+    # Stream audio in 'req_format' with 'policy' (see 'stream_policy') on a connection handed
+    # over by the web server, until the listener goes (or is let go); the caller closes it.
+    async def audio_stream(self, swriter, req_format, policy):
+        stream_id = -1
+        drain = None
 
         try:
-            # TODO: Look into properly reading and handling the entire HTTP request.
-            #       For now, we just care about the first line (handling GET for 'audio.wav').
-            r = await asyncio.wait_for(sreader.read(1024), self.timeout)
-            if (r == b''):
-                raise Exception('Invalid HTTP request?')
-
-            r = r.decode().splitlines()[0].split(' ')
-
-            req_method = r[0]
-            req_data = r[1].strip('/')
-
-            if (req_method != 'GET' or req_data != 'audio.wav'):
-                swriter.write(b'HTTP/1.0 400 Bad Request\r\n\r\n')
-                await swriter.drain()
-                raise
-
-            # if no more FIFOs, send 503 error and end stream early
+            # each listener gets its own cursor into the shared audio ring
+            # if no more listeners are allowed, send 503 error and end stream early
             try:
-                buf = WAVBuffer.fetch(stream_id)
+                stream_id = WAVBuffer.open(req_format)
             except ValueError:
-                swriter.write(b'HTTP/1.0 503 Service Unavailable\r\n'  \
-                              b'Access-Control-Allow-Origin: *\r\n\r\n')
+                write_head(swriter, None, b'503 Service Unavailable', NO_CONTENT_LENGTH)
                 await swriter.drain()
-                raise Exception('No more FIFOs available')
-
-            swriter.write(b'HTTP/1.0 200 OK\r\n' \
-                          b'Access-Control-Allow-Origin: *\r\n' \
-                          b'Content-type: audio/wav\r\n\r\n')
+                raise Exception('No more listeners available')
 
-            swriter.write(WAVBuffer.header())
+            write_head(swriter, None, b'200 OK', AUDIO_HEADERS)
+            swriter.write(WAVBuffer.header(req_format))
             await swriter.drain()
 
+            # [bytes, buffers, total us, max us] sent and spent draining them, then catch-ups
+            # and the buffers left waiting after the last send
+            stream_stats = [0, 0, 0, 0, 0, 0]
+            self.streams[stream_id] = stream_stats
+
+            coalesce, catch_up, max_catch_ups, drain_timeout = self.policies[policy]
+            drain = [asyncio.current_task(), None, drain_timeout, False]
+            self.drains[stream_id] = drain
+            slow_start = time.ticks_ms()
+            slow_catch_ups = 0
+
+            tier = 0
+            self.factors[stream_id] = 1
+            adaptive = (req_format == WAVBuffer.ADPCM)
+            tier_buffers = 0
+            kept_up = 0
+
             # repeatedly send audio buffer as it becomes available
+            audio_event = AudioEvent(stream_id)
             while True:
                 while (buf := WAVBuffer.fetch(stream_id)) == b'':
-                    await asyncio.sleep_ms(1)
+                    await audio_event.wait()
+                    self.wakes += 1
+
+                # write whatever else is waiting too (all at the same rate, so of the same size)
+                block_bytes = len(buf)
                 swriter.write(buf)
+                nbytes = block_bytes
+                nbufs = 1
+                while ((nbytes < coalesce) and ((buf := WAVBuffer.fetch(stream_id)) != b'')):
+                    swriter.write(buf)
+                    nbytes += block_bytes
+                    nbufs += 1
+
+                start = time.ticks_us()
+                drain[1] = time.ticks_ms()
                 await swriter.drain()
+                drain[1] = None
+                elapsed = time.ticks_diff(time.ticks_us(), start)
+                stats_add(stream_stats, nbytes, nbufs, elapsed)
+                stats_add(self.stats, nbytes, nbufs, elapsed)
+                self.buffers += nbufs
+
+                # a backlog this stale is skipped, leaving the newest buffer to send after the
+                # silence, and a listener that keeps needing that at the lowest rate is let go
+                pending = WAVBuffer.pending(stream_id)
+                stream_stats[5] = pending
+                if (catch_up and (pending >= catch_up)):
+                    WAVBuffer.catch_up(stream_id, 1)
+                    swriter.write(self.silence_block(req_format, block_bytes))
+                    stream_stats[4] += 1
+                    self.catch_ups += 1
+
+                    if (time.ticks_diff(time.ticks_ms(), slow_start) > SLOW_WINDOW_MS):
+                        slow_start = time.ticks_ms()
+                        slow_catch_ups = 0
+                    if ((not adaptive) or (tier == len(AUDIO_FACTORS) - 1)):
+                        slow_catch_ups += 1
+                    if (max_catch_ups and (slow_catch_ups > max_catch_ups)):
+                        self.disconnects += 1
+                        break
+
+                if (not adaptive):
+                    continue
+
+                tier_buffers += nbufs
+                if ((elapsed > TIER_DOWN_DRAIN_US) or (pending >= self.tier_down_pending)):
+                    kept_up = 0
+                    if ((tier_buffers <= self.tier_hold) or (tier == len(AUDIO_FACTORS) - 1)):
+                        continue
+                    tier += 1
+                else:
+                    kept_up += nbufs
+                    if ((kept_up < self.tier_up_buffers) or (tier == 0)):
+                        continue
+                    tier -= 1
+
+                # the next buffer fetched is at the new rate, so its header goes out first
+                factor = AUDIO_FACTORS[tier]
+                WAVBuffer.set_decimation(stream_id, factor)
+                swriter.write(WAVBuffer.header(req_format, factor))
+                self.factors[stream_id] = factor
+                self.rate_switches += 1
+                tier_buffers = 0
+                kept_up = 0
 
         except OSError as ose:
             if (ose.errno != errno.ECONNRESET):
                 raise
+        except asyncio.CancelledError:
+            # the listener stalled (see 'check_drains'), or else the task is being stopped (e.g.
+            # with the server), which goes on once the stream is cleaned up
+            if ((drain is None) or (not drain[3])):
+                raise
         except Exception as e:
             print('ERROR in audio_stream: ' + str(e))
-
-        self.cid -= 1
-        await sreader.wait_closed()
-
-    async def close(self):
-        self.server.close()
-        await self.server.wait_closed()
-
+        finally:
+            # (however the stream ends, its cursor into the ring is given back for another)
+            if (stream_id in self.streams):
+                del self.streams[stream_id]
+                del self.factors[stream_id]
+                del self.drains[stream_id]
+            WAVBuffer.close(stream_id)
+
+# How often (in s) the signal measured on tuning to known stations is saved (see 'StationDB').
+STATION_SAVE_S = const(600)
+
+# Static files are streamed from flash in chunks of this size, through a single reusable buffer.
+FILE_CHUNK_SIZE = const(512)
+
+# Static files of up to ASSET_MAX_SIZE bytes are kept in RAM once read (see 'AssetCache'), up to
+# ASSET_CACHE_BYTES in all, and only while ASSET_HEAP_RESERVE bytes of heap are free besides (for
+# the audio streams and connections). The hits and misses are in '/metrics', to tune these by.
+ASSET_CACHE_BYTES = const(16384)
+ASSET_HEAP_RESERVE = const(32768)
+ASSET_MAX_SIZE = const(8192)
+
+# Content types of the static files served, by file extension.
+CONTENT_TYPES = {
+    'html': b'text/html',
+    'js':   b'text/javascript',
+    'css':  b'text/css',
+    'svg':  b'image/svg+xml',
+    'xml':  b'text/xml',
+}
+
+# Content type of '/metrics' (the Prometheus text format).
+METRICS_TYPE = b'text/plain; version=0.0.4'
+
+# Bands scanned for stations, in the order they're scanned.
+SCAN_BANDS = ('AM', 'FM')
+
+# Header for responses without a body, which still need a length to keep the connection open.
+NO_CONTENT_LENGTH = b'Content-Length: 0\r\n'
+
+# Station list formats served, from the station database.
+STATION_LIST_TYPES = {
+    'stations.xml':  b'text/xml',
+    'stations.json': b'application/json',
+}
+
+# The headers of each kind of response, built once rather than for each request.
+CONTENT_TYPE_HEADERS = {ext: b'Content-type: ' + content_type + b'\r\n'
+                        for ext, content_type in CONTENT_TYPES.items()}
+STATION_LIST_HEADERS = {name: b'Content-type: ' + content_type + b'\r\n'
+                        for name, content_type in STATION_LIST_TYPES.items()}
+METRICS_HEADERS = b'Content-type: ' + METRICS_TYPE + b'\r\n' \
+                  b'Cache-Control: no-store\r\n'
+SCAN_STATUS_HEADERS = b'Content-type: application/json\r\n' \
+                      b'Cache-Control: no-store\r\n'
+AUDIO_HEADERS = b'Content-type: audio/wav\r\n' \
+                b'Cache-Control: no-store\r\n'
+SCAN_STARTED_HEADERS = b'Location: /scan.json\r\n' + NO_CONTENT_LENGTH
+
+# Responses are put together here, one at a time (see 'HTTPUtil.ResponseHead').
+RESPONSE_HEAD = HTTPUtil.ResponseHead()
+
+# Write the status line and headers of a response, with a Content-Length of 'length' (if not
+# negative). Every response either has a body with a Content-Length, or none at all, so that the
+# connection can be kept open after it (unless 'req' is None, e.g. for a stream, which goes on
+# until the connection is closed).
+def write_head(swriter, req, status, headers=b'', length=-1):
+    head = RESPONSE_HEAD
+    head.start(status)
+    head.add(headers)
+    if (length >= 0):
+        head.add_length(length)
+    head.write(swriter, (req is not None) and req.keep_alive())
 
 # HTML server to present the web radio app and allow scanning/tuning of the Si4730.
 class HTMLServer:
-    def __init__(self, host='0.0.0.0', port=80, backlog=5, timeout=20, radio=None):
+    # 'audio' is the AudioServer to hand audio streams over to, and report the streams of in
+    # '/metrics' (if any; without it, no audio is served).
+    def __init__(self, host='0.0.0.0', port=80, backlog=5, timeout=20, keepalive_timeout=5,
+                 radio=None, stations=None, audio=None):
         if (radio is None):
             radio = Si4730()
 
@@ -116,126 +427,547 @@ class HTMLServer:
         self.port = port
         self.backlog = backlog
         self.timeout = timeout
+        self.keepalive_timeout = keepalive_timeout
 
         self.__radio = radio
+        self.__audio = audio
+
+        # requests handled, and the total and max. time (in us) taken to handle them
+        self.requests = 0
+        self.request_us = 0
+        self.request_us_max = 0
+
+        # when (in ms since power-up) the first response was sent, e.g. to compare boot times
+        self.first_response_ms = -1
+
+        if (stations is None):
+            stations = StationDB()
+        self.__stations = stations
+
+        # the station list, in each format, as built for a version of the station database
+        # (see '__station_list'), so requests for it are answered straight from RAM; its ETag
+        # also tells this boot apart, as signal updates lost with a reboot (before being saved)
+        # could otherwise have counted the version up to the same as different stations later
+        self.__station_lists = {}
+        self.__boot_tag = random.getrandbits(30)
+
+        # a quick scan after a restart can re-check the stations from before
+        for band in SCAN_BANDS:
+            channels = stations.channels(band)
+            if (len(channels) > 0):
+                radio.set_channels(band, channels)
+
+        self.__file_buf = bytearray(FILE_CHUNK_SIZE)
+        self.__file_mv = memoryview(self.__file_buf)
 
+        self.__assets = AssetCache(ASSET_CACHE_BYTES, ASSET_HEAP_RESERVE, ASSET_MAX_SIZE)
+
+        # the parsers (each with its request buffer) of the connections that have closed, for
+        # new connections to take rather than allocating buffers again
+        self.__parsers = []
+
+        # files named after a hash of their content by the build (see 'tools/build_web.py')
+        # never change, so browsers can cache them without checking back
         try:
-            os.stat('stations.xml')
-        except OSError as ose:
-            if (ose.errno == errno.ENOENT):
-                self.__gen_stations_xml()
+            with open('manifest.json') as manifest:
+                self.__immutable = set(name for name in json.load(manifest).values() if name)
+        except OSError:
+            self.__immutable = set()
+
+        # scans run in the background (see '__scan'), with their progress kept here
+        self.__scan_task = None
+        self.__scan_status = {'state': 'idle', 'full': False, 'band': '', 'progress': 0,
+                              'found': 0}
+
+        # without any stations, scan for them as soon as the server is running
+        self.__scan_on_start = len(stations) == 0
+
+        # the routes of each method, built once: a dict of the paths handled as a whole, then
+        # the path prefixes handled (tried in order), each with its handler and an argument for
+        # it (e.g. the headers it sends); audio streams are served on the same port
+        get_paths = {
+            'metrics':   (self.__get_metrics, METRICS_HEADERS),
+            'scan.json': (self.__get_scan_status, SCAN_STATUS_HEADERS),
+            'scan.xml':  (self.__get_scan_xml, STATION_LIST_HEADERS['stations.xml']),
+        }
+        for name, headers in STATION_LIST_HEADERS.items():
+            get_paths[name] = (self.__get_station_list, headers)
+        if (audio is not None):
+            get_paths['audio.wav'] = (self.__get_audio, WAVBuffer.PCM)
+            get_paths['audio.adpcm'] = (self.__get_audio, WAVBuffer.ADPCM)
+            get_paths['audio.ulaw'] = (self.__get_audio, WAVBuffer.ULAW)
+
+        self.__routes = {
+            'GET':   (get_paths, (('', self.__get_file, None),)),
+            'POST':  ({'scan':      (self.__post_scan, False),
+                       'scan/full': (self.__post_scan, True)}, ()),
+            'PATCH': ({}, (('tune/am/', self.__patch_tune, 'AM'),
+                           ('tune/fm/', self.__patch_tune, 'FM'))),
+        }
+
+    @staticmethod
+    def __station_name(band, freq):
+        if (band == 'FM'):
+            return str(freq/100) + ' FM'
+        return str(freq) + ' AM'
+
+    @staticmethod
+    def __station_url(band, freq):
+        return 'tune/' + band.lower() + '/' + str(freq)
+
+    def __build_stations_xml(self):
+        parts = ['<?xml version="1.0" encoding="UTF-8"?>\r\n<station-list>\r\n']
+        for band, freq, rssi, snr, seen in self.__stations.stations():
+            parts.append('<station>'
+                         '<name>' + self.__station_name(band, freq) + '</name>'
+                         '<url>' + self.__station_url(band, freq) + '</url>'
+                         '<band>' + band + '</band><freq>' + str(freq) + '</freq>'
+                         '<rssi>' + str(rssi) + '</rssi><snr>' + str(snr) + '</snr>'
+                         '<seen>' + str(seen) + '</seen>'
+                         '</station>\r\n')
+        parts.append('</station-list>\r\n')
+        return ''.join(parts).encode()
+
+    def __build_stations_json(self):
+        return json.dumps([{'name': self.__station_name(band, freq),
+                            'url': self.__station_url(band, freq),
+                            'band': band, 'freq': freq, 'rssi': rssi, 'snr': snr, 'seen': seen}
+                           for band, freq, rssi, snr, seen in self.__stations.stations()]).encode()
+
+    # The station list (body and ETag) in the format of 'name', only built again once the
+    # station database changes.
+    def __station_list(self, name):
+        version = self.__stations.version
+        station_list = self.__station_lists.get(name)
+        if ((station_list is None) or (station_list[0] != version)):
+            if (name == 'stations.xml'):
+                body = self.__build_stations_xml()
             else:
-                raise
+                body = self.__build_stations_json()
+            etag = '"s{:x}-{:x}-{:x}"'.format(self.__boot_tag, version, len(body)).encode()
+            station_list = (version, body, etag)
+            self.__station_lists[name] = station_list
+
+        return station_list
+
+    # The counters of the app in the Prometheus text format, one 'name{labels} value' per line,
+    # for '/metrics'. Only built when scraped; the counters themselves are updated in place.
+    def __build_metrics(self):
+        parts = []
+
+        def metric(name, value, labels=''):
+            parts.append('pico_' + name + labels + ' ' + str(value) + '\n')
+
+        produced, drops, depth_max, irqs, irq_us_max, irq_us = WAVBuffer.stats()
+        metric('audio_buffers_produced_total', produced)
+        metric('audio_buffers_dropped_total', drops)
+        metric('audio_ring_depth_max', depth_max)
+        metric('audio_irqs_total', irqs)
+        metric('audio_irq_us_total', irq_us)
+        metric('audio_irq_us_max', irq_us_max)
+
+        # what was sent by all streams (without labels) or a stream (labelled with its ID)
+        def sent_metrics(stats, labels=''):
+            metric('audio_sent_bytes_total', stats[0], labels)
+            metric('audio_sent_buffers_total', stats[1], labels)
+            metric('audio_drain_us_total', stats[2], labels)
+            metric('audio_drain_us_max', stats[3], labels)
+
+        audio = self.__audio
+        if (audio is not None):
+            metric('audio_listeners', len(audio.streams))
+            metric('audio_wakes_total', audio.wakes)
+            metric('audio_rate_switches_total', audio.rate_switches)
+            metric('audio_catch_ups_total', audio.catch_ups)
+            metric('audio_disconnects_total', audio.disconnects)
+            sent_metrics(audio.stats)
+            for i, stats in audio.streams.items():
+                labels = '{stream="' + str(i) + '"}'
+                sent_metrics(stats, labels)
+                metric('audio_catch_ups_total', stats[4], labels)
+                metric('audio_lag_buffers', stats[5], labels)
+                metric('audio_dropped_total', WAVBuffer.drops(i), labels)
+                metric('audio_depth_max', WAVBuffer.depth_max(i), labels)
+                metric('audio_decimation', audio.factors[i], labels)
+
+        assets = self.__assets
+        metric('asset_cache_hits_total', assets.hits)
+        metric('asset_cache_misses_total', assets.misses)
+        metric('asset_cache_evictions_total', assets.evictions)
+        metric('asset_cache_entries', assets.entries)
+        metric('asset_cache_bytes', assets.bytes)
+
+        metric('http_requests_total', self.requests)
+        metric('http_request_us_total', self.request_us)
+        metric('http_request_us_max', self.request_us_max)
+        metric('http_first_response_ms', self.first_response_ms)
+
+        metric('loop_lag_ms', loop_lag)
+        metric('loop_lag_ms_max', loop_lag_max)
+        metric('heap_free_bytes', gc.mem_free())
+        metric('heap_alloc_bytes', gc.mem_alloc())
+
+        i2c_stats = self.__radio.get_i2c_stats()
+        for key in ('writes', 'reads', 'bytes_written', 'bytes_read', 'irqs'):
+            metric('i2c_' + key + '_total', i2c_stats[key])
+
+        band_stats = self.__radio.get_band_switch_stats()
+        metric('radio_band_switches_total', band_stats['switches'])
+        metric('radio_band_switch_ms_total', band_stats['total_ms'])
+        metric('radio_band_switch_ms_max', band_stats['max_ms'])
+
+        for cmd, (count, total_us, max_us) in sorted(self.__radio.get_cmd_stats().items()):
+            labels = '{cmd="0x' + '{:02x}'.format(cmd) + '"}'
+            metric('radio_cmds_total', count, labels)
+            metric('radio_cmd_us_total', total_us, labels)
+            metric('radio_cmd_us_max', max_us, labels)
+
+        return ''.join(parts).encode()
+
+    # save the stations found by a scan, with the signal they were found with
+    def __save_stations(self):
+        bands = {}
+        for band in SCAN_BANDS:
+            stations = []
+            for freq in self.__radio.get_channels()[band]:
+                rssi, snr = self.__radio.get_signal(band, freq) or (0, 0)
+                stations.append((freq, rssi, snr))
+            bands[band] = stations
+
+        self.__stations.set_bands(bands, time.time())
+
+    # Scan both bands with the radio's awaitable commands, so the web app and audio streams keep
+    # being served meanwhile, then write the new station list. The progress can be followed
+    # with 'GET scan.json'. Unless 'full', only the stations already known are re-checked (see
+    # 'Si4730.scan').
+    async def __scan(self, full):
+        status = self.__scan_status
+        found = 0
 
-    def __gen_stations_xml(self):
-        self.__radio.scan('AM')
-        self.__radio.scan('FM')
-        stations = self.__radio.get_channels()
-
-        stations_xml = open('stations.xml', 'w')
-        stations_xml.write('<?xml version="1.0" encoding="UTF-8"?>\r\n' \
-                           '<station-list>\r\n')
-        for station in stations['FM']:
-            stations_xml.write('<station>\r\n' \
-                               '<name>'+str(station/100)+' FM</name>\r\n' \
-                               '<url>tune/fm/'+str(station)+'</url>\r\n' \
-                               '</station>\r\n')
-        for station in stations['AM']:
-            stations_xml.write('<station>\r\n' \
-                               '<name>'+str(station)+' AM</name>\r\n' \
-                               '<url>tune/am/'+str(station)+'</url>\r\n' \
-                               '</station>\r\n')
-        stations_xml.write('</station-list>\r\n')
-        stations_xml.close()
+        try:
+            for i, band in enumerate(SCAN_BANDS):
+                status['band'] = band
+
+                def progress(fraction, channels):
+                    status['progress'] = int(100 * (i + fraction) / len(SCAN_BANDS))
+                    status['found'] = found + len(channels)
+
+                found += len(await self.__radio.scan_async(band, progress, full))
+
+            self.__save_stations()
+            status['state'] = 'done'
+        except Exception as e:
+            print('ERROR in scan: ' + str(e))
+            status['state'] = 'failed'
+
+    def __start_scan(self, full=False):
+        if (self.__scan_status['state'] != 'scanning'):
+            self.__scan_status = {'state': 'scanning', 'full': full, 'band': '', 'progress': 0,
+                                  'found': 0}
+            self.__scan_task = asyncio.create_task(self.__scan(full))
 
     async def run(self):
+        if (self.__scan_on_start):
+            self.__start_scan(full=True)
+
         self.server = await asyncio.start_server(self.html_client, self.host, self.port, self.backlog)
         while True:
-            await asyncio.sleep(100)
-
-    async def html_client(self, sreader, swriter):
+            await asyncio.sleep(STATION_SAVE_S)
+            self.__stations.flush()
+
+    # Send a static file, preferring a gzipped copy ('<file>.gz') if the client accepts it.
+    # The ETag is derived from the file size and modification time, so an unchanged file is
+    # answered with a 304 from just a stat, without reading the file at all. Small files are
+    # kept in RAM once read (see 'AssetCache'), and sent from there while they're unchanged.
+    async def __send_file(self, swriter, req, path, type_headers):
+        gzip = req.header_contains(HTTPUtil.ACCEPT_ENCODING, b'gzip')
+        asset = self.__assets.get(path, gzip)
+        if (asset is not None):
+            self.__send_asset(swriter, req, asset)
+            return
+
+        # (whether there's a gzipped copy is checked for all clients, so that a file without one
+        # is cached once for all of them)
+        file_path = path
+        content_encoding = b''
         try:
-            # TODO: Look into properly reading and handling the entire HTTP request.
-            #       For now, we just care about the first line (handling GET or PATCH).
-            r = await asyncio.wait_for(sreader.read(1024), self.timeout)
-            if (r == b''):
-                raise Exception('Invalid HTTP request?')
-
-            r = r.decode().splitlines()[0].split(' ')
-
-            req_method = r[0]
-            req_data = r[1].strip('/')
-
-            if (req_method == 'GET'):
-                if (req_data == ''):
-                    req_data = 'index.html'
-                elif (req_data == 'scan.xml'):
-                    self.__gen_stations_xml()
-                    req_data = 'stations.xml'
-
-                req_data_ext = req_data.split('.')[-1].lower()
-                if (req_data_ext == 'html'):
-                    content_type = b'Content-type: text/html\r\n\r\n'
-                elif (req_data_ext == 'js'):
-                    content_type = b'Content-type: text/javascript\r\n\r\n'
-                elif (req_data_ext == 'css'):
-                    content_type = b'Content-type: text/css\r\n\r\n'
-                elif (req_data_ext == 'svg'):
-                    content_type = b'Content-type: image/svg+xml\r\n\r\n'
-                elif (req_data_ext == 'xml'):
-                    content_type = b'Content-type: text/xml\r\n\r\n'
-
-                # TODO: read data from file incrementally (may run out of memory)
-                try:
-                    file = open(req_data, 'rb')
-                    file_data = file.read()
-                    file.close()
-
-                    swriter.write(b'HTTP/1.0 200 OK\r\n')
-                    swriter.write(content_type)
-                    swriter.write(file_data)
-                    await swriter.drain()
-                except:
-                    swriter.write(b'HTTP/1.0 400 Bad Request\r\n\r\n')
-                    await swriter.drain()
-
-            elif (req_method == 'PATCH'):
-                valid_patch = False
-                req_data_split = req_data.split('/')
-                if (len(req_data_split) == 3):
-                    if (req_data_split[0] == 'tune'):
-                        if (req_data_split[1] == 'am'):
-                            self.__radio.tune('AM', int(req_data_split[2]))
-                            valid_patch = True
-                        elif (req_data_split[1] == 'fm'):
-                            self.__radio.tune('FM', int(req_data_split[2]))
-                            valid_patch = True
-
-                if (valid_patch):
-                    swriter.write(b'HTTP/1.0 204 No Content\r\n')
-                    swriter.write(b'Content-Location: /' + req_data + '\r\n\r\n')
-                else:
-                    swriter.write(b'HTTP/1.0 400 Bad Request\r\n\r\n')
+            os.stat(path + '.gz')
+            shared = False
+        except OSError:
+            shared = True
+        if (gzip and not shared):
+            file_path += '.gz'
+            content_encoding = b'Content-Encoding: gzip\r\n'
 
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            write_head(swriter, req, b'404 Not Found', NO_CONTENT_LENGTH)
+            return
+
+        if (path in self.__immutable):
+            cache_control = b'Cache-Control: max-age=31536000, immutable\r\n'
+        else:
+            cache_control = b'Cache-Control: no-cache\r\n'
+
+        etag = '"{:x}-{:x}"'.format(stat[6], stat[8]).encode()
+        head = RESPONSE_HEAD
+
+        if (req.header_equals(HTTPUtil.IF_NONE_MATCH, etag)):
+            head.start(b'304 Not Modified')
+            head.add(b'ETag: ')
+            head.add(etag)
+            head.add(b'\r\n')
+            head.add(cache_control)
+            head.add(b'Vary: Accept-Encoding\r\n')
+            head.write(swriter, req.keep_alive())
+            return
+
+        # a file small enough is read whole, into what's cached for it, and sent from there
+        not_modified = b'ETag: ' + etag + b'\r\n' + cache_control + b'Vary: Accept-Encoding\r\n'
+        headers = not_modified + content_encoding + type_headers + \
+                  b'Content-Length: ' + str(stat[6]).encode() + b'\r\n\r\n'
+        if (self.__assets.admits(len(headers) + stat[6])):
+            response = bytearray(len(headers) + stat[6])
+            response[:len(headers)] = headers
+            body = memoryview(response)[len(headers):]
+            with open(file_path, 'rb') as file:
+                n = 0
+                while ((n < len(body)) and (read := file.readinto(body[n:]))):
+                    n += read
+
+            asset = Asset(file_path, stat, etag, not_modified, response, shared)
+            self.__assets.put(path, gzip, asset)
+            self.__send_asset(swriter, req, asset)
+            return
+
+        head.start(b'200 OK')
+        head.add(headers[:-2])
+        head.write(swriter, req.keep_alive())
+
+        # the data is copied into the stream (or sent) on write, so the buffer is free to reuse
+        with open(file_path, 'rb') as file:
+            while (n := file.readinto(self.__file_buf)):
+                swriter.write(self.__file_mv[:n])
                 await swriter.drain()
 
+    # Send a file from the cache (see '__send_file').
+    def __send_asset(self, swriter, req, asset):
+        head = RESPONSE_HEAD
+        if (req.header_equals(HTTPUtil.IF_NONE_MATCH, asset.etag)):
+            head.start(b'304 Not Modified')
+            head.add(asset.not_modified)
+            head.write(swriter, req.keep_alive())
+            return
+
+        head.start(b'200 OK')
+        head.write(swriter, req.keep_alive(), False)
+        swriter.write(asset.response)
+
+    def __send_station_list(self, swriter, req, name, type_headers):
+        _, body, etag = self.__station_list(name)
+        not_modified = req.header_equals(HTTPUtil.IF_NONE_MATCH, etag)
+
+        head = RESPONSE_HEAD
+        head.start(b'304 Not Modified' if (not_modified) else b'200 OK')
+        head.add(b'ETag: ')
+        head.add(etag)
+        head.add(b'\r\nCache-Control: no-cache\r\n')
+        if (not not_modified):
+            head.add(type_headers)
+            head.add_length(len(body))
+        head.write(swriter, req.keep_alive())
+
+        if (not not_modified):
+            swriter.write(body)
+
+    # The handlers of the routes (see '__routes'), each given the request's path (without its
+    # leading '/' and query) and query, and its route's argument. A handler returns what to
+    # hand the connection over to once the response is sent (for an audio stream), or None.
+
+    async def __get_file(self, swriter, req, path, query, arg):
+        if (path == ''):
+            path = 'index.html'
+
+        # (the build names files in lowercase, and the file system is case-sensitive anyway)
+        type_headers = CONTENT_TYPE_HEADERS.get(path[path.rfind('.') + 1:])
+        if (type_headers is None):
+            write_head(swriter, req, b'400 Bad Request', NO_CONTENT_LENGTH)
+        else:
+            await self.__send_file(swriter, req, path, type_headers)
+
+    async def __get_metrics(self, swriter, req, path, query, headers):
+        data = self.__build_metrics()
+        write_head(swriter, req, b'200 OK', headers, len(data))
+        swriter.write(data)
+
+    async def __get_scan_status(self, swriter, req, path, query, headers):
+        data = json.dumps(self.__scan_status).encode()
+        write_head(swriter, req, b'200 OK', headers, len(data))
+        swriter.write(data)
+
+    async def __get_station_list(self, swriter, req, path, query, headers):
+        self.__send_station_list(swriter, req, path, headers)
+
+    async def __get_scan_xml(self, swriter, req, path, query, headers):
+        # older clients wait for the whole scan here (only this connection waits)
+        self.__start_scan(full=True)
+        await self.__scan_task
+        self.__send_station_list(swriter, req, 'stations.xml', headers)
+
+    async def __get_audio(self, swriter, req, path, query, req_format):
+        policy = self.__audio.stream_policy(query)
+        if (policy is None):
+            write_head(swriter, req, b'400 Bad Request', NO_CONTENT_LENGTH)
+            return None
+
+        return (req_format, policy)
+
+    async def __post_scan(self, swriter, req, path, query, full):
+        self.__start_scan(full=full)
+        write_head(swriter, req, b'202 Accepted', SCAN_STARTED_HEADERS)
+
+    async def __patch_tune(self, swriter, req, path, query, band):
+        if (self.__scan_status['state'] == 'scanning'):
+            # the radio is busy until the scan completes
+            write_head(swriter, req, b'409 Conflict', NO_CONTENT_LENGTH)
+            return
+
+        valid_patch = False
+        freq = path[len('tune/fm/'):]
+        if (freq.isdigit()):
+            freq = int(freq)
+            try:
+                valid, rssi, snr = await self.__radio.tune_async(band, freq)
+                valid_patch = True
+            except ValueError:
+                pass
+
+            # keep the signal of a known station up to date
+            if (valid_patch and valid):
+                self.__stations.update(band, freq, rssi, snr, time.time())
+
+        if (valid_patch):
+            head = RESPONSE_HEAD
+            head.start(b'204 No Content')
+            head.add(b'Content-Location: /')
+            head.add(req.raw_path())
+            head.add(b'\r\n')
+            head.write(swriter, req.keep_alive())
+        else:
+            write_head(swriter, req, b'400 Bad Request', NO_CONTENT_LENGTH)
+
+    # Dispatch a request through the route table, returning what its handler hands the
+    # connection over to (if anything).
+    async def __handle_request(self, swriter, req):
+        path = req.path
+
+        handler = None
+        routes = self.__routes.get(req.method)
+        if (routes is not None):
+            paths, prefixes = routes
+            route = paths.get(path)
+            if (route is not None):
+                handler, arg = route
             else:
-                swriter.write(b'HTTP/1.0 400 Bad Request\r\n\r\n')
-                await swriter.drain()
+                for prefix, prefix_handler, prefix_arg in prefixes:
+                    if (path.startswith(prefix)):
+                        handler, arg = prefix_handler, prefix_arg
+                        break
+
+        handover = None
+        if (handler is None):
+            write_head(swriter, req, b'400 Bad Request', NO_CONTENT_LENGTH)
+        else:
+            handover = await handler(swriter, req, path, req.query, arg)
+
+        await swriter.drain()
+        return handover
+
+    # Serve requests on a connection until the client closes it (or asks to), so a browser can
+    # load the app and send its tune/scan requests over one socket instead of reconnecting for each.
+    # A request for an audio stream hands the connection over to the AudioServer for good.
+    async def html_client(self, sreader, swriter):
+        if (self.__parsers):
+            parser = self.__parsers.pop()
+        else:
+            parser = HTTPUtil.HTTPParser()
+        timeout = self.timeout
+        stream = None
 
+        try:
+            while True:
+                try:
+                    req = await HTTPUtil.read_request(sreader, parser, timeout)
+                except ValueError:
+                    write_head(swriter, None, b'400 Bad Request', NO_CONTENT_LENGTH)
+                    await swriter.drain()
+                    break
+
+                if (req is None):
+                    break
+
+                start = time.ticks_us()
+                stream = await self.__handle_request(swriter, req)
+                if (stream is not None):
+                    break
+                self.__request_done(start)
+
+                if (not req.keep_alive()):
+                    break
+
+                # an idle connection holds on to one of lwIP's few sockets, so don't wait as long
+                timeout = self.keepalive_timeout
+
+            if (stream is not None):
+                # the parser isn't needed for as long as the stream goes on
+                parser.reset()
+                self.__parsers.append(parser)
+                parser = req = None
+                await self.__audio.audio_stream(swriter, *stream)
+
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            # (the task is being stopped, so the connection is closed without waiting on it)
+            sreader.close()
+            raise
         except Exception as e:
             print('ERROR in html_client: ' + str(e))
 
+        if (parser is not None):
+            parser.reset()
+            self.__parsers.append(parser)
         await sreader.wait_closed()
 
+    def __request_done(self, start):
+        elapsed = time.ticks_diff(time.ticks_us(), start)
+        if (self.requests == 0):
+            self.first_response_ms = time.ticks_ms()
+        self.requests += 1
+        self.request_us = (self.request_us + elapsed) & STATS_WRAP
+        if (elapsed > self.request_us_max):
+            self.request_us_max = elapsed
+
     async def close(self):
+        self.__stations.flush()
         self.server.close()
         await self.server.wait_closed()
 
+# last and longest time (in ms) the heartbeat was late waking up, as a measure of event loop lag
+loop_lag = 0
+loop_lag_max = 0
+
 async def heartbeat(led):
+    global loop_lag, loop_lag_max
+
     while True:
         led.off()
+        t = time.ticks_ms()
         await asyncio.sleep_ms(800)
+        loop_lag = time.ticks_diff(time.ticks_ms(), t) - 800
+        if (loop_lag > loop_lag_max):
+            loop_lag_max = loop_lag
         led.on()
         await asyncio.sleep_ms(50)
         led.off()
@@ -245,20 +977,36 @@ async def heartbeat(led):
         led.off()
         await asyncio.sleep_ms(50)
 
+# Claim the 2 DMA channels for the audio capture (see 'WAVBuffer.init'), so they can't clash with
+# any other user of DMA (e.g. the CYW43 WLAN driver), or None before MicroPython 1.22 (without
+# 'rp2.DMA'), leaving the native module's default channels (9 and 10) to chance.
+def claim_dma_channels():
+    try:
+        return (rp2.DMA(), rp2.DMA())
+    except AttributeError:
+        return None
+
 # Function to run the entire app.
 # TODO: Look into why the ADC and DMA module can't be started until after
 #       the network is connected (may have to do with DMA being used?)
-def run():
+def run(port=80):
     led = Pin('LED', Pin.OUT)
 
     NetworkUtil.connect()
 
     # start the ADC DMA acquisition after starting the network
-    WAVBuffer.init(ADC_CHAN)
+    dma = claim_dma_channels()
+    dma_chans = (dma[0].channel, dma[1].channel) if (dma) else (9, 10)
+    try:
+        WAVBuffer.init(*((ADC_CHAN,) + dma_chans + AUDIO_PROFILES[AUDIO_PROFILE]))
+    except (ValueError, OSError) as e:
+        print('ERROR in audio profile ' + AUDIO_PROFILE + ': ' + str(e) + ', using the defaults')
+        WAVBuffer.init(ADC_CHAN, *dma_chans)
     WAVBuffer.start()
 
+    # the web app and the audio streams are served on the same port
     audio_server = AudioServer()
-    html_server = HTMLServer(radio=SI4730_RADIO)
+    html_server = HTMLServer(port=port, radio=SI4730_RADIO, audio=audio_server)
 
     try:
         gather_run = asyncio.gather(audio_server.run(), html_server.run(), heartbeat(led))
@@ -266,7 +1014,9 @@ def run():
     except:
         raise
     finally:
-        gather_close = asyncio.gather(audio_server.close(), html_server.close())
-        asyncio.run(gather_close)
+        asyncio.run(html_server.close())
+        if (dma):
+            for chan in dma:
+                chan.close()
         led.off()
         _ = asyncio.new_event_loop()
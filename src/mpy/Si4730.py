@@ -5,7 +5,10 @@
 #
 
 from machine import I2C, Pin
+import machine
 import time
+import errno
+import uasyncio as asyncio
 
 # status bits defined here
 STATUS_CTS                  = const(1 << 7)
@@ -48,6 +51,7 @@ FM_TUNE_STATUS_RESP1_BLTF   = const(1 << 7)
 
 FM_RSQ_STATUS_CMD           = const(0x23)
 FM_RSQ_STATUS_ARG1_INTACK   = const(1 << 0)
+FM_RSQ_STATUS_RESP2_VALID   = const(1 << 0)
 
 AM_TUNE_FREQ_CMD            = const(0x40)
 AM_TUNE_FREQ_ARG1_FAST      = const(1 << 0)
@@ -64,11 +68,36 @@ AM_TUNE_STATUS_RESP1_BLTF   = const(1 << 7)
 
 AM_RSQ_STATUS_CMD           = const(0x43)
 AM_RSQ_STATUS_ARG1_INTACK   = const(1 << 0)
+AM_RSQ_STATUS_RESP2_VALID   = const(1 << 0)
 
 AM_AGC_STATUS_CMD           = const(0x47)
 
+# length of the response (including the status byte) to each command, so that only the bytes
+# needed are read (commands not listed here read the max. length)
+RESP_LEN = {
+    POWER_UP_CMD:        1,
+    POWER_DOWN_CMD:      1,
+    SET_PROPERTY_CMD:    1,
+    GET_PROPERTY_CMD:    4,
+    GET_INT_STATUS_CMD:  1,
+    FM_TUNE_FREQ_CMD:    1,
+    FM_SEEK_START_CMD:   1,
+    FM_TUNE_STATUS_CMD:  8,
+    FM_RSQ_STATUS_CMD:   8,
+    AM_TUNE_FREQ_CMD:    1,
+    AM_SEEK_START_CMD:   1,
+    AM_TUNE_STATUS_CMD:  8,
+    AM_RSQ_STATUS_CMD:   6,
+    AM_AGC_STATUS_CMD:   3,
+}
+RESP_LEN_MAX                = const(16)
+
 
 # common properties and associated arguments defined here
+GPO_IEN_PROP                = const(0x0001)
+GPO_IEN_CTSIEN              = const(1 << 7)
+GPO_IEN_STCIEN              = const(1 << 0)
+
 FM_DEEMPHASIS_PROP          = const(0x1100)
 FM_DEEMPHASIS_DEEMPH_75US   = const(0b10 << 0)
 FM_DEEMPHASIS_DEEMPH_50US   = const(0b01 << 0)
@@ -156,8 +185,113 @@ RX_HARD_MUTE                   = const(0x4001)
 RX_HARD_MUTE_LMUTE             = const(1 << 1)
 RX_HARD_MUTE_RMUTE             = const(1 << 0)
 
+# how often (in ms) the awaitable commands poll the device while waiting for it (the blocking
+# ones poll every ms)
+ASYNC_POLL_MS = const(5)
+
+# With interrupts, how long (in ms) to wait for one before checking the device anyway. Interrupts
+# only say that *something* completed, and one can (rarely) be missed between reading the status
+# and waiting for the next, so this bounds how long that can go unnoticed.
+INT_FALLBACK_MS = const(200)
+
+# Command times (in us) are totalled modulo this, like 'time.ticks_us()' wraps around, so the
+# totals stay small ints and updating them never allocates.
+STATS_WRAP = const(0x3fffffff)
+
+# Per-band commands, so that scanning and tuning can share the same code for both bands.
+# The TUNE_FREQ, SEEK_START, TUNE_STATUS and RSQ_STATUS argument and response bits used are the
+# same for AM and FM.
+BANDS = {
+    'FM': {'seek_start': FM_SEEK_START_CMD, 'tune_freq': FM_TUNE_FREQ_CMD,
+           'tune_status': FM_TUNE_STATUS_CMD, 'rsq_status': FM_RSQ_STATUS_CMD,
+           'tune_freq_args': (0,),
+           'bottom_prop': FM_SEEK_BAND_BOTTOM_PROP, 'top_prop': FM_SEEK_BAND_TOP_PROP},
+    'AM': {'seek_start': AM_SEEK_START_CMD, 'tune_freq': AM_TUNE_FREQ_CMD,
+           'tune_status': AM_TUNE_STATUS_CMD, 'rsq_status': AM_RSQ_STATUS_CMD,
+           'tune_freq_args': (0, 0),
+           'bottom_prop': AM_SEEK_BAND_BOTTOM_PROP, 'top_prop': AM_SEEK_BAND_TOP_PROP},
+}
+
+# Values of the properties used here after a power up (from AN332), so that properties already
+# at the value wanted don't have to be set at all.
+PROPERTY_DEFAULTS = {
+    GPO_IEN_PROP:                     0,
+    FM_DEEMPHASIS_PROP:               FM_DEEMPHASIS_DEEMPH_75US,
+    FM_CHANNEL_FILTER_PROP:           FM_CHANNEL_FILTER_AUTO,
+    FM_BLEND_STEREO_THRESHOLD_PROP:   49,
+    FM_BLEND_MONO_THRESHOLD_PROP:     30,
+    FM_ANTENNA_INPUT_PROP:            FM_ANTENNA_INPUT_FMTXO_FMI,
+    FM_SEEK_BAND_BOTTOM_PROP:         8750,
+    FM_SEEK_BAND_TOP_PROP:            10790,
+    FM_SEEK_FREQ_SPACING_PROP:        10,
+    AM_DEEMPHASIS_PROP:               AM_DEEMPHASIS_NONE,
+    AM_CHANNEL_FILTER_PROP:           AM_CHANNEL_FILTER_2KHZ,
+    AM_SOFT_MUTE_MAX_ATTEN_PROP:      16,
+    AM_SEEK_BAND_BOTTOM_PROP:         520,
+    AM_SEEK_BAND_TOP_PROP:            1710,
+    AM_SEEK_FREQ_SPACING_PROP:        10,
+    AM_SEEK_TUNE_SNR_THRESHOLD_PROP:  5,
+    AM_SEEK_TUNE_RSSI_THRESHOLD_PROP: 25,
+    RX_VOLUME_PROP:                   RX_VOLUME_MAX,
+    RX_HARD_MUTE:                     0,
+}
+
+# Profiles of the properties to set after powering up in each band, loosely following the example
+# flowchart in the datasheet for setting up an AM/FM receiver. The settings common to all regions
+# are in BAND_PROPERTIES, and those specific to an ITU region (1: Europe/Africa, 2: Americas,
+# 3: Asia/Pacific) in REGION_PROPERTIES, which take precedence.
+BAND_PROPERTIES = {
+    'FM': ((FM_ANTENNA_INPUT_PROP, FM_ANTENNA_INPUT_FMTXO_FMI),
+           (FM_BLEND_MONO_THRESHOLD_PROP, FM_BLEND_MONO_THRESHOLD_MONO),
+           (FM_BLEND_STEREO_THRESHOLD_PROP, FM_BLEND_STEREO_THRESHOLD_MONO),
+           (FM_CHANNEL_FILTER_PROP, FM_CHANNEL_FILTER_AUTO),
+           (RX_VOLUME_PROP, RX_VOLUME_MAX),
+           (RX_HARD_MUTE, 0)),
+    'AM': ((AM_DEEMPHASIS_PROP, AM_DEEMPHASIS_50US),
+           (AM_SOFT_MUTE_MAX_ATTEN_PROP, AM_SOFT_MUTE_MAX_ATTEN_MIN),
+           (AM_CHANNEL_FILTER_PROP, AM_CHANNEL_FILTER_6KHZ),
+                                    # | AM_CHANNEL_FILTER_AMPLFLT) too much supression
+           # default thresholds seem to miss signals that sound as good as AM gets
+           (AM_SEEK_TUNE_SNR_THRESHOLD_PROP, 0),
+           (AM_SEEK_TUNE_RSSI_THRESHOLD_PROP, 20),
+           (RX_VOLUME_PROP, RX_VOLUME_MAX),
+           (RX_HARD_MUTE, 0)),
+}
+
+REGION_ITU_1_3_PROPERTIES = {
+    'FM': ((FM_DEEMPHASIS_PROP, FM_DEEMPHASIS_DEEMPH_50US),
+           (FM_SEEK_BAND_BOTTOM_PROP, FM_SEEK_BAND_BOTTOM_ITU_1_3),
+           (FM_SEEK_BAND_TOP_PROP, FM_SEEK_BAND_TOP_ITU_1_3),
+           (FM_SEEK_FREQ_SPACING_PROP, FM_SEEK_FREQ_SPACING_ITU_1_3)),
+    'AM': ((AM_SEEK_BAND_BOTTOM_PROP, AM_SEEK_BAND_BOTTOM_ITU_1_3),
+           (AM_SEEK_BAND_TOP_PROP, AM_SEEK_BAND_TOP_ITU_1_3),
+           (AM_SEEK_FREQ_SPACING_PROP, AM_SEEK_FREQ_SPACING_ITU_1_3)),
+}
+
+REGION_PROPERTIES = {
+    1: REGION_ITU_1_3_PROPERTIES,
+    2: {'FM': ((FM_DEEMPHASIS_PROP, FM_DEEMPHASIS_DEEMPH_75US),
+               (FM_SEEK_BAND_BOTTOM_PROP, FM_SEEK_BAND_BOTTOM_ITU_2),
+               (FM_SEEK_BAND_TOP_PROP, FM_SEEK_BAND_TOP_ITU_2),
+               (FM_SEEK_FREQ_SPACING_PROP, FM_SEEK_FREQ_SPACING_ITU_2)),
+        'AM': ((AM_SEEK_BAND_BOTTOM_PROP, AM_SEEK_BAND_BOTTOM_ITU_2),
+               (AM_SEEK_BAND_TOP_PROP, AM_SEEK_BAND_TOP_ITU_2),
+               (AM_SEEK_FREQ_SPACING_PROP, AM_SEEK_FREQ_SPACING_ITU_2))},
+    3: REGION_ITU_1_3_PROPERTIES,
+}
+
+POWER_UP_ARGS = {
+    'FM': (POWER_UP_ARG1_XOSCEN | POWER_UP_ARG1_FUNC_FM, POWER_UP_ARG2_OPMODE_ANALOG),
+    'AM': (POWER_UP_ARG1_XOSCEN | POWER_UP_ARG1_FUNC_AM, POWER_UP_ARG2_OPMODE_ANALOG),
+}
+
+
 class Si4730:
-    def __init__(self, i2c=None, rst_pin=22, addr=0x63):
+    # If 'int_pin' is given (the GPIO wired to the Si4730's GPO2/INT pin), the device is set up to
+    # interrupt on CTS and STC, so that waits for commands (and tunes/seeks) to complete are
+    # signalled instead of polling the device over I2C.
+    # 'region' is the ITU region (1, 2 or 3) to set up the bands for (see REGION_PROPERTIES).
+    def __init__(self, i2c=None, rst_pin=22, addr=0x63, int_pin=None, region=2):
         if (i2c is None):
             self.__i2c = I2C(0, freq=400000)
         else:
@@ -169,10 +303,47 @@ class Si4730:
         # state to store currently selected band
         self.__band = ''
 
+        # shadow copy of the properties on the device (empty while it's powered down), so that
+        # properties are only set when their value changes
+        self.__properties = {}
+        self.__profiles = {}
+
+        # time taken (in ms) to switch between bands
+        self.__band_switch_stats = {'switches': 0, 'last_ms': 0, 'max_ms': 0, 'total_ms': 0}
+
+        # time (in us) from sending each command to the device being clear to send again, as
+        # [count, total, max] per command (see '__cmd_done')
+        self.__cmd_stats = {}
+
         # maintain a list of channels detected via the scan function on the Si4730
         # store in units of 10KHz (e.g. fm_channel[0] == 8810 ---> real freq. = 88.1MHz)
         self.__channels = {'FM': [], 'AM': []}
 
+        # last (RSSI, SNR) measured on each channel found or tuned to
+        self.__signals = {'FM': {}, 'AM': {}}
+
+        # the awaitable commands can be called from several tasks, but a command (and e.g.
+        # a whole scan) has to finish before the next one is sent
+        self.__lock = asyncio.Lock()
+
+        # I2C traffic, in total and for the last tune and scan
+        self.__i2c_stats = {'writes': 0, 'reads': 0, 'bytes_written': 0, 'bytes_read': 0,
+                            'irqs': 0, 'last_tune': 0, 'last_scan': 0}
+
+        # whether the command being run waits on the device by blocking (see '__run')
+        self.__blocking = False
+
+        # interrupts are only enabled on the device once it's powered up
+        self.__int_enabled = False
+        self.__int_pending = False
+        self.__int_flag = asyncio.ThreadSafeFlag()
+        self.__int_pin = None
+        if (int_pin is not None):
+            self.__int_pin = Pin(int_pin, Pin.IN, Pin.PULL_UP)
+            self.__int_pin.irq(trigger=Pin.IRQ_FALLING, handler=self.__int_handler)
+
+        self.set_region(region)
+
         self.reset()
 
     # use this to initialize the device but also to get out of an unknown state (e.g. bad config.)
@@ -181,56 +352,231 @@ class Si4730:
         self.__rst_pin.off()
         time.sleep_ms(10)
         self.__rst_pin.on()
+        self.__int_enabled = False
 
         # probably not needed after a cycle of the reset pin, but eh, why not
+        self.__run(self.__wait_for_CTS())
         self.send_cmd(POWER_DOWN_CMD)
 
         # start by default in FM mode, to be able to send other commands
-        self.__set_band('FM')
+        self.__band = ''
+        self.__run(self.__set_band('FM'))
 
         if ((self.__get_status() & STATUS_ERR) != 0):
             raise OSError(errno.EIO, 'Error status from Si4730')
 
+    # Select the ITU region to set up the bands for, applying its profile right away to the band
+    # in use (if any).
+    def set_region(self, region):
+        if (region not in REGION_PROPERTIES):
+            raise ValueError('Invalid region')
+
+        self.__region = region
+        for band in BANDS:
+            profile = {}
+            for prop, val in BAND_PROPERTIES[band] + REGION_PROPERTIES[region][band]:
+                profile[prop] = val
+            if (self.__int_pin is not None):
+                profile[GPO_IEN_PROP] = GPO_IEN_CTSIEN | GPO_IEN_STCIEN
+            self.__profiles[band] = profile
+
+        if (self.__band != ''):
+            self.__run(self.__apply_profile(self.__band))
+
+    def get_region(self):
+        return self.__region
+
+    # bottom and top of a band (in units of 10KHz) in the region selected
+    def get_band_limits(self, band):
+        info = self.__band_info(band.upper())
+        profile = self.__profiles[band.upper()]
+        return profile[info['bottom_prop']], profile[info['top_prop']]
+
+    def get_i2c_stats(self):
+        return self.__i2c_stats
+
+    def get_band_switch_stats(self):
+        return self.__band_switch_stats
+
+    def get_cmd_stats(self):
+        return self.__cmd_stats
+
+    # the list for each command is only created the first time it's sent
+    def __cmd_done(self, cmd, start):
+        elapsed = time.ticks_diff(time.ticks_us(), start)
+
+        stats = self.__cmd_stats.get(cmd)
+        if (stats is None):
+            stats = [0, 0, 0]
+            self.__cmd_stats[cmd] = stats
+        stats[0] += 1
+        stats[1] = (stats[1] + elapsed) & STATS_WRAP
+        if (elapsed > stats[2]):
+            stats[2] = elapsed
+
+    def __band_switched(self, start):
+        elapsed = time.ticks_diff(time.ticks_ms(), start)
+
+        stats = self.__band_switch_stats
+        stats['switches'] += 1
+        stats['last_ms'] = elapsed
+        stats['max_ms'] = max(stats['max_ms'], elapsed)
+        stats['total_ms'] += elapsed
+
+    def __i2c_bytes(self):
+        return self.__i2c_stats['bytes_written'] + self.__i2c_stats['bytes_read']
+
+    def __int_handler(self, pin):
+        self.__int_pending = True
+        self.__int_flag.set()
+        self.__i2c_stats['irqs'] += 1
+
+    def __int_clear(self):
+        self.__int_pending = False
+        self.__int_flag.clear()
+
+    # Run one of the awaitable commands below to completion without the event loop (e.g. from the
+    # REPL, or while setting up the device), returning its result. While it runs, waiting on the
+    # device blocks (see '__wait_for_int' and '__poll_wait') instead of yielding to the loop, so
+    # the coroutine never suspends and there's a single implementation of each command. While a
+    # task holds the device, it fails straight away, without waiting on the lock (which would
+    # queue the current task, None outside the loop, for the lock's release to resume).
+    def __run(self, coro):
+        if (self.__lock.locked()):
+            coro.close()
+            raise OSError(errno.EBUSY, 'Si4730 in use by a task')
+
+        self.__blocking = True
+        try:
+            coro.send(None)
+        except StopIteration as e:
+            return e.value
+        finally:
+            self.__blocking = False
+
+        # (only if the command had to wait on something else that a task holds)
+        coro.close()
+        raise OSError(errno.EBUSY, 'Si4730 in use by a task')
+
+    # wait for an interrupt, or at most 'timeout' ms
+    async def __wait_for_int(self, timeout):
+        if (self.__blocking):
+            start = time.ticks_ms()
+            while ((not self.__int_pending) and
+                   (time.ticks_diff(time.ticks_ms(), start) < timeout)):
+                machine.idle()
+        else:
+            try:
+                await asyncio.wait_for_ms(self.__int_flag.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        self.__int_clear()
+
+    # wait before polling the device again (without interrupts)
+    async def __poll_wait(self):
+        if (self.__blocking):
+            time.sleep_ms(1)
+        else:
+            await asyncio.sleep_ms(ASYNC_POLL_MS)
+
+    def __write(self, data):
+        self.__i2c.writeto(self.__addr, data)
+        self.__i2c_stats['writes'] += 1
+        self.__i2c_stats['bytes_written'] += len(data)
+
+    def __read(self, nbytes):
+        self.__i2c_stats['reads'] += 1
+        self.__i2c_stats['bytes_read'] += nbytes
+        return self.__i2c.readfrom(self.__addr, nbytes)
+
     def __get_status(self):
-        return self.__i2c.readfrom(self.__addr, 1)[0]
+        return self.__read(1)[0]
 
     # status byte appears to be first byte of response to any command
     # so let's just read from the device to see if it's clear to send
-    def __wait_for_CTS(self, timeout=1000):
-        while ((self.__get_status() & STATUS_CTS) == 0):
-            time.sleep_ms(1)
-            timeout -= 1
-
-            if (timeout < 0):
+    # (returns the status byte, which is the whole response for most commands)
+    async def __wait_for_CTS(self, timeout=1000):
+        start = time.ticks_ms()
+        while True:
+            if (self.__int_enabled):
+                await self.__wait_for_int(INT_FALLBACK_MS)
+
+            status = self.__get_status()
+            if ((status & STATUS_CTS) != 0):
+                return status
+
+            if (time.ticks_diff(time.ticks_ms(), start) > timeout):
                 raise OSError(errno.ETIMEDOUT, 'Timeout waiting for CTS')
 
-    # default timeout of 60s, seeking for valid channels can take a while
-    def __wait_for_STC(self, timeout=60000):
-        while ((self.send_cmd(GET_INT_STATUS_CMD)[0] & STATUS_STCINT) == 0):
-            time.sleep_ms(1)
-            timeout -= 1
+            if (not self.__int_enabled):
+                await self.__poll_wait()
 
-            if (timeout < 0):
+    # default timeout of 60s, seeking for valid channels can take a while
+    async def __wait_for_STC(self, timeout=60000):
+        start = time.ticks_ms()
+        while (((await self.__send_cmd(GET_INT_STATUS_CMD))[0] & STATUS_STCINT) == 0):
+            if (time.ticks_diff(time.ticks_ms(), start) > timeout):
                 raise OSError(errno.ETIMEDOUT, 'Timeout waiting for STC (try longer)')
 
-    # cmd and args are treated as integers (to allow bitwise ops before calling)
-    def send_cmd(self, cmd, *args):
-        self.__wait_for_CTS()
-        self.__i2c.writeto(self.__addr, bytes([cmd]) + bytes(args))
-
-        # TODO: optimize this to not return max length response each time
-        resp = self.__i2c.readfrom(self.__addr, 16)
+            if (self.__int_enabled):
+                await self.__wait_for_int(INT_FALLBACK_MS)
+            else:
+                await self.__poll_wait()
+
+    def __write_cmd(self, cmd, args):
+        # a power up enables interrupts (if used), including for its own completion, and resets
+        # the properties to their defaults
+        if (cmd == POWER_UP_CMD):
+            self.__int_enabled = self.__int_pin is not None
+            self.__properties = dict(PROPERTY_DEFAULTS)
+        elif (cmd == POWER_DOWN_CMD):
+            self.__int_enabled = False
+            self.__properties = {}
+
+        self.__int_clear()
+        self.__write(bytes([cmd]) + bytes(args))
+
+    def __read_resp(self, cmd, status):
+        resp_len = RESP_LEN.get(cmd, RESP_LEN_MAX)
+        if (resp_len > 1):
+            resp = self.__read(resp_len)
+        else:
+            resp = bytes([status])
 
         if ((resp[0] & STATUS_ERR) != 0):
             raise OSError(errno.EIO, 'Error status from Si4730')
 
         return resp
 
+    # cmd and args are treated as integers (to allow bitwise ops before calling)
+    # the response is read once the command completes, with only as many bytes as it has
+    async def __send_cmd(self, cmd, *args):
+        start = time.ticks_us()
+        self.__write_cmd(cmd, args)
+        status = await self.__wait_for_CTS()
+        self.__cmd_done(cmd, start)
+        return self.__read_resp(cmd, status)
+
+    def send_cmd(self, cmd, *args):
+        return self.__run(self.__send_cmd(cmd, *args))
+
+    async def send_cmd_async(self, cmd, *args):
+        async with self.__lock:
+            return await self.__send_cmd(cmd, *args)
+
     # prop and val are treated as length-2 array of ints
+    # (the property isn't set if it's known to have the value already)
+    async def __set_property(self, prop, val):
+        if (self.__properties.get(prop) == val):
+            return
+
+        await self.__send_cmd(SET_PROPERTY_CMD, SET_PROPERTY_ARG1,
+                                                prop >> 8, prop & 0xff,
+                                                val >> 8, val & 0xff)
+        self.__properties[prop] = val
+
     def set_property(self, prop, val):
-        self.send_cmd(SET_PROPERTY_CMD, SET_PROPERTY_ARG1,
-                                        prop >> 8, prop & 0xff,
-                                        val >> 8, val & 0xff)
+        self.__run(self.__set_property(prop, val))
 
     def get_property(self, prop):
         resp = self.send_cmd(GET_PROPERTY_CMD, GET_PROPERTY_ARG1,
@@ -238,136 +584,192 @@ class Si4730:
 
         return resp[2]*256 + resp[3]
 
+    @staticmethod
+    def __band_info(band):
+        info = BANDS.get(band)
+        if (info is None):
+            raise ValueError('Invalid band selected')
+        return info
 
-    # loosely follows example flowchart in datasheet for setting up AM/FM receiver
-    # TODO: allow for setting up selected band based on region provided
-    #       as it currently sets up assuming Americas
-    def __set_band(self, band):
-        band = band.upper()
-
-        # don't needlessly power down/power up device if band is already selected
-        if (band == self.__band):
-            return
-
-        if (band == 'FM'):
-            self.__band = band
+    # the power up arguments for a band, including for interrupts (if used)
+    def __power_up_args(self, band):
+        arg1, arg2 = POWER_UP_ARGS[band]
 
-            self.send_cmd(POWER_DOWN_CMD)
+        if (self.__int_pin is not None):
+            arg1 |= POWER_UP_ARG1_CTSIEN | POWER_UP_ARG1_GPO2OEN
 
-            self.send_cmd(POWER_UP_CMD, POWER_UP_ARG1_XOSCEN | POWER_UP_ARG1_FUNC_FM,
-                                        POWER_UP_ARG2_OPMODE_ANALOG)
+        return arg1, arg2
 
-            self.set_property(FM_ANTENNA_INPUT_PROP, FM_ANTENNA_INPUT_FMTXO_FMI)
-            self.set_property(FM_DEEMPHASIS_PROP, FM_DEEMPHASIS_DEEMPH_75US)
-            self.set_property(FM_BLEND_MONO_THRESHOLD_PROP, FM_BLEND_MONO_THRESHOLD_MONO)
-            self.set_property(FM_BLEND_STEREO_THRESHOLD_PROP, FM_BLEND_STEREO_THRESHOLD_MONO)
+    # set the properties of the band's profile, as one batch of only those that differ
+    async def __apply_profile(self, band):
+        for prop, val in self.__profiles[band].items():
+            await self.__set_property(prop, val)
 
-            self.set_property(FM_CHANNEL_FILTER_PROP, FM_CHANNEL_FILTER_AUTO)
-            self.set_property(FM_SEEK_BAND_BOTTOM_PROP, FM_SEEK_BAND_BOTTOM_ITU_2)
-            self.set_property(FM_SEEK_BAND_TOP_PROP, FM_SEEK_BAND_TOP_ITU_2)
-            self.set_property(FM_SEEK_FREQ_SPACING_PROP, FM_SEEK_FREQ_SPACING_ITU_2)
-        elif (band == 'AM'):
-            self.__band = band
+    # Switching bands takes a power cycle (which resets the properties to their defaults), but
+    # then only the properties of the band's profile that differ from the defaults are set.
+    async def __set_band(self, band):
+        band = band.upper()
+        self.__band_info(band)
 
-            self.send_cmd(POWER_DOWN_CMD)
+        # don't needlessly power down/power up device if band is already selected
+        if (band == self.__band):
+            return
 
-            self.send_cmd(POWER_UP_CMD, POWER_UP_ARG1_XOSCEN | POWER_UP_ARG1_FUNC_AM,
-                                        POWER_UP_ARG2_OPMODE_ANALOG)
+        start = time.ticks_ms()
+        self.__band = band
 
-            self.set_property(AM_DEEMPHASIS_PROP, AM_DEEMPHASIS_50US)
-            self.set_property(AM_SOFT_MUTE_MAX_ATTEN_PROP, AM_SOFT_MUTE_MAX_ATTEN_MIN)
+        await self.__send_cmd(POWER_DOWN_CMD)
+        await self.__send_cmd(POWER_UP_CMD, *self.__power_up_args(band))
+        await self.__apply_profile(band)
 
-            self.set_property(AM_CHANNEL_FILTER_PROP, AM_CHANNEL_FILTER_6KHZ)
-                                                      # | AM_CHANNEL_FILTER_AMPLFLT) too much supression
-            self.set_property(AM_SEEK_BAND_BOTTOM_PROP, AM_SEEK_BAND_BOTTOM_ITU_2)
-            self.set_property(AM_SEEK_BAND_TOP_PROP, AM_SEEK_BAND_TOP_ITU_2)
-            self.set_property(AM_SEEK_FREQ_SPACING_PROP, AM_SEEK_FREQ_SPACING_ITU_2)
-
-            # default thresholds seem to miss signals that sound as good as AM gets
-            self.set_property(AM_SEEK_TUNE_SNR_THRESHOLD_PROP, 0)
-            self.set_property(AM_SEEK_TUNE_RSSI_THRESHOLD_PROP, 20)
-        else:
-            raise ValueError('Invalid band selected')
-
-        self.set_property(RX_VOLUME_PROP, RX_VOLUME_MAX)
-        self.set_property(RX_HARD_MUTE, 0)
+        self.__band_switched(start)
 
     def get_channels(self):
         return self.__channels
 
-    def scan(self, band):
+    # channels known from before (e.g. saved from an earlier scan), for a quick scan to re-check
+    def set_channels(self, band, channels):
+        self.__channels[band.upper()] = sorted(channels)
+
+    # the last (RSSI, SNR) measured on a channel (when found, checked or tuned to), if any
+    def get_signal(self, band, freq):
+        return self.__signals[band.upper()].get(freq)
+
+    # tune to freq in the band selected, returning the TUNE_STATUS response once tuned
+    async def __tune_freq(self, info, freq):
+        await self.__send_cmd(info['tune_freq'], 0, freq >> 8, freq & 0xff,
+                              *info['tune_freq_args'])
+        await self.__wait_for_STC()
+
+        return await self.__send_cmd(info['tune_status'], FM_TUNE_STATUS_ARG1_INTACK)
+
+    # acknowledge STC with TUNE_STATUS, without reading the rest of its response
+    async def __ack_STC(self, info):
+        start = time.ticks_us()
+        self.__write_cmd(info['tune_status'], (FM_TUNE_STATUS_ARG1_INTACK,))
+        status = await self.__wait_for_CTS()
+        self.__cmd_done(info['tune_status'], start)
+        if ((status & STATUS_ERR) != 0):
+            raise OSError(errno.EIO, 'Error status from Si4730')
+
+    # Fast tune to a known channel (skipping the validation of a normal tune) and return the
+    # RSQ_STATUS response, of whether the channel is still valid and its RSSI and SNR.
+    async def __check_channel(self, info, freq):
+        await self.__send_cmd(info['tune_freq'], FM_TUNE_FREQ_ARG1_FAST, freq >> 8, freq & 0xff,
+                              *info['tune_freq_args'])
+        await self.__wait_for_STC()
+        await self.__ack_STC(info)
+
+        return await self.__send_cmd(info['rsq_status'], 0)
+
+    # Seek up from lo until hi (or the top of the band if None), adding the valid channels found
+    # in between (and lo itself) to channels, and their signal to signals. 'progress' is called
+    # with the channel reached after each seek.
+    async def __seek_range(self, info, lo, hi, channels, signals, progress):
+        resp = await self.__tune_freq(info, lo)
+        if ((resp[1] & FM_TUNE_STATUS_RESP1_VALID) and (lo not in channels)):
+            channels.append(lo)
+            signals[lo] = (resp[4], resp[5])
+
+        while True:
+            await self.__send_cmd(info['seek_start'], FM_SEEK_START_ARG1_SEEKUP)
+            await self.__wait_for_STC()
+
+            resp = await self.__send_cmd(info['tune_status'], FM_TUNE_STATUS_ARG1_INTACK)
+            freq = resp[2]*256 + resp[3]
+            if ((resp[1] & FM_TUNE_STATUS_RESP1_BLTF) or ((hi is not None) and (freq >= hi))):
+                return
+
+            if (resp[1] & FM_TUNE_STATUS_RESP1_VALID):
+                channels.append(freq)
+                signals[freq] = (resp[4], resp[5])
+
+            progress(freq)
+
+    # A full scan seeks through the whole band, which takes a tune per channel in the band.
+    # Otherwise (if channels are known in the band), a quick scan re-checks the known channels
+    # with a fast tune each, and only seeks through the gaps around channels no longer valid
+    # (so new stations are only found next to lost ones, or by a full scan).
+    # 'progress', if given, is called after each channel checked or found (and at the end of the
+    # band) with how far through the band the scan is (from 0 to 1) and the channels found so far.
+    async def scan_async(self, band, progress=None, full=False):
         band = band.upper()
+        info = self.__band_info(band)
 
-        if (band == 'FM'):
-            # device may be tuned or otherwise configured in an unknown way
-            # so let's force the band to be selected and configured
-            self.__band = ''
-            self.__set_band('FM')
+        async with self.__lock:
+            i2c_bytes = self.__i2c_bytes()
 
-            self.__channels['FM'].clear()
-            seek_halt = False
-            while (not seek_halt):
-                self.send_cmd(FM_SEEK_START_CMD, FM_SEEK_START_ARG1_SEEKUP)
-                self.__wait_for_STC()
+            # the band's configuration is known, so it's only selected if not already
+            await self.__set_band(band)
 
-                resp = self.send_cmd(FM_TUNE_STATUS_CMD, FM_TUNE_STATUS_ARG1_INTACK)
-                if (resp[1] & FM_TUNE_STATUS_RESP1_VALID):
-                    self.__channels['FM'].append(resp[2]*256 + resp[3])
+            known = self.__channels[band]
+            signals = self.__signals[band]
+            channels = []
+            bottom, top = self.get_band_limits(band)
 
-                if (resp[1] & FM_TUNE_STATUS_RESP1_BLTF):
-                    seek_halt = True
+            def report(freq):
+                if (progress is not None):
+                    progress(min(max((freq - bottom) / (top - bottom), 0), 1), channels)
 
-                # TODO: seek to first valid channel or mute here
-        elif (band == 'AM'):
-            self.__band = ''
-            self.__set_band('AM')
+            if (full or (len(known) == 0)):
+                await self.__seek_range(info, bottom, None, channels, signals, report)
+            else:
+                lo = bottom
+                lost = False
+                for freq in known:
+                    resp = await self.__check_channel(info, freq)
+                    if ((resp[2] & FM_RSQ_STATUS_RESP2_VALID) == 0):
+                        lost = True
+                        continue
 
-            seek_halt = False
-            self.__channels['AM'].clear()
-            while (not seek_halt):
-                self.send_cmd(AM_SEEK_START_CMD, AM_SEEK_START_ARG1_SEEKUP)
-                self.__wait_for_STC()
+                    if (lost):
+                        await self.__seek_range(info, lo, freq, channels, signals, report)
+                        lost = False
+                    channels.append(freq)
+                    signals[freq] = (resp[4], resp[5])
+                    lo = freq
+                    report(freq)
 
-                resp = self.send_cmd(AM_TUNE_STATUS_CMD, AM_TUNE_STATUS_ARG1_INTACK)
-                if (resp[1] & AM_TUNE_STATUS_RESP1_VALID):
-                    self.__channels['AM'].append(resp[2]*256 + resp[3])
+                if (lost):
+                    await self.__seek_range(info, lo, None, channels, signals, report)
 
-                if (resp[1] & AM_TUNE_STATUS_RESP1_BLTF):
-                    seek_halt = True
+            report(top)
 
-                # TODO: seek to first valid channel or mute here
-        else:
-            raise ValueError('Invalid band selected')
+            # only replace the previous channels once the scan of the band completes
+            self.__channels[band] = channels
+            self.__i2c_stats['last_scan'] = self.__i2c_bytes() - i2c_bytes
 
-        return self.get_channels()[band]
+        return channels
 
     # expects freq in the units of 10KHz
-    def tune(self, band, freq):
+    async def tune_async(self, band, freq):
         band = band.upper()
+        info = self.__band_info(band)
 
-        if (band == 'FM'):
-            # this won't perform a power cycle if band is already selected
-            self.__set_band('FM')
+        bottom, top = self.get_band_limits(band)
+        if (freq < bottom or freq > top):
+            raise ValueError('Frequency out of range')
 
-            if (freq < FM_SEEK_BAND_BOTTOM_ITU_2 or freq > FM_SEEK_BAND_TOP_ITU_2):
-                raise ValueError('Frequency out of range')
+        async with self.__lock:
+            i2c_bytes = self.__i2c_bytes()
 
-            self.send_cmd(FM_TUNE_FREQ_CMD, 0, freq >> 8, freq & 0xff, 0)
-            self.__wait_for_STC()
+            # this won't perform a power cycle if band is already selected
+            await self.__set_band(band)
+            resp = await self.__tune_freq(info, freq)
+            self.__signals[band][freq] = (resp[4], resp[5])
 
-            resp = self.send_cmd(FM_TUNE_STATUS_CMD, FM_TUNE_STATUS_ARG1_INTACK)
-        elif (band == 'AM'):
-            self.__set_band('AM')
+            self.__i2c_stats['last_tune'] = self.__i2c_bytes() - i2c_bytes
 
-            if (freq < AM_SEEK_BAND_BOTTOM_ITU_2 or freq > AM_SEEK_BAND_TOP_ITU_2):
-                raise ValueError('Frequency out of range')
+        # return whether station is valid, and the RSSI and SNR
+        return [resp[1] & 1, resp[4], resp[5]]
 
-            self.send_cmd(AM_TUNE_FREQ_CMD, 0, freq >> 8, freq & 0xff, 0, 0)
-            self.__wait_for_STC()
+    # Blocking variants of the above (see '__run'), e.g. for the REPL. From the uasyncio loop,
+    # use the awaitable ones, which yield to the loop while waiting on the device (instead of
+    # blocking it), so e.g. the audio streams and web server keep running during a scan, which
+    # can take minutes.
 
-            resp = self.send_cmd(AM_TUNE_STATUS_CMD, AM_TUNE_STATUS_ARG1_INTACK)
-        else:
-            raise ValueError('Invalid band selected')
+    def scan(self, band, full=False):
+        return self.__run(self.scan_async(band, full=full))
 
-        # return whether station is valid, and the RSSI and SNR
-        return [resp[1] & 1, resp[4], resp[5]]
+    def tune(self, band, freq):
+        return self.__run(self.tune_async(band, freq))
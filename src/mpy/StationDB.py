@@ -0,0 +1,128 @@
+# Persistent database of the stations found by scanning, with their signal quality.
+#
+# The stations are kept on flash in a compact binary file, of a header followed by a fixed-size
+# record per station, which is written in one go whenever the stations change (instead of many
+# small writes). The database has a version, counting the changes made to the stations (and saved
+# with it), so that anything derived from it (e.g. the station list sent to the web app) only has
+# to be rebuilt when the version changes.
+#
+# The signal of a station measured when it's tuned to is only updated in RAM, as tuning is far
+# more frequent than scanning: rewriting the file each time would wear the flash and hold up the
+# event loop. It's written back along with the next change, or by 'flush' (e.g. now and then, see
+# 'HTMLServer.run'). It still counts as a change of the version, so the station list shows it.
+#
+# Written to also run under CPython, so it can be tested on a host (see 'test/host').
+
+try:
+    import ustruct as struct
+except ImportError:
+    import struct
+
+DB_MAGIC = b'PWRS'
+
+# magic, version, number of records
+DB_HEADER = '<4sII'
+DB_HEADER_SIZE = struct.calcsize(DB_HEADER)
+
+# frequency (in units of 10KHz for FM, 1KHz for AM, like Si4730), band, RSSI (dBuV), SNR (dB)
+# and when last seen (by 'time.time()', i.e. seconds since 2000 on MicroPython, or 1970 on a host)
+DB_RECORD = '<HBBBI'
+DB_RECORD_SIZE = struct.calcsize(DB_RECORD)
+
+# bands in the order they're listed
+BANDS = ('FM', 'AM')
+
+class StationDB:
+    def __init__(self, path='stations.db'):
+        self.path = path
+        self.version = 0
+
+        # whether there are signal updates not saved yet (see 'update')
+        self.dirty = False
+
+        # (band, freq) -> [rssi, snr, last seen]
+        self.__stations = {}
+
+        self.load()
+
+    def __len__(self):
+        return len(self.__stations)
+
+    # a missing or corrupt database is treated as an empty one
+    def load(self):
+        try:
+            with open(self.path, 'rb') as db:
+                data = db.read()
+        except OSError:
+            return
+
+        if (len(data) < DB_HEADER_SIZE):
+            return
+        magic, version, count = struct.unpack_from(DB_HEADER, data, 0)
+        if ((magic != DB_MAGIC) or (len(data) != DB_HEADER_SIZE + count * DB_RECORD_SIZE)):
+            return
+
+        stations = {}
+        for i in range(count):
+            freq, band, rssi, snr, seen = struct.unpack_from(DB_RECORD, data,
+                                                             DB_HEADER_SIZE + i * DB_RECORD_SIZE)
+            if (band < len(BANDS)):
+                stations[(BANDS[band], freq)] = [rssi, snr, seen]
+
+        self.version = version
+        self.__stations = stations
+
+    def save(self):
+        stations = self.stations()
+
+        data = bytearray(DB_HEADER_SIZE + len(stations) * DB_RECORD_SIZE)
+        struct.pack_into(DB_HEADER, data, 0, DB_MAGIC, self.version, len(stations))
+        offset = DB_HEADER_SIZE
+        for band, freq, rssi, snr, seen in stations:
+            struct.pack_into(DB_RECORD, data, offset, freq, BANDS.index(band),
+                             min(rssi, 255), min(snr, 255), seen)
+            offset += DB_RECORD_SIZE
+
+        with open(self.path, 'wb') as db:
+            db.write(data)
+        self.dirty = False
+
+    # save the signal updates, if any
+    def flush(self):
+        if (self.dirty):
+            self.save()
+
+    def __changed(self):
+        self.version += 1
+        self.save()
+
+    # the stations as (band, freq, rssi, snr, last seen), by band then frequency
+    def stations(self):
+        return sorted(((band, freq) + tuple(info) for (band, freq), info in self.__stations.items()),
+                      key=lambda station: (BANDS.index(station[0]), station[1]))
+
+    def channels(self, band):
+        return sorted(freq for b, freq in self.__stations if (b == band))
+
+    # Replace the stations of the bands given (e.g. with those found by a scan), as a dict of
+    # band to a list of (freq, rssi, snr), all seen at 'seen'.
+    def set_bands(self, bands, seen):
+        for key in [key for key in self.__stations if (key[0] in bands)]:
+            del self.__stations[key]
+        for band, stations in bands.items():
+            for freq, rssi, snr in stations:
+                self.__stations[(band, freq)] = [rssi, snr, int(seen)]
+
+        self.__changed()
+
+    # Update the signal of a station already in the database (e.g. when tuned to), returning
+    # whether it was. Counted as a change, but only kept in RAM until saved (see 'flush').
+    def update(self, band, freq, rssi, snr, seen):
+        info = self.__stations.get((band, freq))
+        if (info is None):
+            return False
+
+        info[0], info[1], info[2] = rssi, snr, int(seen)
+        self.version += 1
+        self.dirty = True
+        return True
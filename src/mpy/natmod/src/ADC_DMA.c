@@ -1,58 +1,208 @@
 #include "ADC_DMA.h"
-#include "fifo.h"
+#include "ring.h"
+#include "adpcm.h"
+#include "ulaw.h"
+#include "decimate.h"
+#include "capture_ring.h"
 
 // error check the input channel elsewhere
 #define ADC_PIN(adc_chan) (26 + (adc_chan))
 
-// TODO: set these channels based on the helper functions in the Pico SDK ('claim unused')
-#define DMA_CHAN_A 9
-#define DMA_CHAN_B 10
+// the DMA channels claimed by the caller (see 'adc_dma_init'): with DMA_RING_MODE, A captures
+// and B re-triggers it, otherwise they take turns capturing a buffer each
+uint32_t dma_chan_a;
+uint32_t dma_chan_b;
 
-fifo_t *fifos[MAX_FIFOS];
+ring_t ring;
+ring_cursor_t cursors[MAX_LISTENERS];
+
+// the geometry the ring was set up with (see 'adc_dma_init'), and the bytes per block of the ring
+adc_dma_geometry_t geometry;
+uint32_t block_bytes;
+
+// the ring (and capture buffers), allocated by the caller for the geometry (see 'adc_dma_init')
+uint32_t *arena;
 
 uint32_t adc_buf_idx;
 
-// set the buffer as uint16_t type for alignment
-#if BITS_PER_SAMPLE == 8
-#if ((NSAMPLES / 2) * 2) == NSAMPLES
-    uint16_t adc_buf[NBUFS][NSAMPLES/2];
-#else
-    #error NSAMPLES should be divisible by 2
+// time spent in the DMA interrupt, measured with the 1 MHz system timer
+uint32_t irq_count;
+uint32_t irq_us_max;
+uint32_t irq_us_total;
+
+#if DMA_RING_MODE
+#if ADPCM_RING
+    #error DMA_RING_MODE does not support ADPCM_RING
+#elif BITS_PER_SAMPLE != 8
+    #error DMA_RING_MODE only supports BITS_PER_SAMPLE of 8
 #endif
-#elif BITS_PER_SAMPLE == 12
-    uint16_t adc_buf[NBUFS][NSAMPLES];
-#else
+    // the ring goes at the first address within the arena that's aligned to its size
+    capture_ring_t capture;
+
+    // written back into the capture channel's transfer count by the control channel
+    uint32_t capture_reload;
+#elif ADPCM_RING
+#if BITS_PER_SAMPLE != 8
+    #error ADPCM_RING only supports BITS_PER_SAMPLE of 8
+#endif
+    // one capture buffer for each DMA channel at the start of the arena, then the compressed ring
+    uint16_t *adc_buf[2];
+    uint8_t *adpcm_buf;
+    adpcm_state_t adpcm_state;
+
+    // fetched blocks are decoded here, so a fetched buffer is only valid until the next fetch
+    uint16_t decode_buf[MAX_NSAMPLES/2];
+#elif BITS_PER_SAMPLE != 8 && BITS_PER_SAMPLE != 12
     #error Unsupported BITS_PER_SAMPLE (specify 8 or 12)
 #endif
 
-// could use uPythons memory alignment helper functions to allow ring transfers,
-// avoiding the use of interrupts (but still would need it to push buffer pointers
-// to registered FIFOs)
-void dma_handler(void)
+// listeners fetching ADPCM from a PCM ring (or decimated ADPCM from an ADPCM ring) each keep
+// their own encoder state, with blocks encoded here, as are mu-law buffers (which are the larger,
+// at a byte per sample), so a fetched ADPCM or mu-law buffer is only valid until the next fetch
+adpcm_state_t adpcm_states[MAX_LISTENERS];
+uint8_t encode_buf[MAX_NSAMPLES];
+
+// each listener's decimator (a factor of 1 unless set otherwise, see 'adc_dma_set_decimation'),
+// with decimated buffers written here (so, again, only valid until the next fetch)
+#if ((MAX_NSAMPLES / 4) * 4) != MAX_NSAMPLES
+    #error MAX_NSAMPLES should be divisible by 4 (to decimate by up to 4)
+#endif
+decimator_t decimators[MAX_LISTENERS];
+uint16_t decimate_buf[MAX_NSAMPLES/4];
+
+// the block in 'slot' of the ring
+static inline void * ring_block(uint32_t slot)
+{
+    #if DMA_RING_MODE
+        return (void *) capture_ring_block(&capture, slot);
+    #elif ADPCM_RING
+        return adpcm_buf + slot * block_bytes;
+    #else
+        return (uint8_t *) arena + slot * block_bytes;
+    #endif
+}
+
+// bytes of the arena taken by the ring (and capture buffers) for a geometry
+uint32_t adc_dma_arena_bytes(const adc_dma_geometry_t *g)
+{
+    #if DMA_RING_MODE
+        // (wherever the arena is, the ring can be aligned within twice its size)
+        return 2 * g->nbufs * g->nsamples;
+    #elif ADPCM_RING
+        return 2 * g->nsamples * 2 + g->nbufs * ADPCM_BLOCK_BYTES(g->nsamples);
+    #else
+        return g->nbufs * g->nsamples * ((BITS_PER_SAMPLE + 7) / 8);
+    #endif
+}
+
+#if DMA_RING_MODE
+// microseconds the DMA channel takes to write the whole ring of a geometry, for 'capture_ring.h'
+// (the ring being a power of 2 of at least 256 bytes, and a sample taking 48 MHz / sample rate)
+static uint32_t ring_lap_us(const adc_dma_geometry_t *g)
+{
+    return adc_dma_udiv(((g->nbufs * g->nsamples) >> 4) *
+                        adc_dma_udiv(48000000ul, g->sample_rate, NULL), 3, NULL);
+}
+#endif
+
+// Check that a geometry can be captured, returning NULL if so, or what's wrong with it if not.
+const char * adc_dma_check_geometry(const adc_dma_geometry_t *g)
 {
-    if (dma_hw->ints0 & (1 << DMA_CHAN_A))
+    uint32_t rem = 1;
+
+    if (g->sample_rate >= 1000 && g->sample_rate <= 500000)
     {
-        for (int i = 0; i < MAX_FIFOS; i++)
-        {
-            fifo_push(fifos[i], (uint32_t *) adc_buf[(adc_buf_idx - 1) % NBUFS]);
-        }
+        adc_dma_udiv(48000000ul, g->sample_rate, &rem);
+    }
+    if (rem != 0)
+    {
+        return "Sample rate should divide 48 MHz, from 1 kHz to 500 kHz";
+    }
+
+    if (g->nsamples < 64 || g->nsamples > MAX_NSAMPLES || (g->nsamples & 7) != 0)
+    {
+        return "Buffer size should be a multiple of 8 samples, from 64 to 3000";
+    }
 
-        adc_buf_idx = (adc_buf_idx + 1) % NBUFS;
-        dma_hw->ch[DMA_CHAN_A].write_addr = (io_rw_32) adc_buf[adc_buf_idx];
-        dma_hw->ints0 = 1u << DMA_CHAN_A;
+    if (g->nbufs <= RING_GUARD || g->nbufs > ADC_DMA_ARENA_BYTES)
+    {
+        return "Too few buffers in the ring";
     }
-    else if (dma_hw->ints0 & (1 << DMA_CHAN_B))
+
+    if (adc_dma_arena_bytes(g) > ADC_DMA_ARENA_BYTES)
     {
-        for (int i = 0; i < MAX_FIFOS; i++)
+        return "Not enough memory for the ring (see ADC_DMA_ARENA_BYTES)";
+    }
+
+    #if DMA_RING_MODE
+        if ((g->nbufs * g->nsamples) & (g->nbufs * g->nsamples - 1))
+        {
+            return "The ring size should be a power of 2 with DMA_RING_MODE";
+        }
+        if (ring_lap_us(g) >= (1u << 24))
         {
-            fifo_push(fifos[i], (uint32_t *) adc_buf[(adc_buf_idx - 1) % NBUFS]);
+            return "The ring should take under 16 seconds to fill with DMA_RING_MODE";
         }
+    #endif
+
+    return NULL;
+}
+
+const adc_dma_geometry_t * adc_dma_get_geometry(void)
+{
+    return &geometry;
+}
+
+#if !DMA_RING_MODE
+// Publish the buffer that 'dma_chan' just finished, and point the channel to its next buffer
+// (the other channel is already running, having been chained to when this one finished).
+static inline void dma_chan_done(uint32_t dma_chan, uint32_t capture_idx)
+{
+#if ADPCM_RING
+    // takes a couple of ms at 125MHz for 3000 samples, well before this buffer is written to again
+    adpcm_encode_u12(&adpcm_state, adc_buf[capture_idx], geometry.nsamples,
+                     ring_block(ring_head_slot(&ring)));
+    ring_publish(&ring);
 
-        adc_buf_idx = (adc_buf_idx + 1) % NBUFS;
-        dma_hw->ch[DMA_CHAN_B].write_addr = (io_rw_32) adc_buf[adc_buf_idx];
-        dma_hw->ints0 = 1u << DMA_CHAN_B;
+    dma_hw->ch[dma_chan].write_addr = (io_rw_32) adc_buf[capture_idx];
+#else
+    (void) capture_idx;
+
+    ring_publish(&ring);
+
+    adc_buf_idx = (adc_buf_idx + 1 == geometry.nbufs) ? 0 : adc_buf_idx + 1;
+    dma_hw->ch[dma_chan].write_addr = (io_rw_32) ring_block(adc_buf_idx);
+#endif
+    dma_hw->ints0 = 1u << dma_chan;
+}
+
+// (see DMA_RING_MODE for capturing without this interrupt)
+void dma_handler(void)
+{
+    uint32_t start = timer_hw->timerawl;
+
+    if (dma_hw->ints0 & (1 << dma_chan_a))
+    {
+        dma_chan_done(dma_chan_a, 0);
+    }
+    else if (dma_hw->ints0 & (1 << dma_chan_b))
+    {
+        dma_chan_done(dma_chan_b, 1);
     }
+
+    uint32_t elapsed = timer_hw->timerawl - start;
+    irq_count++;
+    irq_us_total += elapsed;
+    if (elapsed > irq_us_max)
+    {
+        irq_us_max = elapsed;
+    }
+
+    // signal that a new buffer is ready, waking the core if it's waiting for an event
+    // (e.g. MicroPython's poll loop, which uasyncio sleeps in until some I/O is ready)
+    __SEV();
 }
+#endif
 
 void adc_io_init(uint32_t adc_pin)
 {
@@ -74,10 +224,10 @@ void adc_init(uint32_t adc_chan)
     adc_hw->fcs |= 1 << ADC_FCS_THRESH_LSB;
     adc_hw->fcs |= 1 << ADC_FCS_OVER_LSB;
     adc_hw->fcs |= 1 << ADC_FCS_UNDER_LSB;
-    if (BITS_PER_SAMPLE == 8)
+    if (ADC_BITS == 8)
         adc_hw->fcs |= 1 << ADC_FCS_SHIFT_LSB;
 
-    adc_hw->div = (48000000ul / SAMPLE_RATE - 1) << ADC_DIV_INT_LSB;
+    adc_hw->div = (adc_dma_udiv(48000000ul, geometry.sample_rate, NULL) - 1) << ADC_DIV_INT_LSB;
 
     while (adc_hw->fcs & ADC_FCS_LEVEL_BITS)
     {
@@ -85,11 +235,56 @@ void adc_init(uint32_t adc_chan)
     }
 }
 
+#if DMA_RING_MODE
+void dma_init(void)
+{
+    uint32_t size = geometry.nbufs * geometry.nsamples;
+    uintptr_t base = ((uintptr_t) arena + size - 1) & ~(uintptr_t) (size - 1);
+    uint32_t ring_bits = 0;
+
+    while ((1u << ring_bits) < size)
+    {
+        ring_bits++;
+    }
+
+    capture_ring_init(&capture, &dma_hw->ch[dma_chan_a].write_addr, base, size,
+                      geometry.nsamples, ring_lap_us(&geometry), timer_hw->timerawl);
+    capture_reload = 0xffffffff;
+
+    // the capture channel writes the ring, wrapping around within it, and chains to the control
+    // channel once its transfer count runs out
+    dma_hw->ch[dma_chan_a].read_addr = (io_rw_32) &(adc_hw->fifo);
+    dma_hw->ch[dma_chan_a].write_addr = (io_rw_32) base;
+    dma_hw->ch[dma_chan_a].transfer_count = capture_reload;
+
+    dma_hw->ch[dma_chan_a].ctrl_trig = 0;
+    dma_hw->ch[dma_chan_a].ctrl_trig |= dma_chan_b << DMA_CH0_CTRL_TRIG_CHAIN_TO_LSB;
+    dma_hw->ch[dma_chan_a].ctrl_trig |= DMA_CH0_CTRL_TRIG_INCR_WRITE_BITS;
+    dma_hw->ch[dma_chan_a].ctrl_trig |= DMA_CH0_CTRL_TRIG_RING_SEL_BITS;
+    dma_hw->ch[dma_chan_a].ctrl_trig |= ring_bits << DMA_CH0_CTRL_TRIG_RING_SIZE_LSB;
+    dma_hw->ch[dma_chan_a].ctrl_trig |= DREQ_ADC << DMA_CH0_CTRL_TRIG_TREQ_SEL_LSB;
+    dma_hw->ch[dma_chan_a].ctrl_trig |= DMA_CH0_CTRL_TRIG_DATA_SIZE_VALUE_SIZE_BYTE << DMA_CH0_CTRL_TRIG_DATA_SIZE_LSB;
+    dma_hw->ch[dma_chan_a].ctrl_trig |= DMA_CH0_CTRL_TRIG_EN_BITS;
+
+    // the control channel writes the count back into the capture channel, re-triggering it
+    // where it left off (its own count of 1 is reloaded each time it's chained to); set up
+    // through the alias that doesn't trigger it, and chained to itself, i.e. to nothing
+    dma_hw->ch[dma_chan_b].read_addr = (io_rw_32) &capture_reload;
+    dma_hw->ch[dma_chan_b].write_addr = (io_rw_32) &dma_hw->ch[dma_chan_a].al1_transfer_count_trig;
+    dma_hw->ch[dma_chan_b].transfer_count = 1;
+
+    dma_hw->ch[dma_chan_b].al1_ctrl = 0;
+    dma_hw->ch[dma_chan_b].al1_ctrl |= dma_chan_b << DMA_CH0_CTRL_TRIG_CHAIN_TO_LSB;
+    dma_hw->ch[dma_chan_b].al1_ctrl |= DMA_CH0_CTRL_TRIG_TREQ_SEL_VALUE_PERMANENT << DMA_CH0_CTRL_TRIG_TREQ_SEL_LSB;
+    dma_hw->ch[dma_chan_b].al1_ctrl |= DMA_CH0_CTRL_TRIG_DATA_SIZE_VALUE_SIZE_WORD << DMA_CH0_CTRL_TRIG_DATA_SIZE_LSB;
+    dma_hw->ch[dma_chan_b].al1_ctrl |= DMA_CH0_CTRL_TRIG_EN_BITS;
+}
+#else
 void adc_dma_chan_init(uint32_t dma_chan, uint32_t dma_chainto_chan, void *p_buf)
 {
     dma_hw->ch[dma_chan].read_addr = (io_rw_32) &(adc_hw->fifo);
     dma_hw->ch[dma_chan].write_addr = (io_rw_32) p_buf;
-    dma_hw->ch[dma_chan].transfer_count = NSAMPLES;
+    dma_hw->ch[dma_chan].transfer_count = geometry.nsamples;
 
     dma_hw->inte0 |= 1u << dma_chan;
 
@@ -98,9 +293,9 @@ void adc_dma_chan_init(uint32_t dma_chan, uint32_t dma_chainto_chan, void *p_buf
     dma_hw->ch[dma_chan].ctrl_trig |= dma_chainto_chan << DMA_CH0_CTRL_TRIG_CHAIN_TO_LSB;
     dma_hw->ch[dma_chan].ctrl_trig |= DMA_CH0_CTRL_TRIG_INCR_WRITE_BITS;
     dma_hw->ch[dma_chan].ctrl_trig |= DREQ_ADC << DMA_CH0_CTRL_TRIG_TREQ_SEL_LSB;
-    #if BITS_PER_SAMPLE == 8
+    #if ADC_BITS == 8
         dma_hw->ch[dma_chan].ctrl_trig |= DMA_CH0_CTRL_TRIG_DATA_SIZE_VALUE_SIZE_BYTE << DMA_CH0_CTRL_TRIG_DATA_SIZE_LSB;
-    #elif BITS_PER_SAMPLE == 12
+    #elif ADC_BITS == 12
         dma_hw->ch[dma_chan].ctrl_trig |= DMA_CH0_CTRL_TRIG_DATA_SIZE_VALUE_SIZE_HALFWORD << DMA_CH0_CTRL_TRIG_DATA_SIZE_LSB;
     #endif
     dma_hw->ch[dma_chan].ctrl_trig |= DMA_CH0_CTRL_TRIG_EN_BITS;
@@ -108,21 +303,58 @@ void adc_dma_chan_init(uint32_t dma_chan, uint32_t dma_chainto_chan, void *p_buf
 
 void dma_init(void)
 {
-    adc_buf_idx = 0;
-
-    adc_dma_chan_init(DMA_CHAN_A, DMA_CHAN_B, adc_buf[adc_buf_idx]);
-    adc_dma_chan_init(DMA_CHAN_B, DMA_CHAN_A, adc_buf[++adc_buf_idx]);
+    #if ADPCM_RING
+        adc_dma_chan_init(dma_chan_a, dma_chan_b, adc_buf[0]);
+        adc_dma_chan_init(dma_chan_b, dma_chan_a, adc_buf[1]);
+    #else
+        adc_buf_idx = 1;
+        adc_dma_chan_init(dma_chan_a, dma_chan_b, ring_block(0));
+        adc_dma_chan_init(dma_chan_b, dma_chan_a, ring_block(1));
+    #endif
 
     // may interfere with other modules built for MicroPython
     NVIC_SetVector(DMA_IRQ_0_IRQn, (uint32_t) dma_handler);
     NVIC_EnableIRQ(DMA_IRQ_0_IRQn);
 }
+#endif
+
+// publish the buffers captured since last time, where there's no interrupt doing it
+// (with DMA_RING_MODE; cheap enough to call whenever a listener looks for a buffer)
+static inline void capture_update(void)
+{
+    #if DMA_RING_MODE
+        capture_ring_update(&capture, &ring, timer_hw->timerawl);
+    #endif
+}
 
-void adc_dma_init(uint32_t adc_chan)
+// 'dma_chan_a' and 'dma_chan_b' should be claimed by the caller, and different, the geometry
+// checked with 'adc_dma_check_geometry', and 'arena_in' word-aligned, of 'adc_dma_arena_bytes'
+// for the geometry, and kept for as long as the capture runs (error check them elsewhere)
+void adc_dma_init(uint32_t adc_chan, uint32_t dma_chan_a_in, uint32_t dma_chan_b_in,
+                  const adc_dma_geometry_t *geometry_in, void *arena_in)
 {
-    for (int i = 0; i < MAX_FIFOS; i++)
+    dma_chan_a = dma_chan_a_in;
+    dma_chan_b = dma_chan_b_in;
+    geometry = *geometry_in;
+    arena = arena_in;
+
+    #if ADPCM_RING
+        adc_buf[0] = (uint16_t *) arena;
+        adc_buf[1] = adc_buf[0] + geometry.nsamples;
+        adpcm_buf = (uint8_t *) (adc_buf[1] + geometry.nsamples);
+        block_bytes = ADPCM_BLOCK_BYTES(geometry.nsamples);
+        adpcm_init(&adpcm_state);
+    #else
+        block_bytes = geometry.nsamples * ((BITS_PER_SAMPLE + 7) / 8);
+    #endif
+
+    ring_init(&ring, geometry.nbufs, geometry.nbufs - RING_GUARD);
+    irq_count = 0;
+    irq_us_max = 0;
+    irq_us_total = 0;
+    for (int i = 0; i < MAX_LISTENERS; i++)
     {
-        fifos[i] = fifo_create(NBUFS);
+        ring_cursor_close(&cursors[i]);
     }
 
     adc_init(adc_chan);
@@ -134,13 +366,232 @@ void adc_dma_start(void)
     adc_hw->cs |= ADC_CS_START_MANY_BITS;
 }
 
+// register a new listener on the ring, returning its ID (or -1 if there's no room left)
+int32_t adc_dma_open(void)
+{
+    for (int i = 0; i < MAX_LISTENERS; i++)
+    {
+        if (!cursors[i].active)
+        {
+            // (the listener starts at the live edge, so what's been captured is published first)
+            capture_update();
+            ring_cursor_open(&ring, &cursors[i]);
+            adpcm_init(&adpcm_states[i]);
+            decimate_init(&decimators[i], 1);
+            return i;
+        }
+    }
+
+    return -1;
+}
+
+void adc_dma_close(uint32_t listener_id)
+{
+    if (listener_id < MAX_LISTENERS)
+    {
+        ring_cursor_close(&cursors[listener_id]);
+    }
+}
+
+bool adc_dma_is_open(uint32_t listener_id)
+{
+    return (listener_id < MAX_LISTENERS) && cursors[listener_id].active;
+}
+
+// Serve the listener at 1/factor of the sample rate from its next fetch on, with 'factor'
+// being 1, 2 or 4 (see 'decimate.h'); returns false if the factor isn't supported.
+bool adc_dma_set_decimation(uint32_t listener_id, uint32_t factor)
+{
+    if (!adc_dma_is_open(listener_id))
+    {
+        return false;
+    }
+
+    #if BITS_PER_SAMPLE != 8
+        if (factor != 1)
+        {
+            return false;
+        }
+    #endif
+
+    // the filter starts over from silence: a click at most, along with the change of rate
+    return decimate_init(&decimators[listener_id], factor);
+}
+
+#if BITS_PER_SAMPLE == 8
+// the 8-bit samples of the buffer in 'slot', decimated for the listener if need be, with the
+// number of samples in '*nsamples'
+static uint8_t * get_samples_u8(uint32_t listener_id, uint32_t slot, uint32_t *nsamples)
+{
+    uint8_t *samples;
+
+    #if ADPCM_RING
+        adpcm_decode_u8(ring_block(slot), geometry.nsamples, (uint8_t *) decode_buf);
+        samples = (uint8_t *) decode_buf;
+    #else
+        samples = ring_block(slot);
+    #endif
+
+    if (decimators[listener_id].factor == 1)
+    {
+        *nsamples = geometry.nsamples;
+        return samples;
+    }
+
+    *nsamples = decimate_u8(&decimators[listener_id], samples, geometry.nsamples,
+                            (uint8_t *) decimate_buf);
+    return (uint8_t *) decimate_buf;
+}
+#endif
+
 // non-blocking buffer acquisition (to work with uPython asyncio)
-uint16_t * adc_dma_get_buf(uint32_t fifo_id)
+// the buffer holds nsamples / factor samples (see 'adc_dma_set_decimation')
+uint16_t * adc_dma_get_buf(uint32_t listener_id)
+{
+    uint32_t slot;
+
+    if (!adc_dma_is_open(listener_id))
+    {
+        return NULL;
+    }
+
+    capture_update();
+    if (!ring_next(&ring, &cursors[listener_id], &slot))
+    {
+        return NULL;
+    }
+
+    #if BITS_PER_SAMPLE == 8
+        uint32_t nsamples;
+        return (uint16_t *) get_samples_u8(listener_id, slot, &nsamples);
+    #else
+        return ring_block(slot);
+    #endif
+}
+
+// same as above, but gets the buffer as an ADPCM block (see 'adpcm.h') for low-bandwidth streams
+uint8_t * adc_dma_get_adpcm(uint32_t listener_id)
 {
-    if (fifo_id >= MAX_FIFOS)
+    uint32_t slot;
+
+    if (!adc_dma_is_open(listener_id))
+    {
+        return NULL;
+    }
+
+    capture_update();
+    if (!ring_next(&ring, &cursors[listener_id], &slot))
     {
         return NULL;
     }
 
-    return (uint16_t *) fifo_pop(fifos[fifo_id]);
+    #if BITS_PER_SAMPLE == 8
+        uint32_t nsamples;
+
+        #if ADPCM_RING
+            if (decimators[listener_id].factor == 1)
+            {
+                return ring_block(slot);
+            }
+        #endif
+
+        uint8_t *samples = get_samples_u8(listener_id, slot, &nsamples);
+        adpcm_encode_u8(&adpcm_states[listener_id], samples, nsamples, encode_buf);
+        return encode_buf;
+    #else
+        adpcm_encode_u12(&adpcm_states[listener_id], ring_block(slot), geometry.nsamples,
+                         encode_buf);
+        return encode_buf;
+    #endif
+}
+
+// same as above, but gets the buffer as mu-law (see 'ulaw.h'), companded from the 12-bit samples
+// if the ring holds them (with BITS_PER_SAMPLE at 12), or else from the 8-bit samples
+uint8_t * adc_dma_get_ulaw(uint32_t listener_id)
+{
+    uint32_t slot;
+
+    if (!adc_dma_is_open(listener_id))
+    {
+        return NULL;
+    }
+
+    capture_update();
+    if (!ring_next(&ring, &cursors[listener_id], &slot))
+    {
+        return NULL;
+    }
+
+    #if BITS_PER_SAMPLE == 8
+        uint32_t nsamples;
+        uint8_t *samples = get_samples_u8(listener_id, slot, &nsamples);
+        ulaw_encode_u8(samples, nsamples, encode_buf);
+    #else
+        ulaw_encode_u12(ring_block(slot), geometry.nsamples, encode_buf);
+    #endif
+
+    return encode_buf;
+}
+
+// number of buffers waiting to be fetched by the listener (cheap enough to call when polling)
+uint32_t adc_dma_pending(uint32_t listener_id)
+{
+    if (!adc_dma_is_open(listener_id))
+    {
+        return 0;
+    }
+
+    capture_update();
+    return ring_pending(&ring, &cursors[listener_id]);
+}
+
+// skip the listener ahead to the newest 'keep' buffers (see 'ring_skip'), returning how many
+// buffers were skipped
+uint32_t adc_dma_skip(uint32_t listener_id, uint32_t keep)
+{
+    if (!adc_dma_is_open(listener_id))
+    {
+        return 0;
+    }
+
+    capture_update();
+    return ring_skip(&ring, &cursors[listener_id], keep);
+}
+
+uint32_t adc_dma_drops(uint32_t listener_id)
+{
+    if (!adc_dma_is_open(listener_id))
+    {
+        return 0;
+    }
+
+    return cursors[listener_id].drops;
+}
+
+// most buffers the listener has had waiting, i.e. how close it has come to dropping some
+uint32_t adc_dma_depth_max(uint32_t listener_id)
+{
+    if (!adc_dma_is_open(listener_id))
+    {
+        return 0;
+    }
+
+    return cursors[listener_id].depth_max;
+}
+
+// Copy out the counters. Each has a single writer, so reading them needs no locking:
+//   - the buffers produced ('ring.head'): the DMA interrupt, or with DMA_RING_MODE the
+//     listeners' thread (MicroPython's), in 'capture_update',
+//   - the drops and max. depth: the listeners, as they fetch buffers (in MicroPython's thread),
+//   - the interrupt count and time: the DMA interrupt (they stay 0 with DMA_RING_MODE).
+void adc_dma_get_stats(adc_dma_stats_t *stats)
+{
+    capture_update();
+
+    stats->produced = ring.head;
+    stats->drops = ring.drops;
+    stats->depth_max = ring.depth_max;
+    stats->irqs = irq_count;
+    stats->irq_us_max = irq_us_max;
+    stats->irq_us_total = irq_us_total;
 }
@@ -14,41 +14,196 @@
     module is built using the register macros/structs (wrangled from the SDK by a custom utility),
     as mentioned in the RP2040 datasheet and the Pico C/C++ SDK manual.
 
-    Note that total BSS memory used will be: NBUFS * NSAMPLES * ceil(BITS_PER_SAMPLE / 8).
-    The default configuration here uses 48K (!) of memory to store about 1.6 seconds of audio.
-
-    TODO: Until a way of doing real-time compression (MP3 or otherwise) is devised, maybe
-          store the audio in memory using ADPCM. Note that it seems ADPCM-WAV files aren't
-          supported in any browser, so we would need to decompress a buffer that is retrieved
-          from a FIFO holding ADPCM data.
+    The sample rate, the number of samples per buffer and the number of buffers in the ring are
+    chosen at run time (see 'adc_dma_geometry_t'), along with the arena of memory the ring is kept
+    in, which the caller allocates for the geometry (from the MicroPython heap, see 'WAVBuffer.init')
+    and which is only as big as the ring needs ('adc_dma_arena_bytes'), up to ADC_DMA_ARENA_BYTES:
+    nbufs * nsamples * ceil(BITS_PER_SAMPLE / 8) bytes. The default geometry takes 48K (!) to store
+    about 1.6 seconds of audio, in buffers of 100 ms; shorter buffers cut the latency (a buffer is
+    only sent once it's complete), at the cost of more interrupts, and more buffers to send, per
+    second, and a shallower ring leaves the rest of the memory to the heap.
+
+    The buffers form a single ring shared by all listeners (see 'ring.h'), where each listener
+    only keeps a read cursor into the ring. That way the DMA interrupt does the same amount of
+    work no matter how many listeners there are, and buffers are never copied.
+
+    Until a way of doing real-time compression (MP3 or otherwise) is devised, the ring can
+    optionally be stored in memory as 4-bit IMA-ADPCM (see ADPCM_RING below). Note that it seems
+    ADPCM-WAV files aren't supported in any browser, so buffers are decompressed when fetched.
+    In this mode, audio is captured at 12 bits into 2 DMA buffers, and each one is encoded into
+    the ring when finished, so the arena holds instead:
+        nbufs * (4 + nsamples / 2) + 2 * nsamples * 2
+    e.g. with nbufs set to 23, the same 48K holds about 2.3 seconds of audio from a 12-bit source
+    (plus 1.5K of decode buffer), nearly 3 times what it would hold as 12-bit PCM.
+
+    Each listener can also be served at half or a quarter of the sample rate (see
+    'adc_dma_set_decimation' and 'decimate.h'), e.g. for a listener on a slow link. Buffers are
+    then decimated (and encoded, if fetched as ADPCM) when fetched, into a buffer shared by all
+    listeners, which adds MAX_NSAMPLES / 4 bytes (plus 56 bytes of filter state per listener, and
+    an encode buffer of MAX_NSAMPLES bytes, for ADPCM or mu-law). This is only supported with
+    BITS_PER_SAMPLE at 8.
+
+    Buffers can also be fetched as mu-law (see 'ulaw.h'), which only improves on 8-bit PCM when
+    the ring holds 12-bit samples (BITS_PER_SAMPLE at 12, without ADPCM_RING): it's then as good
+    as 8-bit PCM from about half of full scale down, and much better on quieter audio, but in as
+    many bytes as 8-bit PCM. Fetched as ADPCM, buffers take half the bytes of 8-bit PCM, but
+    (whatever the ring holds) at a lower quality than it on all but quiet audio, so neither makes
+    a smaller stream at the quality of 8-bit PCM (see 'test/natmod/adpcm_test.c').
+
+    Alternatively, audio can be captured without any interrupt (see DMA_RING_MODE below and
+    'capture_ring.h'): a single DMA channel writes the whole ring, wrapping around within it, and
+    re-triggers itself through a second channel, while listeners work out the buffers completed
+    from where it's writing (and from the time, for any whole laps of the ring gone by unseen).
+    This needs the ring aligned to its size (a power of 2 up to 32K), which a heap allocation
+    isn't, so the arena is twice the size of the ring, which is placed within it at an address
+    that is (e.g. the default 16K ring of 0.55 seconds of audio, in 32K).
+
+    The 2 DMA channels used are given to 'adc_dma_init' (claimed by the caller, e.g. with
+    'rp2.DMA' in MicroPython).
 
 *******/
 
 #ifndef __ADC_DMA_H__
 #define __ADC_DMA_H__
 
+#include <stdbool.h>
+
 #include "RP2040_structs.h"
 #include "RP2040_regs.h"   // needed for DREQ constants, or just include "hardware/regs/dreq.h"
 
 #define ADC_NCHANS 4
+#define DMA_NCHANS 12
+
+// set to 1 to store the ring as ADPCM (served as 8-bit PCM, so keep BITS_PER_SAMPLE at 8)
+#define ADPCM_RING 0
+
+// set to 1 to capture with DMA ring mode instead of the DMA interrupt (8-bit PCM only)
+#define DMA_RING_MODE 0
 
-// make sure sample rate divides 48MHz, otherwise actual sample rate will be different
-#define SAMPLE_RATE 30000
 #define NCHANNELS 1
 #define BITS_PER_SAMPLE 8
 
-#define NSAMPLES 3000
+// the most memory the ring (and capture buffers) may take, whatever its geometry (see
+// 'adc_dma_geometry_t'), e.g. 2.4 seconds of 8-bit PCM at 30 kHz
+#define ADC_DMA_ARENA_BYTES 72000
+
+// the default geometry, used unless another is given to 'adc_dma_init'
+#define DEFAULT_SAMPLE_RATE 30000
+#if DMA_RING_MODE
+    // nbufs * nsamples bytes should be a power of 2 (up to 32K) for the DMA to wrap
+    #define DEFAULT_NSAMPLES 1024
+#else
+    #define DEFAULT_NSAMPLES 3000
+#endif
+#define DEFAULT_NBUFS 16
+
+// the largest buffer allowed, which sizes the (fixed) decode, decimate and encode buffers
+#define MAX_NSAMPLES 3000
+
+// max. number of listeners reading from the shared ring of audio blocks at once
+#define MAX_LISTENERS 4
+
+#if DMA_RING_MODE
+    #define ADC_BITS BITS_PER_SAMPLE
+
+    // number of ring blocks that a listener can't read from: the block the DMA channel is
+    // writing into (found out when the listener fetches, see 'capture_ring.h'), and 1 block to
+    // give a listener time to send out its last fetched block
+    #define RING_GUARD 2
+#elif ADPCM_RING
+    // bits per sample acquired from the ADC
+    #define ADC_BITS 12
+
+    // number of ring blocks that a listener can't read from: the block written by the
+    // next interrupt, and 2 blocks to give a listener time to send out its last fetched
+    // block (which is handed out straight from the ring when fetched as ADPCM)
+    #define RING_GUARD 3
+#else
+    #define ADC_BITS BITS_PER_SAMPLE
+
+    // number of ring blocks that a listener can't read from: the 2 blocks the DMA channels are
+    // writing into, and 1 block to give a listener time to send out its last fetched block
+    #define RING_GUARD 3
+#endif
+
+// the geometry of the capture, checked with 'adc_dma_check_geometry'
+typedef struct adc_dma_geometry_struct
+{
+    uint32_t sample_rate;     // samples per second (should divide 48 MHz, the ADC's clock)
+    uint32_t nsamples;        // samples per buffer (a multiple of 8, up to MAX_NSAMPLES)
+    uint32_t nbufs;           // buffers in the ring (more than RING_GUARD)
+} adc_dma_geometry_t;
+
+// counters of the acquisition, for monitoring (see 'adc_dma_get_stats')
+typedef struct adc_dma_stats_struct
+{
+    uint32_t produced;        // buffers published to the ring (wraps around, see 'ring.h')
+    uint32_t drops;           // buffers dropped by listeners falling behind (all of them, so far)
+    uint32_t depth_max;       // most buffers any listener has had waiting
+    uint32_t irqs;            // DMA interrupts handled (none with DMA_RING_MODE)
+    uint32_t irq_us_max;      // longest time spent in the DMA interrupt (in us)
+    uint32_t irq_us_total;    // total time spent in the DMA interrupt (in us, wraps around)
+} adc_dma_stats_t;
+
+// 'n' divided by 'd' (non-zero, up to 2^31) by binary long division ('__aeabi_uidiv' isn't
+// available to MicroPython native modules), with the remainder in '*rem' if not NULL; for setting
+// up, not for the hot paths
+static inline uint32_t adc_dma_udiv(uint32_t n, uint32_t d, uint32_t *rem)
+{
+    uint32_t q = 0;
+    uint32_t r = 0;
+
+    for (int i = 31; i >= 0; i--)
+    {
+        r = (r << 1) | ((n >> i) & 1);
+        if (r >= d)
+        {
+            r -= d;
+            q |= 1u << i;
+        }
+    }
+
+    if (rem)
+    {
+        *rem = r;
+    }
+
+    return q;
+}
+
+const char * adc_dma_check_geometry(const adc_dma_geometry_t *geometry);
+
+uint32_t adc_dma_arena_bytes(const adc_dma_geometry_t *geometry);
+
+const adc_dma_geometry_t * adc_dma_get_geometry(void);
+
+void adc_dma_init(uint32_t adc_chan, uint32_t dma_chan_a, uint32_t dma_chan_b,
+                  const adc_dma_geometry_t *geometry, void *arena);
 
-// TODO: allow non power-of-2 buffer sizes in the FIFO
-#define NBUFS 16
+void adc_dma_start(void);
 
-// TODO: investigate how to make more than 1 audio stream on the server work without hiccups
-#define MAX_FIFOS 1
+int32_t adc_dma_open(void);
 
-void adc_dma_init(uint32_t adc_chan);
+void adc_dma_close(uint32_t listener_id);
 
-void adc_dma_start(void);
+bool adc_dma_is_open(uint32_t listener_id);
+
+uint16_t * adc_dma_get_buf(uint32_t listener_id);
+
+uint8_t * adc_dma_get_adpcm(uint32_t listener_id);
+
+uint8_t * adc_dma_get_ulaw(uint32_t listener_id);
+
+bool adc_dma_set_decimation(uint32_t listener_id, uint32_t factor);
+
+uint32_t adc_dma_pending(uint32_t listener_id);
+
+uint32_t adc_dma_skip(uint32_t listener_id, uint32_t keep);
+
+uint32_t adc_dma_drops(uint32_t listener_id);
+
+uint32_t adc_dma_depth_max(uint32_t listener_id);
 
-uint16_t * adc_dma_get_buf(uint32_t fifo_id);
+void adc_dma_get_stats(adc_dma_stats_t *stats);
 
 #endif
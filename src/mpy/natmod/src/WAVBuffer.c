@@ -7,7 +7,9 @@
 
 // Include the header file to get access to the MicroPython API
 #include "py/dynruntime.h"
+#include "py/mperrno.h"
 #include "ADC_DMA.h"
+#include "adpcm.h"
 
 // for memcpy
 #include <string.h>
@@ -30,50 +32,265 @@ typedef struct wav_header_struct
     uint32_t  Subchunk2Size;
 } wav_header_t;
 
-wav_header_t wav_header;
+// WAV format tags for the formats a listener can fetch buffers in
+#define FORMAT_PCM 0x0001
+#define FORMAT_IMA_ADPCM 0x0011
+#define FORMAT_MULAW 0x0007
+
+// the IMA-ADPCM format has a couple of extra fields in the 'fmt ' chunk
+typedef struct wav_adpcm_header_struct
+{
+    char      ChunkID[4];
+    uint32_t  ChunkSize;
+    char      Format[4];
+    char      Subchunk1ID[4];
+    uint32_t  Subchunk1Size;
+    uint16_t  AudioFormat;
+    uint16_t  NumChannels;
+    uint32_t  SampleRate;
+    uint32_t  ByteRate;
+    uint16_t  BlockAlign;
+    uint16_t  BitsPerSample;
+    uint16_t  ExtraParamSize;
+    uint16_t  SamplesPerBlock;
+    char      Subchunk2ID[4];
+    uint32_t  Subchunk2Size;
+} wav_adpcm_header_t;
+
+// as do the other formats that aren't PCM, if only to say there are none (packed, as the field
+// would otherwise be padded to the alignment of the 'data' chunk's size)
+typedef struct wav_ulaw_header_struct
+{
+    char      ChunkID[4];
+    uint32_t  ChunkSize;
+    char      Format[4];
+    char      Subchunk1ID[4];
+    uint32_t  Subchunk1Size;
+    uint16_t  AudioFormat;
+    uint16_t  NumChannels;
+    uint32_t  SampleRate;
+    uint32_t  ByteRate;
+    uint16_t  BlockAlign;
+    uint16_t  BitsPerSample;
+    uint16_t  ExtraParamSize;
+    char      Subchunk2ID[4];
+    uint32_t  Subchunk2Size;
+} __attribute__((packed)) wav_ulaw_header_t;
+
+// a listener can be served at 1/factor of the sample rate (see 'set_decimation'), for each
+// factor of 1 << tier
+#define NTIERS 3
+
+wav_header_t wav_headers[NTIERS];
+wav_adpcm_header_t wav_adpcm_headers[NTIERS];
+wav_ulaw_header_t wav_ulaw_headers[NTIERS];
+
+// the arena the ring is kept in (see 'adc_dma_init'), allocated from the heap by 'init' for the
+// geometry, and held (as a bytearray) in a list in the module's globals ('_arena'), so that the
+// GC sees it's in use for as long as the capture runs
+mp_obj_t arena_holder;
+
+uint16_t listener_formats[MAX_LISTENERS];
+uint16_t listener_tiers[MAX_LISTENERS];
+
+// the tier for a decimation factor, or -1 if there's none
+static int factor_tier(mp_int_t factor)
+{
+    for (int tier = 0; tier < NTIERS; tier++)
+    {
+        if (factor == (1 << tier))
+        {
+            return tier;
+        }
+    }
+
+    return -1;
+}
 
 // TODO: Create an endian-independent header initializer.
-void wav_header_init(void)
+void wav_header_init(wav_header_t *header, const adc_dma_geometry_t *geometry, int tier)
 {
-    memcpy(wav_header.ChunkID, "RIFF", 4);
-    wav_header.ChunkSize = 0xffffffff; // max size to indicate endless stream
-    memcpy(wav_header.Format, "WAVE", 4);
+    uint32_t sample_rate = geometry->sample_rate >> tier;
 
-    memcpy(wav_header.Subchunk1ID, "fmt ", 4);
-    wav_header.Subchunk1Size = 16; // PCM
-    wav_header.AudioFormat = 1;    // PCM
-    wav_header.NumChannels = NCHANNELS;
-    wav_header.SampleRate = SAMPLE_RATE;
-    wav_header.ByteRate = SAMPLE_RATE * NCHANNELS * (BITS_PER_SAMPLE / 8);
-    wav_header.BlockAlign = NCHANNELS * (BITS_PER_SAMPLE / 8);
-    wav_header.BitsPerSample = BITS_PER_SAMPLE;
+    memcpy(header->ChunkID, "RIFF", 4);
+    header->ChunkSize = 0xffffffff; // max size to indicate endless stream
+    memcpy(header->Format, "WAVE", 4);
 
-    memcpy(wav_header.Subchunk2ID, "data", 4);
-    wav_header.Subchunk2Size = 0xffffffff; // max size to indicate endless stream
+    memcpy(header->Subchunk1ID, "fmt ", 4);
+    header->Subchunk1Size = 16; // PCM
+    header->AudioFormat = 1;    // PCM
+    header->NumChannels = NCHANNELS;
+    header->SampleRate = sample_rate;
+    header->ByteRate = sample_rate * NCHANNELS * (BITS_PER_SAMPLE / 8);
+    header->BlockAlign = NCHANNELS * (BITS_PER_SAMPLE / 8);
+    header->BitsPerSample = BITS_PER_SAMPLE;
+
+    memcpy(header->Subchunk2ID, "data", 4);
+    header->Subchunk2Size = 0xffffffff; // max size to indicate endless stream
+}
+
+// Standard IMA-ADPCM decoders take the 16-bit sample in each block header as the first
+// sample of the block, whereas here it's the decoder state before the first sample (i.e. the
+// last sample of the previous block). Standard decoders will work but output 1 extra sample
+// per block, while the web client skips it.
+void wav_adpcm_header_init(wav_adpcm_header_t *header, const adc_dma_geometry_t *geometry,
+                           int tier)
+{
+    uint32_t sample_rate = geometry->sample_rate >> tier;
+    uint32_t nsamples = geometry->nsamples >> tier;
+
+    memcpy(header->ChunkID, "RIFF", 4);
+    header->ChunkSize = 0xffffffff;
+    memcpy(header->Format, "WAVE", 4);
+
+    memcpy(header->Subchunk1ID, "fmt ", 4);
+    header->Subchunk1Size = 20;
+    header->AudioFormat = FORMAT_IMA_ADPCM;
+    header->NumChannels = NCHANNELS;
+    header->SampleRate = sample_rate;
+    header->ByteRate = adc_dma_udiv(geometry->sample_rate * ADPCM_BLOCK_BYTES(nsamples),
+                                    geometry->nsamples, NULL);
+    header->BlockAlign = ADPCM_BLOCK_BYTES(nsamples);
+    header->BitsPerSample = 4;
+    header->ExtraParamSize = 2;
+    header->SamplesPerBlock = nsamples + 1;
+
+    memcpy(header->Subchunk2ID, "data", 4);
+    header->Subchunk2Size = 0xffffffff;
 }
 
+// mu-law streams are always 8 bits per sample (see 'ulaw.h'), whatever BITS_PER_SAMPLE
+void wav_ulaw_header_init(wav_ulaw_header_t *header, const adc_dma_geometry_t *geometry, int tier)
+{
+    uint32_t sample_rate = geometry->sample_rate >> tier;
+
+    memcpy(header->ChunkID, "RIFF", 4);
+    header->ChunkSize = 0xffffffff;
+    memcpy(header->Format, "WAVE", 4);
+
+    memcpy(header->Subchunk1ID, "fmt ", 4);
+    header->Subchunk1Size = 18;
+    header->AudioFormat = FORMAT_MULAW;
+    header->NumChannels = NCHANNELS;
+    header->SampleRate = sample_rate;
+    header->ByteRate = sample_rate * NCHANNELS;
+    header->BlockAlign = NCHANNELS;
+    header->BitsPerSample = 8;
+    header->ExtraParamSize = 0;
 
-STATIC mp_obj_t header(void)
+    memcpy(header->Subchunk2ID, "data", 4);
+    header->Subchunk2Size = 0xffffffff;
+}
+
+// get the WAV header for a stream in the given format (8-bit PCM if not given), at 1/factor of
+// the sample rate (see 'set_decimation')
+STATIC mp_obj_t header(size_t n_args, const mp_obj_t *args)
 {
-    return mp_obj_new_bytearray_by_ref(sizeof(wav_header_t), &wav_header);
+    mp_int_t format = (n_args > 0) ? mp_obj_get_int(args[0]) : FORMAT_PCM;
+    int tier = factor_tier((n_args > 1) ? mp_obj_get_int(args[1]) : 1);
+
+    if (tier < 0)
+    {
+        mp_raise_ValueError(MP_ERROR_TEXT("Unsupported decimation factor"));
+    }
+
+    if (format == FORMAT_PCM)
+    {
+        return mp_obj_new_bytearray_by_ref(sizeof(wav_header_t), &wav_headers[tier]);
+    }
+    else if (format == FORMAT_IMA_ADPCM)
+    {
+        return mp_obj_new_bytearray_by_ref(sizeof(wav_adpcm_header_t), &wav_adpcm_headers[tier]);
+    }
+    else if (format == FORMAT_MULAW)
+    {
+        return mp_obj_new_bytearray_by_ref(sizeof(wav_ulaw_header_t), &wav_ulaw_headers[tier]);
+    }
+
+    mp_raise_ValueError(MP_ERROR_TEXT("Unsupported format"));
 }
-STATIC MP_DEFINE_CONST_FUN_OBJ_0(header_obj, header);
+STATIC MP_DEFINE_CONST_FUN_OBJ_VAR_BETWEEN(header_obj, 0, 2, header);
 
 
-STATIC mp_obj_t init(mp_obj_t adc_chan_in)
+// Start acquiring from the given ADC channel, with the 2 DMA channels given (claimed by the
+// caller, e.g. with 'rp2.DMA'; both or neither), or channels 9 and 10 if not given, and
+// optionally at the given sample rate, samples per buffer and number of buffers in the ring
+// (see 'adc_dma_geometry_t'), e.g. to trade latency for overhead (see 'AUDIO_PROFILES' in
+// 'PicoWebRadio.py'). The ring takes only the memory its geometry needs from the heap.
+STATIC mp_obj_t init(size_t n_args, const mp_obj_t *args)
 {
-    mp_int_t adc_chan = mp_obj_get_int(adc_chan_in);
+    mp_int_t adc_chan = mp_obj_get_int(args[0]);
     if (adc_chan < 0 || adc_chan >= ADC_NCHANS)
     {
         mp_raise_ValueError(MP_ERROR_TEXT("No such ADC channel: choose between 0 to 3"));
     }
 
-    wav_header_init();
-    adc_dma_init(adc_chan);
+    // (a lone channel would otherwise be ignored, silently capturing through channels 9 and 10)
+    if (n_args == 2)
+    {
+        mp_raise_ValueError(MP_ERROR_TEXT("Give 2 different DMA channels between 0 and 11"));
+    }
+
+    mp_int_t dma_chan_a = (n_args > 2) ? mp_obj_get_int(args[1]) : 9;
+    mp_int_t dma_chan_b = (n_args > 2) ? mp_obj_get_int(args[2]) : 10;
+    if (dma_chan_a < 0 || dma_chan_a >= DMA_NCHANS || dma_chan_b < 0 || dma_chan_b >= DMA_NCHANS ||
+        dma_chan_a == dma_chan_b)
+    {
+        mp_raise_ValueError(MP_ERROR_TEXT("Give 2 different DMA channels between 0 and 11"));
+    }
+
+    adc_dma_geometry_t geometry = {DEFAULT_SAMPLE_RATE, DEFAULT_NSAMPLES, DEFAULT_NBUFS};
+    uint32_t *fields[3] = {&geometry.sample_rate, &geometry.nsamples, &geometry.nbufs};
+    for (size_t i = 3; i < n_args; i++)
+    {
+        mp_int_t value = mp_obj_get_int(args[i]);
+        *fields[i - 3] = (value > 0) ? value : 0;   // (which the check below refuses)
+    }
+
+    const char *error = adc_dma_check_geometry(&geometry);
+    if (error)
+    {
+        mp_raise_ValueError(error);
+    }
+
+    uint32_t arena_bytes = adc_dma_arena_bytes(&geometry);
+    void *arena = m_malloc(arena_bytes);
+    if (!arena)
+    {
+        mp_raise_OSError(MP_ENOMEM);
+    }
+
+    for (int tier = 0; tier < NTIERS; tier++)
+    {
+        wav_header_init(&wav_headers[tier], &geometry, tier);
+        wav_adpcm_header_init(&wav_adpcm_headers[tier], &geometry, tier);
+        wav_ulaw_header_init(&wav_ulaw_headers[tier], &geometry, tier);
+    }
+    adc_dma_init(adc_chan, dma_chan_a, dma_chan_b, &geometry, arena);
+
+    // (any previous arena is only let go once the capture has moved off it)
+    mp_obj_subscr(arena_holder, MP_OBJ_NEW_SMALL_INT(0),
+                  mp_obj_new_bytearray_by_ref(arena_bytes, arena));
 
     return mp_const_none;
 }
-STATIC MP_DEFINE_CONST_FUN_OBJ_1(init_obj, init);
+STATIC MP_DEFINE_CONST_FUN_OBJ_VAR_BETWEEN(init_obj, 1, 6, init);
+
+// the geometry of the capture, as a tuple of (sample rate, samples per buffer, buffers in the
+// ring), as set up by 'init'
+STATIC mp_obj_t capture_geometry(void)
+{
+    const adc_dma_geometry_t *g = adc_dma_get_geometry();
+
+    mp_obj_t items[3] = {
+        mp_obj_new_int_from_uint(g->sample_rate),
+        mp_obj_new_int_from_uint(g->nsamples),
+        mp_obj_new_int_from_uint(g->nbufs),
+    };
+
+    return mp_obj_new_tuple(3, items);
+}
+STATIC MP_DEFINE_CONST_FUN_OBJ_0(capture_geometry_obj, capture_geometry);
 
 // would do this in 'init' above, but starting ADC_DMA before a WLAN connection crashes
 // (maybe uPython network code uses DMA when connecting?)
@@ -85,14 +302,175 @@ STATIC mp_obj_t start(void)
 }
 STATIC MP_DEFINE_CONST_FUN_OBJ_0(start_obj, start);
 
+// register a listener on the shared audio ring, returning the ID to pass to 'fetch'
+// buffers are fetched as PCM unless another format is given (e.g. 'WAVBuffer.ADPCM')
+STATIC mp_obj_t stream_open(size_t n_args, const mp_obj_t *args)
+{
+    mp_int_t format = (n_args > 0) ? mp_obj_get_int(args[0]) : FORMAT_PCM;
+    if (format != FORMAT_PCM && format != FORMAT_IMA_ADPCM && format != FORMAT_MULAW)
+    {
+        mp_raise_ValueError(MP_ERROR_TEXT("Unsupported format"));
+    }
+
+    int32_t idx = adc_dma_open();
+    if (idx < 0)
+    {
+        mp_raise_ValueError(MP_ERROR_TEXT("No more listeners available"));
+    }
+
+    listener_formats[idx] = format;
+    listener_tiers[idx] = 0;
+
+    return mp_obj_new_int(idx);
+}
+STATIC MP_DEFINE_CONST_FUN_OBJ_VAR_BETWEEN(stream_open_obj, 0, 1, stream_open);
+
+STATIC mp_obj_t stream_close(mp_obj_t idx_in)
+{
+    mp_int_t idx = mp_obj_get_int(idx_in);
+    if (idx >= 0)
+    {
+        adc_dma_close(idx);
+    }
+
+    return mp_const_none;
+}
+STATIC MP_DEFINE_CONST_FUN_OBJ_1(stream_close_obj, stream_close);
+
+// serve a listener at 1/factor of the sample rate (factor being 1, 2 or 4) from its next fetch on,
+// e.g. for a listener on a slow link; the stream should then carry the matching WAV header (see
+// 'header') before the next buffer, with buffers getting smaller by the same factor
+STATIC mp_obj_t stream_set_decimation(mp_obj_t idx_in, mp_obj_t factor_in)
+{
+    mp_int_t idx = mp_obj_get_int(idx_in);
+    mp_int_t factor = mp_obj_get_int(factor_in);
+    if (idx < 0 || !adc_dma_is_open(idx))
+    {
+        mp_raise_ValueError(MP_ERROR_TEXT("No such listener"));
+    }
+
+    int tier = factor_tier(factor);
+    if (tier < 0 || !adc_dma_set_decimation(idx, factor))
+    {
+        mp_raise_ValueError(MP_ERROR_TEXT("Unsupported decimation factor"));
+    }
+
+    listener_tiers[idx] = tier;
+
+    return mp_const_none;
+}
+STATIC MP_DEFINE_CONST_FUN_OBJ_2(stream_set_decimation_obj, stream_set_decimation);
+
+// number of buffers waiting for the listener; used as the readiness check when polling
+// so that the audio stream only wakes up once the DMA interrupt has published a buffer (or with
+// DMA_RING_MODE, once the DMA has written one, checked each time this is polled)
+STATIC mp_obj_t stream_pending(mp_obj_t idx_in)
+{
+    mp_int_t idx = mp_obj_get_int(idx_in);
+    if (idx < 0 || !adc_dma_is_open(idx))
+    {
+        mp_raise_ValueError(MP_ERROR_TEXT("No such listener"));
+    }
+
+    return mp_obj_new_int_from_uint(adc_dma_pending(idx));
+}
+STATIC MP_DEFINE_CONST_FUN_OBJ_1(stream_pending_obj, stream_pending);
+
+// skip a listener ahead to the live edge, leaving only the newest 'keep' buffers waiting for it,
+// e.g. once its backlog is too stale to be worth sending; returns the number of buffers skipped
+// (counted as dropped, see 'drops')
+STATIC mp_obj_t stream_catch_up(mp_obj_t idx_in, mp_obj_t keep_in)
+{
+    mp_int_t idx = mp_obj_get_int(idx_in);
+    mp_int_t keep = mp_obj_get_int(keep_in);
+    if (idx < 0 || !adc_dma_is_open(idx))
+    {
+        mp_raise_ValueError(MP_ERROR_TEXT("No such listener"));
+    }
+
+    return mp_obj_new_int_from_uint(adc_dma_skip(idx, (keep > 0) ? keep : 0));
+}
+STATIC MP_DEFINE_CONST_FUN_OBJ_2(stream_catch_up_obj, stream_catch_up);
+
+// number of buffers a listener has dropped so far by falling behind
+STATIC mp_obj_t stream_drops(mp_obj_t idx_in)
+{
+    mp_int_t idx = mp_obj_get_int(idx_in);
+    if (idx < 0 || !adc_dma_is_open(idx))
+    {
+        mp_raise_ValueError(MP_ERROR_TEXT("No such listener"));
+    }
+
+    return mp_obj_new_int_from_uint(adc_dma_drops(idx));
+}
+STATIC MP_DEFINE_CONST_FUN_OBJ_1(stream_drops_obj, stream_drops);
+
+// most buffers a listener has had waiting (drops start once it passes nbufs - RING_GUARD)
+STATIC mp_obj_t stream_depth_max(mp_obj_t idx_in)
+{
+    mp_int_t idx = mp_obj_get_int(idx_in);
+    if (idx < 0 || !adc_dma_is_open(idx))
+    {
+        mp_raise_ValueError(MP_ERROR_TEXT("No such listener"));
+    }
+
+    return mp_obj_new_int_from_uint(adc_dma_depth_max(idx));
+}
+STATIC MP_DEFINE_CONST_FUN_OBJ_1(stream_depth_max_obj, stream_depth_max);
+
+// counters of the acquisition as a tuple of (buffers produced, buffers dropped by all listeners,
+// most buffers any listener has had waiting, DMA interrupts, longest interrupt in us,
+// total time in interrupts in us), for the '/metrics' endpoint
+STATIC mp_obj_t stats(void)
+{
+    adc_dma_stats_t s;
+    adc_dma_get_stats(&s);
+
+    mp_obj_t items[6] = {
+        mp_obj_new_int_from_uint(s.produced),
+        mp_obj_new_int_from_uint(s.drops),
+        mp_obj_new_int_from_uint(s.depth_max),
+        mp_obj_new_int_from_uint(s.irqs),
+        mp_obj_new_int_from_uint(s.irq_us_max),
+        mp_obj_new_int_from_uint(s.irq_us_total),
+    };
+
+    return mp_obj_new_tuple(6, items);
+}
+STATIC MP_DEFINE_CONST_FUN_OBJ_0(stats_obj, stats);
+
 // non-blocking buffer acquisition (to work with uPython asyncio)
-// returns non-empty buffer iff FIFO is non-empty
+// returns non-empty buffer iff the listener has a buffer waiting in the ring
 STATIC mp_obj_t fetch(mp_obj_t idx_in)
 {
     mp_int_t idx = mp_obj_get_int(idx_in);
-    if (idx < 0 || idx >= MAX_FIFOS)
+    if (idx < 0 || !adc_dma_is_open(idx))
     {
-        mp_raise_ValueError(MP_ERROR_TEXT("No more FIFOs available"));
+        mp_raise_ValueError(MP_ERROR_TEXT("No such listener"));
+    }
+
+    if (listener_formats[idx] == FORMAT_IMA_ADPCM)
+    {
+        uint8_t *p_block = adc_dma_get_adpcm(idx);
+        if (!p_block)
+        {
+            return mp_obj_new_bytearray_by_ref(0, NULL);
+        }
+
+        uint32_t nsamples = adc_dma_get_geometry()->nsamples >> listener_tiers[idx];
+        return mp_obj_new_bytearray_by_ref(ADPCM_BLOCK_BYTES(nsamples), p_block);
+    }
+
+    if (listener_formats[idx] == FORMAT_MULAW)
+    {
+        uint8_t *p_ulaw = adc_dma_get_ulaw(idx);
+        if (!p_ulaw)
+        {
+            return mp_obj_new_bytearray_by_ref(0, NULL);
+        }
+
+        uint32_t nsamples = adc_dma_get_geometry()->nsamples >> listener_tiers[idx];
+        return mp_obj_new_bytearray_by_ref(nsamples, p_ulaw);
     }
 
     uint16_t *p_buf = adc_dma_get_buf(idx);
@@ -108,7 +486,8 @@ STATIC mp_obj_t fetch(mp_obj_t idx_in)
         bytes_per_sample = 2;
     #endif
 
-    return mp_obj_new_bytearray_by_ref(bytes_per_sample * NSAMPLES, p_buf);
+    uint32_t nsamples = adc_dma_get_geometry()->nsamples >> listener_tiers[idx];
+    return mp_obj_new_bytearray_by_ref(bytes_per_sample * nsamples, p_buf);
 }
 STATIC MP_DEFINE_CONST_FUN_OBJ_1(fetch_obj, fetch);
 
@@ -118,9 +497,26 @@ mp_obj_t mpy_init(mp_obj_fun_bc_t *self, size_t n_args, size_t n_kw, mp_obj_t *a
     // This must be first, it sets up the globals dict and other things
     MP_DYNRUNTIME_INIT_ENTRY
 
+    mp_store_global(MP_QSTR_PCM, MP_OBJ_NEW_SMALL_INT(FORMAT_PCM));
+    mp_store_global(MP_QSTR_ADPCM, MP_OBJ_NEW_SMALL_INT(FORMAT_IMA_ADPCM));
+    mp_store_global(MP_QSTR_ULAW, MP_OBJ_NEW_SMALL_INT(FORMAT_MULAW));
+
+    mp_obj_t no_arena = mp_const_none;
+    arena_holder = mp_obj_new_list(1, &no_arena);
+    mp_store_global(MP_QSTR__arena, arena_holder);
+
     mp_store_global(MP_QSTR_header, MP_OBJ_FROM_PTR(&header_obj));
     mp_store_global(MP_QSTR_init, MP_OBJ_FROM_PTR(&init_obj));
+    mp_store_global(MP_QSTR_geometry, MP_OBJ_FROM_PTR(&capture_geometry_obj));
     mp_store_global(MP_QSTR_start, MP_OBJ_FROM_PTR(&start_obj));
+    mp_store_global(MP_QSTR_open, MP_OBJ_FROM_PTR(&stream_open_obj));
+    mp_store_global(MP_QSTR_close, MP_OBJ_FROM_PTR(&stream_close_obj));
+    mp_store_global(MP_QSTR_set_decimation, MP_OBJ_FROM_PTR(&stream_set_decimation_obj));
+    mp_store_global(MP_QSTR_pending, MP_OBJ_FROM_PTR(&stream_pending_obj));
+    mp_store_global(MP_QSTR_catch_up, MP_OBJ_FROM_PTR(&stream_catch_up_obj));
+    mp_store_global(MP_QSTR_drops, MP_OBJ_FROM_PTR(&stream_drops_obj));
+    mp_store_global(MP_QSTR_depth_max, MP_OBJ_FROM_PTR(&stream_depth_max_obj));
+    mp_store_global(MP_QSTR_stats, MP_OBJ_FROM_PTR(&stats_obj));
     mp_store_global(MP_QSTR_fetch, MP_OBJ_FROM_PTR(&fetch_obj));
 
     // This must be last, it restores the globals dict
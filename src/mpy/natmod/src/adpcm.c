@@ -0,0 +1,165 @@
+#include "adpcm.h"
+
+static const int16_t step_table[89] =
+{
+        7,     8,     9,    10,    11,    12,    13,    14,    16,    17,
+       19,    21,    23,    25,    28,    31,    34,    37,    41,    45,
+       50,    55,    60,    66,    73,    80,    88,    97,   107,   118,
+      130,   143,   157,   173,   190,   209,   230,   253,   279,   307,
+      337,   371,   408,   449,   494,   544,   598,   658,   724,   796,
+      876,   963,  1060,  1166,  1282,  1411,  1552,  1707,  1878,  2066,
+     2272,  2499,  2749,  3024,  3327,  3660,  4026,  4428,  4871,  5358,
+     5894,  6484,  7132,  7845,  8630,  9493, 10442, 11487, 12635, 13899,
+    15289, 16818, 18500, 20350, 22385, 24623, 27086, 29794, 32767
+};
+
+static const int8_t index_table[8] =
+{
+    -1, -1, -1, -1, 2, 4, 6, 8
+};
+
+// update the state from a nibble (shared by the encoder and decoder so they stay in lock-step)
+static inline int32_t adpcm_step(adpcm_state_t *state, uint8_t nibble)
+{
+    int32_t step = step_table[state->index];
+    int32_t diff = step >> 3;
+
+    if (nibble & 4)
+        diff += step;
+    if (nibble & 2)
+        diff += step >> 1;
+    if (nibble & 1)
+        diff += step >> 2;
+
+    if (nibble & 8)
+        state->predictor -= diff;
+    else
+        state->predictor += diff;
+
+    if (state->predictor > 32767)
+        state->predictor = 32767;
+    else if (state->predictor < -32768)
+        state->predictor = -32768;
+
+    state->index += index_table[nibble & 7];
+    if (state->index < 0)
+        state->index = 0;
+    else if (state->index > 88)
+        state->index = 88;
+
+    return state->predictor;
+}
+
+static inline uint8_t adpcm_encode_sample(adpcm_state_t *state, int32_t sample)
+{
+    int32_t step = step_table[state->index];
+    int32_t diff = sample - state->predictor;
+    uint8_t nibble = 0;
+
+    if (diff < 0)
+    {
+        nibble = 8;
+        diff = -diff;
+    }
+
+    if (diff >= step)
+    {
+        nibble |= 4;
+        diff -= step;
+    }
+    step >>= 1;
+    if (diff >= step)
+    {
+        nibble |= 2;
+        diff -= step;
+    }
+    step >>= 1;
+    if (diff >= step)
+    {
+        nibble |= 1;
+    }
+
+    adpcm_step(state, nibble);
+
+    return nibble;
+}
+
+static inline void adpcm_write_header(const adpcm_state_t *state, uint8_t *out)
+{
+    out[0] = state->predictor & 0xff;
+    out[1] = (state->predictor >> 8) & 0xff;
+    out[2] = state->index;
+    out[3] = 0;
+}
+
+static inline void adpcm_read_header(adpcm_state_t *state, const uint8_t *in)
+{
+    state->predictor = (int16_t) (in[0] | (in[1] << 8));
+    state->index = in[2] > 88 ? 88 : in[2];
+}
+
+void adpcm_init(adpcm_state_t *state)
+{
+    state->predictor = 0;
+    state->index = 0;
+}
+
+void adpcm_encode_u12(adpcm_state_t *state, const uint16_t *in, uint32_t nsamples, uint8_t *out)
+{
+    adpcm_write_header(state, out);
+    out += ADPCM_BLOCK_HEADER;
+
+    for (uint32_t i = 0; i < nsamples; i += 2)
+    {
+        uint8_t lo = adpcm_encode_sample(state, ((int32_t) in[i] - 2048) << 4);
+        uint8_t hi = adpcm_encode_sample(state, ((int32_t) in[i+1] - 2048) << 4);
+
+        *out++ = lo | (hi << 4);
+    }
+}
+
+void adpcm_encode_u8(adpcm_state_t *state, const uint8_t *in, uint32_t nsamples, uint8_t *out)
+{
+    adpcm_write_header(state, out);
+    out += ADPCM_BLOCK_HEADER;
+
+    for (uint32_t i = 0; i < nsamples; i += 2)
+    {
+        uint8_t lo = adpcm_encode_sample(state, ((int32_t) in[i] - 128) << 8);
+        uint8_t hi = adpcm_encode_sample(state, ((int32_t) in[i+1] - 128) << 8);
+
+        *out++ = lo | (hi << 4);
+    }
+}
+
+void adpcm_decode_s16(const uint8_t *in, uint32_t nsamples, int16_t *out)
+{
+    adpcm_state_t state;
+
+    adpcm_read_header(&state, in);
+    in += ADPCM_BLOCK_HEADER;
+
+    for (uint32_t i = 0; i < nsamples; i += 2)
+    {
+        uint8_t b = *in++;
+
+        *out++ = adpcm_step(&state, b & 0x0f);
+        *out++ = adpcm_step(&state, b >> 4);
+    }
+}
+
+void adpcm_decode_u8(const uint8_t *in, uint32_t nsamples, uint8_t *out)
+{
+    adpcm_state_t state;
+
+    adpcm_read_header(&state, in);
+    in += ADPCM_BLOCK_HEADER;
+
+    for (uint32_t i = 0; i < nsamples; i += 2)
+    {
+        uint8_t b = *in++;
+
+        *out++ = (adpcm_step(&state, b & 0x0f) >> 8) + 128;
+        *out++ = (adpcm_step(&state, b >> 4) >> 8) + 128;
+    }
+}
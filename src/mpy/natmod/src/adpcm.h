@@ -0,0 +1,47 @@
+/*
+    A plain C IMA-ADPCM encoder/decoder, used to keep the audio ring compressed in memory
+    (4 bits per sample instead of 8 or 16).
+
+    Based on the IMA Digital Audio Focus and Technical Working Groups' recommended practices
+    (IMA-ADPCM, rev. 3.00), as used in the Microsoft IMA-ADPCM WAV format (format tag 0x11).
+
+    Each block is self-contained so that a listener can start decoding from any block in the ring:
+    a 4-byte header holding the encoder state before the first sample (little-endian 16-bit
+    predictor, 8-bit step index and a reserved byte), followed by 2 samples per byte, with the
+    first sample in the low nibble.
+
+    Like 'ring.h', this doesn't depend on MicroPython or the RP2040 headers, so it can also
+    be built and tested on the host (see 'test/natmod').
+*/
+
+#ifndef __ADPCM_H__
+#define __ADPCM_H__
+
+#include <stdint.h>
+
+#define ADPCM_BLOCK_HEADER 4
+
+// number of bytes in an encoded block of 'nsamples' samples (which should be even)
+#define ADPCM_BLOCK_BYTES(nsamples) (ADPCM_BLOCK_HEADER + (nsamples) / 2)
+
+typedef struct adpcm_state_struct
+{
+    int32_t predictor;
+    int32_t index;
+} adpcm_state_t;
+
+void adpcm_init(adpcm_state_t *state);
+
+// encode unsigned 12-bit samples (e.g. straight from the ADC FIFO)
+void adpcm_encode_u12(adpcm_state_t *state, const uint16_t *in, uint32_t nsamples, uint8_t *out);
+
+// encode unsigned 8-bit samples (e.g. 8-bit PCM as used in WAV files)
+void adpcm_encode_u8(adpcm_state_t *state, const uint8_t *in, uint32_t nsamples, uint8_t *out);
+
+// decode a block to signed 16-bit samples
+void adpcm_decode_s16(const uint8_t *in, uint32_t nsamples, int16_t *out);
+
+// decode a block to unsigned 8-bit samples (i.e. 8-bit PCM as used in WAV files)
+void adpcm_decode_u8(const uint8_t *in, uint32_t nsamples, uint8_t *out);
+
+#endif
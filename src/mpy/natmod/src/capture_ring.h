@@ -0,0 +1,151 @@
+/*
+    Capture into a single ring with DMA address wrapping, without any interrupt (see
+    DMA_RING_MODE in 'ADC_DMA.h').
+
+    The DMA channel writes ADC samples into a buffer whose size is a power of 2, with its write
+    address wrapping around within the buffer (the RP2040's DMA ring mode, which needs the buffer
+    aligned to its size). When its transfer count runs out (after 2^32 - 1 samples, i.e. more than
+    a day and a half at 30 kHz), it chains to a control channel that writes the count back into it
+    and re-triggers it, so the capture never stops and nothing needs to be done per block.
+
+    Instead of an interrupt publishing each block, the blocks completed are worked out from where
+    the channel is writing (its WRITE_ADDR register) whenever a listener looks for one: the bytes
+    written since the last look (modulo the buffer size) are added up, and a block of the ring of
+    blocks (see 'ring.h') is published for each complete one. The buffer holds a whole number of blocks,
+    so the block being written is always the one in slot 'ring_head_slot'.
+
+    The write address only gives the position within the buffer, so an update can't tell from it
+    alone how many whole laps of the buffer (e.g. 0.55 s for 16K at 30 kHz) have gone by since the
+    last one: MicroPython's poll loop updates for each listener waiting on a block every
+    millisecond or so, but nothing updates while every listener is busy elsewhere (e.g. sending,
+    or blocked on a slow client), and nothing guarantees that's for less than a lap. So each
+    update also takes the time (from the caller's microsecond clock), and the time since the
+    last update, less the time the bytes written (modulo the buffer size) took, rounded to whole
+    laps, gives the laps missed. Those are published all at once ('ring_publish_laps'), which
+    leaves every block with the sequence number of the block the DMA wrote, and drops them for
+    the listeners (as they lag by more than a lap), so they resync with the write address rather
+    than reading blocks under the wrong numbers. Gaps between updates of more than half the
+    clock's range (35 minutes for a 32-bit count of microseconds) can count the wrong number of
+    laps, but still publish a whole number of them.
+
+    Only the low bits of the write address are used, so like 'ring.h' this doesn't depend on
+    MicroPython or the RP2040 headers, and can also be built and tested on the host (against a mocked DMA
+    channel, see 'test/natmod').
+*/
+
+#ifndef __CAPTURE_RING_H__
+#define __CAPTURE_RING_H__
+
+#include <stdint.h>
+
+#include "ring.h"
+
+typedef struct capture_ring_struct
+{
+    const volatile uint32_t *write_addr;  // the DMA channel's WRITE_ADDR register
+    uintptr_t base;           // address of the buffer (aligned to its size)
+    uint32_t size;            // size of the buffer in bytes (a power of 2)
+    uint32_t size_bits;       // log2 of 'size'
+    uint32_t block_size;      // size of a block in bytes (dividing 'size')
+    uint32_t lap;             // time the DMA channel takes to write the buffer (under 2^24)
+    uint32_t offset;          // write offset into the buffer as of the last update
+    uint32_t partial;         // bytes written into the block being written, as of the last update
+    uint32_t time;            // time of the last update
+} capture_ring_t;
+
+// Set up for the DMA channel to start writing at 'base' at time 'now', taking 'lap' to write the
+// whole buffer (in the units of 'now', e.g. microseconds), with the caller's ring of blocks
+// initialized to 'size / block_size' blocks (so it can choose 'lag_max').
+static inline void capture_ring_init(capture_ring_t *capture, const volatile uint32_t *write_addr,
+                                     uintptr_t base, uint32_t size, uint32_t block_size,
+                                     uint32_t lap, uint32_t now)
+{
+    capture->write_addr = write_addr;
+    capture->base = base;
+    capture->size = size;
+    capture->size_bits = 0;
+    while ((1u << capture->size_bits) < size)
+    {
+        capture->size_bits++;
+    }
+    capture->block_size = block_size;
+    capture->lap = lap;
+    capture->offset = 0;
+    capture->partial = 0;
+    capture->time = now;
+}
+
+// the address of the block in 'slot'
+static inline uintptr_t capture_ring_block(capture_ring_t *capture, uint32_t slot)
+{
+    return capture->base + slot * capture->block_size;
+}
+
+// whole laps in 'elapsed' (to the nearest), by binary long division as in 'ring_mod'
+static inline uint32_t capture_ring_laps(capture_ring_t *capture, uint32_t elapsed)
+{
+    uint32_t m = (elapsed > 0xffffffff - (capture->lap >> 1)) ? 0xffffffff :
+                 elapsed + (capture->lap >> 1);
+    uint32_t d = capture->lap;
+    uint32_t bit = 1;
+    uint32_t laps = 0;
+
+    while (d <= (m >> 1))
+    {
+        d <<= 1;
+        bit <<= 1;
+    }
+
+    while (bit != 0)
+    {
+        if (m >= d)
+        {
+            m -= d;
+            laps |= bit;
+        }
+        d >>= 1;
+        bit >>= 1;
+    }
+
+    return laps;
+}
+
+// Publish the blocks the DMA channel has completed since the last update (at time 'now'),
+// returning the number of blocks published.
+static inline uint32_t capture_ring_update(capture_ring_t *capture, ring_t *ring, uint32_t now)
+{
+    uint32_t offset = (*capture->write_addr - (uint32_t) capture->base) & (capture->size - 1);
+    uint32_t delta = (offset - capture->offset) & (capture->size - 1);
+    uint32_t elapsed = now - capture->time;
+    uint32_t published = 0;
+
+    // the time the bytes written since took, to 1/256 of a lap ('lap' being under 2^24), and
+    // any laps gone by on top of that (as the clock isn't read at quite the same time as the
+    // write address, the difference can come out slightly negative)
+    uint32_t delta_time = ((((delta << 8) >> capture->size_bits) * capture->lap) >> 8);
+    int32_t ahead = (int32_t) (elapsed - delta_time);
+    if (ahead > 0)
+    {
+        uint32_t laps = capture_ring_laps(capture, (uint32_t) ahead);
+        if (laps > 0)
+        {
+            ring_publish_laps(ring, laps);
+            published += laps * ring->nblocks;
+        }
+    }
+
+    capture->partial += delta;
+    capture->offset = offset;
+    capture->time = now;
+
+    while (capture->partial >= capture->block_size)
+    {
+        capture->partial -= capture->block_size;
+        ring_publish(ring);
+        published++;
+    }
+
+    return published;
+}
+
+#endif
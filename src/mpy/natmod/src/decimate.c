@@ -0,0 +1,140 @@
+#include "decimate.h"
+
+// number of input samples filtered at a time (a multiple of 4, to halve twice)
+#define DECIMATE_CHUNK 64
+
+// the non-zero coefficients (Q15) either side of the centre, at offsets 1, 3, 5 and 7 (the
+// centre coefficient being 1/2, see 'decimate.h'); they sum to 1/4, for a DC gain of exactly 1
+#define H1 10009
+#define H3 (-2404)
+#define H5 644
+#define H7 (-57)
+
+static inline uint8_t to_u8(int32_t sample)
+{
+    // back from 8.8 fixed point, rounding
+    sample = (sample + 128 + (128 << 8)) >> 8;
+
+    if (sample < 0)
+    {
+        return 0;
+    }
+    if (sample > 255)
+    {
+        return 255;
+    }
+    return sample;
+}
+
+// Halve the rate of the 'n' (even) samples in 'buf' after the stage's history (i.e. from
+// 'buf[DECIMATE_HISTORY]'), writing n/2 samples to 'out', then keep the last of them as the
+// history for the next call.
+static void halfband(decimate_stage_t *stage, int16_t *buf, uint32_t n, int16_t *out)
+{
+    for (uint32_t i = 0; i < DECIMATE_HISTORY; i++)
+    {
+        buf[i] = stage->history[i];
+    }
+
+    // each output is centred 7 samples before the newest input it takes (the 2nd of each pair)
+    const int16_t *x = buf + DECIMATE_HISTORY / 2 + 1;
+    for (uint32_t m = 0; m < n / 2; m++, x += 2)
+    {
+        int32_t acc = ((int32_t) x[0] << 14) +
+                      H1 * ((int32_t) x[-1] + x[1]) +
+                      H3 * ((int32_t) x[-3] + x[3]) +
+                      H5 * ((int32_t) x[-5] + x[5]) +
+                      H7 * ((int32_t) x[-7] + x[7]);
+
+        // the filter overshoots a little (by up to 30%) on full-scale steps
+        acc = (acc + (1 << 14)) >> 15;
+        if (acc < INT16_MIN)
+        {
+            acc = INT16_MIN;
+        }
+        else if (acc > INT16_MAX)
+        {
+            acc = INT16_MAX;
+        }
+        out[m] = acc;
+    }
+
+    for (uint32_t i = 0; i < DECIMATE_HISTORY; i++)
+    {
+        stage->history[i] = buf[n + i];
+    }
+}
+
+int decimate_init(decimator_t *decimator, uint32_t factor)
+{
+    if (factor != 1 && factor != 2 && factor != 4)
+    {
+        return 0;
+    }
+
+    decimator->factor = factor;
+
+    // start from silence
+    for (uint32_t s = 0; s < DECIMATE_MAX_STAGES; s++)
+    {
+        for (uint32_t i = 0; i < DECIMATE_HISTORY; i++)
+        {
+            decimator->stages[s].history[i] = 0;
+        }
+    }
+
+    return 1;
+}
+
+uint32_t decimate_u8(decimator_t *decimator, const uint8_t *in, uint32_t nsamples, uint8_t *out)
+{
+    // samples are filtered as signed 8.8 fixed point, so rounding errors stay below 8 bits
+    int16_t buf1[DECIMATE_HISTORY + DECIMATE_CHUNK];
+    int16_t buf2[DECIMATE_HISTORY + DECIMATE_CHUNK / 2];
+    int16_t buf4[DECIMATE_CHUNK / 4];
+    uint32_t factor = decimator->factor;
+    uint32_t nout = 0;
+
+    if (factor == 1)
+    {
+        for (uint32_t i = 0; i < nsamples; i++)
+        {
+            out[i] = in[i];
+        }
+        return nsamples;
+    }
+
+    for (uint32_t start = 0; start < nsamples; start += DECIMATE_CHUNK)
+    {
+        uint32_t n = nsamples - start;
+        if (n > DECIMATE_CHUNK)
+        {
+            n = DECIMATE_CHUNK;
+        }
+
+        for (uint32_t i = 0; i < n; i++)
+        {
+            buf1[DECIMATE_HISTORY + i] = ((int16_t) in[start + i] - 128) << 8;
+        }
+
+        // the first halving goes straight into the input of the second
+        halfband(&decimator->stages[0], buf1, n, buf2 + DECIMATE_HISTORY);
+
+        if (factor == 2)
+        {
+            for (uint32_t i = 0; i < n / 2; i++)
+            {
+                out[nout++] = to_u8(buf2[DECIMATE_HISTORY + i]);
+            }
+            continue;
+        }
+
+        halfband(&decimator->stages[1], buf2, n / 2, buf4);
+        for (uint32_t i = 0; i < n / 4; i++)
+        {
+            out[nout++] = to_u8(buf4[i]);
+        }
+    }
+
+    return nout;
+}
@@ -0,0 +1,49 @@
+/*
+    An anti-aliased decimator for 8-bit PCM audio, to serve listeners on slow links a stream at
+    half or a quarter of the sample rate (e.g. 15 kHz or 7.5 kHz from 30 kHz).
+
+    Each halving is a 15-tap halfband FIR low-pass filter (Hann-windowed sinc, Q15 coefficients),
+    keeping every other sample: every other coefficient of a halfband filter is zero and the centre
+    one is 1/2, so each output takes 4 multiplies. The passband is flat (within 0.04 dB) up to
+    0.15 of the input rate, and everything above 0.35 of it, which would alias into the passband,
+    is attenuated by at least 45 dB (about the dynamic range of 8-bit audio). A quarter of the rate
+    is 2 halvings in cascade.
+
+    Each decimator keeps the last samples of the block before (the filter's history), so blocks
+    can be decimated one after the other with no discontinuity between them. Blocks are filtered
+    in chunks through buffers on the stack, so the state is only 56 bytes per decimator.
+
+    Like 'ring.h', this doesn't depend on MicroPython or the RP2040 headers, so it can also be
+    built and tested on the host (see 'test/natmod').
+*/
+
+#ifndef __DECIMATE_H__
+#define __DECIMATE_H__
+
+#include <stdint.h>
+
+#define DECIMATE_TAPS 15
+#define DECIMATE_HISTORY (DECIMATE_TAPS - 1)
+
+// max. number of halvings in cascade (i.e. a max. factor of 4)
+#define DECIMATE_MAX_STAGES 2
+
+typedef struct decimate_stage_struct
+{
+    int16_t history[DECIMATE_HISTORY];
+} decimate_stage_t;
+
+typedef struct decimator_struct
+{
+    uint32_t factor;
+    decimate_stage_t stages[DECIMATE_MAX_STAGES];
+} decimator_t;
+
+// 'factor' is 1 (just copies samples), 2 or 4; returns false for any other factor
+int decimate_init(decimator_t *decimator, uint32_t factor);
+
+// Decimate 'nsamples' unsigned 8-bit samples (a multiple of the factor) from 'in' into 'out',
+// returning the number of samples written (nsamples / factor).
+uint32_t decimate_u8(decimator_t *decimator, const uint8_t *in, uint32_t nsamples, uint8_t *out);
+
+#endif
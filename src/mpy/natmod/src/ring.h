@@ -0,0 +1,245 @@
+/*
+    A lossy ring of audio blocks shared by all listeners of the audio stream.
+
+    The producer (the DMA interrupt) only ever bumps a single block counter when a block is
+    finished, so publishing a block costs the same regardless of how many listeners are attached.
+    Each listener owns a read cursor (also a monotonically increasing block counter) and works
+    out how far behind it is from the difference between the two. A listener that falls too far
+    behind skips ahead to the oldest block that is still safe to read, counting the dropped blocks,
+    without affecting any other listener. A listener can also skip ahead to the newest blocks of
+    its own accord (see 'ring_skip'), e.g. rather than send a backlog that's gone stale.
+
+    Only the producer writes 'head' and only the owner of a cursor writes to that cursor, so no
+    interrupt masking is needed: this is a single-producer/single-consumer ring per listener,
+    with 'head' stored with release semantics once a block is complete and loaded with acquire
+    semantics by the listeners, so a listener that sees a block published also sees its contents
+    (32-bit loads/stores are atomic on the Cortex-M0+; on the RP2040 these are plain loads/stores
+    with a DMB, which also covers a producer on the other core). The same goes for the statistics
+    kept (blocks dropped and the deepest a listener has lagged), which are only updated by the
+    listeners, when they get their next block.
+
+    The ring can have any number of slots. Block counters run modulo a multiple of that number
+    ('wrap', see 'ring_init'), so the slot of a block stays the same across the wrap, and the
+    producer and each cursor step their slot along with their counter, so no division is needed
+    ('__aeabi_uidivmod' isn't available to MicroPython native modules). Only opening a cursor or
+    skipping ahead works a slot out from scratch, with a shift-and-subtract remainder.
+
+    This header deliberately doesn't depend on MicroPython or the RP2040 headers, so it can also
+    be built and tested on the host (see 'test/natmod').
+*/
+
+#ifndef __RING_H__
+#define __RING_H__
+
+#include <stdint.h>
+#include <stdbool.h>
+
+#define RING_LOAD_ACQUIRE(p) __atomic_load_n((p), __ATOMIC_ACQUIRE)
+#define RING_STORE_RELEASE(p, v) __atomic_store_n((p), (v), __ATOMIC_RELEASE)
+
+// 'm' modulo 'n' by binary long division, without '__aeabi_uidivmod'
+static inline uint32_t ring_mod(uint32_t m, uint32_t n)
+{
+    uint32_t d = n;
+
+    while (d <= (m >> 1))
+    {
+        d <<= 1;
+    }
+
+    while (d >= n)
+    {
+        if (m >= d)
+        {
+            m -= d;
+        }
+        d >>= 1;
+    }
+
+    return m;
+}
+
+typedef struct ring_struct
+{
+    uint32_t head;            // number of blocks published so far (modulo 'wrap')
+    uint32_t head_slot;       // slot of block 'head', i.e. the next to be published (producer only)
+    uint32_t nblocks;         // number of slots in the ring
+    uint32_t wrap;            // block counters run modulo this multiple of 'nblocks'
+    uint32_t lag_max;         // max. number of published blocks a cursor may lag behind 'head'
+    uint32_t drops;           // number of blocks dropped by all listeners so far
+    uint32_t depth_max;       // most blocks any listener has had waiting
+} ring_t;
+
+typedef struct ring_cursor_struct
+{
+    uint32_t tail;            // next block to be read by this listener
+    uint32_t slot;            // slot of block 'tail'
+    uint32_t seq;             // the block last read (see 'ring_overwritten')
+    uint32_t drops;           // number of blocks skipped because the listener was too slow
+    uint32_t depth_max;       // most blocks this listener has had waiting
+    bool active;
+} ring_cursor_t;
+
+// block counter 'seq' moved ahead by 'n' (less than 'wrap') blocks
+static inline uint32_t ring_seq_add(ring_t *ring, uint32_t seq, uint32_t n)
+{
+    seq += n;
+    return (seq >= ring->wrap) ? seq - ring->wrap : seq;
+}
+
+// number of blocks from block counter 'from' up to 'to'
+static inline uint32_t ring_seq_diff(ring_t *ring, uint32_t to, uint32_t from)
+{
+    return (to >= from) ? to - from : to + (ring->wrap - from);
+}
+
+static inline uint32_t ring_slot(ring_t *ring, uint32_t seq)
+{
+    return ring_mod(seq, ring->nblocks);
+}
+
+// 'lag_max' should leave enough slack for the blocks the producer may be writing into,
+// and for a block that has been handed out by reference and is still being read
+static inline void ring_init(ring_t *ring, uint32_t nblocks, uint32_t lag_max)
+{
+    // the largest multiple of 'nblocks' by a power of 2 up to 2^31, so counters can be added
+    // to and compared without overflowing
+    uint32_t wrap = nblocks;
+    while (wrap <= (1u << 30))
+    {
+        wrap <<= 1;
+    }
+
+    ring->head = 0;
+    ring->head_slot = 0;
+    ring->nblocks = nblocks;
+    ring->wrap = wrap;
+    ring->lag_max = lag_max;
+    ring->drops = 0;
+    ring->depth_max = 0;
+}
+
+// slot of the next block to be published (for the producer to write into)
+static inline uint32_t ring_head_slot(ring_t *ring)
+{
+    return ring->head_slot;
+}
+
+// called by the producer once the block in slot 'ring_head_slot(ring)' is complete
+static inline void ring_publish(ring_t *ring)
+{
+    ring->head_slot = (ring->head_slot + 1 == ring->nblocks) ? 0 : ring->head_slot + 1;
+    RING_STORE_RELEASE(&ring->head, ring_seq_add(ring, ring->head, 1));
+
+    // and the writes into the next block can't be seen before the count (see 'ring_overwritten')
+    __atomic_thread_fence(__ATOMIC_RELEASE);
+}
+
+// Called by the producer for 'n' whole laps of the ring completed at once (e.g. blocks it only
+// learns of after the fact), which leave 'ring_head_slot' where it was ('n * nblocks' should be
+// less than 'wrap'). A listener then lagging by more than 'lag_max' drops what it missed.
+static inline void ring_publish_laps(ring_t *ring, uint32_t n)
+{
+    RING_STORE_RELEASE(&ring->head, ring_seq_add(ring, ring->head, n * ring->nblocks));
+
+    __atomic_thread_fence(__ATOMIC_RELEASE);
+}
+
+// new listeners start at the live edge (i.e. the next block to be published)
+static inline void ring_cursor_open(ring_t *ring, ring_cursor_t *cursor)
+{
+    cursor->tail = RING_LOAD_ACQUIRE(&ring->head);
+    cursor->slot = ring_slot(ring, cursor->tail);
+    cursor->seq = cursor->tail;
+    cursor->drops = 0;
+    cursor->depth_max = 0;
+    cursor->active = true;
+}
+
+static inline void ring_cursor_close(ring_cursor_t *cursor)
+{
+    cursor->active = false;
+}
+
+// number of blocks waiting to be read by the listener (including any that would be dropped)
+static inline uint32_t ring_pending(ring_t *ring, ring_cursor_t *cursor)
+{
+    return ring_seq_diff(ring, RING_LOAD_ACQUIRE(&ring->head), cursor->tail);
+}
+
+// move the listener 'n' (waiting) blocks ahead, counting them as dropped
+static inline void ring_cursor_drop(ring_t *ring, ring_cursor_t *cursor, uint32_t n)
+{
+    cursor->drops += n;
+    ring->drops += n;
+    cursor->tail = ring_seq_add(ring, cursor->tail, n);
+    cursor->slot += ring_mod(n, ring->nblocks);
+    if (cursor->slot >= ring->nblocks)
+    {
+        cursor->slot -= ring->nblocks;
+    }
+}
+
+// Get the slot of the next block for the listener, returning false if none is available.
+// Listeners lagging more than 'lag_max' blocks are moved up to the oldest safe block first.
+static inline bool ring_next(ring_t *ring, ring_cursor_t *cursor, uint32_t *slot)
+{
+    uint32_t head = RING_LOAD_ACQUIRE(&ring->head);
+    uint32_t lag = ring_seq_diff(ring, head, cursor->tail);
+
+    if (lag == 0)
+    {
+        return false;
+    }
+
+    if (lag > cursor->depth_max)
+    {
+        cursor->depth_max = lag;
+    }
+    if (lag > ring->depth_max)
+    {
+        ring->depth_max = lag;
+    }
+
+    if (lag > ring->lag_max)
+    {
+        ring_cursor_drop(ring, cursor, lag - ring->lag_max);
+    }
+
+    *slot = cursor->slot;
+    cursor->seq = cursor->tail;
+    cursor->tail = ring_seq_add(ring, cursor->tail, 1);
+    cursor->slot = (cursor->slot + 1 == ring->nblocks) ? 0 : cursor->slot + 1;
+
+    return true;
+}
+
+// Move the listener up to the live edge, leaving only the newest 'keep' blocks waiting (e.g. for a
+// listener whose backlog is too stale to be worth sending), and return the number of blocks
+// skipped, which are counted as dropped.
+static inline uint32_t ring_skip(ring_t *ring, ring_cursor_t *cursor, uint32_t keep)
+{
+    uint32_t lag = ring_seq_diff(ring, RING_LOAD_ACQUIRE(&ring->head), cursor->tail);
+
+    if (lag <= keep)
+    {
+        return 0;
+    }
+
+    ring_cursor_drop(ring, cursor, lag - keep);
+
+    return lag - keep;
+}
+
+// Whether the block last read by the listener may have been overwritten since (i.e. the producer
+// has come round to its slot), for a listener that can't rely on 'lag_max' leaving it enough time
+// (e.g. one preempted for a while) to check after copying the block out.
+static inline bool ring_overwritten(ring_t *ring, ring_cursor_t *cursor)
+{
+    // the block's contents are read before the count
+    __atomic_thread_fence(__ATOMIC_ACQUIRE);
+
+    return ring_seq_diff(ring, RING_LOAD_ACQUIRE(&ring->head), cursor->seq) >= ring->nblocks;
+}
+
+#endif
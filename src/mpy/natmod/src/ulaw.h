@@ -0,0 +1,82 @@
+/*
+    A plain C G.711 mu-law encoder/decoder, for streams of companded 8-bit samples (WAV format
+    tag 0x07).
+
+    Each sample keeps about 14 bits of range in 8 bits, with the quantization step growing with
+    the level (a 3-bit segment and 4-bit mantissa, plus sign), so quiet audio keeps the detail
+    that 8-bit PCM truncates away. Encoded from 12-bit samples, it's as good as 8-bit PCM from
+    about half of full scale down, and much better on quieter audio (see
+    'test/natmod/adpcm_test.c'), but in as many bytes as 8-bit PCM, so it makes a better stream,
+    not a smaller one. Encoded from 8-bit samples, there's nothing to gain over sending them as
+    they are.
+
+    Like 'adpcm.h', this doesn't depend on MicroPython or the RP2040 headers, so it can also
+    be built and tested on the host (see 'test/natmod').
+*/
+
+#ifndef __ULAW_H__
+#define __ULAW_H__
+
+#include <stdint.h>
+
+#define ULAW_BIAS 0x84
+#define ULAW_CLIP 32635
+
+// the mu-law byte for silence (i.e. a sample of 0)
+#define ULAW_SILENCE 0xff
+
+// encode a signed 16-bit sample
+static inline uint8_t ulaw_encode(int32_t sample)
+{
+    uint8_t sign = 0;
+
+    if (sample < 0)
+    {
+        sign = 0x80;
+        sample = -sample;
+    }
+    if (sample > ULAW_CLIP)
+    {
+        sample = ULAW_CLIP;
+    }
+    sample += ULAW_BIAS;
+
+    // the segment is the position of the highest bit set above the 8 lowest
+    uint8_t segment = 7;
+    for (int32_t mask = 0x4000; segment > 0 && !(sample & mask); mask >>= 1)
+    {
+        segment--;
+    }
+
+    return ~(sign | (segment << 4) | ((sample >> (segment + 3)) & 0x0f));
+}
+
+// decode to a signed 16-bit sample (the middle of the quantization step)
+static inline int32_t ulaw_decode(uint8_t byte)
+{
+    byte = ~byte;
+
+    int32_t sample = ((((byte & 0x0f) << 3) + ULAW_BIAS) << ((byte >> 4) & 7)) - ULAW_BIAS;
+
+    return (byte & 0x80) ? -sample : sample;
+}
+
+// encode unsigned 12-bit samples (e.g. straight from the ADC FIFO)
+static inline void ulaw_encode_u12(const uint16_t *in, uint32_t nsamples, uint8_t *out)
+{
+    for (uint32_t i = 0; i < nsamples; i++)
+    {
+        out[i] = ulaw_encode(((int32_t) in[i] - 2048) << 4);
+    }
+}
+
+// encode unsigned 8-bit samples (e.g. 8-bit PCM as used in WAV files)
+static inline void ulaw_encode_u8(const uint8_t *in, uint32_t nsamples, uint8_t *out)
+{
+    for (uint32_t i = 0; i < nsamples; i++)
+    {
+        out[i] = ulaw_encode(((int32_t) in[i] - 128) << 8);
+    }
+}
+
+#endif
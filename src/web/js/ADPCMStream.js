@@ -0,0 +1,113 @@
+/*
+    Functions to decode the IMA-ADPCM audio stream ('audio.adpcm') from the Pico, played by
+    StreamPlayer.js.
+
+    The stream is a WAV header (format 0x11) followed by fixed-size blocks, each starting with
+    the decoder state (16-bit predictor and step index) followed by 2 samples per byte (low nibble
+    first). Unlike standard IMA-ADPCM, the predictor in the block header is not an extra sample
+    (it's the last sample of the previous block), so it isn't played here.
+
+    Browsers won't play ADPCM WAV files, so blocks are decoded here.
+
+    The Pico lowers the sample rate for a listener that can't keep up (see 'AudioServer' in
+    PicoWebRadio.py), and raises it again later, by sending a new WAV header for the new rate
+    (with smaller or larger blocks) between blocks. A block never starts with "RIFF" (the 4th
+    byte of its header is always 0), so each block boundary is checked for one.
+
+    Much help from:
+        https://developer.mozilla.org/en-US/docs/Web/API/Streams_API/Using_readable_streams
+*/
+
+const adpcmStepTable = [
+        7,     8,     9,    10,    11,    12,    13,    14,    16,    17,
+       19,    21,    23,    25,    28,    31,    34,    37,    41,    45,
+       50,    55,    60,    66,    73,    80,    88,    97,   107,   118,
+      130,   143,   157,   173,   190,   209,   230,   253,   279,   307,
+      337,   371,   408,   449,   494,   544,   598,   658,   724,   796,
+      876,   963,  1060,  1166,  1282,  1411,  1552,  1707,  1878,  2066,
+     2272,  2499,  2749,  3024,  3327,  3660,  4026,  4428,  4871,  5358,
+     5894,  6484,  7132,  7845,  8630,  9493, 10442, 11487, 12635, 13899,
+    15289, 16818, 18500, 20350, 22385, 24623, 27086, 29794, 32767
+];
+const adpcmIndexTable = [-1, -1, -1, -1, 2, 4, 6, 8];
+
+// Decode a single block (as a Uint8Array) into a Float32Array of samples.
+function adpcmDecodeBlock(block, samples)
+{
+    let predictor = (block[0] | (block[1] << 8)) << 16 >> 16;
+    let index = Math.min(block[2], 88);
+    let n = 0;
+
+    function decodeNibble(nibble)
+    {
+        const step = adpcmStepTable[index];
+        let diff = step >> 3;
+
+        if (nibble & 4) diff += step;
+        if (nibble & 2) diff += step >> 1;
+        if (nibble & 1) diff += step >> 2;
+
+        predictor += (nibble & 8) ? -diff : diff;
+        predictor = Math.max(-32768, Math.min(32767, predictor));
+
+        index = Math.max(0, Math.min(88, index + adpcmIndexTable[nibble & 7]));
+
+        samples[n++] = predictor / 32768;
+    }
+
+    for (let i = 4; i < block.length; i++)
+    {
+        decodeNibble(block[i] & 0x0f);
+        decodeNibble(block[i] >> 4);
+    }
+}
+
+// Whether 'bytes' starts with a new WAV header (i.e. "RIFF") rather than a block.
+function adpcmStartsWithHeader(bytes)
+{
+    return (bytes.length >= 4) && (bytes[0] == 0x52) && (bytes[1] == 0x49) &&
+           (bytes[2] == 0x46) && (bytes[3] == 0x46);
+}
+
+// Parse the WAV header at the start of 'bytes', returning null until enough of it has arrived.
+// (also used for PCM streams by StreamPlayer.js)
+function adpcmParseHeader(bytes)
+{
+    if (bytes.length < 12)
+    {
+        return null;
+    }
+
+    const view = new DataView(bytes.buffer, bytes.byteOffset, bytes.byteLength);
+    let header = {};
+    let offset = 12;
+
+    while (offset + 8 <= bytes.length)
+    {
+        const chunkID = String.fromCharCode(...bytes.subarray(offset, offset + 4));
+        const chunkSize = view.getUint32(offset + 4, true);
+
+        if (chunkID === "data")
+        {
+            header.dataOffset = offset + 8;
+            return header;
+        }
+
+        if (offset + 8 + chunkSize > bytes.length)
+        {
+            return null;
+        }
+
+        if (chunkID === "fmt ")
+        {
+            header.format = view.getUint16(offset + 8, true);
+            header.sampleRate = view.getUint32(offset + 12, true);
+            header.blockAlign = view.getUint16(offset + 20, true);
+            header.bitsPerSample = view.getUint16(offset + 22, true);
+        }
+
+        offset += 8 + chunkSize;
+    }
+
+    return null;
+}
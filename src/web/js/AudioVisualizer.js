@@ -1,36 +1,69 @@
 /*
-    Various helper functions to draw on the canvas.
+    Set up of the canvas, which is drawn on by SpectrumRenderer.js; in a worker
+    (SpectrumWorker.js) on an OffscreenCanvas where supported, so drawing stays off the main
+    thread, or on the page otherwise.
+
+    Add '#fps' to the page's URL to show the frame rate and time taken to draw each frame.
 */
 var canvas = document.getElementById("audio-visualizer");
-var canvasContext = canvas.getContext("2d");
 
-// Actual canvas width and height don't match the CSS (I think?), still figuring this out...
-// Using the offset dimensions works for now
-canvas.width = canvas.offsetWidth;
-canvas.height = canvas.offsetHeight;
+const canvasShowStats = (window.location.hash === "#fps");
 
-function canvasDrawBlack()
+var canvasWorker = null;
+var canvasRenderer = null;
+var canvasPending = [];
+
+// Send a message to the renderer (see SpectrumRenderer.js), transferring 'transfer' if in a
+// worker. Messages are queued until the renderer is loaded.
+function canvasPost(msg, transfer)
 {
-    canvasContext.fillStyle = "black";
-    canvasContext.fillRect(0, 0, canvas.width, canvas.height);
+    if (canvasWorker)
+    {
+        canvasWorker.postMessage(msg, transfer || []);
+    }
+    else if (canvasRenderer)
+    {
+        canvasRenderer.handle(msg);
+    }
+    else
+    {
+        canvasPending.push(msg);
+    }
 }
 
-// Draw a pause button in the middle of the canvas.
-function canvasDrawPauseButton()
+// Actual canvas width and height don't match the CSS (I think?), still figuring this out...
+// Using the offset dimensions works for now
+function canvasResize()
 {
-    canvasContext.fillStyle = "white";
-    canvasContext.fillRect(canvas.width/2-5, canvas.height/2-10, 5, 20);
-    canvasContext.fillRect(canvas.width/2+5, canvas.height/2-10, 5, 20);
+    canvasPost({type: "resize", width: canvas.offsetWidth, height: canvas.offsetHeight});
 }
 
-// Display a 'Live' indicator in the top right corner of the canvas.
-function canvasDrawLiveIndicator()
+function canvasInit()
 {
-    canvasContext.fillStyle = "white";
-    canvasContext.font = '16px Consolas';
-    canvasContext.fillText("Live", canvas.width-50, 20);
-    canvasContext.fillStyle = "red";
-    canvasContext.fillRect(canvas.width-60, 10, 10, 10);
+    if (canvas.transferControlToOffscreen && window.Worker)
+    {
+        const offscreen = canvas.transferControlToOffscreen();
+        canvasWorker = new Worker("js/SpectrumWorker.js");
+        canvasWorker.postMessage({type: "init", canvas: offscreen, showStats: canvasShowStats,
+                                  width: canvas.offsetWidth, height: canvas.offsetHeight},
+                                 [offscreen]);
+        return;
+    }
+
+    const script = document.createElement("script");
+    script.src = "js/SpectrumRenderer.js";
+    script.onload = () =>
+    {
+        canvasRenderer = new SpectrumRenderer(canvas, canvasShowStats);
+        canvasRenderer.resize(canvas.offsetWidth, canvas.offsetHeight);
+        canvasRenderer.drawPaused();
+        for (const msg of canvasPending)
+        {
+            canvasRenderer.handle(msg);
+        }
+        canvasPending = [];
+    };
+    document.head.appendChild(script);
 }
 
 
@@ -43,29 +76,45 @@ function canvasDrawLiveIndicator()
 /*
     Functions to control actual audio playback.
 
-    TODO: Playback of WAV files not supported on iOS/Safari (!), so figure out
-          a way of loading WAV files using JavaScript and converting to e.g. MP3 on-the-fly.
-          Real-time compression on the Pico may be possible using the second core,
-          so look into that too.
+    The stream is played with low latency through the jitter buffer of StreamPlayer.js,
+    whichever the format (and wherever the page is browsed from, see StreamPlayer.js).
 */
 
-// TODO: Figure out how to extract sample rate after audio.load(),
-//       either through reading WAV header or otherwise.
-var audio = document.getElementById("audio");
-var audioSampleRate = 30000;
+var audioStatsElem = document.getElementById("audio-stats");
 var audioPlaying = false;
 
+// the stream's own sample rate (from its WAV header) is resampled to this by the jitter buffer
+var audioSampleRate = 30000;
+
+// 'adpcm' streams at half the bandwidth (or less) of 'wav', at a lower quality but on quiet audio,
+// and 'ulaw' at the bandwidth of 8-bit PCM with better quality when the Pico captures at 12 bits
+var audioFormat = 'adpcm';
+
+// the audio is served by the same server (and port) as the page
+function audioStreamUrl(ext)
+{
+    return 'audio.' + ext;
+}
+
+// Show the state of the jitter buffer (see StreamPlayer.js).
+function audioShowStats(stats)
+{
+    audioStatsElem.innerText = "Buffer " + Math.round(stats.depth) + " ms (target " +
+                               Math.round(stats.target) + " ms), " + stats.underruns +
+                               " underruns, " + Math.round(stats.dropped) + " ms dropped";
+}
+
 function startAudio()
 {
-    audio.src = window.location.protocol + '//' + window.location.hostname + ':1234/audio.wav';
-    audio.preload = "none"; // setting preload to "none" doesn't seem to work on Chrome?
-    audio.load();
-    audio.play();
+    audioContextInit();
+
+    audioStatsElem.style.visibility = "visible";
+    streamPlayerStart(audioStreamUrl(audioFormat), audioContext, audioAnalyser, audioShowStats);
 }
 function stopAudio()
 {
-    audio.src = audio.src; // allows the stream to end when not playing (save bandwidth)
-    audio.pause();
+    streamPlayerStop(); // (which ends the stream, to save bandwidth)
+    audioStatsElem.style.visibility = "hidden";
 }
 
 
@@ -82,73 +131,105 @@ function stopAudio()
     TODO: Implement setting to allow either scope view or current spectrum view (or disabled).
 */
 
-var renderRequestID;
+var renderRequestID = null;
 
 var audioContext = null;
-var audioSource = null;
 var audioAnalyser = null;
 
-function startVisualizer()
+// Frames are taken from the analyser at up to visualizerMaxFps, dropping to visualizerIdleFps
+// once the spectrum hasn't changed for visualizerIdleFrames frames (e.g. while muted), and not
+// at all while the page is hidden.
+const visualizerMaxFps = 60;
+const visualizerIdleFps = 5;
+const visualizerIdleFrames = 30;
+
+// initialize the audio context on user action (disabled AutoPlay cancels otherwise)
+function audioContextInit()
 {
-    // initialize the audio context on user action (disabled AutoPlay cancels otherwise)
     if (audioContext == null)
     {
         audioContext = new AudioContext({sampleRate: audioSampleRate});
         audioAnalyser = audioContext.createAnalyser();
 
-        audioSource = audioContext.createMediaElementSource(audio);
-        audioSource.connect(audioAnalyser);
-
         // no distortion, connect directly to audio context
         audioAnalyser.connect(audioContext.destination);
     }
+}
+
+function startVisualizer()
+{
+    audioContextInit();
 
     audioAnalyser.fftSize = 128;
     const bufferLength = audioAnalyser.frequencyBinCount;
-    const dataArray = new Uint8Array(bufferLength);
+    let dataArray = new Uint8Array(bufferLength);
     const lastDataArray = new Uint8Array(bufferLength);
 
-    canvasDrawBlack();
+    let frameInterval = 1000 / visualizerMaxFps;
+    let lastFrameTime = 0;
+    let unchangedFrames = 0;
 
-    function drawSpectrum()
+    function sampleSpectrum(now)
     {
-        renderRequestID = requestAnimationFrame(drawSpectrum);
-
-        audioAnalyser.getByteFrequencyData(dataArray);
-
-        canvasDrawBlack();
-        canvasDrawLiveIndicator();
+        renderRequestID = requestAnimationFrame(sampleSpectrum);
 
-        const gradFill = canvasContext.createLinearGradient(0, 0, 0, 640);
-        gradFill.addColorStop(0, "green");
-        gradFill.addColorStop(1, "blue");
-
-        const barWidth = (canvas.width / bufferLength) * 0.6;
-        const spaceWidth = (canvas.width / bufferLength) * 0.4;
-        let barHeight;
-        let x = 0;
+        // with a ms of slack, so frames due at the display's rate aren't skipped over jitter
+        if (now - lastFrameTime < frameInterval - 1)
+        {
+            return;
+        }
+        lastFrameTime = now;
 
-        for (var i = 0; i < bufferLength; i++) {
-            barHeight = dataArray[i];
+        audioAnalyser.getByteFrequencyData(dataArray);
 
-            canvasContext.fillStyle = gradFill;
-            canvasContext.fillRect(x, canvas.height - barHeight, barWidth, barHeight);
+        let changed = false;
+        for (let i = 0; i < bufferLength; i++)
+        {
+            if (dataArray[i] !== lastDataArray[i])
+            {
+                changed = true;
+                break;
+            }
+        }
 
-            x += barWidth + spaceWidth;
+        if (!changed)
+        {
+            unchangedFrames++;
+            if (unchangedFrames >= visualizerIdleFrames)
+            {
+                frameInterval = 1000 / visualizerIdleFps;
+            }
+            return;
+        }
+        unchangedFrames = 0;
+        frameInterval = 1000 / visualizerMaxFps;
+        lastDataArray.set(dataArray);
+
+        // the snapshot is handed over to the worker, so take the next one in a new array
+        canvasPost({type: "frame", data: dataArray}, [dataArray.buffer]);
+        if (canvasWorker)
+        {
+            dataArray = new Uint8Array(bufferLength);
         }
     }
 
-    drawSpectrum();
+    cancelAnimationFrame(renderRequestID);
+    renderRequestID = requestAnimationFrame(sampleSpectrum);
 };
 
 function stopVisualizer()
 {
-    // set a timeout to have a smooth fade away of spectrum when audio stops
+    cancelAnimationFrame(renderRequestID);
+    renderRequestID = null;
+}
+
+// set a timeout to have a smooth fade away of spectrum when audio stops
+function pauseVisualizer()
+{
     setTimeout(() =>
     {
-        cancelAnimationFrame(renderRequestID);
-        canvasDrawBlack();
-        canvasDrawPauseButton();
+        stopVisualizer();
+        canvasPost({type: "pause"});
     }, 100);
 };
 
@@ -157,7 +238,7 @@ canvas.addEventListener('click', function(event)
     if (audioPlaying)
     {
         stopAudio();
-        stopVisualizer();
+        pauseVisualizer();
     }
     else
     {
@@ -167,25 +248,35 @@ canvas.addEventListener('click', function(event)
     audioPlaying = !audioPlaying;
 }, false);
 
-// Keep the canvas and spectrum resolution in line with window resizing.
-// See: https://developer.mozilla.org/en-US/docs/Web/API/Window/resize_event
-addEventListener('resize', (event) =>
+// Nothing is drawn while the page is hidden.
+document.addEventListener('visibilitychange', () =>
 {
-    canvas.width = canvas.offsetWidth;
-    canvas.height = canvas.offsetHeight;
+    if (!audioPlaying)
+    {
+        return;
+    }
 
-    if (audioPlaying)
+    if (document.hidden)
     {
-        cancelAnimationFrame(renderRequestID);
-        startVisualizer();
+        stopVisualizer();
     }
     else
     {
-        canvasDrawBlack();
-        canvasDrawPauseButton();
+        startVisualizer();
+    }
+});
+
+// Keep the canvas and spectrum resolution in line with window resizing.
+// See: https://developer.mozilla.org/en-US/docs/Web/API/Window/resize_event
+addEventListener('resize', (event) =>
+{
+    canvasResize();
+
+    if (!audioPlaying)
+    {
+        canvasPost({type: "pause"});
     }
 });
 
 // Draw initial black canvas with a pause button.
-canvasDrawBlack();
-canvasDrawPauseButton();
+canvasInit();
@@ -0,0 +1,163 @@
+/*
+    AudioWorklet playing the audio fetched and decoded by StreamPlayer.js, through a small
+    adaptive jitter buffer (a ring of samples at the stream's own sample rate).
+
+    It adapts as the jitter buffer of StreamPlayer.js does without AudioWorklet, with the same
+    parameters ('streamPlayerJitter', given as the processor's options), but one render quantum
+    at a time: if it's far behind, the oldest audio is dropped to get back to the target.
+
+    The stream's sample rate is resampled (linearly) to the audio context's, so the context
+    doesn't have to match the stream.
+
+    Messages from StreamPlayer.js:
+        {type: "format", sampleRate}    the stream's sample rate
+        {type: "samples", samples}      a Float32Array of decoded samples
+    Reports back {depth, target, underruns, dropped} (times in ms) every reportInterval s.
+*/
+
+// ring size in samples (a power of 2), ~2 s at the Pico's sample rate
+const jitterRingSize = 1 << 16;
+
+class JitterBufferProcessor extends AudioWorkletProcessor
+{
+    constructor(options)
+    {
+        super();
+
+        this.params = options.processorOptions;
+
+        this.ring = new Float32Array(jitterRingSize);
+        this.mask = jitterRingSize - 1;
+        this.write = 0;
+        this.read = 0;
+
+        this.sourceRate = sampleRate;
+        this.target = this.params.targetMin;
+        this.playing = false;
+
+        this.underruns = 0;
+        this.dropped = 0;
+        this.lastUnderrun = currentTime;
+        this.lastReport = currentTime;
+
+        this.port.onmessage = (event) =>
+        {
+            const msg = event.data;
+
+            if (msg.type === "format")
+            {
+                this.sourceRate = msg.sampleRate;
+            }
+            else if (msg.type === "samples")
+            {
+                this.push(msg.samples);
+            }
+        };
+    }
+
+    // samples queued, in s
+    depth()
+    {
+        return (this.write - this.read) / this.sourceRate;
+    }
+
+    push(samples)
+    {
+        for (let i = 0; i < samples.length; i++)
+        {
+            this.ring[(this.write + i) & this.mask] = samples[i];
+        }
+        this.write += samples.length;
+
+        // overflowing the ring drops the oldest samples
+        if (this.write - this.read > jitterRingSize - 1)
+        {
+            this.drop(this.write - this.read - (jitterRingSize - 1));
+        }
+    }
+
+    drop(n)
+    {
+        this.read += n;
+        this.dropped += n / this.sourceRate;
+    }
+
+    underrun()
+    {
+        this.playing = false;
+        this.underruns++;
+        this.target = Math.min(this.target + this.params.targetStep, this.params.targetMax);
+        this.lastUnderrun = currentTime;
+    }
+
+    report()
+    {
+        if (currentTime - this.lastReport < this.params.reportInterval)
+        {
+            return;
+        }
+        this.lastReport = currentTime;
+
+        this.port.postMessage({depth: 1000 * this.depth(), target: 1000 * this.target,
+                               underruns: this.underruns, dropped: 1000 * this.dropped});
+    }
+
+    process(inputs, outputs)
+    {
+        const out = outputs[0][0];
+        const params = this.params;
+
+        if ((this.target > params.targetMin) &&
+            (currentTime - this.lastUnderrun > params.relaxTime))
+        {
+            this.target = Math.max(this.target - params.targetStep, params.targetMin);
+            this.lastUnderrun = currentTime;
+        }
+
+        if (!this.playing)
+        {
+            this.playing = (this.depth() >= this.target);
+        }
+        else if (this.depth() > params.dropFactor * this.target)
+        {
+            this.drop(Math.floor((this.depth() - this.target) * this.sourceRate));
+        }
+
+        if (!this.playing)
+        {
+            out.fill(0);
+            this.report();
+            return true;
+        }
+
+        let step = this.sourceRate / sampleRate;
+        if (this.depth() > params.catchUpFactor * this.target)
+        {
+            step *= params.catchUpSpeed;
+        }
+
+        for (let i = 0; i < out.length; i++)
+        {
+            // interpolating needs the sample after the one read too
+            if (this.write - this.read < 2)
+            {
+                out.fill(0, i);
+                this.underrun();
+                break;
+            }
+
+            const index = Math.floor(this.read);
+            const frac = this.read - index;
+            const a = this.ring[index & this.mask];
+            const b = this.ring[(index + 1) & this.mask];
+            out[i] = a + (b - a) * frac;
+
+            this.read += step;
+        }
+
+        this.report();
+        return true;
+    }
+}
+
+registerProcessor("jitter-buffer", JitterBufferProcessor);
@@ -0,0 +1,151 @@
+/*
+    Drawing of the audio visualizer, on a canvas given to it (normally an OffscreenCanvas
+    in SpectrumWorker.js, or the page's canvas where OffscreenCanvas isn't supported).
+
+    Driven by messages from AudioVisualizer.js (see 'handle'):
+        {type: "resize", width, height}
+        {type: "frame", data}   a getByteFrequencyData snapshot to draw
+        {type: "pause"}         draw the pause button instead of the spectrum
+
+    Everything that doesn't change between frames (the bar gradient and the 'Live' indicator)
+    is only drawn once per canvas size, and all the bars are filled as a single path.
+*/
+class SpectrumRenderer
+{
+    // 'showStats' adds an overlay of the frame rate and time taken to draw each frame
+    constructor(canvas, showStats)
+    {
+        this.canvas = canvas;
+        this.context = canvas.getContext("2d");
+        this.showStats = showStats;
+
+        this.gradient = null;
+        this.overlay = null;
+
+        this.frames = 0;
+        this.framesStart = performance.now();
+        this.drawTime = 0;
+        this.stats = "";
+    }
+
+    handle(msg)
+    {
+        if (msg.type === "resize")
+        {
+            this.resize(msg.width, msg.height);
+        }
+        else if (msg.type === "frame")
+        {
+            this.drawSpectrum(msg.data);
+        }
+        else if (msg.type === "pause")
+        {
+            this.drawPaused();
+        }
+    }
+
+    resize(width, height)
+    {
+        this.canvas.width = width;
+        this.canvas.height = height;
+
+        this.gradient = this.context.createLinearGradient(0, 0, 0, 640);
+        this.gradient.addColorStop(0, "green");
+        this.gradient.addColorStop(1, "blue");
+
+        this.overlay = this.createLiveIndicator();
+    }
+
+    // the 'Live' indicator for the top right corner, drawn once onto its own canvas
+    createLiveIndicator()
+    {
+        let overlay;
+        if (typeof OffscreenCanvas !== "undefined")
+        {
+            overlay = new OffscreenCanvas(60, 30);
+        }
+        else
+        {
+            overlay = document.createElement("canvas");
+            overlay.width = 60;
+            overlay.height = 30;
+        }
+        const context = overlay.getContext("2d");
+
+        context.fillStyle = "white";
+        context.font = '16px Consolas';
+        context.fillText("Live", 10, 20);
+        context.fillStyle = "red";
+        context.fillRect(0, 10, 10, 10);
+
+        return overlay;
+    }
+
+    drawBlack()
+    {
+        this.context.fillStyle = "black";
+        this.context.fillRect(0, 0, this.canvas.width, this.canvas.height);
+    }
+
+    // Draw a pause button in the middle of the canvas.
+    drawPaused()
+    {
+        const width = this.canvas.width;
+        const height = this.canvas.height;
+
+        this.drawBlack();
+        this.context.fillStyle = "white";
+        this.context.fillRect(width/2-5, height/2-10, 5, 20);
+        this.context.fillRect(width/2+5, height/2-10, 5, 20);
+    }
+
+    drawSpectrum(data)
+    {
+        const start = performance.now();
+        const context = this.context;
+        const width = this.canvas.width;
+        const height = this.canvas.height;
+
+        this.drawBlack();
+        context.drawImage(this.overlay, width-60, 0);
+
+        const barWidth = (width / data.length) * 0.6;
+        const spaceWidth = (width / data.length) * 0.4;
+        let x = 0;
+
+        context.beginPath();
+        for (let i = 0; i < data.length; i++)
+        {
+            context.rect(x, height - data[i], barWidth, data[i]);
+            x += barWidth + spaceWidth;
+        }
+        context.fillStyle = this.gradient;
+        context.fill();
+
+        if (this.showStats)
+        {
+            this.drawStats(performance.now() - start);
+        }
+    }
+
+    // Frame rate (over the last second) and mean time taken to draw a frame.
+    drawStats(frameTime)
+    {
+        const now = performance.now();
+
+        this.frames++;
+        this.drawTime += frameTime;
+        if (now - this.framesStart >= 1000)
+        {
+            const fps = 1000 * this.frames / (now - this.framesStart);
+            this.stats = fps.toFixed(1) + " fps, " + (this.drawTime / this.frames).toFixed(2) + " ms";
+            this.frames = 0;
+            this.drawTime = 0;
+            this.framesStart = now;
+        }
+
+        this.context.fillStyle = "white";
+        this.context.font = '12px Consolas';
+        this.context.fillText(this.stats, 10, 20);
+    }
+}
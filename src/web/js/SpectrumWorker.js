@@ -0,0 +1,24 @@
+/*
+    Worker drawing the audio visualizer on an OffscreenCanvas, so drawing doesn't compete with
+    the page (and the audio decoding) on the main thread. AudioVisualizer.js transfers the canvas
+    with an "init" message, then sends the spectrum to draw (see SpectrumRenderer.js).
+*/
+importScripts("SpectrumRenderer.js");
+
+var renderer = null;
+
+onmessage = (event) =>
+{
+    const msg = event.data;
+
+    if (msg.type === "init")
+    {
+        renderer = new SpectrumRenderer(msg.canvas, msg.showStats);
+        renderer.resize(msg.width, msg.height);
+        renderer.drawPaused();
+    }
+    else
+    {
+        renderer.handle(msg);
+    }
+};
@@ -26,40 +26,65 @@ function stationListToggle()
     stationListVisible = !stationListVisible;
 }
 
-// Assuming first element of the list is the scan button.
-// Maybe put the scan button as a separate item with its own CSS?
+// Assuming the scan buttons come first in the list, ahead of the stations.
 function stationListClear()
 {
-    const stationList = stationSidebarElem.getElementsByTagName('a');
-    let stationListLen = stationList.length;
-    for (var i = 1; i < stationListLen; i++)
+    const stationList = stationSidebarElem.getElementsByClassName('station');
+    while (stationList.length > 0)
     {
-        stationList[1].remove();
+        stationList[0].remove();
     }
 }
 
-function stationListRefresh(stationXML)
+// the stations last fetched from the Pico, each with its name, url, band, freq, rssi and snr
+var stationListStations = [];
+
+const stationListSortElem = document.getElementById("station-list-sort");
+const stationListMinSignalElem = document.getElementById("station-list-min-signal");
+
+function stationListRefresh(stations)
+{
+    stationListStations = stations;
+    stationListRender();
+}
+
+// Show the stations with at least the minimum signal strength chosen, in the order chosen.
+function stationListRender()
 {
     stationListClear();
 
-    let stations = stationXML.getElementsByTagName("station");
+    const sortBy = stationListSortElem.value;
+    const minSignal = Number(stationListMinSignalElem.value);
 
-    for (var i = 0; i < stations.length; i++)
+    let stations = stationListStations.filter(station => station.rssi >= minSignal);
+    if (sortBy !== "freq")
     {
-        let stationName = stations[i].getElementsByTagName("name")[0].innerHTML;
-        let stationUrl = stations[i].getElementsByTagName("url")[0].innerHTML;
+        // strongest first
+        stations.sort((a, b) => b[sortBy] - a[sortBy]);
+    }
 
-        let newStation = `<a href="javascript:void(0)"
+    for (const station of stations)
+    {
+        let newStation = `<a href="javascript:void(0)" class="station"
                              style=""
-                             onclick="webRadioTune('${stationUrl}', this)">
-                          ${stationName}</a>`;
+                             data-url="${station.url}"
+                             title="RSSI ${station.rssi} dB&micro;V, SNR ${station.snr} dB"
+                             onclick="webRadioTune('${station.url}', this)">
+                          ${station.name}</a>`;
 
         stationSidebarElem.insertAdjacentHTML("beforeend", newStation);
+
+        // keep the station tuned to highlighted
+        if (station.url === stationListSelectedUrl)
+        {
+            stationListUpdateSelection(stationSidebarElem.lastElementChild, true);
+        }
     }
 }
 
 // Highlight the selected station in the list based on choice of 'status'
 var lastStation;
+var stationListSelectedUrl;
 function stationListUpdateSelection(station, status)
 {
     if (lastStation)
@@ -70,16 +95,19 @@ function stationListUpdateSelection(station, status)
     if (status)
     {
         station.setAttribute('style', 'background-color: green; border-radius: 10px');
+        stationListSelectedUrl = station.dataset.url;
     }
     else
     {
         station.setAttribute('style', '');
+        stationListSelectedUrl = undefined;
     }
 
     lastStation = station;
 }
 
-function stationListSetScanStatus(scanStatus)
+// 'progress' (in %) is optional, and only shown while scanning
+function stationListSetScanStatus(scanStatus, progress)
 {
     const scanButton = stationSidebarElem.getElementsByTagName('a')[0];
 
@@ -92,6 +120,10 @@ function stationListSetScanStatus(scanStatus)
     {
         scanButton.setAttribute('style', "background-color: green; border-radius: 10px;");
         scanButton.innerText = 'Scanning...';
+        if (progress !== undefined)
+        {
+            scanButton.innerText += ' ' + progress + '%';
+        }
     }
     else if (scanStatus === "failed")
     {
@@ -0,0 +1,446 @@
+/*
+    Functions to play an audio stream from the Pico ('audio.wav', 'audio.adpcm' or 'audio.ulaw')
+    with low latency, through a small adaptive jitter buffer.
+
+    The stream is read with fetch() as it arrives, its WAV header parsed for the format and
+    sample rate, and the audio decoded here (8/16-bit PCM, mu-law, or IMA-ADPCM with
+    ADPCMStream.js) and handed over to the jitter buffer. Unlike the audio element, which buffers
+    seconds of audio before playing, this only buffers as much as the network's jitter needs
+    (about 60-250 ms, see 'streamPlayerJitter').
+
+    Playback starts (or restarts, after running dry) once the buffer holds the target depth.
+    The target starts low, is raised a step on every underrun, and lowered a step again after
+    a while without one. If the buffer grows past the target (e.g. after a network stall, or as
+    the Pico's clock runs slightly fast), playback speeds up a little to catch up, and if it's
+    still far behind, audio is dropped to get back to the target.
+
+    The jitter buffer works in any browser with Web Audio, by scheduling the decoded audio as
+    buffers back to back in the audio context (see 'StreamPlayerScheduler'), with the buffer's
+    depth being how far ahead of the context's time audio is scheduled. Where AudioWorklet is
+    available (only in a secure context, i.e. HTTPS or localhost, so not when browsing to the
+    Pico W itself), it's played through JitterBufferWorklet.js instead, which adapts at a finer
+    grain (of 128 samples rather than a buffer at a time).
+
+    An ADPCM stream can switch to a lower sample rate (and back) part way, with a new WAV header
+    (see ADPCMStream.js). Audio at a lower rate is upsampled back to the stream's first rate
+    here, so the jitter buffer keeps running at one rate throughout.
+
+    Much help from:
+        https://developer.mozilla.org/en-US/docs/Web/API/AudioWorklet
+        https://developer.mozilla.org/en-US/docs/Web/API/AudioBufferSourceNode
+        https://developer.mozilla.org/en-US/docs/Web/API/Streams_API/Using_readable_streams
+*/
+
+// Target depth (in s) of the jitter buffer, and how it adapts: above catchUpFactor times the
+// target playback speeds up by catchUpSpeed, and above dropFactor times the target audio is
+// dropped down to the target. The state of the buffer is reported every reportInterval s.
+// (also passed to JitterBufferWorklet.js)
+const streamPlayerJitter = {
+    targetMin: 0.06,
+    targetMax: 0.25,
+    targetStep: 0.02,
+    relaxTime: 10,
+    catchUpFactor: 1.5,
+    catchUpSpeed: 1.02,
+    dropFactor: 3,
+    reportInterval: 0.25,
+};
+
+// play through JitterBufferWorklet.js where AudioWorklet is available (or always schedule buffers)
+var streamPlayerUseWorklet = true;
+
+var streamPlayerAbort = null;
+var streamPlayerBuffer = null;
+var streamPlayerModule = null;
+
+function streamPlayerWorkletSupported(context)
+{
+    return (window.AudioWorkletNode !== undefined) && (context.audioWorklet !== undefined);
+}
+
+// Decode 'bytes' of PCM audio into a Float32Array, returning it with the bytes left over
+// (of a partial sample).
+function streamPlayerDecodePCM(bytes, bitsPerSample)
+{
+    if (bitsPerSample == 16)
+    {
+        const n = bytes.length >> 1;
+        const view = new DataView(bytes.buffer, bytes.byteOffset, n * 2);
+        const samples = new Float32Array(n);
+        for (let i = 0; i < n; i++)
+        {
+            samples[i] = view.getInt16(2 * i, true) / 32768;
+        }
+        return [samples, bytes.subarray(n * 2)];
+    }
+
+    // 8-bit samples are unsigned
+    const samples = new Float32Array(bytes.length);
+    for (let i = 0; i < bytes.length; i++)
+    {
+        samples[i] = (bytes[i] - 128) / 128;
+    }
+    return [samples, bytes.subarray(bytes.length)];
+}
+
+// the sample for each mu-law byte (see 'ulaw.h' in the native module)
+var streamPlayerULawTable = null;
+
+// Decode 'bytes' of mu-law audio into a Float32Array.
+function streamPlayerDecodeULaw(bytes)
+{
+    if (streamPlayerULawTable == null)
+    {
+        streamPlayerULawTable = new Float32Array(256);
+        for (let i = 0; i < 256; i++)
+        {
+            const byte = ~i & 0xff;
+            const sample = ((((byte & 0x0f) << 3) + 0x84) << ((byte >> 4) & 7)) - 0x84;
+            streamPlayerULawTable[i] = ((byte & 0x80) ? -sample : sample) / 32768;
+        }
+    }
+
+    const samples = new Float32Array(bytes.length);
+    for (let i = 0; i < bytes.length; i++)
+    {
+        samples[i] = streamPlayerULawTable[bytes[i]];
+    }
+    return samples;
+}
+
+// Upsample 'samples' by an integer 'factor', interpolating linearly from 'last' (the sample
+// before them).
+function streamPlayerUpsample(samples, factor, last)
+{
+    const out = new Float32Array(samples.length * factor);
+    for (let i = 0; i < samples.length; i++)
+    {
+        for (let k = 1; k <= factor; k++)
+        {
+            out[i * factor + k - 1] = last + (samples[i] - last) * k / factor;
+        }
+        last = samples[i];
+    }
+    return out;
+}
+
+// The jitter buffer without AudioWorklet: decoded audio is scheduled as AudioBufferSourceNodes
+// back to back, from 'nextTime' on. Until playback starts, audio waits in 'waiting' instead.
+class StreamPlayerScheduler
+{
+    constructor(context, destination, onStats)
+    {
+        this.context = context;
+        this.sampleRate = 0;
+
+        // route buffers through a node of their own, so buffers already scheduled can be cut off
+        this.output = context.createGain();
+        this.output.connect(destination);
+
+        this.waiting = [];
+        this.waitingSamples = 0;
+        this.scheduled = [];
+        this.nextTime = 0;
+        this.playing = false;
+        this.target = streamPlayerJitter.targetMin;
+
+        this.underruns = 0;
+        this.dropped = 0;
+        this.lastUnderrun = context.currentTime;
+
+        this.timer = setInterval(() => onStats(this.stats()),
+                                 1000 * streamPlayerJitter.reportInterval);
+    }
+
+    format(sampleRate)
+    {
+        this.sampleRate = sampleRate;
+    }
+
+    // audio buffered (scheduled ahead, or waiting for playback to start), in s
+    depth()
+    {
+        if (!this.playing)
+        {
+            return (this.sampleRate > 0) ? this.waitingSamples / this.sampleRate : 0;
+        }
+        return Math.max(this.nextTime - this.context.currentTime, 0);
+    }
+
+    stats()
+    {
+        return {depth: 1000 * this.depth(), target: 1000 * this.target,
+                underruns: this.underruns, dropped: 1000 * this.dropped};
+    }
+
+    push(samples)
+    {
+        const now = this.context.currentTime;
+        const jitter = streamPlayerJitter;
+
+        // the buffers scheduled so far have all played (i.e. it ran dry)
+        if (this.playing && (this.nextTime <= now))
+        {
+            this.playing = false;
+            this.underruns++;
+            this.target = Math.min(this.target + jitter.targetStep, jitter.targetMax);
+            this.lastUnderrun = now;
+        }
+
+        if ((this.target > jitter.targetMin) && (now - this.lastUnderrun > jitter.relaxTime))
+        {
+            this.target = Math.max(this.target - jitter.targetStep, jitter.targetMin);
+            this.lastUnderrun = now;
+        }
+
+        if (!this.playing)
+        {
+            this.waiting.push(samples);
+            this.waitingSamples += samples.length;
+            if (this.depth() < this.target)
+            {
+                return;
+            }
+
+            this.playing = true;
+            this.nextTime = now;
+            for (const waiting of this.waiting)
+            {
+                this.schedule(waiting, 1);
+            }
+            this.waiting = [];
+            this.waitingSamples = 0;
+            return;
+        }
+
+        // buffers that have finished playing are done with
+        while ((this.scheduled.length > 0) && (this.scheduled[0].end <= now))
+        {
+            this.scheduled.shift();
+        }
+
+        // far behind, the buffers not yet started are dropped (leaving the one playing)
+        if (this.depth() > jitter.dropFactor * this.target)
+        {
+            let last;
+            while ((this.scheduled.length > 1) &&
+                   ((last = this.scheduled[this.scheduled.length - 1]).start > now))
+            {
+                this.scheduled.pop();
+                last.source.stop();
+                this.dropped += last.end - last.start;
+                this.nextTime = last.start;
+            }
+        }
+
+        this.schedule(samples, (this.depth() > jitter.catchUpFactor * this.target) ?
+                               jitter.catchUpSpeed : 1);
+    }
+
+    // schedule 'samples' to play at 'nextTime', sped up by 'speed'
+    schedule(samples, speed)
+    {
+        const buffer = this.context.createBuffer(1, samples.length, this.sampleRate);
+        buffer.copyToChannel(samples, 0);
+
+        const source = this.context.createBufferSource();
+        source.buffer = buffer;
+        source.playbackRate.value = speed;
+        source.connect(this.output);
+        source.start(this.nextTime);
+
+        const end = this.nextTime + buffer.duration / speed;
+        this.scheduled.push({source: source, start: this.nextTime, end: end});
+        this.nextTime = end;
+    }
+
+    stop()
+    {
+        clearInterval(this.timer);
+        this.output.disconnect();
+    }
+}
+
+// The jitter buffer of JitterBufferWorklet.js, with the same methods as StreamPlayerScheduler.
+class StreamPlayerWorklet
+{
+    constructor(context, destination, onStats)
+    {
+        this.node = new AudioWorkletNode(context, "jitter-buffer",
+                                         {numberOfInputs: 0, outputChannelCount: [1],
+                                          processorOptions: streamPlayerJitter});
+        this.node.port.onmessage = (event) => onStats(event.data);
+        this.node.connect(destination);
+    }
+
+    format(sampleRate)
+    {
+        this.node.port.postMessage({type: "format", sampleRate: sampleRate});
+    }
+
+    push(samples)
+    {
+        this.node.port.postMessage({type: "samples", samples: samples}, [samples.buffer]);
+    }
+
+    stop()
+    {
+        this.node.disconnect();
+    }
+}
+
+// Start streaming from 'url', playing through 'destination' (e.g. the visualizer's analyser).
+// 'onStats' is called a few times a second with the state of the jitter buffer, as
+// {depth, target, underruns, dropped} (times in ms).
+async function streamPlayerStart(url, context, destination, onStats)
+{
+    streamPlayerStop();
+
+    const abort = new AbortController();
+    const signal = abort.signal;
+    streamPlayerAbort = abort;
+
+    let buffer;
+    if (streamPlayerUseWorklet && streamPlayerWorkletSupported(context))
+    {
+        if (streamPlayerModule == null)
+        {
+            streamPlayerModule = context.audioWorklet.addModule("js/JitterBufferWorklet.js");
+        }
+        await streamPlayerModule;
+        if (signal.aborted)
+        {
+            return;
+        }
+
+        buffer = new StreamPlayerWorklet(context, destination, onStats);
+    }
+    else
+    {
+        buffer = new StreamPlayerScheduler(context, destination, onStats);
+    }
+    streamPlayerBuffer = buffer;
+
+    try
+    {
+        const response = await fetch(url, {signal: signal});
+        const reader = response.body.getReader();
+        let pending = new Uint8Array(0);
+        let header = null;
+
+        // the stream's first sample rate, that of the jitter buffer
+        let sampleRate = 0;
+        let lastSample = 0;
+
+        while (!signal.aborted)
+        {
+            const {done, value} = await reader.read();
+            if (done)
+            {
+                break;
+            }
+
+            let joined = new Uint8Array(pending.length + value.length);
+            joined.set(pending);
+            joined.set(value, pending.length);
+            pending = joined;
+
+            while (true)
+            {
+                if (header == null)
+                {
+                    header = adpcmParseHeader(pending);
+                    if (header == null)
+                    {
+                        break;
+                    }
+                    if ((header.format != 0x01) && (header.format != 0x07) &&
+                        (header.format != 0x11))
+                    {
+                        throw new Error("Unsupported WAV format " + header.format);
+                    }
+                    if (sampleRate == 0)
+                    {
+                        sampleRate = header.sampleRate;
+                        buffer.format(sampleRate);
+                    }
+                    pending = pending.subarray(header.dataOffset);
+                }
+
+                let samples;
+                if (header.format == 0x11)
+                {
+                    // decode the blocks up to a new header (if any)
+                    let blocks = 0;
+                    while ((pending.length >= (blocks + 1) * header.blockAlign) &&
+                           !adpcmStartsWithHeader(pending.subarray(blocks * header.blockAlign)))
+                    {
+                        blocks++;
+                    }
+
+                    const blockSamples = (header.blockAlign - 4) * 2;
+                    samples = new Float32Array(blocks * blockSamples);
+                    for (let i = 0; i < blocks; i++)
+                    {
+                        adpcmDecodeBlock(pending.subarray(i * header.blockAlign, (i + 1) * header.blockAlign),
+                                         samples.subarray(i * blockSamples, (i + 1) * blockSamples));
+                    }
+                    pending = pending.subarray(blocks * header.blockAlign);
+                }
+                else if (header.format == 0x07)
+                {
+                    samples = streamPlayerDecodeULaw(pending);
+                    pending = pending.subarray(pending.length);
+                }
+                else
+                {
+                    [samples, pending] = streamPlayerDecodePCM(pending, header.bitsPerSample);
+                }
+
+                if (samples.length > 0)
+                {
+                    const factor = Math.round(sampleRate / header.sampleRate);
+                    if (factor > 1)
+                    {
+                        const last = lastSample;
+                        lastSample = samples[samples.length - 1];
+                        samples = streamPlayerUpsample(samples, factor, last);
+                    }
+                    else
+                    {
+                        lastSample = samples[samples.length - 1];
+                    }
+                    buffer.push(samples);
+                }
+
+                if ((header.format != 0x11) || !adpcmStartsWithHeader(pending))
+                {
+                    break;
+                }
+                header = null;
+            }
+        }
+    }
+    catch (error)
+    {
+        if (!signal.aborted)
+        {
+            console.log("Audio stream stopped: " + error);
+        }
+    }
+}
+
+function streamPlayerStop()
+{
+    if (streamPlayerAbort)
+    {
+        streamPlayerAbort.abort();
+        streamPlayerAbort = null;
+    }
+
+    if (streamPlayerBuffer)
+    {
+        streamPlayerBuffer.stop();
+        streamPlayerBuffer = null;
+    }
+}
@@ -27,34 +27,81 @@ function webRadioTune(url, navLink)
     xhttp.send();
 }
 
-function webRadioScan()
+// how often to check on a scan running on the Pico (in ms)
+const webRadioScanPollInterval = 500;
+
+function webRadioScanFailed()
+{
+    stationListSetScanStatus("failed");
+    setTimeout(() =>
+    {
+        stationListSetScanStatus("idle");
+    }, 2000);
+}
+
+// Start a scan, which runs in the background on the Pico, and follow its progress.
+// A quick scan only re-checks the stations already found, while a 'full' scan seeks through
+// the whole of each band.
+function webRadioScan(full)
 {
-    stationListSetScanStatus("scanning");
+    stationListSetScanStatus("scanning", 0);
 
     var xhttp = new XMLHttpRequest();
     xhttp.onreadystatechange = function()
     {
         if (this.readyState == 4)
         {
-            if (xhttp.status == 200)
-            {                
-                stationListSetScanStatus("idle");
-                stationListRefresh(this.responseXML);
+            if (this.status == 202)
+            {
+                setTimeout(webRadioPollScan, webRadioScanPollInterval);
             }
             else
             {
-                stationListSetScanStatus("failed");
-                setTimeout(() =>
-                {
-                    stationListSetScanStatus("idle");
-                }, 2000);
+                webRadioScanFailed();
+            }
+        }
+    };
+    xhttp.open("POST", full ? "scan/full" : "scan", true);
+    xhttp.send();
+}
+
+// Check on the scan (if any), refreshing the station list once it's done.
+function webRadioPollScan()
+{
+    var xhttp = new XMLHttpRequest();
+    xhttp.onreadystatechange = function()
+    {
+        if (this.readyState == 4)
+        {
+            if (this.status != 200)
+            {
+                webRadioScanFailed();
+                return;
+            }
+
+            const scan = JSON.parse(this.responseText);
+            if (scan.state === "scanning")
+            {
+                stationListSetScanStatus("scanning", scan.progress);
+                setTimeout(webRadioPollScan, webRadioScanPollInterval);
+            }
+            else if (scan.state === "failed")
+            {
+                webRadioScanFailed();
+            }
+            else
+            {
+                stationListSetScanStatus("idle");
+                webRadioGetStations();
             }
         }
     };
-    xhttp.open("GET", "scan.xml", true);
+    xhttp.open("GET", "scan.json", true);
     xhttp.send();
 }
 
+// The station list comes with the signal of each station, so it can be sorted and filtered
+// without asking the Pico again.
 function webRadioGetStations()
 {
     var xhttp = new XMLHttpRequest();
@@ -62,11 +109,12 @@ function webRadioGetStations()
     {
         if (this.readyState == 4 && this.status == 200)
         {
-            stationListRefresh(this.responseXML);
+            stationListRefresh(JSON.parse(this.responseText));
         }
     };
-    xhttp.open("GET", "stations.xml", true);
+    xhttp.open("GET", "stations.json", true);
     xhttp.send();
 }
 
-webRadioGetStations();
+// the Pico may still be scanning for the initial station list
+webRadioPollScan();
@@ -0,0 +1,154 @@
+#!/bin/python3
+
+# Host test of the adaptive sample rate of ADPCM streams (see 'AudioServer' in
+# 'PicoWebRadio.py'), with the whole app running in the host emulator (see 'pico_emu.py').
+#
+# A listener reads the stream slower than it's sent (through a small receive buffer, so the
+# server soon has to wait on it), and should be stepped down to a quarter of the sample rate;
+# then it reads as fast as it can, and should be stepped back up to the full rate. Throughout,
+# each new WAV header must come at a block boundary, with the blocks after it of the size it
+# gives, and no buffer may be skipped other than those dropped while the listener fell behind
+# (including any skipped by catching it up to the live edge, marked by a block of silence, see
+# 'STREAM_POLICIES'). Reports when each switch reached the listener (after whatever was sent
+# before it), and how many buffers were dropped while it fell behind.
+#
+# Usage: adaptive_rate_test.py [throttled kB/s]
+
+import os
+import socket
+import struct
+import sys
+import time
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, TEST_DIR)
+
+import pico_emu
+import PicoWebRadio
+import WAVBuffer
+
+HOST = '127.0.0.1'
+HTML_PORT = 18082
+
+RECV_BUF_SIZE = 4096
+
+# longest each phase may take: a step down needs the server's socket buffers to fill first, and
+# each step up TIER_UP_MS of buffers kept up with
+THROTTLED_TIME = 30
+RECOVER_TIME = 3 * (PicoWebRadio.TIER_UP_MS + PicoWebRadio.TIER_HOLD_MS) / 1000
+
+class Listener:
+    def __init__(self):
+        self.sock = socket.socket()
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUF_SIZE)
+        self.sock.connect((HOST, HTML_PORT))
+        self.sock.sendall(b'GET /audio.adpcm HTTP/1.0\r\n\r\n')
+        self.file = self.sock.makefile('rb')
+        while self.file.readline() != b'\r\n':
+            pass
+
+        self.start = time.monotonic()
+        self.switches = []
+        self.last_index = None
+        self.dropped = 0
+        self.catch_ups = 0
+        self.factor = self.read_header()
+        assert self.factor == 1
+
+    # read the WAV header at the start of the stream or at a switch, returning its factor
+    def read_header(self):
+        header = self.file.read(len(WAVBuffer.header(WAVBuffer.ADPCM)))
+        assert header[:4] == b'RIFF', header[:4]
+        sample_rate, byte_rate, self.block_align = struct.unpack_from('<IIH', header, 24)
+        samples_per_block = struct.unpack_from('<H', header, 38)[0]
+
+        factor = WAVBuffer.SAMPLE_RATE // sample_rate
+        assert header == WAVBuffer.header(WAVBuffer.ADPCM, factor)
+        assert self.block_align == 4 + (samples_per_block - 1) // 2
+        assert byte_rate == self.block_align / WAVBuffer.BUF_PERIOD
+        return factor
+
+    # read the next block (or a header then a block), throttled to 'rate' bytes/s (if given)
+    def read_block(self, rate=None):
+        first = self.file.read(4)
+        if (first == b'RIFF'):
+            self.file = PrefixedFile(first, self.file)
+            self.factor = self.read_header()
+            self.file = self.file.file
+            self.switches.append((time.monotonic() - self.start, self.factor, self.dropped))
+            first = self.file.read(4)
+
+        block = first + self.file.read(self.block_align - 4)
+        assert len(block) == self.block_align
+        assert block[3] == 0, 'Not a block header'
+
+        # the silence sent when catching up isn't stamped
+        if (block == bytes(len(block))):
+            self.catch_ups += 1
+            return
+
+        index = struct.unpack_from('<I', block, WAVBuffer.STAMP_OFFSET[WAVBuffer.ADPCM])[0]
+        if (self.last_index is not None):
+            assert index > self.last_index
+            self.dropped += index - self.last_index - 1
+        self.last_index = index
+
+        if (rate):
+            time.sleep(len(block) / rate)
+
+    def close(self):
+        self.sock.close()
+
+# a file whose first bytes have already been read
+class PrefixedFile:
+    def __init__(self, prefix, file):
+        self.prefix = prefix
+        self.file = file
+
+    def read(self, n):
+        return self.prefix + self.file.read(n - len(self.prefix))
+
+def main(throttled_rate):
+    web_dir = pico_emu.setup()
+    WAVBuffer.STAMP = True
+    pico_emu.start(HTML_PORT)
+
+    try:
+        listener = Listener()
+
+        # throttled: step down to the lowest rate
+        deadline = time.monotonic() + THROTTLED_TIME
+        while ((listener.factor != PicoWebRadio.AUDIO_FACTORS[-1]) and
+               (time.monotonic() < deadline)):
+            listener.read_block(throttled_rate)
+        assert listener.factor == PicoWebRadio.AUDIO_FACTORS[-1], listener.switches
+        throttled_switches = len(listener.switches)
+
+        # reading as fast as it comes: step back up to the full rate
+        deadline = time.monotonic() + RECOVER_TIME
+        recover_start = time.monotonic() - listener.start
+        while ((listener.factor != 1) and (time.monotonic() < deadline)):
+            listener.read_block()
+        assert listener.factor == 1, listener.switches
+
+        switches = [factor for _, factor, _ in listener.switches]
+        assert switches[:throttled_switches] == [2, 4], switches
+        assert switches[-2:] == [2, 1], switches
+
+        # buffers are only dropped while falling behind, i.e. none once stepping back up (the
+        # buffers dropped before it can still be on the way at the step down, so arrive later)
+        dropped = listener.switches[-2][2]
+        assert listener.dropped == dropped, (dropped, listener.dropped)
+
+        listener.close()
+    finally:
+        pico_emu.cleanup(web_dir)
+
+    print('Adaptive rate checks passed (throttled to {:g} kB/s, {} buffers dropped, {} catch-ups)'
+          .format(throttled_rate / 1000, dropped, listener.catch_ups))
+    for t, factor, _ in listener.switches:
+        print('  {:5.1f} s: {:5} Hz ({})'.format(t, WAVBuffer.SAMPLE_RATE // factor,
+              'throttled' if (t < recover_start) else 'unthrottled'))
+
+if __name__ == '__main__':
+    main(1000 * float(sys.argv[1]) if len(sys.argv) > 1 else 5000)
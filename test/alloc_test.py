@@ -0,0 +1,319 @@
+#!/bin/python3
+
+# Host benchmark of the heap allocated by the web server per request (see 'HTTPUtil.py' and
+# 'HTMLServer' in 'PicoWebRadio.py'), running the real PicoWebRadio.HTMLServer on CPython (see
+# 'host/mpyhost.py'), so that allocations creeping back into the request path are caught before
+# they cause GC pauses on the Pico W (where a collection stalls every audio stream with it).
+#
+# Each kind of request (sent with the headers a browser sends) is replayed many times over one
+# keep-alive connection, through a stream that hands the server one request per read, and the
+# heap is sampled whenever the server reads:
+#   - allocated: the most the heap grew by while handling a request, i.e. its temporary
+#     objects. On MicroPython that's the 'gc.mem_alloc()' delta over the request (nothing is
+#     freed until a collection), while CPython frees temporaries as soon as they're dropped, so
+#     the peak (from tracemalloc, which 'gc.mem_alloc()' reports on the host) stands in for it,
+#   - retained: what the heap kept per request once handled (which should be nothing).
+# CPython's own 'wait_for' (a Task per read) is replaced by a pass-through, so that only the
+# app's allocations are counted. Fails if a request allocates more than its budget.
+#
+# Then the same for whole connections, each making one request, from being accepted to being
+# closed: a keep-alive connection loading the page, and an audio stream, sending STREAM_SENDS
+# buffers (from a ring that always has one waiting) before the listener goes:
+#   - allocated: as above, over the connection,
+#   - held: what the heap held for the connection while it was open (idle after the response,
+#     or streaming), i.e. what each open connection costs,
+#   - retained: what the heap kept once it was closed (which should be nothing, the request
+#     buffers being kept for the next connection).
+# The first connection of each kind isn't counted, as it allocates the buffers that the next ones
+# reuse. Fails if a connection holds more than its budget while open. Also checks that audio
+# streams ended by other errors than a reset (more of them than there are listeners) give back
+# their cursor into the ring, rather than holding it until a reboot, and that cancelling a
+# stream's task (other than for stalling, see 'AudioServer.check_drains') stops it.
+#
+# Usage: alloc_test.py [requests per kind]
+
+import array
+import asyncio
+import errno
+import os
+import sys
+import tracemalloc
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, TEST_DIR)
+
+import pico_emu
+import http_keepalive_test
+import HTTPUtil
+import PicoWebRadio
+
+# what a browser sends along with its requests
+BROWSER_HEADERS = 'Host: 192.168.1.50\r\n' \
+                  'User-Agent: Mozilla/5.0 (X11; Linux x86_64; rv:120.0) Gecko/20100101 ' \
+                  'Firefox/120.0\r\n' \
+                  'Accept: */*\r\n' \
+                  'Accept-Language: en-US,en;q=0.5\r\n' \
+                  'Accept-Encoding: gzip, deflate\r\n' \
+                  'Referer: http://192.168.1.50/\r\n' \
+                  'Connection: keep-alive\r\n'
+
+# the kinds of requests, with the most each may allocate (in bytes, as measured on the host):
+# the tune is to a known station (whose signal is updated in RAM), and what the rest allocate
+# is mostly their body (e.g. 'scan.json'; the page is sent from the cache, see 'AssetCache.py',
+# without touching its file)
+REQUESTS = (
+    ('PATCH /tune/fm/10110', '', 256),
+    ('GET /stations.json', '', 256),
+    ('GET /scan.json', '', 1536),
+    ('GET / (not modified)', 'If-None-Match: {etag}\r\n', 512),
+    ('GET /', '', 512),
+)
+
+WARMUP = 10
+
+# the kinds of connections, with the most each may hold while open (in bytes, as measured on the
+# host): neither allocates a request buffer of its own (see 'HTMLServer.html_client'), and an
+# audio stream gives the one it took back before streaming, holding only its state
+CONNECTIONS = (
+    ('GET / (keep-alive)', 'GET /', 2048),
+    ('GET /audio.wav', 'GET /audio.wav', 1536),
+)
+
+# buffers sent on an audio stream before the listener goes
+STREAM_SENDS = 10
+
+# the radio of 'http_keepalive_test.py', without keeping a list of the tunes
+class FakeRadio(http_keepalive_test.FakeRadio):
+    async def tune_async(self, band, freq):
+        return [1, 30, 10]
+
+# Stands in for a connection's stream, handing the server one request per read and sampling
+# the heap each time (i.e. between requests). What's written is only counted.
+class ReplayStream:
+    def __init__(self, req, n):
+        self.__req = req
+        self.__left = n
+        self.head = b''
+        self.__head_done = False
+
+        # (allocated up front, and without an int object per sample, so sampling doesn't allocate)
+        self.allocated = array.array('q', bytes(8 * n))
+        self.retained = array.array('q', bytes(8 * n))
+        self.__samples = -1
+        self.__current = 0
+        self.__last = 0
+
+    def __sample(self):
+        current, peak = tracemalloc.get_traced_memory()
+        i = self.__samples
+        if (i >= 0):
+            self.allocated[i] = peak - self.__current
+            self.retained[i] = current - self.__last
+        self.__samples = i + 1
+        self.__last = current
+        tracemalloc.reset_peak()
+        self.__current = tracemalloc.get_traced_memory()[0]
+
+    def __next(self):
+        self.__sample()
+        if (self.__left == 0):
+            return b''
+        self.__left -= 1
+        return self.__req
+
+    async def read(self, n=-1):
+        return self.__next()[:n]
+
+    async def readinto(self, buf):
+        data = self.__next()
+        buf[:len(data)] = data
+        return len(data)
+
+    # (keeping the first response's head, which may be written in pieces)
+    def write(self, buf):
+        if (not self.__head_done):
+            self.head += bytes(buf)
+            self.__head_done = b'\r\n\r\n' in self.head
+
+    async def drain(self):
+        pass
+
+    async def wait_closed(self):
+        pass
+
+# Stands in for an accepted connection's stream, handing the server one request and then closing
+# (after STREAM_SENDS sends, for an audio stream), and sampling the heap each time the server reads
+# or sends (i.e. while the connection is open).
+class ConnectionStream:
+    def __init__(self, req, error=errno.ECONNRESET):
+        self.__req = req
+        self.__error = error
+        self.__sends = 0
+
+        # (allocated up front, so sampling doesn't allocate)
+        self.held = array.array('q', bytes(8))
+
+    def __sample(self):
+        self.held[0] = tracemalloc.get_traced_memory()[0]
+
+    async def read(self, n=-1):
+        return (await self.__next())[:n]
+
+    async def readinto(self, buf):
+        data = await self.__next()
+        buf[:len(data)] = data
+        return len(data)
+
+    async def __next(self):
+        req = self.__req
+        self.__req = b''
+        if (not req):
+            self.__sample()
+        return req
+
+    def write(self, buf):
+        pass
+
+    def close(self):
+        pass
+
+    async def drain(self):
+        self.__sends += 1
+        if (self.__sends > STREAM_SENDS):
+            self.__sample()
+            raise OSError(self.__error, 'Connection lost')
+
+    async def wait_closed(self):
+        pass
+
+# Make 'n' connections (after one to warm up), each sending 'req', returning what each allocated,
+# held while open and retained (see above).
+async def connections(server, req, n):
+    allocated = array.array('q', bytes(8 * n))
+    held = array.array('q', bytes(8 * n))
+    retained = array.array('q', bytes(8 * n))
+
+    await server.html_client(ConnectionStream(req), ConnectionStream(req))
+    for i in range(n):
+        stream = ConnectionStream(req)
+        tracemalloc.reset_peak()
+        start = tracemalloc.get_traced_memory()[0]
+        await server.html_client(stream, stream)
+        current, peak = tracemalloc.get_traced_memory()
+        allocated[i] = peak - start
+        held[i] = stream.held[0] - start
+        retained[i] = current - start
+
+    return allocated, held, retained
+
+# Make more audio streams than there are listeners, each ending with a different error, then
+# check that every listener is free again.
+async def stream_errors(server, req):
+    errors = (errno.EPIPE, errno.ECONNABORTED, errno.ENOTCONN, errno.ETIMEDOUT)
+    for i in range(PicoWebRadio.WAVBuffer.MAX_LISTENERS + 1):
+        stream = ConnectionStream(req, errors[i % len(errors)])
+        await server.html_client(stream, stream)
+
+    wav_buffer = PicoWebRadio.WAVBuffer
+    stream_ids = [wav_buffer.open() for _ in range(wav_buffer.MAX_LISTENERS)]
+    for stream_id in stream_ids:
+        wav_buffer.close(stream_id)
+
+# A connection whose listener stops taking what's sent after a few sends.
+class StalledStream(ConnectionStream):
+    sends = 0
+
+    async def drain(self):
+        self.sends += 1
+        if (self.sends > 2):
+            await asyncio.sleep(3600)
+
+# Cancel an audio stream's task while it waits on a send, checking that the cancellation goes
+# through and the stream's listener is given back.
+async def stream_cancel(server, req):
+    streams = server._HTMLServer__audio.streams
+    stream = StalledStream(req)
+    task = asyncio.create_task(server.html_client(stream, stream))
+    while (stream.sends <= 2):
+        await asyncio.sleep(0)
+    assert len(streams) == 1
+
+    task.cancel()
+    try:
+        await task
+        assert False, 'stream not cancelled'
+    except asyncio.CancelledError:
+        pass
+    assert len(streams) == 0
+
+async def pass_through(aw, timeout):
+    return await aw
+
+def replay(server, req, n):
+    stream = ReplayStream(req, n)
+    asyncio.run(server.html_client(stream, stream))
+    return stream
+
+def main(n):
+    web_dir = pico_emu.setup()
+    HTTPUtil.asyncio.wait_for = pass_through
+    server = PicoWebRadio.HTMLServer(radio=FakeRadio(), audio=PicoWebRadio.AudioServer())
+
+    # (the stream's buffers, always one waiting, as the ring's slots are allocated once)
+    fetch = PicoWebRadio.WAVBuffer.fetch
+    audio_buf = bytearray(PicoWebRadio.WAVBuffer.geometry()[1])
+    PicoWebRadio.WAVBuffer.fetch = lambda stream_id: audio_buf
+
+    try:
+        # the ETag the server sends for the page, for it to answer 'not modified'
+        head = replay(server, b'GET / HTTP/1.1\r\n\r\n', 1).head
+        etag = [line.split(b': ')[1].decode() for line in head.split(b'\r\n')
+                if line.startswith(b'ETag: ')][0]
+
+        tracemalloc.start()
+        results = []
+        for line, headers, budget in REQUESTS:
+            method, path = line.split(' ')[:2]
+            req = '{} {} HTTP/1.1\r\n{}{}\r\n'.format(method, path, BROWSER_HEADERS,
+                                                      headers.format(etag=etag)).encode()
+            stream = replay(server, req, WARMUP + n)
+            assert b' 200 ' in stream.head or b' 204 ' in stream.head or \
+                   b' 304 ' in stream.head, stream.head
+            allocated = stream.allocated[WARMUP:]
+            retained = stream.retained[WARMUP:]
+            results.append((line, len(req), allocated, retained, budget))
+
+        conn_results = []
+        for line, req_line, budget in CONNECTIONS:
+            req = '{} HTTP/1.1\r\n{}\r\n'.format(req_line, BROWSER_HEADERS).encode()
+            conn_results.append((line, *asyncio.run(connections(server, req, n)), budget))
+        tracemalloc.stop()
+
+        asyncio.run(stream_errors(server, req))
+        asyncio.run(stream_cancel(server, req))
+    finally:
+        PicoWebRadio.WAVBuffer.fetch = fetch
+        pico_emu.cleanup(web_dir)
+
+    print('Heap allocated per request ({} requests of each kind, with browser headers):'
+          .format(n))
+    for line, size, allocated, retained, budget in results:
+        print('  {:22} ({:3} bytes): allocated mean {:6.0f}, max {:5} bytes; '
+              'retained {:4.1f} bytes'.format(line, size, sum(allocated) / n, max(allocated),
+                                              sum(retained) / n))
+
+    print('Heap per connection ({} connections of each kind, one request each):'.format(n))
+    for line, allocated, held, retained, budget in conn_results:
+        print('  {:22} allocated mean {:6.0f}, max {:5} bytes; held mean {:6.0f} bytes; '
+              'retained {:4.1f} bytes'.format(line, sum(allocated) / n, max(allocated),
+                                              sum(held) / n, sum(retained) / n))
+
+    for line, size, allocated, retained, budget in results:
+        assert max(allocated) <= budget, (line, max(allocated), budget)
+        assert abs(sum(retained) / n) < 1, (line, sum(retained) / n)
+    for line, allocated, held, retained, budget in conn_results:
+        assert max(held) <= budget, (line, max(held), budget)
+        assert abs(sum(retained) / n) < 1, (line, sum(retained) / n)
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
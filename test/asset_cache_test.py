@@ -0,0 +1,166 @@
+#!/bin/python3
+
+# Host test of the web server's cache of static files in RAM (see 'src/mpy/AssetCache.py'),
+# running the real PicoWebRadio.HTMLServer on CPython (see 'host/mpyhost.py').
+#
+# Checks that a file is read from flash once and then sent from RAM (counting hits and misses,
+# see also 'metrics_test.py'), byte for byte as without the cache, that a file without a gzipped
+# copy is cached once for all clients, and the plain and gzipped copies of a file apart, that a
+# file changed since it was cached is read again (once it's next checked), that the least
+# recently used files are evicted to stay within the cache's budget, and that files are evicted
+# once the heap runs low. Then measures the per-request latency of fetching each of the files of
+# the page with and without the cache.
+#
+# Note that on the host the files are read from the OS's page cache, so the latency difference
+# here is much smaller than on the Pico W (where each one is opened and read from flash).
+#
+# Usage: asset_cache_test.py [number of requests]
+
+import asyncio
+import gc
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, TEST_DIR)
+
+from http_keepalive_test import FakeRadio, HOST, request, read_response, connect, report
+import AssetCache
+import PicoWebRadio
+
+# files fetched on a page load (that fit in the cache together)
+FILES = ('', 'css/StationList.css', 'css/AudioVisualizer.css', 'js/WebRadio.js',
+         'js/StationList.js')
+
+def start_server():
+    loop = asyncio.new_event_loop()
+    server = PicoWebRadio.HTMLServer(host=HOST, port=0, radio=FakeRadio())
+
+    async def serve():
+        server.server = await PicoWebRadio.asyncio.start_server(server.html_client, HOST, 0, 5)
+        return server.server.sockets[0].getsockname()[1]
+
+    port = loop.run_until_complete(serve())
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return server, port
+
+# GET 'path' on the connection 'conn' (see 'connect'), returning the response
+def get(conn, path, headers=''):
+    sock, file = conn
+    sock.sendall(request('GET', path, headers))
+    return read_response(file)
+
+def test_cache(server, port):
+    assets = server._HTMLServer__assets
+    conn = connect(port)
+
+    # read once, then sent from RAM as it was, to all clients (there's no gzipped copy)
+    misses, hits = assets.misses, assets.hits
+    first = get(conn, '')
+    second = get(conn, '')
+    assert (first[0] == 200) and (first == second)
+    assert first[2] == open('index.html', 'rb').read()
+    assert (assets.misses == misses + 1) and (assets.hits == hits + 1)
+    assert get(conn, '', 'If-None-Match: ' + first[1]['etag'] + '\r\n')[0] == 304
+    assert get(conn, '', 'Accept-Encoding: gzip, deflate\r\n') == first
+    assert (assets.hits == hits + 3) and (assets.entries == 1)
+
+    # files are only checked for changes every FILE_CHECK_MS: a gzipped copy that appears is
+    # sent from then on, cached apart from the plain file
+    with open('index.html.gz', 'wb') as gz:
+        gz.write(b'gzipped index.html')
+    assert get(conn, '', 'Accept-Encoding: gzip, deflate\r\n') == first
+    time.sleep(AssetCache.FILE_CHECK_MS / 1000)
+    gzipped = get(conn, '', 'Accept-Encoding: gzip, deflate\r\n')
+    assert gzipped[1]['content-encoding'] == 'gzip'
+    assert gzipped[2] == b'gzipped index.html'
+    assert get(conn, '', 'Accept-Encoding: gzip, deflate\r\n') == gzipped
+    assert get(conn, '') == first
+    assert assets.entries == 2
+
+    # a file changed since is read again
+    with open('index.html.gz', 'wb') as gz:
+        gz.write(b'gzipped index.html, changed')
+    time.sleep(AssetCache.FILE_CHECK_MS / 1000)
+    misses = assets.misses
+    changed = get(conn, '', 'Accept-Encoding: gzip, deflate\r\n')
+    assert changed[2] == b'gzipped index.html, changed'
+    assert changed[1]['etag'] != gzipped[1]['etag']
+    assert assets.misses == misses + 1
+    os.remove('index.html.gz')
+
+    # the least recently used files are evicted to make room (for one of the size of the other two)
+    assets.clear()
+    for path in FILES[1:3]:
+        get(conn, path)
+    with open('css/Copy.css', 'wb') as copy:
+        copy.write(open(FILES[2], 'rb').read())
+    assets.budget = assets.bytes + 64
+    evictions = assets.evictions
+    get(conn, FILES[1])
+    get(conn, 'css/Copy.css')
+    assert assets.evictions == evictions + 1
+    hits = assets.hits
+    get(conn, FILES[1])
+    assert assets.hits == hits + 1
+    get(conn, FILES[2])
+    assert assets.hits == hits + 1
+    assert assets.bytes <= assets.budget
+    assets.budget = PicoWebRadio.ASSET_CACHE_BYTES
+
+    # and as much as the heap is short of its reserve (checked at most every HEAP_CHECK_MS), here
+    # everything cached (as nothing's freed on the host, where the heap is only traced)
+    reserve = assets.reserve
+    assets.reserve = gc.mem_free() + assets.bytes
+    time.sleep(AssetCache.HEAP_CHECK_MS / 1000)
+    evictions = assets.evictions
+    get(conn, FILES[1])
+    assert (assets.entries == 0) and (assets.evictions == evictions + 2)
+    assets.reserve = reserve
+
+    conn[0].close()
+    print('Asset cache checks passed')
+
+def latency(port, n):
+    times = []
+    conn = connect(port)
+    for _ in range(n):
+        for path in FILES:
+            t = time.perf_counter()
+            assert get(conn, path)[0] == 200
+            times.append(time.perf_counter() - t)
+    conn[0].close()
+    return times
+
+def main(n):
+    web_dir = tempfile.mkdtemp()
+    shutil.copytree(os.path.join(TEST_DIR, '..', 'src', 'web'), web_dir, dirs_exist_ok=True)
+    os.chdir(web_dir)
+
+    cached, cached_port = start_server()
+    uncached, uncached_port = start_server()
+    uncached._HTMLServer__assets.budget = 0
+
+    try:
+        test_cache(cached, cached_port)
+
+        with_cache = latency(cached_port, n)
+        without_cache = latency(uncached_port, n)
+        assets = cached._HTMLServer__assets
+        assert assets.entries == len(FILES)
+        assert uncached._HTMLServer__assets.entries == 0
+    finally:
+        os.chdir(TEST_DIR)
+        shutil.rmtree(web_dir)
+
+    print('Per-file latency ({} page loads of {} files, {} bytes cached):'.format(
+          n, len(FILES), assets.bytes))
+    report('cached in RAM', with_cache)
+    report('read from file', without_cache)
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
@@ -0,0 +1,191 @@
+#!/bin/python3
+
+# Host test of how audio streams cope with listeners that can't keep up (see 'STREAM_POLICIES'
+# in 'PicoWebRadio.py'), with the whole app running in the host emulator (see 'pico_emu.py').
+# Each listener reads 8-bit PCM (so every block is the same size) through a small receive buffer,
+# paced like a player (one buffer per buffer period), with network stalls injected by not reading
+# for a while:
+#   - a stall shorter than the drain timeout, then playing on: with the 'live' policy, the stream
+#     must catch up to the live edge (with a block of silence in place of what was skipped), so
+#     the latency from capture to listener is bounded after it, while with the 'buffered' policy
+#     it plays on that far behind,
+#   - a stall longer than the drain timeout: the listener must be disconnected,
+#   - a listener reading at a fraction of the stream's rate: it must be disconnected after the
+#     policy's max. catch-ups,
+# with the catch-ups and disconnects counted in '/metrics'. Reports the latency (mean and max.
+# over the last seconds of playing on) of each policy after a stall, and how long the stalled and
+# slow listeners took to be disconnected.
+
+import http.client
+import os
+import socket
+import struct
+import sys
+import time
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, TEST_DIR)
+
+import pico_emu
+import PicoWebRadio
+import WAVBuffer
+
+HOST = '127.0.0.1'
+HTML_PORT = 18084
+
+RECV_BUF_SIZE = 4096
+
+# playing before and after a short stall (the latency is measured over the last PLAY_MEASURE s)
+PLAY_TIME = 2
+SHORT_STALL = 3
+PLAY_ON_TIME = 5
+PLAY_MEASURE = 2
+
+# the long stall is past the drain timeout plus a check, and the slow listener reads at this
+# fraction of the stream's rate
+LONG_STALL = 8
+SLOW_FRACTION = 0.1
+SLOW_DEADLINE = 30
+
+# the most audio that can be on the way besides the policy's backlog: the emulated send buffer
+# (see 'host/uasyncio.py'), doubled by the kernel, and the listener's receive buffer
+IN_FLIGHT_BYTES = 2 * 8 * 1460 + 2 * RECV_BUF_SIZE
+
+def scrape(name):
+    conn = http.client.HTTPConnection(HOST, HTML_PORT)
+    conn.request('GET', '/metrics')
+    body = conn.getresponse().read().decode()
+    conn.close()
+    for line in body.splitlines():
+        key, _, value = line.partition(' ')
+        if (key == 'pico_' + name):
+            return int(value)
+    raise KeyError(name)
+
+class Listener:
+    def __init__(self, policy):
+        self.sock = socket.socket()
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUF_SIZE)
+        self.sock.connect((HOST, HTML_PORT))
+        self.sock.sendall('GET /audio.wav?policy={} HTTP/1.0\r\n\r\n'.format(policy).encode())
+        self.file = self.sock.makefile('rb')
+        assert self.file.readline().split(b' ')[1] == b'200'
+        while self.file.readline() != b'\r\n':
+            pass
+        assert self.file.read(len(WAVBuffer.header(WAVBuffer.PCM))) == \
+               WAVBuffer.header(WAVBuffer.PCM)
+
+        self.silences = 0
+        self.latencies = []
+
+    # Read the next block, recording its latency (or counting it if it's silence), returning
+    # False once the stream has ended.
+    def read_block(self):
+        block = self.file.read(WAVBuffer.NSAMPLES)
+        if (len(block) < WAVBuffer.NSAMPLES):
+            return False
+
+        if (block == b'\x80' * len(block)):
+            self.silences += 1
+        else:
+            index = struct.unpack_from('<I', block, WAVBuffer.STAMP_OFFSET[WAVBuffer.PCM])[0]
+            self.latencies.append((time.monotonic(),
+                                   time.monotonic() - WAVBuffer.capture_time(index)))
+        return True
+
+    # read a block per 'period' (or per buffer period, like a player) for 'duration' s
+    def play(self, duration, period=None):
+        period = period or WAVBuffer.BUF_PERIOD
+        start = time.monotonic()
+        n = 0
+        while (time.monotonic() < start + duration):
+            if (not self.read_block()):
+                return False
+            n += 1
+            time.sleep(max(start + n * period - time.monotonic(), 0))
+        return True
+
+    # read whatever's left, returning whether the stream ended within 'timeout' s
+    def ended(self, timeout):
+        self.sock.settimeout(timeout)
+        try:
+            while (self.read_block()):
+                pass
+        except socket.timeout:
+            return False
+        return True
+
+    def close(self):
+        self.sock.close()
+
+# A short stall, then playing on, returning the latencies over the end of it and the silences.
+def short_stall(policy):
+    listener = Listener(policy)
+    listener.play(PLAY_TIME)
+    time.sleep(SHORT_STALL)
+    assert listener.play(PLAY_ON_TIME)
+    listener.close()
+
+    end = time.monotonic() - PLAY_MEASURE
+    return ([latency for t, latency in listener.latencies if (t > end)], listener.silences)
+
+def main():
+    web_dir = pico_emu.setup()
+    WAVBuffer.STAMP = True
+    pico_emu.start(HTML_PORT)
+
+    try:
+        _, catch_up_ms, max_catch_ups, drain_timeout = PicoWebRadio.STREAM_POLICIES['live']
+        bound = (catch_up_ms / 1000 + WAVBuffer.BUF_PERIOD +
+                 IN_FLIGHT_BYTES / (WAVBuffer.NSAMPLES / WAVBuffer.BUF_PERIOD))
+
+        # a short stall: caught up to a bounded latency, or left playing that far behind
+        catch_ups = scrape('audio_catch_ups_total')
+        live, live_silences = short_stall('live')
+        assert live_silences > 0
+        assert scrape('audio_catch_ups_total') > catch_ups
+        assert max(live) < bound, (max(live), bound)
+
+        buffered, buffered_silences = short_stall('buffered')
+        assert buffered_silences == 0
+        assert min(buffered) > max(live), (min(buffered), max(live))
+
+        # a long stall: disconnected once the drain times out
+        disconnects = scrape('audio_disconnects_total')
+        listener = Listener('live')
+        listener.play(PLAY_TIME)
+        start = time.monotonic()
+        stall_time = None
+        while (time.monotonic() < start + LONG_STALL):
+            if ((stall_time is None) and (scrape('audio_disconnects_total') > disconnects)):
+                stall_time = time.monotonic() - start
+            time.sleep(0.1)
+        assert stall_time is not None
+        assert listener.ended(drain_timeout / 1000)
+        listener.close()
+        assert scrape('audio_disconnects_total') == disconnects + 1
+
+        # a listener that stays slow: disconnected after the max. catch-ups
+        listener = Listener('live')
+        start = time.monotonic()
+        listener.play(SLOW_DEADLINE, WAVBuffer.BUF_PERIOD / SLOW_FRACTION)
+        slow_time = time.monotonic() - start
+        assert slow_time < SLOW_DEADLINE
+        assert listener.silences == max_catch_ups + 1, listener.silences
+        listener.close()
+        assert scrape('audio_disconnects_total') == disconnects + 2
+    finally:
+        pico_emu.cleanup(web_dir)
+
+    print('Backpressure checks passed ({:.1f} s stall, latency bound {:.0f} ms)'.format(
+          SHORT_STALL, 1000 * bound))
+    for policy, latencies, silences in (('live', live, live_silences),
+                                        ('buffered', buffered, buffered_silences)):
+        print('  {:8} latency after the stall: mean {:5.0f} ms, max {:5.0f} ms ({} catch-ups)'
+              .format(policy, 1000 * sum(latencies) / len(latencies), 1000 * max(latencies),
+                      silences))
+    print('  stalled listener disconnected {:.1f} s into its stall, slow listener after {:.1f} s'
+          .format(stall_time, slow_time))
+
+if __name__ == '__main__':
+    main()
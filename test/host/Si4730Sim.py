@@ -0,0 +1,267 @@
+# Simulated Si4730 on the host's I2C bus (see 'machine.py'), for testing the Si4730 driver and
+# the servers without the radio.
+#
+# Models what the driver relies on (derived from the Si47xx Programming Guide, AN332):
+#   - the status byte, with CTS cleared while a command is running (for roughly as long as the
+#     real device takes, e.g. 110 ms to power up, 10 ms to set a property),
+#   - STC set once a tune or seek completes (60 ms per FM channel stepped, 80 ms per AM channel,
+#     and a quarter of that for a FAST tune), and cleared by INTACK in the TUNE_STATUS command,
+#   - the TUNE_STATUS and RSQ_STATUS responses, with VALID set at the stations,
+#   - the ERR bit for commands sent while not clear to send, powered down, or unknown,
+#   - properties, and tuning/seeking over a given list of stations (with their RSSI and SNR),
+#   - CTS and STC interrupts on the GPO2/INT pin (if enabled by POWER_UP and the GPO_IEN property),
+#     pulsing the host GPIO 'int_pin' (see 'machine.Pin.trigger') from a timer thread.
+#
+# All durations are multiplied by 'time_scale', to run long scans faster in tests.
+# Counters of the I2C traffic and commands are kept for tests to check.
+
+import threading
+import time
+
+import machine
+
+STATUS_CTS = 1 << 7
+STATUS_ERR = 1 << 6
+STATUS_STCINT = 1 << 0
+
+POWER_UP_CMD = 0x01
+POWER_DOWN_CMD = 0x11
+SET_PROPERTY_CMD = 0x12
+GET_PROPERTY_CMD = 0x13
+GET_INT_STATUS_CMD = 0x14
+
+POWER_UP_ARG1_CTSIEN = 1 << 7
+POWER_UP_ARG1_GPO2OEN = 1 << 6
+
+GPO_IEN_PROP = 0x0001
+GPO_IEN_CTSIEN = 1 << 7
+GPO_IEN_STCIEN = 1 << 0
+
+# tune/seek/status commands per band
+BAND_CMDS = {
+    'FM': {'tune_freq': 0x20, 'seek_start': 0x21, 'tune_status': 0x22, 'rsq_status': 0x23},
+    'AM': {'tune_freq': 0x40, 'seek_start': 0x41, 'tune_status': 0x42, 'rsq_status': 0x43},
+}
+
+# seek band properties (bottom, top, spacing) per band, and their defaults
+BAND_PROPS = {
+    'FM': ((0x1400, 8750), (0x1401, 10790), (0x1402, 10)),
+    'AM': ((0x3400, 520), (0x3401, 1710), (0x3402, 10)),
+}
+
+# time (in s) for each command to complete, and per channel stepped by a tune/seek
+POWER_UP_TIME = 0.110
+SET_PROPERTY_TIME = 0.010
+CMD_TIME = 0.0003
+CHANNEL_TIME = {'FM': 0.060, 'AM': 0.080}
+# fraction of the channel time taken by a FAST tune, which skips validating the channel (a guess,
+# as the datasheet only gives the time of a normal tune)
+FAST_TUNE_FACTOR = 0.25
+
+TUNE_FREQ_ARG1_FAST = 1 << 0
+
+# RSSI/SNR reported where there isn't a station
+NOISE_RSSI = 5
+NOISE_SNR = 0
+
+class Si4730Sim:
+    # 'stations' is a dict per band, of frequency (in units of 10 kHz, like the driver) to
+    # (RSSI, SNR), e.g. {'FM': {10110: (40, 25)}, 'AM': {680: (35, 12)}}
+    def __init__(self, stations=None, time_scale=1.0, int_pin=None):
+        if (stations is None):
+            stations = {'FM': {}, 'AM': {}}
+
+        self.stations = stations
+        self.time_scale = time_scale
+        self.int_pin = int_pin
+
+        self.__gpo2_oen = False
+        self.__cts_ien = False
+        self.__stc_ien = False
+
+        self.band = None
+        self.properties = {}
+        self.freq = 0
+
+        self.__busy_until = 0
+        self.__stc_at = None
+        self.__stcint = False
+        self.__err = False
+        self.__valid = False
+        self.__bltf = False
+        self.__resp = b''
+
+        # I2C traffic and command counters
+        self.writes = 0
+        self.reads = 0
+        self.bytes_written = 0
+        self.bytes_read = 0
+        self.commands = {}
+        self.errors = 0
+        self.interrupts = 0
+
+    def __now(self):
+        return time.monotonic()
+
+    def __interrupt(self, delay):
+        if ((self.int_pin is None) or (not self.__gpo2_oen)):
+            return
+
+        self.interrupts += 1
+        timer = threading.Timer(max(delay, 0), machine.Pin.trigger, (self.int_pin,))
+        timer.daemon = True
+        timer.start()
+
+    def __busy(self, duration):
+        self.__busy_until = self.__now() + duration * self.time_scale
+        if (self.__cts_ien):
+            self.__interrupt(duration * self.time_scale)
+
+    def __status(self):
+        now = self.__now()
+
+        if ((self.__stc_at is not None) and (now >= self.__stc_at)):
+            self.__stc_at = None
+            self.__stcint = True
+
+        status = 0
+        if (now >= self.__busy_until):
+            status |= STATUS_CTS
+        if (self.__err):
+            status |= STATUS_ERR
+        if (self.__stcint):
+            status |= STATUS_STCINT
+        return status
+
+    def __prop(self, prop):
+        for p, default in BAND_PROPS[self.band]:
+            if (p == prop):
+                return self.properties.get(prop, default)
+
+    def __band_limits(self):
+        return [self.__prop(p) for p, _ in BAND_PROPS[self.band]]
+
+    def __signal(self, freq):
+        return self.stations.get(self.band, {}).get(freq, (NOISE_RSSI, NOISE_SNR))
+
+    def __start_tune(self, freq, channels, factor=1):
+        self.freq = freq
+        self.__stcint = False
+        delay = max(channels, 1) * CHANNEL_TIME[self.band] * factor * self.time_scale
+        self.__stc_at = self.__now() + delay
+        self.__busy(CMD_TIME)
+        if (self.__stc_ien):
+            self.__interrupt(delay)
+
+    def __seek(self):
+        bottom, top, spacing = self.__band_limits()
+        freq = max(self.freq + spacing, bottom)
+        channels = 1
+
+        # seek up (without wrapping) to the next station, or stop at the top of the band
+        while ((freq <= top) and (freq not in self.stations.get(self.band, {}))):
+            freq += spacing
+            channels += 1
+
+        self.__bltf = freq > top
+        self.__valid = not self.__bltf
+        self.__start_tune(min(freq, top), channels)
+
+    def __band_cmd(self, cmd):
+        if (self.band is None):
+            return None
+        for name, value in BAND_CMDS[self.band].items():
+            if (value == cmd):
+                return name
+        return None
+
+    def __command(self, data):
+        cmd = data[0]
+        resp = b''
+
+        if (cmd == POWER_UP_CMD):
+            self.band = 'AM' if (data[1] & 0x0f) == 1 else 'FM'
+            self.properties = {}
+            self.__gpo2_oen = bool(data[1] & POWER_UP_ARG1_GPO2OEN)
+            self.__cts_ien = bool(data[1] & POWER_UP_ARG1_CTSIEN)
+            self.__stc_ien = False
+            self.freq = self.__band_limits()[0]
+            self.__busy(POWER_UP_TIME)
+            return resp
+        elif (cmd == POWER_DOWN_CMD):
+            self.band = None
+            self.__gpo2_oen = self.__cts_ien = self.__stc_ien = False
+            self.__busy(CMD_TIME)
+            return resp
+
+        if (self.band is None):
+            raise ValueError('Command while powered down')
+
+        band_cmd = self.__band_cmd(cmd)
+        if (cmd == SET_PROPERTY_CMD):
+            prop, val = (data[2] << 8) | data[3], (data[4] << 8) | data[5]
+            self.properties[prop] = val
+            if (prop == GPO_IEN_PROP):
+                self.__cts_ien = bool(val & GPO_IEN_CTSIEN)
+                self.__stc_ien = bool(val & GPO_IEN_STCIEN)
+            self.__busy(SET_PROPERTY_TIME)
+        elif (cmd == GET_PROPERTY_CMD):
+            prop = self.properties.get((data[2] << 8) | data[3], 0)
+            resp = bytes([0, prop >> 8, prop & 0xff])
+            self.__busy(CMD_TIME)
+        elif (cmd == GET_INT_STATUS_CMD):
+            self.__busy(CMD_TIME)
+        elif (band_cmd == 'tune_freq'):
+            freq = (data[2] << 8) | data[3]
+            bottom, top, spacing = self.__band_limits()
+            if ((freq < bottom) or (freq > top)):
+                raise ValueError('Frequency out of range')
+            self.__valid = freq in self.stations.get(self.band, {})
+            self.__bltf = False
+            self.__start_tune(freq, 1, FAST_TUNE_FACTOR if (data[1] & TUNE_FREQ_ARG1_FAST) else 1)
+        elif (band_cmd == 'seek_start'):
+            self.__seek()
+        elif (band_cmd == 'tune_status'):
+            if (data[1] & 1):
+                self.__stcint = False
+            rssi, snr = self.__signal(self.freq)
+            flags = (self.__bltf << 7) | self.__valid
+            resp = bytes([flags, self.freq >> 8, self.freq & 0xff, rssi, snr])
+            self.__busy(CMD_TIME)
+        elif (band_cmd == 'rsq_status'):
+            # the signal now, rather than as of the last tune/seek
+            rssi, snr = self.__signal(self.freq)
+            valid = self.freq in self.stations.get(self.band, {})
+            resp = bytes([0, valid, 0, rssi, snr])
+            self.__busy(CMD_TIME)
+        else:
+            raise ValueError('Unknown command')
+
+        return resp
+
+    # I2C device interface
+
+    def i2c_write(self, data):
+        self.writes += 1
+        self.bytes_written += len(data)
+        self.commands[data[0]] = self.commands.get(data[0], 0) + 1
+
+        # a command sent before the last one completes is an error, like any invalid command
+        self.__err = False
+        if (self.__now() < self.__busy_until):
+            self.__err = True
+        else:
+            try:
+                self.__resp = self.__command(data)
+            except ValueError:
+                self.__err = True
+
+        if (self.__err):
+            self.errors += 1
+            self.__resp = b''
+
+    def i2c_read(self, nbytes):
+        self.reads += 1
+        self.bytes_read += nbytes
+        resp = bytes([self.__status()]) + self.__resp
+        return (resp + bytes(nbytes))[:nbytes]
@@ -0,0 +1,208 @@
+# Host stand-in for the WAVBuffer native module (see 'src/mpy/natmod'), with the same API.
+#
+# Instead of the ADC, buffers of silence are "captured" at the same rate as on the Pico (one buffer
+# of NSAMPLES every NSAMPLES/SAMPLE_RATE seconds, counted from 'start()'), into a ring with the same
+# geometry, so listeners see the same cadence, pending counts and drops as on the real thing. The
+# geometry given to 'init' is checked as on the Pico (for the default build, see 'ADC_DMA.h').
+
+import struct
+import time
+
+NCHANNELS = 1
+BITS_PER_SAMPLE = 8
+MAX_LISTENERS = 4
+RING_GUARD = 3
+
+ARENA_BYTES = 72000
+MAX_NSAMPLES = 3000
+
+PCM = 0x0001
+ADPCM = 0x0011
+ULAW = 0x0007
+FORMATS = (PCM, ADPCM, ULAW)
+
+# a listener can be served at 1/factor of the sample rate (see 'set_decimation')
+FACTORS = (1, 2, 4)
+
+def __pcm_header(factor):
+    sample_rate = SAMPLE_RATE // factor
+    return b'RIFF' + struct.pack('<I', 0xffffffff) + b'WAVE' + \
+           b'fmt ' + struct.pack('<IHHIIHH', 16, PCM, NCHANNELS, sample_rate,
+                                 sample_rate * NCHANNELS * (BITS_PER_SAMPLE // 8),
+                                 NCHANNELS * (BITS_PER_SAMPLE // 8), BITS_PER_SAMPLE) + \
+           b'data' + struct.pack('<I', 0xffffffff)
+
+def __adpcm_header(factor):
+    nsamples = NSAMPLES // factor
+    block_bytes = 4 + nsamples // 2
+    return b'RIFF' + struct.pack('<I', 0xffffffff) + b'WAVE' + \
+           b'fmt ' + struct.pack('<IHHIIHHHH', 20, ADPCM, NCHANNELS, SAMPLE_RATE // factor,
+                                 SAMPLE_RATE * block_bytes // NSAMPLES,
+                                 block_bytes, 4, 2, nsamples + 1) + \
+           b'data' + struct.pack('<I', 0xffffffff)
+
+def __ulaw_header(factor):
+    sample_rate = SAMPLE_RATE // factor
+    return b'RIFF' + struct.pack('<I', 0xffffffff) + b'WAVE' + \
+           b'fmt ' + struct.pack('<IHHIIHHH', 18, ULAW, NCHANNELS, sample_rate,
+                                 sample_rate * NCHANNELS, NCHANNELS, 8, 0) + \
+           b'data' + struct.pack('<I', 0xffffffff)
+
+# silence in each format (a byte of it, or the block of it for ADPCM)
+__SILENCE = {PCM: b'\x80', ULAW: b'\xff'}
+
+# Set up the ring's geometry (see 'init'), along with the headers and buffers of silence (i.e.
+# mid-scale 8-bit PCM, mu-law zeros, or ADPCM starting, and staying, at zero) served from it, and
+# the ring's arena, taking only the memory the geometry needs from the heap as on the Pico.
+def __setup(sample_rate, nsamples, nbufs):
+    global SAMPLE_RATE, NSAMPLES, NBUFS, BUF_PERIOD, ADPCM_BLOCK_BYTES, __headers, __bufs, __arena
+
+    if (not (1000 <= sample_rate <= 500000) or (48000000 % sample_rate != 0)):
+        raise ValueError('Sample rate should divide 48 MHz, from 1 kHz to 500 kHz')
+    if (not (64 <= nsamples <= MAX_NSAMPLES) or (nsamples % 8 != 0)):
+        raise ValueError('Buffer size should be a multiple of 8 samples, from 64 to 3000')
+    if (nbufs <= RING_GUARD):
+        raise ValueError('Too few buffers in the ring')
+    if (nbufs * nsamples > ARENA_BYTES):
+        raise ValueError('Not enough memory for the ring (see ADC_DMA_ARENA_BYTES)')
+
+    SAMPLE_RATE, NSAMPLES, NBUFS = sample_rate, nsamples, nbufs
+    __arena = bytearray(nbufs * nsamples)
+    BUF_PERIOD = NSAMPLES / SAMPLE_RATE
+    ADPCM_BLOCK_BYTES = 4 + NSAMPLES // 2
+
+    __headers = {(fmt, factor): make(factor) for factor in FACTORS
+                 for fmt, make in ((PCM, __pcm_header), (ADPCM, __adpcm_header),
+                                   (ULAW, __ulaw_header))}
+    __bufs = {(fmt, factor): bytearray(__SILENCE[fmt] * (NSAMPLES // factor)) if (fmt != ADPCM) else
+                             bytearray(4 + NSAMPLES // factor // 2)
+              for factor in FACTORS for fmt in FORMATS}
+
+__setup(30000, 3000, 16)
+
+# Host only: if set, the first 4 bytes of audio in each buffer fetched are its index since
+# 'start()' (32-bit little-endian), so a client can count the buffers dropped from its stream
+# (see 'test/load_test.py'). PCM and mu-law buffers start with the audio, ADPCM blocks after the
+# 4 byte block header (see 'STAMP_OFFSET').
+STAMP = False
+STAMP_OFFSET = {PCM: 0, ADPCM: 4, ULAW: 0}
+
+__start_time = None
+__listeners = [None] * MAX_LISTENERS
+
+# counters for 'stats()' (there's no DMA interrupt to time here, but one is counted per buffer)
+__drops = 0
+__depth_max = 0
+
+def __head():
+    if (__start_time is None):
+        return 0
+    return int((time.monotonic() - __start_time) / BUF_PERIOD)
+
+def header(fmt=PCM, factor=1):
+    if (factor not in FACTORS):
+        raise ValueError('Unsupported decimation factor')
+    if (fmt not in FORMATS):
+        raise ValueError('Unsupported format')
+    return __headers[(fmt, factor)]
+
+def init(adc_chan, dma_chan_a=None, dma_chan_b=None, sample_rate=30000, nsamples=3000, nbufs=16):
+    if ((dma_chan_a is None) and (dma_chan_b is None)):
+        dma_chan_a, dma_chan_b = 9, 10
+    if ((dma_chan_a is None) or (dma_chan_b is None) or
+        not (0 <= dma_chan_a < 12 and 0 <= dma_chan_b < 12) or (dma_chan_a == dma_chan_b)):
+        raise ValueError('Give 2 different DMA channels between 0 and 11')
+    __setup(sample_rate, nsamples, nbufs)
+    global __start_time, __listeners, __drops, __depth_max
+    __start_time = None
+    __listeners = [None] * MAX_LISTENERS
+    __drops = 0
+    __depth_max = 0
+
+def geometry():
+    return (SAMPLE_RATE, NSAMPLES, NBUFS)
+
+# Host only: when the buffer with the given index (see 'STAMP') started being captured.
+def capture_time(index):
+    return __start_time + index * BUF_PERIOD
+
+def start():
+    global __start_time
+    __start_time = time.monotonic()
+
+def open(fmt=PCM):
+    if (fmt not in FORMATS):
+        raise ValueError('Unsupported format')
+
+    for i in range(MAX_LISTENERS):
+        if (__listeners[i] is None):
+            __listeners[i] = {'format': fmt, 'factor': 1, 'tail': __head(), 'drops': 0,
+                              'depth_max': 0}
+            return i
+
+    raise ValueError('No more listeners available')
+
+def close(stream_id):
+    if (0 <= stream_id < MAX_LISTENERS):
+        __listeners[stream_id] = None
+
+def __listener(stream_id):
+    if ((not 0 <= stream_id < MAX_LISTENERS) or (__listeners[stream_id] is None)):
+        raise ValueError('No such listener')
+    return __listeners[stream_id]
+
+def set_decimation(stream_id, factor):
+    listener = __listener(stream_id)
+    if (factor not in FACTORS):
+        raise ValueError('Unsupported decimation factor')
+    listener['factor'] = factor
+
+def pending(stream_id):
+    listener = __listener(stream_id)
+    return __head() - listener['tail']
+
+def catch_up(stream_id, keep):
+    global __drops
+    listener = __listener(stream_id)
+    head = __head()
+
+    skip = max(head - listener['tail'] - max(keep, 0), 0)
+    listener['drops'] += skip
+    __drops += skip
+    listener['tail'] += skip
+    return skip
+
+def drops(stream_id):
+    return __listener(stream_id)['drops']
+
+def depth_max(stream_id):
+    return __listener(stream_id)['depth_max']
+
+def stats():
+    return (__head(), __drops, __depth_max, __head(), 0, 0)
+
+def fetch(stream_id):
+    global __drops, __depth_max
+    listener = __listener(stream_id)
+    head = __head()
+
+    lag = head - listener['tail']
+    if (lag == 0):
+        return bytearray()
+    listener['depth_max'] = max(listener['depth_max'], lag)
+    __depth_max = max(__depth_max, lag)
+    if (lag > NBUFS - RING_GUARD):
+        listener['drops'] += lag - (NBUFS - RING_GUARD)
+        __drops += lag - (NBUFS - RING_GUARD)
+        listener['tail'] = head - (NBUFS - RING_GUARD)
+
+    index = listener['tail']
+    listener['tail'] += 1
+
+    buf = __bufs[(listener['format'], listener['factor'])]
+
+    if (STAMP):
+        buf = bytearray(buf)
+        offset = STAMP_OFFSET[listener['format']]
+        buf[offset:offset + 4] = struct.pack('<I', index)
+    return buf
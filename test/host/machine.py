@@ -0,0 +1,68 @@
+# Host stand-in for MicroPython's 'machine' module.
+
+import errno
+import time
+
+def idle():
+    time.sleep(0.0001)
+
+# GPIO pin. Simulated devices can trigger a pin's IRQ handler with 'Pin.trigger(id)', from any
+# thread (like an interrupt would).
+class Pin:
+    IN = 0
+    OUT = 1
+
+    PULL_UP = 1
+    PULL_DOWN = 2
+
+    IRQ_FALLING = 4
+    IRQ_RISING = 8
+
+    handlers = {}
+
+    def __init__(self, id, mode=-1, pull=-1, value=0):
+        self.id = id
+        self.mode = mode
+        self.__value = value
+
+    def irq(self, handler=None, trigger=IRQ_FALLING | IRQ_RISING, hard=False):
+        Pin.handlers[self.id] = (self, handler)
+
+    @staticmethod
+    def trigger(id):
+        pin, handler = Pin.handlers.get(id, (None, None))
+        if (handler is not None):
+            handler(pin)
+
+    def value(self, value=None):
+        if (value is None):
+            return self.__value
+        self.__value = 1 if value else 0
+
+    def on(self):
+        self.value(1)
+
+    def off(self):
+        self.value(0)
+
+# I2C bus with simulated devices attached by address. A device just needs 'i2c_write(data)' and
+# 'i2c_read(nbytes)' methods, and is attached with 'I2C.devices[addr] = device'.
+class I2C:
+    devices = {}
+
+    def __init__(self, id, scl=None, sda=None, freq=400000):
+        self.id = id
+        self.freq = freq
+
+    def __device(self, addr):
+        device = I2C.devices.get(addr)
+        if (device is None):
+            raise OSError(errno.ENODEV, 'No I2C device at 0x{:02x}'.format(addr))
+        return device
+
+    def writeto(self, addr, buf, stop=True):
+        self.__device(addr).i2c_write(bytes(buf))
+        return len(buf)
+
+    def readfrom(self, addr, nbytes, stop=True):
+        return bytes(self.__device(addr).i2c_read(nbytes))
@@ -0,0 +1,49 @@
+# Host (CPython) stand-ins for the MicroPython environment on the Pico W, so that the real code in
+# 'src/mpy' can be run and tested on a PC. Call install() before importing anything from 'src/mpy'.
+#
+# The stand-ins for the MicroPython modules ('machine', 'uasyncio', 'WAVBuffer', ...) are the
+# other modules in this directory, and only cover what PicoWebRadio actually uses.
+
+import builtins
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+HOST_DIR = os.path.dirname(os.path.abspath(__file__))
+MPY_DIR = os.path.normpath(os.path.join(HOST_DIR, '..', '..', 'src', 'mpy'))
+
+# nominal size of the MicroPython heap, for 'gc.mem_free()' to count down from (the Pico W's
+# depends on the firmware build)
+HEAP_SIZE = 192 * 1024
+
+def install():
+    # MicroPython builtins and 'time' extensions
+    builtins.const = lambda x: x
+
+    # MicroPython's heap figures: what's allocated is what 'tracemalloc' traces (if started)
+    gc.mem_alloc = lambda: tracemalloc.get_traced_memory()[0]
+    gc.mem_free = lambda: max(HEAP_SIZE - gc.mem_alloc(), 0)
+
+    time.sleep_ms = lambda ms: time.sleep(ms / 1000)
+    time.sleep_us = lambda us: time.sleep(us / 1000000)
+    # (counting from install(), as the Pico W's count from power-up)
+    start = time.monotonic()
+    time.ticks_ms = lambda: int((time.monotonic() - start) * 1000)
+    time.ticks_us = lambda: int((time.monotonic() - start) * 1000000)
+    time.ticks_diff = lambda a, b: a - b
+    time.ticks_add = lambda a, b: a + b
+
+    for path in (MPY_DIR, HOST_DIR):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+
+# Make a coroutine function of an 'async def' that waits by yielding (MicroPython's way of
+# suspending a task, e.g. 'yield core._io_queue.queue_read(obj)', see 'uasyncio.py'), which
+# CPython makes an async generator instead. Each value yielded is awaited in turn.
+def yielding(fn):
+    async def wrapper(*args, **kwargs):
+        async for awaitable in fn(*args, **kwargs):
+            await awaitable
+    return wrapper
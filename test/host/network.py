@@ -0,0 +1,30 @@
+# Host stand-in for MicroPython's 'network' module: the host is always connected.
+
+STA_IF = 0
+AP_IF = 1
+
+STAT_IDLE = 0
+STAT_CONNECTING = 1
+STAT_WRONG_PASSWORD = -3
+STAT_NO_AP_FOUND = -2
+STAT_CONNECT_FAIL = -1
+STAT_GOT_IP = 3
+
+class WLAN:
+    def __init__(self, interface=STA_IF):
+        self.interface = interface
+
+    def active(self, active=None):
+        return True
+
+    def config(self, *args, **kwargs):
+        pass
+
+    def connect(self, ssid, password):
+        pass
+
+    def status(self):
+        return STAT_GOT_IP
+
+    def ifconfig(self):
+        return ('127.0.0.1', '255.0.0.0', '127.0.0.1', '127.0.0.1')
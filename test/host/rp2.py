@@ -0,0 +1,18 @@
+# Host stand-in for MicroPython's 'rp2' module.
+
+def country(code=None):
+    return code
+
+# DMA channels claimed so far
+_claimed = set()
+
+class DMA:
+    def __init__(self):
+        free = [chan for chan in range(12) if (chan not in _claimed)]
+        if (not free):
+            raise OSError('No DMA channels available')
+        self.channel = free[0]
+        _claimed.add(self.channel)
+
+    def close(self):
+        _claimed.discard(self.channel)
@@ -0,0 +1,153 @@
+# Host stand-in for MicroPython's 'uasyncio' module, built on CPython's asyncio.
+#
+# MicroPython hands a server's client callback the same Stream object as both reader and writer,
+# so the CPython reader/writer pair is wrapped up the same way here.
+
+from asyncio import *
+import asyncio as _asyncio
+import errno as _errno
+import socket as _socket
+
+# MicroPython's gather() can be called outside of the event loop, and run() takes any awaitable
+# (e.g. the result of gather()), unlike CPython's.
+def gather(*aws, return_exceptions=False):
+    async def gathered():
+        return await _asyncio.gather(*aws, return_exceptions=return_exceptions)
+    return gathered()
+
+def run(main):
+    async def runner():
+        return await main
+    return _asyncio.run(runner())
+
+async def sleep_ms(t):
+    await _asyncio.sleep(t / 1000)
+
+async def wait_for_ms(aw, timeout):
+    return await _asyncio.wait_for(aw, timeout / 1000)
+
+# Flag that can be set from outside the event loop (e.g. from an IRQ handler, which on the host
+# runs in another thread), and is cleared once waited on.
+class ThreadSafeFlag:
+    def __init__(self):
+        self.__flag = False
+        self.__loop = None
+        self.__event = None
+
+    def set(self):
+        self.__flag = True
+        loop = self.__loop
+        if ((loop is not None) and (not loop.is_closed())):
+            loop.call_soon_threadsafe(self.__wake)
+
+    def __wake(self):
+        if (self.__event is not None):
+            self.__event.set()
+
+    def clear(self):
+        self.__flag = False
+
+    async def wait(self):
+        while (not self.__flag):
+            self.__loop = _asyncio.get_running_loop()
+            self.__event = _asyncio.Event()
+            if (self.__flag):
+                break
+            await self.__event.wait()
+        self.__flag = False
+        self.__loop = None
+
+class Stream:
+    def __init__(self, reader, writer):
+        self.__reader = reader
+        self.__writer = writer
+
+    async def read(self, n=-1):
+        return await self.__reader.read(n)
+
+    async def readinto(self, buf):
+        data = await self.__reader.read(len(buf))
+        buf[:len(data)] = data
+        return len(data)
+
+    async def readline(self):
+        return await self.__reader.readline()
+
+    def write(self, buf):
+        self.__writer.write(bytes(buf))
+
+    async def drain(self):
+        # CPython's streams raise a ConnectionResetError without an errno, unlike MicroPython's
+        try:
+            await self.__writer.drain()
+        except ConnectionResetError as e:
+            raise OSError(_errno.ECONNRESET, str(e))
+
+    def close(self):
+        self.__writer.close()
+
+    async def wait_closed(self):
+        self.__writer.close()
+        try:
+            await self.__writer.wait_closed()
+        except OSError:
+            pass
+
+# Size of the send buffer of each connection, like lwIP's on the Pico W (TCP_SND_BUF, 8 segments
+# of 1460 bytes in MicroPython's rp2 port). MicroPython's drain() only returns once everything
+# written fits in it, so a slow client holds up its stream as soon as this fills, rather than
+# once the host's much larger socket buffers do.
+SEND_BUF_SIZE = 8 * 1460
+
+async def start_server(cb, host, port, backlog=5):
+    async def client(reader, writer):
+        writer.get_extra_info('socket').setsockopt(_socket.SOL_SOCKET, _socket.SO_SNDBUF,
+                                                   SEND_BUF_SIZE)
+        writer.transport.set_write_buffer_limits(0)
+        stream = Stream(reader, writer)
+        await cb(stream, stream)
+
+    return await _asyncio.start_server(client, host, port, backlog=backlog, reuse_address=True)
+
+# MicroPython's IO queue ('uasyncio.core._io_queue'), which resumes a task once an object's
+# 'ioctl' polls as ready, for objects other than sockets (e.g. PicoWebRadio.AudioEvent). Such
+# objects have no file descriptor on the host, so instead of being woken by the poller, the
+# objects waited on are polled every POLL_INTERVAL s.
+#
+# On MicroPython a task waits with 'yield core._io_queue.queue_read(obj)' in an 'async def',
+# which CPython makes an async generator; see 'mpyhost.yielding' to await such a function.
+MP_STREAM_POLL = 3
+MP_STREAM_POLL_RD = 1
+
+POLL_INTERVAL = 0.001
+
+class IOQueue:
+    def __init__(self):
+        self.__waiting = []
+        self.__handle = None
+
+    def queue_read(self, obj):
+        future = _asyncio.get_running_loop().create_future()
+        self.__waiting.append((obj, future))
+        if (self.__handle is None):
+            self.__handle = future.get_loop().call_later(POLL_INTERVAL, self.__poll)
+        return future
+
+    def __poll(self):
+        waiting = []
+        for obj, future in self.__waiting:
+            if (future.done()):
+                continue
+            if (obj.ioctl(MP_STREAM_POLL, MP_STREAM_POLL_RD)):
+                future.set_result(None)
+            else:
+                waiting.append((obj, future))
+        self.__waiting = waiting
+
+        if (waiting):
+            self.__handle = waiting[0][1].get_loop().call_later(POLL_INTERVAL, self.__poll)
+        else:
+            self.__handle = None
+
+class core:
+    _io_queue = IOQueue()
@@ -0,0 +1,3 @@
+# Host stand-in for MicroPython's 'usocket' module.
+
+from socket import *
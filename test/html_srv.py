@@ -2,6 +2,7 @@
 
 import socket
 import os
+import threading
 import time
 
 addr = socket.getaddrinfo('0.0.0.0', 8080)[0][-1]
@@ -11,6 +12,22 @@ socket1.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
 socket1.bind(addr)
 socket1.listen(1)
 
+# stream 'test.wav' on a connection of its own (as the audio is served on the same port)
+def stream_audio(conn):
+    with open("test.wav", 'rb') as file:
+        try:
+            conn.send(b'HTTP/1.0 200 OK\r\n' \
+                      b'Content-type: audio/wav\r\n\r\n')
+            while True:
+                conn.sendall(file.read(3000))
+                time.sleep(0.1) # simulate time taken to acquire 100ms of samples
+        except:
+            conn.close()
+
+# simulate a background scan taking a few seconds, started by 'POST scan' (or 'scan/full')
+scan_time = 4
+scan_start = 0
+
 while True:
     conn, addr = socket1.accept()
     try:
@@ -21,7 +38,20 @@ while True:
         req_data = r[1]
         req_data = req_data.strip('/')
 
-        if (req_method == 'GET'):
+        if (req_method == 'GET' and req_data.split('?')[0] in ('audio.wav', 'audio.adpcm')):
+            threading.Thread(target=stream_audio, args=(conn,), daemon=True).start()
+        elif (req_method == 'GET' and req_data == 'scan.json'):
+            progress = min(int(100 * (time.time() - scan_start) / scan_time), 100)
+            state = 'scanning' if progress < 100 else 'done'
+            conn.send(b'HTTP/1.0 200 OK\r\n')
+            conn.send(b'Content-type: application/json\r\n\r\n')
+            conn.send(('{"state": "' + state + '", "progress": ' + str(progress) + '}').encode())
+            conn.close()
+        elif (req_method == 'POST' and req_data in ('scan', 'scan/full')):
+            scan_start = time.time()
+            conn.send(b'HTTP/1.0 202 Accepted\r\n\r\n')
+            conn.close()
+        elif (req_method == 'GET'):
             conn.send(b'HTTP/1.0 200 OK\r\n')
 
             if (req_data == 'scan.xml'):
@@ -42,6 +72,8 @@ while True:
                     conn.send(b'Content-type: text/css\r\n\r\n')
                 elif (req_data_ext == 'xml'):
                     conn.send(b'Content-type: text/xml\r\n\r\n')
+                elif (req_data_ext == 'json'):
+                    conn.send(b'Content-type: application/json\r\n\r\n')
                 else:
                     raise ValueError
 
@@ -0,0 +1,208 @@
+#!/bin/python3
+
+# Host test of the HTML server's HTTP/1.1 handling (see 'src/mpy/HTTPUtil.py'), running the real
+# PicoWebRadio.HTMLServer on CPython (see 'host/mpyhost.py').
+#
+# Checks that requests split across reads and pipelined on one connection are all answered in
+# order, that 'Connection: close' (and HTTP/1.0) close the connection, and that a bad request
+# gets a 400. Then measures the per-request latency of sequential requests over one persistent
+# connection vs. a new connection per request.
+#
+# Note that on the host the TCP handshake is cheap, so the latency difference here is much
+# smaller than on the Pico W (where each new connection also costs lwIP a PCB and a handshake
+# over WiFi).
+#
+# Usage: http_keepalive_test.py [number of requests]
+
+import asyncio
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_DIR, 'host'))
+
+import mpyhost
+mpyhost.install()
+
+import machine
+from Si4730Sim import Si4730Sim
+
+# for the module-level radio in PicoWebRadio (the server is given the fake radio below)
+machine.I2C.devices[0x63] = Si4730Sim(time_scale=0)
+
+import PicoWebRadio
+
+class FakeRadio:
+    def __init__(self):
+        self.tuned = []
+
+    async def tune_async(self, band, freq):
+        self.tuned.append((band, freq))
+        return [1, 30, 10]
+
+    async def scan_async(self, band, progress=None, full=False):
+        return self.get_channels()[band]
+
+    def get_channels(self):
+        return {'FM': [10110], 'AM': [680]}
+
+    def set_channels(self, band, channels):
+        pass
+
+    def get_signal(self, band, freq):
+        return (30, 10)
+
+HOST = '127.0.0.1'
+
+def start_server(radio):
+    loop = asyncio.new_event_loop()
+    server = PicoWebRadio.HTMLServer(host=HOST, port=0, radio=radio)
+
+    async def serve():
+        server.server = await PicoWebRadio.asyncio.start_server(server.html_client, HOST, 0, 5)
+        return server.server.sockets[0].getsockname()[1]
+
+    port = loop.run_until_complete(serve())
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return port
+
+def request(method, path, headers=''):
+    return '{} /{} HTTP/1.1\r\nHost: pico\r\n{}\r\n'.format(method, path, headers).encode()
+
+# read one response, returning (status, headers, body)
+def read_response(file):
+    status_line = file.readline()
+    if (status_line == b''):
+        return None
+
+    status = int(status_line.split(b' ')[1])
+    headers = {}
+    while (line := file.readline()) != b'\r\n':
+        key, _, value = line.decode().partition(':')
+        headers[key.strip().lower()] = value.strip()
+
+    body = file.read(int(headers.get('content-length', 0)))
+    return status, headers, body
+
+def connect(port):
+    sock = socket.create_connection((HOST, port))
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sock, sock.makefile('rb')
+
+def test_pipelining(port, radio):
+    reqs = [request('GET', ''),
+            request('GET', 'css/StationList.css', 'Accept-Encoding: gzip, deflate\r\n'),
+            request('PATCH', 'tune/fm/10110'),
+            request('GET', 'stations.xml'),
+            request('GET', 'missing.html'),
+            request('GET', 'file.exe'),
+            request('PATCH', 'tune/am/680', 'Content-Length: 4\r\n') + b'body']
+    expected = [200, 200, 204, 200, 404, 400, 204]
+
+    # send everything at once, but in small pieces to split the requests across reads
+    sock, file = connect(port)
+    data = b''.join(reqs)
+    for i in range(0, len(data), 7):
+        sock.sendall(data[i:i + 7])
+        time.sleep(0.001)
+
+    responses = [read_response(file) for _ in reqs]
+    assert [r[0] for r in responses] == expected, [r[0] for r in responses]
+    assert all(r[1]['connection'] == 'keep-alive' for r in responses)
+    assert responses[0][2] == open('index.html', 'rb').read()
+    assert radio.tuned[-2:] == [('FM', 10110), ('AM', 680)]
+
+    # a conditional request on the same connection
+    sock.sendall(request('GET', '', 'If-None-Match: ' + responses[0][1]['etag'] + '\r\n'))
+    assert read_response(file)[0] == 304
+
+    # the connection is closed once asked to
+    sock.sendall(request('GET', '', 'Connection: close\r\n'))
+    status, headers, _ = read_response(file)
+    assert (status == 200) and (headers['connection'] == 'close')
+    assert read_response(file) is None
+    sock.close()
+
+    # HTTP/1.0 closes by default
+    sock, file = connect(port)
+    sock.sendall(b'GET / HTTP/1.0\r\n\r\n')
+    assert read_response(file)[0] == 200
+    assert read_response(file) is None
+    sock.close()
+
+    # as does a request that can't be parsed
+    sock, file = connect(port)
+    sock.sendall(b'GARBAGE\r\n\r\n')
+    assert read_response(file)[0] == 400
+    assert read_response(file) is None
+    sock.close()
+
+    print('Pipelining/keep-alive checks passed')
+
+def percentile(times, p):
+    return sorted(times)[int(p * (len(times) - 1))]
+
+def report(name, times):
+    print('  {:<28} mean {:7.3f} ms, p50 {:7.3f} ms, p95 {:7.3f} ms'.format(
+        name, 1000 * sum(times) / len(times), 1000 * percentile(times, 0.5),
+        1000 * percentile(times, 0.95)))
+
+def test_latency(port, n):
+    req = request('PATCH', 'tune/fm/10110')
+
+    times = []
+    sock, file = connect(port)
+    for _ in range(n):
+        t = time.perf_counter()
+        sock.sendall(req)
+        assert read_response(file)[0] == 204
+        times.append(time.perf_counter() - t)
+    sock.close()
+    keep_alive = times
+
+    times = []
+    for _ in range(n):
+        t = time.perf_counter()
+        sock, file = connect(port)
+        sock.sendall(request('PATCH', 'tune/fm/10110', 'Connection: close\r\n'))
+        assert read_response(file)[0] == 204
+        sock.close()
+        times.append(time.perf_counter() - t)
+    new_conn = times
+
+    # all requests written back-to-back, then all responses read
+    sock, file = connect(port)
+    t = time.perf_counter()
+    sock.sendall(req * n)
+    for _ in range(n):
+        assert read_response(file)[0] == 204
+    pipelined = (time.perf_counter() - t) / n
+    sock.close()
+
+    print('Per-request latency ({} requests):'.format(n))
+    report('keep-alive, sequential', keep_alive)
+    report('new connection per request', new_conn)
+    print('  {:<28} mean {:7.3f} ms'.format('keep-alive, pipelined', 1000 * pipelined))
+
+def main(n):
+    web_dir = tempfile.mkdtemp()
+    shutil.copytree(os.path.join(TEST_DIR, '..', 'src', 'web'), web_dir, dirs_exist_ok=True)
+    os.chdir(web_dir)
+
+    radio = FakeRadio()
+    port = start_server(radio)
+
+    try:
+        test_pipelining(port, radio)
+        test_latency(port, n)
+    finally:
+        os.chdir(TEST_DIR)
+        shutil.rmtree(web_dir)
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
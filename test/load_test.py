@@ -0,0 +1,175 @@
+#!/bin/python3
+
+# Load test of the whole app, running in the host emulator (see 'pico_emu.py'): opens N audio
+# listeners and M control clients at once for a given time, then reports per client:
+#   - listeners: throughput, buffers received and dropped (the emulated WAVBuffer stamps each
+#     buffer with its index, so gaps in a stream are buffers the server dropped for it), and the
+#     longest gap between buffers arriving (they're captured every 100 ms),
+#   - control clients (tuning back and forth between stations over a keep-alive connection, and
+#     fetching the station list now and then): tune latency, station list latency and errors,
+# and the app's event loop lag (from its heartbeat, see 'PicoWebRadio.heartbeat').
+#
+# Listeners past WAVBuffer's limit are refused (503), and control clients contend for the radio,
+# so their tunes queue up behind each other's. The simulated Si4730 takes as long as the real one
+# to tune, and clients run in this process (in another thread from the app), so absolute numbers
+# are those of the host; compare runs against each other.
+#
+# Usage: load_test.py [listeners] [control clients] [seconds] [wav|adpcm|ulaw]
+
+import asyncio
+import os
+import struct
+import sys
+import time
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, TEST_DIR)
+
+import pico_emu
+import PicoWebRadio
+import WAVBuffer
+
+HOST = '127.0.0.1'
+HTML_PORT = 18080
+
+# what a control client does each round, and how long it waits after
+TUNES = ('fm/9530', 'fm/10110', 'am/680', 'fm/8810')
+STATION_LIST_EVERY = 4
+THINK_TIME = 0.2
+
+# the stations loaded at the start aren't part of the measurement
+WARMUP = 1.0
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[int(p * (len(values) - 1))] if values else 0
+
+async def listener(fmt, stop):
+    stats = {'status': None, 'bytes': 0, 'buffers': 0, 'dropped': 0, 'max_gap': 0}
+
+    reader, writer = await asyncio.open_connection(HOST, HTML_PORT)
+    writer.write('GET /audio.{} HTTP/1.0\r\n\r\n'.format(fmt).encode())
+
+    status_line = await reader.readline()
+    stats['status'] = int(status_line.split(b' ')[1])
+    while (await reader.readline()) not in (b'\r\n', b''):
+        pass
+
+    if (stats['status'] == 200):
+        if (fmt == 'adpcm'):
+            wav_format, buf_size = WAVBuffer.ADPCM, WAVBuffer.ADPCM_BLOCK_BYTES
+        elif (fmt == 'ulaw'):
+            wav_format, buf_size = WAVBuffer.ULAW, WAVBuffer.NSAMPLES
+        else:
+            wav_format, buf_size = WAVBuffer.PCM, WAVBuffer.NSAMPLES
+        await reader.readexactly(len(WAVBuffer.header(wav_format)))
+        offset = WAVBuffer.STAMP_OFFSET[wav_format]
+
+        start = None
+        last_index = None
+        last_time = None
+        while (time.monotonic() < stop):
+            try:
+                buf = await asyncio.wait_for(reader.readexactly(buf_size), stop - time.monotonic())
+            except asyncio.TimeoutError:
+                break
+
+            now = time.monotonic()
+            index = struct.unpack_from('<I', buf, offset)[0]
+            if (start is None):
+                start = now
+            else:
+                stats['bytes'] += buf_size
+                stats['buffers'] += 1
+                stats['dropped'] += index - last_index - 1
+                stats['max_gap'] = max(stats['max_gap'], now - last_time)
+            last_index = index
+            last_time = now
+
+        stats['time'] = (last_time - start) if start else 0
+
+    writer.close()
+    return stats
+
+async def request(reader, writer, method, path):
+    writer.write('{} /{} HTTP/1.1\r\nHost: pico\r\n\r\n'.format(method, path).encode())
+
+    status = int((await reader.readline()).split(b' ')[1])
+    length = 0
+    while (line := await reader.readline()) != b'\r\n':
+        key, _, value = line.decode().partition(':')
+        if (key.strip().lower() == 'content-length'):
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+async def control_client(n, stop):
+    stats = {'tunes': [], 'lists': [], 'errors': 0}
+
+    reader, writer = await asyncio.open_connection(HOST, HTML_PORT)
+
+    i = n
+    while (time.monotonic() < stop):
+        t = time.monotonic()
+        status = await request(reader, writer, 'PATCH', 'tune/' + TUNES[i % len(TUNES)])
+        stats['tunes'].append(time.monotonic() - t)
+        stats['errors'] += (status != 204)
+
+        if (i % STATION_LIST_EVERY == 0):
+            t = time.monotonic()
+            status = await request(reader, writer, 'GET', 'stations.json')
+            stats['lists'].append(time.monotonic() - t)
+            stats['errors'] += (status != 200)
+
+        i += 1
+        await asyncio.sleep(THINK_TIME)
+
+    writer.close()
+    return stats
+
+async def load(listeners, controls, duration, fmt):
+    await asyncio.sleep(WARMUP)
+    PicoWebRadio.loop_lag_max = 0
+
+    stop = time.monotonic() + duration
+    return await asyncio.gather(asyncio.gather(*[listener(fmt, stop) for _ in range(listeners)]),
+                                asyncio.gather(*[control_client(n, stop) for n in range(controls)]))
+
+def main(listeners, controls, duration, fmt):
+    web_dir = pico_emu.setup()
+    WAVBuffer.STAMP = True
+    pico_emu.start(HTML_PORT)
+
+    try:
+        listener_stats, control_stats = asyncio.run(load(listeners, controls, duration, fmt))
+    finally:
+        pico_emu.cleanup(web_dir)
+
+    print('Load test: {} {} listeners, {} control clients, {:g} s'.format(listeners, fmt, controls,
+                                                                         duration))
+
+    for i, stats in enumerate(listener_stats):
+        if (stats['status'] != 200):
+            print('  listener {}: refused ({})'.format(i, stats['status']))
+            continue
+        assert stats['buffers'] > 0
+        print('  listener {}: {:6.1f} kB/s, {:4} buffers, {:3} dropped, longest gap {:4.0f} ms'.format(
+              i, stats['bytes'] / stats['time'] / 1000, stats['buffers'], stats['dropped'],
+              1000 * stats['max_gap']))
+
+    for i, stats in enumerate(control_stats):
+        assert stats['errors'] == 0
+        tunes, lists = stats['tunes'], stats['lists']
+        print('  control {}:  {:3} tunes: mean {:5.1f} ms, p95 {:5.1f} ms, max {:5.1f} ms; '
+              'station list: mean {:4.1f} ms'.format(
+              i, len(tunes), 1000 * sum(tunes) / len(tunes), 1000 * percentile(tunes, 0.95),
+              1000 * max(tunes), 1000 * sum(lists) / max(len(lists), 1)))
+
+    print('  event loop lag: max {} ms'.format(PicoWebRadio.loop_lag_max))
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    main(int(args[0]) if len(args) > 0 else 4,
+         int(args[1]) if len(args) > 1 else 2,
+         float(args[2]) if len(args) > 2 else 10,
+         args[3] if len(args) > 3 else 'adpcm')
@@ -0,0 +1,134 @@
+#!/bin/python3
+
+# Host test of the '/metrics' endpoint, with the whole app running in the host emulator (see
+# 'pico_emu.py').
+#
+# Streams audio and tunes the radio for a while, then checks that every line of '/metrics' is in
+# the Prometheus text format, and that the counters agree with what the clients saw: bytes and
+# buffers sent to the stream, requests handled, and the commands sent to the (simulated) Si4730
+# for the tunes. Then measures how long a scrape takes.
+#
+# Note that the emulated WAVBuffer doesn't time a DMA interrupt, so those counters stay at 0.
+#
+# Usage: metrics_test.py [number of scrapes]
+
+import os
+import re
+import socket
+import sys
+import time
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, TEST_DIR)
+
+import pico_emu
+import WAVBuffer
+
+HOST = '127.0.0.1'
+HTML_PORT = 18081
+
+# 'name{labels} value', with labels optional
+METRIC_RE = re.compile(r'^(pico_[a-z0-9_]+)(\{[a-z]+="[^"]*"\})? (\d+)$')
+
+TUNE_FREQ_CMD = 0x20
+
+def request(sock, file, method, path):
+    sock.sendall('{} /{} HTTP/1.1\r\nHost: pico\r\n\r\n'.format(method, path).encode())
+
+    status = int(file.readline().split(b' ')[1])
+    headers = {}
+    while (line := file.readline()) != b'\r\n':
+        key, _, value = line.decode().partition(':')
+        headers[key.strip().lower()] = value.strip()
+    return status, headers, file.read(int(headers.get('content-length', 0)))
+
+def parse(body):
+    metrics = {}
+    for line in body.decode().splitlines():
+        match = METRIC_RE.match(line)
+        assert match, 'Bad metric line: ' + line
+        metrics[match.group(1) + (match.group(2) or '')] = int(match.group(3))
+    return metrics
+
+def main(n):
+    web_dir = pico_emu.setup()
+    pico_emu.start(HTML_PORT)
+
+    try:
+        audio = socket.create_connection((HOST, HTML_PORT))
+        audio.sendall(b'GET /audio.adpcm HTTP/1.0\r\n\r\n')
+        audio_file = audio.makefile('rb')
+        while audio_file.readline() != b'\r\n':
+            pass
+        audio_file.read(len(WAVBuffer.header(WAVBuffer.ADPCM)))
+
+        sock = socket.create_connection((HOST, HTML_PORT))
+        file = sock.makefile('rb')
+
+        tunes = ('fm/9530', 'fm/10110', 'am/680', 'fm/8810')
+        for path in tunes:
+            assert request(sock, file, 'PATCH', 'tune/' + path)[0] == 204
+
+        # the page, read from its file then from the cache
+        pages = 2
+        for _ in range(pages):
+            assert request(sock, file, 'GET', '')[0] == 200
+
+        # stop reading the stream once some buffers have come through, and wait for the server
+        # to be blocked on the next one
+        buffers = 5
+        for _ in range(buffers):
+            audio_file.read(WAVBuffer.ADPCM_BLOCK_BYTES)
+        time.sleep(2 * WAVBuffer.BUF_PERIOD)
+
+        status, headers, body = request(sock, file, 'GET', 'metrics')
+        assert status == 200
+        assert headers['content-type'].startswith('text/plain')
+        assert headers['cache-control'] == 'no-store'
+        metrics = parse(body)
+
+        # the server has sent at least what was read, and the buffers that followed are either
+        # still on the way or waiting in the socket buffers
+        sent = metrics['pico_audio_sent_buffers_total{stream="0"}']
+        assert sent >= buffers, sent
+        assert metrics['pico_audio_sent_bytes_total{stream="0"}'] == \
+               sent * WAVBuffer.ADPCM_BLOCK_BYTES
+        assert metrics['pico_audio_sent_bytes_total'] == \
+               metrics['pico_audio_sent_bytes_total{stream="0"}']
+        assert metrics['pico_audio_listeners'] == 1
+        assert metrics['pico_audio_buffers_produced_total'] >= sent
+
+        # the scrape itself isn't counted until it's done
+        assert metrics['pico_http_requests_total'] == len(tunes) + pages
+        assert metrics['pico_http_request_us_max'] > 0
+        assert metrics['pico_http_first_response_ms'] > 0
+
+        assert metrics['pico_asset_cache_misses_total'] == 1
+        assert metrics['pico_asset_cache_hits_total'] == pages - 1
+        assert metrics['pico_asset_cache_entries'] == 1
+        assert metrics['pico_asset_cache_bytes'] > os.path.getsize('index.html')
+
+        # the radio powered up in FM, then switched to AM and back (for the tunes above)
+        assert metrics['pico_radio_band_switches_total'] == 3
+        assert metrics['pico_radio_cmds_total{cmd="0x%02x"}' % TUNE_FREQ_CMD] == 3
+        assert metrics['pico_radio_cmds_total{cmd="0x40"}'] == 1
+        assert metrics['pico_heap_free_bytes'] > 0
+
+        print('Metrics checks passed ({} metrics, {} bytes)'.format(len(metrics), len(body)))
+
+        times = []
+        for _ in range(n):
+            t = time.perf_counter()
+            assert request(sock, file, 'GET', 'metrics')[0] == 200
+            times.append(time.perf_counter() - t)
+        times.sort()
+        print('Scrape of /metrics ({} requests): mean {:.3f} ms, p95 {:.3f} ms'.format(
+              n, 1000 * sum(times) / n, 1000 * times[int(0.95 * (n - 1))]))
+
+        sock.close()
+        audio.close()
+    finally:
+        pico_emu.cleanup(web_dir)
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
@@ -0,0 +1,317 @@
+/*
+    Host test and benchmark of the IMA-ADPCM codec ('adpcm.h') used for the compressed ring,
+    and of the mu-law codec ('ulaw.h').
+
+    Encodes a reference 12-bit signal (a tone sweep with some noise, as the ADC would see it)
+    block by block, and checks that:
+        - decoding each block on its own reproduces exactly what the encoder tracked,
+        - the decoded audio is close enough to the reference (SNR, shown next to that of
+          8-bit truncation for comparison),
+        - mu-law encoded from the 12-bit samples is at least as good as 8-bit truncation (SNR),
+          at the reference's level and at a quarter of it,
+    and shows the SNR of ADPCM encoded from the 12-bit samples (as 'audio.adpcm' would serve
+    them, in half the bytes of 8-bit PCM) against that of 8-bit truncation (as 'audio.wav' serves
+    them) from the reference's level down, which it only matches on quieter audio,
+    then reports the encode/decode throughput in nanoseconds (and cycles, on x86) per sample.
+*/
+
+#include <math.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <time.h>
+
+#if defined(__x86_64__) || defined(__i386__)
+#include <x86intrin.h>
+#define HAVE_RDTSC 1
+#endif
+
+#include "adpcm.h"
+#include "ulaw.h"
+
+#define SAMPLE_RATE 30000
+#define NSAMPLES 3000
+#define NBLOCKS 100
+#define NBENCH 20
+
+static uint16_t pcm[NBLOCKS][NSAMPLES];
+static uint8_t adpcm[NBLOCKS][ADPCM_BLOCK_BYTES(NSAMPLES)];
+static int16_t decoded[NBLOCKS][NSAMPLES];
+static uint8_t decoded_u8[NSAMPLES];
+static uint8_t pcm_u8[NSAMPLES];
+
+static double snr_db(double signal, double noise)
+{
+    return 10.0 * log10(signal / noise);
+}
+
+// SNR of mu-law (encoded from the 12-bit samples) and of 8-bit truncation, for the reference
+// scaled down by 'shift' bits
+static void snr_ulaw(int shift, double *ulaw, double *u8)
+{
+    static uint8_t encoded[NSAMPLES];
+    static uint16_t scaled[NSAMPLES];
+    double signal = 0, noise_ulaw = 0, noise_u8 = 0;
+
+    for (int b = 0; b < NBLOCKS; b++)
+    {
+        for (int i = 0; i < NSAMPLES; i++)
+        {
+            scaled[i] = 2048 + (((int32_t) pcm[b][i] - 2048) >> shift);
+        }
+
+        ulaw_encode_u12(scaled, NSAMPLES, encoded);
+
+        for (int i = 0; i < NSAMPLES; i++)
+        {
+            double ref = ((int32_t) scaled[i] - 2048) * 16.0;
+            double err_u8 = ((int32_t) (scaled[i] >> 4) - 128) * 256.0 - ref;
+            double err_ulaw = ulaw_decode(encoded[i]) - ref;
+
+            signal += ref * ref;
+            noise_ulaw += err_ulaw * err_ulaw;
+            noise_u8 += err_u8 * err_u8;
+        }
+    }
+
+    *ulaw = snr_db(signal, noise_ulaw);
+    *u8 = snr_db(signal, noise_u8);
+}
+
+// SNR of ADPCM (encoded from the 12-bit samples) and of 8-bit truncation, for the reference
+// scaled down by 'shift' bits
+static void snr_adpcm(int shift, double *adpcm_snr, double *u8)
+{
+    static uint16_t scaled[NSAMPLES];
+    static uint8_t block[ADPCM_BLOCK_BYTES(NSAMPLES)];
+    static int16_t block_decoded[NSAMPLES];
+    adpcm_state_t state;
+    double signal = 0, noise_adpcm = 0, noise_u8 = 0;
+
+    adpcm_init(&state);
+    for (int b = 0; b < NBLOCKS; b++)
+    {
+        for (int i = 0; i < NSAMPLES; i++)
+        {
+            scaled[i] = 2048 + (((int32_t) pcm[b][i] - 2048) >> shift);
+        }
+
+        adpcm_encode_u12(&state, scaled, NSAMPLES, block);
+        adpcm_decode_s16(block, NSAMPLES, block_decoded);
+
+        for (int i = 0; i < NSAMPLES; i++)
+        {
+            double ref = ((int32_t) scaled[i] - 2048) * 16.0;
+            double err_u8 = ((int32_t) (scaled[i] >> 4) - 128) * 256.0 - ref;
+            double err_adpcm = block_decoded[i] - ref;
+
+            signal += ref * ref;
+            noise_adpcm += err_adpcm * err_adpcm;
+            noise_u8 += err_u8 * err_u8;
+        }
+    }
+
+    *adpcm_snr = snr_db(signal, noise_adpcm);
+    *u8 = snr_db(signal, noise_u8);
+}
+
+static double now_ns(void)
+{
+    struct timespec ts;
+
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+
+    return ts.tv_sec * 1e9 + ts.tv_nsec;
+}
+
+static void report(const char *name, double ns, uint64_t cycles, uint32_t nsamples)
+{
+    printf("%s: %.2f ns/sample", name, ns / nsamples);
+    #ifdef HAVE_RDTSC
+        printf(", %.1f cycles/sample (host TSC)", (double) cycles / nsamples);
+    #else
+        (void) cycles;
+    #endif
+    printf("\n");
+}
+
+static inline uint64_t cycles_now(void)
+{
+    #ifdef HAVE_RDTSC
+        return __rdtsc();
+    #else
+        return 0;
+    #endif
+}
+
+int main(void)
+{
+    adpcm_state_t state;
+    double signal = 0, noise_adpcm = 0, noise_u8 = 0, noise_adpcm_u8 = 0;
+    int failed = 0;
+
+    srand(1);
+
+    // tone sweeping from 100Hz to 5kHz at about half of full-scale, plus a little noise
+    double phase = 0;
+    for (int b = 0; b < NBLOCKS; b++)
+    {
+        for (int i = 0; i < NSAMPLES; i++)
+        {
+            double t = (double) (b * NSAMPLES + i) / (NBLOCKS * NSAMPLES);
+            double freq = 100.0 + 4900.0 * t;
+            double noise = ((rand() % 17) - 8);
+
+            phase += 2.0 * M_PI * freq / SAMPLE_RATE;
+            pcm[b][i] = (uint16_t) (2048 + 1000.0 * sin(phase) + noise);
+        }
+    }
+
+    adpcm_init(&state);
+    for (int b = 0; b < NBLOCKS; b++)
+    {
+        adpcm_encode_u12(&state, pcm[b], NSAMPLES, adpcm[b]);
+    }
+
+    // decode blocks out of order, as a listener joining or dropping would
+    for (int b = NBLOCKS - 1; b >= 0; b--)
+    {
+        adpcm_decode_s16(adpcm[b], NSAMPLES, decoded[b]);
+    }
+
+    // the header of each block should match the decoder state at the end of the previous block
+    for (int b = 1; b < NBLOCKS; b++)
+    {
+        int16_t header_predictor = (int16_t) (adpcm[b][0] | (adpcm[b][1] << 8));
+
+        if (header_predictor != decoded[b-1][NSAMPLES-1])
+        {
+            printf("block %d: header doesn't continue from the previous block\n", b);
+            failed = 1;
+        }
+    }
+
+    for (int b = 0; b < NBLOCKS; b++)
+    {
+        adpcm_decode_u8(adpcm[b], NSAMPLES, decoded_u8);
+
+        for (int i = 0; i < NSAMPLES; i++)
+        {
+            double ref = ((int32_t) pcm[b][i] - 2048) * 16.0;
+            double u8 = ((int32_t) (pcm[b][i] >> 4) - 128) * 256.0;
+            double err = decoded[b][i] - ref;
+
+            if (decoded_u8[i] != (uint8_t) ((decoded[b][i] >> 8) + 128))
+            {
+                printf("block %d: 8-bit decode doesn't match 16-bit decode\n", b);
+                failed = 1;
+                break;
+            }
+
+            signal += ref * ref;
+            noise_adpcm += err * err;
+            noise_u8 += (u8 - ref) * (u8 - ref);
+        }
+    }
+
+    // as served over 'audio.adpcm' when the ring holds 8-bit PCM
+    adpcm_init(&state);
+    for (int b = 0; b < NBLOCKS; b++)
+    {
+        for (int i = 0; i < NSAMPLES; i++)
+        {
+            pcm_u8[i] = pcm[b][i] >> 4;
+        }
+
+        adpcm_encode_u8(&state, pcm_u8, NSAMPLES, adpcm[b]);
+        adpcm_decode_s16(adpcm[b], NSAMPLES, decoded[b]);
+
+        for (int i = 0; i < NSAMPLES; i++)
+        {
+            double err = decoded[b][i] - ((int32_t) pcm[b][i] - 2048) * 16.0;
+            noise_adpcm_u8 += err * err;
+        }
+    }
+
+    printf("SNR: %.1f dB as ADPCM (4 bits/sample), %.1f dB as 8-bit PCM (8 bits/sample), "
+           "%.1f dB as ADPCM from 8-bit PCM\n", snr_db(signal, noise_adpcm),
+           snr_db(signal, noise_u8), snr_db(signal, noise_adpcm_u8));
+
+    // IMA-ADPCM is typically good for 20-30dB on wideband material like this
+    if (snr_db(signal, noise_adpcm) < 20.0)
+    {
+        printf("ADPCM SNR too low\n");
+        failed = 1;
+    }
+
+    // served over 'audio.adpcm' from a 12-bit capture, against 'audio.wav' (which sends twice the
+    // bytes): 4-bit ADPCM falls short of 8-bit PCM but on quiet audio, so there's no stream with
+    // half the bytes of 'audio.wav' at its quality
+    for (int shift = 0; shift <= 6; shift += 2)
+    {
+        double adpcm_snr, u8;
+
+        snr_adpcm(shift, &adpcm_snr, &u8);
+        printf("SNR at %d dB: %.1f dB as ADPCM from 12-bit, %.1f dB as 8-bit PCM\n",
+               -6 * shift, adpcm_snr, u8);
+
+        // (it does better from a quarter of the reference's level down)
+        if (shift >= 4 && adpcm_snr < u8)
+        {
+            printf("ADPCM SNR below 8-bit PCM on quiet audio\n");
+            failed = 1;
+        }
+    }
+
+    // served over 'audio.ulaw' (at 8 bits/sample, see 'ulaw.h')
+    for (int shift = 0; shift <= 2; shift += 2)
+    {
+        double ulaw, u8;
+
+        snr_ulaw(shift, &ulaw, &u8);
+        printf("SNR at %d dB: %.1f dB as mu-law from 12-bit, %.1f dB as 8-bit PCM\n",
+               -6 * shift, ulaw, u8);
+
+        if (ulaw < u8)
+        {
+            printf("mu-law SNR below 8-bit PCM\n");
+            failed = 1;
+        }
+    }
+
+    // (but for 0x7f, a negative zero, which encodes back as 0xff)
+    for (int i = 0; i < 256; i++)
+    {
+        if (ulaw_encode(ulaw_decode(i)) != i && i != 0x7f)
+        {
+            printf("mu-law byte %d doesn't decode and encode back to itself\n", i);
+            failed = 1;
+        }
+    }
+
+    double t0 = now_ns();
+    uint64_t c0 = cycles_now();
+    for (int n = 0; n < NBENCH; n++)
+    {
+        adpcm_init(&state);
+        for (int b = 0; b < NBLOCKS; b++)
+        {
+            adpcm_encode_u12(&state, pcm[b], NSAMPLES, adpcm[b]);
+        }
+    }
+    report("encode", now_ns() - t0, cycles_now() - c0, NBENCH * NBLOCKS * NSAMPLES);
+
+    t0 = now_ns();
+    c0 = cycles_now();
+    for (int n = 0; n < NBENCH; n++)
+    {
+        for (int b = 0; b < NBLOCKS; b++)
+        {
+            adpcm_decode_u8(adpcm[b], NSAMPLES, decoded_u8);
+        }
+    }
+    report("decode", now_ns() - t0, cycles_now() - c0, NBENCH * NBLOCKS * NSAMPLES);
+
+    printf("adpcm_test: %s\n", failed ? "FAILED" : "passed");
+
+    return failed ? EXIT_FAILURE : EXIT_SUCCESS;
+}
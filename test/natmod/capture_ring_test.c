@@ -0,0 +1,355 @@
+/*
+    Host test of the interrupt-free capture ring ('capture_ring.h'), against a mocked DMA
+    channel writing into a ring of blocks the way the RP2040's DMA does in ring mode.
+
+    The mocked capture channel writes bytes into the buffer (each byte being the number of the
+    block it belongs to, modulo 256), wrapping its write address around within the buffer, and
+    runs its transfer count down, being re-triggered where it left off when it runs out (as by
+    the control channel), with a mocked microsecond clock going at a byte per sample period (at
+    30 kHz) give or take some jitter. A listener polls at random intervals, taking a few blocks at
+    a time, and checks that:
+        - a block handed out is never the one the DMA is writing, and holds a single block's
+          samples, which stay intact for at least the block period after it's handed out,
+        - every block is published once, with the sequence number the ring gives it matching the
+          block the DMA wrote, and every block is either read or counted as dropped, both while
+          it polls at least once per lap of the buffer and when it misses laps.
+
+    Then benchmarks an update when polling (with and without a new block to publish).
+*/
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <time.h>
+
+#if defined(__x86_64__) || defined(__i386__)
+#include <x86intrin.h>
+#define HAVE_RDTSC 1
+#endif
+
+#include "capture_ring.h"
+
+#define NBUFS 16
+#define NSAMPLES 1024
+#define CAPTURE_BYTES (NBUFS * NSAMPLES)
+#define RING_GUARD 2
+#define NPOLLS 200000
+#define NBENCH 10000000
+
+// (the capture channel is re-triggered every RELOAD_COUNT bytes, i.e. not on a block boundary)
+#define RELOAD_COUNT 5000
+
+// the mocked clock: microseconds per byte (i.e. per sample, at 30 kHz), as 100 / 3, and up to
+// JITTER_US either way on each reading
+#define SAMPLE_US_NUM 100
+#define SAMPLE_US_DEN 3
+#define LAP_US ((CAPTURE_BYTES * SAMPLE_US_NUM) / SAMPLE_US_DEN)
+#define JITTER_US 200
+
+// a DMA channel's registers, as laid out in the RP2040's 'dma_channel_hw_t'
+typedef struct mock_dma_channel_struct
+{
+    volatile uint32_t read_addr;
+    volatile uint32_t write_addr;
+    volatile uint32_t transfer_count;
+    volatile uint32_t ctrl_trig;
+} mock_dma_channel_t;
+
+typedef struct mock_dma_hw_struct
+{
+    mock_dma_channel_t ch[12];
+} mock_dma_hw_t;
+
+static mock_dma_hw_t mock_dma;
+static mock_dma_hw_t *dma_hw = &mock_dma;
+
+#define CAPTURE_CHAN 9
+
+// placed within twice its size, as in 'ADC_DMA.c'
+static uint8_t capture_space[2 * CAPTURE_BYTES];
+static uint8_t *capture_buf;
+static uint32_t capture_reload;
+
+static uint32_t written;
+static uint32_t retriggers;
+static uint32_t jitter_random;
+
+static capture_ring_t capture;
+static ring_t ring;
+static ring_cursor_t cursor;
+
+// xorshift, for the random poll intervals
+static uint32_t next_random(uint32_t *state)
+{
+    *state ^= *state << 13;
+    *state ^= *state >> 17;
+    *state ^= *state << 5;
+    return *state;
+}
+
+// the mocked microsecond clock (wrapping around like the RP2040's 32-bit timer)
+static uint32_t clock_now(void)
+{
+    return (uint32_t) (((uint64_t) written * SAMPLE_US_NUM) / SAMPLE_US_DEN) +
+           (next_random(&jitter_random) % (2 * JITTER_US + 1)) - JITTER_US;
+}
+
+static void dma_init(void)
+{
+    uintptr_t base = ((uintptr_t) capture_space + CAPTURE_BYTES - 1) &
+                     ~(uintptr_t) (CAPTURE_BYTES - 1);
+
+    capture_buf = (uint8_t *) base;
+    memset(capture_space, 0xff, sizeof(capture_space));
+    written = 0;
+    retriggers = 0;
+    jitter_random = 67890;
+
+    capture_reload = RELOAD_COUNT;
+    dma_hw->ch[CAPTURE_CHAN].write_addr = (uint32_t) base;
+    dma_hw->ch[CAPTURE_CHAN].transfer_count = capture_reload;
+
+    ring_init(&ring, NBUFS, NBUFS - RING_GUARD);
+    capture_ring_init(&capture, &dma_hw->ch[CAPTURE_CHAN].write_addr, base, CAPTURE_BYTES,
+                      NSAMPLES, LAP_US, clock_now());
+    ring_cursor_open(&ring, &cursor);
+}
+
+// the DMA capturing 'n' bytes
+static void dma_write(uint32_t n)
+{
+    mock_dma_channel_t *ch = &dma_hw->ch[CAPTURE_CHAN];
+
+    while (n-- > 0)
+    {
+        uint32_t offset = (ch->write_addr - (uint32_t) (uintptr_t) capture_buf) &
+                          (CAPTURE_BYTES - 1);
+
+        capture_buf[offset] = (uint8_t) (written / NSAMPLES);
+        written++;
+
+        // only the low bits of the address are incremented, wrapping around within the ring
+        ch->write_addr = (ch->write_addr & ~(uint32_t) (CAPTURE_BYTES - 1)) |
+                         ((ch->write_addr + 1) & (CAPTURE_BYTES - 1));
+
+        // chained to the control channel, which writes the count back and re-triggers it
+        if (--ch->transfer_count == 0)
+        {
+            ch->transfer_count = capture_reload;
+            retriggers++;
+        }
+    }
+}
+
+// the slot the DMA is writing into
+static uint32_t dma_slot(void)
+{
+    return ((dma_hw->ch[CAPTURE_CHAN].write_addr - (uint32_t) (uintptr_t) capture_buf) &
+            (CAPTURE_BYTES - 1)) / NSAMPLES;
+}
+
+// whether all of a block is from the same block written by the DMA, that block being in 'slot'
+static int block_whole(uint8_t *block, uint32_t slot)
+{
+    for (int i = 0; i < NSAMPLES; i++)
+    {
+        if (block[i] != block[0])
+        {
+            return 0;
+        }
+    }
+
+    return (block[0] % NBUFS) == slot;
+}
+
+// Poll NPOLLS times, the DMA writing up to 'max_interval' bytes in between (with one poll in
+// 'long_every' waiting up to 'long_interval' instead), returning the number of failures.
+static int run(const char *name, uint32_t max_interval, uint32_t long_every,
+               uint32_t long_interval, int laps_missed)
+{
+    uint32_t random = 12345;
+    uint32_t reads = 0;
+    uint32_t mislabelled = 0;
+    uint32_t errors = 0;
+    uint32_t published = 0;
+    uint8_t *last_block = NULL;
+    uint8_t last_value = 0;
+    uint32_t last_written = 0;
+    uint32_t laps_missed_polls = 0;
+
+    dma_init();
+
+    for (uint32_t poll = 0; poll < NPOLLS; poll++)
+    {
+        uint32_t interval = (long_every && (next_random(&random) % long_every) == 0) ?
+                            next_random(&random) % long_interval :
+                            next_random(&random) % max_interval;
+
+        dma_write(interval);
+        if (interval >= CAPTURE_BYTES)
+        {
+            laps_missed_polls++;
+        }
+
+        // the block handed out last is intact for a block period after (while it's sent out)
+        if (last_block && (written - last_written <= NSAMPLES) &&
+            !(last_block[0] == last_value && block_whole(last_block, (last_value % NBUFS))))
+        {
+            if (errors++ < 10)
+            {
+                printf("%s: block %u overwritten while being sent\n", name, cursor.seq);
+            }
+        }
+
+        published += capture_ring_update(&capture, &ring, clock_now());
+
+        for (uint32_t n = next_random(&random) % 4; n > 0; n--)
+        {
+            uint32_t slot;
+
+            if (!ring_next(&ring, &cursor, &slot))
+            {
+                break;
+            }
+
+            uint8_t *block = (uint8_t *) capture_ring_block(&capture, slot);
+            reads++;
+
+            if (slot == dma_slot() || !block_whole(block, slot))
+            {
+                if (errors++ < 10)
+                {
+                    printf("%s: block %u in slot %u handed out while being written\n", name,
+                           cursor.seq, slot);
+                }
+            }
+            if (block[0] != (uint8_t) cursor.seq)
+            {
+                mislabelled++;
+            }
+
+            last_block = block;
+            last_value = block[0];
+            last_written = written;
+        }
+    }
+
+    printf("%s: %u bytes captured (%u re-triggers), %u polls after laps missed, %u blocks "
+           "published, %u read, %u dropped, %u mislabelled\n", name, written, retriggers,
+           laps_missed_polls, published, reads, cursor.drops, mislabelled);
+
+    if ((laps_missed_polls > 0) != laps_missed)
+    {
+        printf("%s: laps were%s missed\n", name, laps_missed ? " not" : "");
+        errors++;
+    }
+    if (published != written / NSAMPLES)
+    {
+        printf("%s: %u blocks completed but %u published\n", name, written / NSAMPLES,
+               published);
+        errors++;
+    }
+    if (mislabelled)
+    {
+        printf("%s: blocks mislabelled\n", name);
+        errors++;
+    }
+    if (reads + cursor.drops + ring_pending(&ring, &cursor) != published)
+    {
+        printf("%s: blocks unaccounted for\n", name);
+        errors++;
+    }
+    if (cursor.drops == 0)
+    {
+        printf("%s: the listener never fell behind\n", name);
+        errors++;
+    }
+
+    return errors ? 1 : 0;
+}
+
+static double now_ns(void)
+{
+    struct timespec ts;
+
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+
+    return ts.tv_sec * 1e9 + ts.tv_nsec;
+}
+
+static inline uint64_t cycles_now(void)
+{
+    #ifdef HAVE_RDTSC
+        return __rdtsc();
+    #else
+        return 0;
+    #endif
+}
+
+static void report(const char *name, double ns, uint64_t cycles, uint32_t sum)
+{
+    printf("%s: %.2f ns per poll", name, ns / NBENCH);
+    #ifdef HAVE_RDTSC
+        printf(", %.1f cycles per poll (host TSC)", (double) cycles / NBENCH);
+    #else
+        (void) cycles;
+    #endif
+    printf(" (%u)\n", sum & 0xff);
+}
+
+static void benchmark(void)
+{
+    mock_dma_channel_t *ch = &dma_hw->ch[CAPTURE_CHAN];
+    uint32_t sum = 0;
+    uint32_t time;
+    uint64_t cycles;
+    double ns;
+
+    // (the clock going at a byte, or a block, per poll)
+    dma_init();
+    time = capture.time;
+    ns = now_ns();
+    cycles = cycles_now();
+    for (uint32_t i = 0; i < NBENCH; i++)
+    {
+        // (a byte captured since the last poll)
+        ch->write_addr = (uint32_t) (uintptr_t) capture_buf + (i & (CAPTURE_BYTES - 1));
+        time += SAMPLE_US_NUM / SAMPLE_US_DEN;
+        sum += capture_ring_update(&capture, &ring, time);
+    }
+    cycles = cycles_now() - cycles;
+    ns = now_ns() - ns;
+    report("update, nothing to publish", ns, cycles, sum);
+
+    dma_init();
+    time = capture.time;
+    ns = now_ns();
+    cycles = cycles_now();
+    for (uint32_t i = 0; i < NBENCH; i++)
+    {
+        ch->write_addr = (uint32_t) (uintptr_t) capture_buf +
+                         ((i * NSAMPLES) & (CAPTURE_BYTES - 1));
+        time += LAP_US / NBUFS;
+        sum += capture_ring_update(&capture, &ring, time);
+    }
+    cycles = cycles_now() - cycles;
+    ns = now_ns() - ns;
+    report("update, publishing a block", ns, cycles, sum);
+}
+
+int main(void)
+{
+    int failed = 0;
+
+    // polled often, with now and then a pause long enough to drop blocks (but less than a lap)
+    failed |= run("polled each lap", 3 * NSAMPLES, 50, CAPTURE_BYTES - 1, 0);
+
+    // polled now and then after several laps
+    failed |= run("laps missed", 3 * NSAMPLES, 50, 5 * CAPTURE_BYTES, 1);
+
+    benchmark();
+
+    printf("capture_ring_test: %s\n", failed ? "FAILED" : "passed");
+
+    return failed ? EXIT_FAILURE : EXIT_SUCCESS;
+}
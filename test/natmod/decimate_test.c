@@ -0,0 +1,216 @@
+/*
+    Host test and benchmark of the decimator ('decimate.h') used to serve slow listeners
+    a stream at a lower sample rate.
+
+    For each factor (2 and 4), checks that:
+        - a constant (DC) signal comes through unchanged,
+        - a tone in the passband keeps its level,
+        - a tone that would alias into the passband is attenuated (by at least MIN_REJECT_DB),
+        - decimating block by block (as the ring is served) gives exactly the same output as
+          decimating the whole signal at once,
+    then reports the throughput in nanoseconds (and cycles, on x86) per input sample.
+*/
+
+#include <math.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <time.h>
+
+#if defined(__x86_64__) || defined(__i386__)
+#include <x86intrin.h>
+#define HAVE_RDTSC 1
+#endif
+
+#include "decimate.h"
+
+#define SAMPLE_RATE 30000
+#define NSAMPLES 3000
+#define NBLOCKS 20
+#define NBENCH 200
+
+// what the filter's ripple and 8-bit rounding allow for
+#define MAX_PASS_DB 0.3
+#define MIN_REJECT_DB 40.0
+
+static uint8_t in[NBLOCKS * NSAMPLES];
+static uint8_t whole[NBLOCKS * NSAMPLES];
+static uint8_t blocks[NBLOCKS * NSAMPLES];
+
+static double now_ns(void)
+{
+    struct timespec ts;
+
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+
+    return ts.tv_sec * 1e9 + ts.tv_nsec;
+}
+
+static inline uint64_t cycles_now(void)
+{
+    #ifdef HAVE_RDTSC
+        return __rdtsc();
+    #else
+        return 0;
+    #endif
+}
+
+static void tone(double freq, double amplitude)
+{
+    for (int i = 0; i < NBLOCKS * NSAMPLES; i++)
+    {
+        in[i] = (uint8_t) lround(128.0 + amplitude * sin(2.0 * M_PI * freq * i / SAMPLE_RATE));
+    }
+}
+
+// RMS level (around mid-scale) of the output, skipping the filter's start up
+static double rms(const uint8_t *out, uint32_t n)
+{
+    double sum = 0;
+
+    for (uint32_t i = 64; i < n; i++)
+    {
+        sum += (out[i] - 128.0) * (out[i] - 128.0);
+    }
+
+    return sqrt(sum / (n - 64));
+}
+
+static uint32_t decimate_whole(uint32_t factor)
+{
+    decimator_t decimator;
+
+    decimate_init(&decimator, factor);
+    return decimate_u8(&decimator, in, NBLOCKS * NSAMPLES, whole);
+}
+
+static int check_factor(uint32_t factor)
+{
+    const double amplitude = 100.0;
+    const double in_rms = amplitude / sqrt(2.0);
+    int failed = 0;
+
+    // DC, at a few levels
+    for (int level = 0; level < 256; level += 51)
+    {
+        memset(in, level, sizeof(in));
+        uint32_t n = decimate_whole(factor);
+
+        for (uint32_t i = 64; i < n; i++)
+        {
+            if (whole[i] != level)
+            {
+                printf("factor %u: DC level %d came out as %d\n", factor, level, whole[i]);
+                failed = 1;
+                break;
+            }
+        }
+    }
+
+    // a tone at 0.1 of the output rate, and one at 0.4 of the input rate above the output's
+    // Nyquist frequency (aliasing to 0.1 of the output rate)
+    double out_rate = (double) SAMPLE_RATE / factor;
+    double pass_freq = 0.1 * out_rate;
+    double alias_freq = out_rate - pass_freq;
+
+    tone(pass_freq, amplitude);
+    double pass_db = 20.0 * log10(rms(whole, decimate_whole(factor)) / in_rms);
+
+    // (if nothing of it is left after rounding to 8 bits, count it as half an LSB)
+    tone(alias_freq, amplitude);
+    double alias_rms = rms(whole, decimate_whole(factor));
+    double reject_db = -20.0 * log10((alias_rms > 0 ? alias_rms : 0.5) / in_rms);
+
+    printf("factor %u (%.0f Hz): %.0f Hz tone %+.2f dB, %.0f Hz tone (aliasing to %.0f Hz) "
+           "%s%.1f dB\n", factor, out_rate, pass_freq, pass_db, alias_freq, pass_freq,
+           alias_rms > 0 ? "-" : "below -", reject_db);
+
+    if (fabs(pass_db) > MAX_PASS_DB)
+    {
+        printf("factor %u: passband tone not kept at its level\n", factor);
+        failed = 1;
+    }
+    if (reject_db < MIN_REJECT_DB)
+    {
+        printf("factor %u: aliasing tone not attenuated enough\n", factor);
+        failed = 1;
+    }
+
+    // block by block (as fetched from the ring) vs. all at once, on a sweep with some noise
+    srand(1);
+    double phase = 0;
+    for (int i = 0; i < NBLOCKS * NSAMPLES; i++)
+    {
+        double freq = 100.0 + 14000.0 * i / (NBLOCKS * NSAMPLES);
+
+        phase += 2.0 * M_PI * freq / SAMPLE_RATE;
+        in[i] = (uint8_t) lround(128.0 + 90.0 * sin(phase) + (rand() % 17) - 8);
+    }
+
+    uint32_t n = decimate_whole(factor);
+
+    decimator_t decimator;
+    uint32_t nout = 0;
+    decimate_init(&decimator, factor);
+    for (int b = 0; b < NBLOCKS; b++)
+    {
+        nout += decimate_u8(&decimator, in + b * NSAMPLES, NSAMPLES, blocks + nout);
+    }
+
+    if (nout != n || n != NBLOCKS * NSAMPLES / factor || memcmp(whole, blocks, n) != 0)
+    {
+        printf("factor %u: decimating block by block doesn't match decimating all at once\n",
+               factor);
+        failed = 1;
+    }
+
+    return failed;
+}
+
+static void benchmark(uint32_t factor)
+{
+    decimator_t decimator;
+    uint64_t cycles;
+    double ns;
+
+    decimate_init(&decimator, factor);
+
+    ns = now_ns();
+    cycles = cycles_now();
+    for (int r = 0; r < NBENCH; r++)
+    {
+        decimate_u8(&decimator, in + (r % NBLOCKS) * NSAMPLES, NSAMPLES, blocks);
+    }
+    cycles = cycles_now() - cycles;
+    ns = now_ns() - ns;
+
+    printf("decimate by %u: %.2f ns/input sample", factor, ns / (NBENCH * NSAMPLES));
+    #ifdef HAVE_RDTSC
+        printf(", %.1f cycles/input sample (host TSC)", (double) cycles / (NBENCH * NSAMPLES));
+    #else
+        (void) cycles;
+    #endif
+    printf("\n");
+}
+
+int main(void)
+{
+    decimator_t decimator;
+    int failed = 0;
+
+    if (decimate_init(&decimator, 3))
+    {
+        printf("decimate_init accepted a factor of 3\n");
+        failed = 1;
+    }
+
+    failed |= check_factor(2);
+    failed |= check_factor(4);
+
+    benchmark(2);
+    benchmark(4);
+
+    printf("decimate_test: %s\n", failed ? "FAILED" : "passed");
+
+    return failed ? EXIT_FAILURE : EXIT_SUCCESS;
+}
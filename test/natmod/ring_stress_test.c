@@ -0,0 +1,324 @@
+/*
+    Stress test and benchmark of the shared audio ring ('ring.h') with the producer and the
+    listener running in parallel, in threads of their own.
+
+    The producer fills each block with its sequence number before publishing it, pausing for a
+    random while after each, while the listener reads at its own pace (also pausing now and
+    then, long enough to be lapped), copying each block out and then checking with
+    'ring_overwritten' whether the producer may have come round to it meanwhile. Every block
+    copied out that wasn't overwritten must hold the sequence number the ring gave for it, the
+    sequence numbers must only ever go up, and every block must be either read or counted as
+    dropped. The counters start just before they wrap, and the ring is run both with a power of 2
+    slots and without.
+
+    Then benchmarks publishing a block and getting it back (single-threaded), against the ring as
+    it was before it allowed any number of slots (a power of 2, masked, without barriers).
+*/
+
+#include <pthread.h>
+#include <sched.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <time.h>
+
+#if defined(__x86_64__) || defined(__i386__)
+#include <x86intrin.h>
+#define HAVE_RDTSC 1
+#endif
+
+#include "ring.h"
+
+#define MAX_SLOTS 16
+#define RING_GUARD 3
+#define BLOCK_WORDS 64
+#define NPUBLISH 500000
+#define NBENCH 10000000
+
+static uint32_t blocks[MAX_SLOTS][BLOCK_WORDS];
+static ring_t ring;
+static ring_cursor_t cursor;
+static volatile int producer_done;
+
+typedef struct result_struct
+{
+    uint32_t reads;
+    uint32_t overwritten;
+    uint32_t errors;
+} result_t;
+
+// xorshift, so each thread has its own random pauses
+static uint32_t next_random(uint32_t *state)
+{
+    *state ^= *state << 13;
+    *state ^= *state >> 17;
+    *state ^= *state << 5;
+    return *state;
+}
+
+static void pause_for(uint32_t n)
+{
+    for (volatile uint32_t i = 0; i < n; i++)
+    {
+    }
+}
+
+static void *producer(void *arg)
+{
+    uint32_t random = 1;
+    (void) arg;
+
+    for (uint32_t i = 0; i < NPUBLISH; i++)
+    {
+        uint32_t *block = blocks[ring_head_slot(&ring)];
+        uint32_t seq = ring.head;
+
+        for (int w = 0; w < BLOCK_WORDS; w++)
+        {
+            __atomic_store_n(&block[w], seq, __ATOMIC_RELAXED);
+        }
+        ring_publish(&ring);
+
+        // (on a single core, the listener only gets to run when the producer yields)
+        pause_for(next_random(&random) & 0x1ff);
+        if (next_random(&random) & 1)
+        {
+            sched_yield();
+        }
+    }
+
+    producer_done = 1;
+    return NULL;
+}
+
+static void *listener(void *arg)
+{
+    result_t *result = arg;
+    uint32_t copy[BLOCK_WORDS];
+    uint32_t random = 7;
+    bool first = true;
+    uint32_t last_seq = 0;
+
+    while (!producer_done || ring_pending(&ring, &cursor) > 0)
+    {
+        uint32_t slot;
+
+        if (!ring_next(&ring, &cursor, &slot))
+        {
+            sched_yield();
+            continue;
+        }
+
+        for (int w = 0; w < BLOCK_WORDS; w++)
+        {
+            copy[w] = __atomic_load_n(&blocks[slot][w], __ATOMIC_RELAXED);
+        }
+
+        result->reads++;
+        if (!first && ring_seq_diff(&ring, cursor.seq, last_seq) == 0)
+        {
+            printf("block %u read twice\n", cursor.seq);
+            result->errors++;
+        }
+        first = false;
+        last_seq = cursor.seq;
+
+        if (ring_overwritten(&ring, &cursor))
+        {
+            result->overwritten++;
+        }
+        else
+        {
+            for (int w = 0; w < BLOCK_WORDS; w++)
+            {
+                if (copy[w] != cursor.seq)
+                {
+                    if (result->errors++ < 10)
+                    {
+                        printf("block %u in slot %u holds %u\n", cursor.seq, slot, copy[w]);
+                    }
+                    break;
+                }
+            }
+        }
+
+        if ((next_random(&random) & 0xfff) == 0)
+        {
+            pause_for(next_random(&random) & 0x3ffff);
+        }
+    }
+
+    return NULL;
+}
+
+static int stress(uint32_t nslots)
+{
+    pthread_t threads[2];
+    result_t result = {0, 0, 0};
+    int failed = 0;
+
+    ring_init(&ring, nslots, nslots - RING_GUARD);
+
+    // start just before the counters wrap
+    ring.head = ring.wrap - NPUBLISH / 2;
+    ring.head_slot = ring_slot(&ring, ring.head);
+    ring_cursor_open(&ring, &cursor);
+    producer_done = 0;
+
+    pthread_create(&threads[1], NULL, listener, &result);
+    pthread_create(&threads[0], NULL, producer, NULL);
+    pthread_join(threads[0], NULL);
+    pthread_join(threads[1], NULL);
+
+    printf("%u slots: %u published, %u read (%u overwritten while copied out), %u dropped, "
+           "deepest %u\n", nslots, NPUBLISH, result.reads, result.overwritten, cursor.drops,
+           ring.depth_max);
+
+    if (result.errors)
+    {
+        printf("%u slots: %u bad blocks\n", nslots, result.errors);
+        failed = 1;
+    }
+    if (result.reads + cursor.drops != NPUBLISH)
+    {
+        printf("%u slots: blocks unaccounted for\n", nslots);
+        failed = 1;
+    }
+    if (ring.drops == 0)
+    {
+        printf("%u slots: the listener was never lapped\n", nslots);
+        failed = 1;
+    }
+
+    return failed;
+}
+
+// the ring before it allowed any number of slots, for comparison
+typedef struct prev_ring_struct
+{
+    volatile uint32_t head;
+    uint32_t nblocks;
+    uint32_t lag_max;
+    uint32_t drops;
+} prev_ring_t;
+
+static inline bool prev_ring_next(prev_ring_t *ring, uint32_t *tail, uint32_t *slot)
+{
+    uint32_t head = ring->head;
+    uint32_t lag = head - *tail;
+
+    if (lag == 0)
+    {
+        return false;
+    }
+    if (lag > ring->lag_max)
+    {
+        ring->drops += lag - ring->lag_max;
+        *tail = head - ring->lag_max;
+    }
+
+    *slot = *tail & (ring->nblocks - 1);
+    (*tail)++;
+
+    return true;
+}
+
+static double now_ns(void)
+{
+    struct timespec ts;
+
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+
+    return ts.tv_sec * 1e9 + ts.tv_nsec;
+}
+
+static inline uint64_t cycles_now(void)
+{
+    #ifdef HAVE_RDTSC
+        return __rdtsc();
+    #else
+        return 0;
+    #endif
+}
+
+static void report(const char *name, double ns, uint64_t cycles, uint32_t sum)
+{
+    printf("%s: %.2f ns per block", name, ns / NBENCH);
+    #ifdef HAVE_RDTSC
+        printf(", %.1f cycles per block (host TSC)", (double) cycles / NBENCH);
+    #else
+        (void) cycles;
+    #endif
+    printf(" (%u)\n", sum & 0xff);
+}
+
+static void benchmark(void)
+{
+    uint32_t slot = 0;
+    uint32_t sum = 0;
+    uint64_t cycles;
+    double ns;
+
+    prev_ring_t prev = {0, MAX_SLOTS, MAX_SLOTS - RING_GUARD, 0};
+    uint32_t tail = 0;
+    ns = now_ns();
+    cycles = cycles_now();
+    for (uint32_t i = 0; i < NBENCH; i++)
+    {
+        prev.head++;
+        prev_ring_next(&prev, &tail, &slot);
+        sum += slot;
+    }
+    cycles = cycles_now() - cycles;
+    ns = now_ns() - ns;
+    report("previous ring (16 slots, masked)", ns, cycles, sum);
+
+    for (uint32_t nslots = MAX_SLOTS - 1; nslots <= MAX_SLOTS; nslots++)
+    {
+        char name[64];
+
+        ring_init(&ring, nslots, nslots - RING_GUARD);
+        ring_cursor_open(&ring, &cursor);
+
+        ns = now_ns();
+        cycles = cycles_now();
+        for (uint32_t i = 0; i < NBENCH; i++)
+        {
+            ring_publish(&ring);
+            ring_next(&ring, &cursor, &slot);
+            sum += slot;
+        }
+        cycles = cycles_now() - cycles;
+        ns = now_ns() - ns;
+        snprintf(name, sizeof(name), "ring (%u slots)", nslots);
+        report(name, ns, cycles, sum);
+    }
+}
+
+int main(void)
+{
+    int failed = 0;
+
+    // a slot from scratch agrees with stepping through them
+    ring_init(&ring, 15, 12);
+    for (uint32_t i = 0; i < 100; i++)
+    {
+        if (ring_slot(&ring, ring.head) != ring_head_slot(&ring) ||
+            ring_slot(&ring, ring.wrap - 1) != 14)
+        {
+            printf("slot of block %u: %u, expected %u\n", ring.head, ring_slot(&ring, ring.head),
+                   ring_head_slot(&ring));
+            failed = 1;
+            break;
+        }
+        ring_publish(&ring);
+    }
+
+    failed |= stress(MAX_SLOTS);
+    failed |= stress(MAX_SLOTS - 1);
+
+    benchmark();
+
+    printf("ring_stress_test: %s\n", failed ? "FAILED" : "passed");
+
+    return failed ? EXIT_FAILURE : EXIT_SUCCESS;
+}
@@ -0,0 +1,220 @@
+/*
+    Host test of the shared audio ring ('ring.h'), with a simulated DMA producer
+    and several listeners consuming at different speeds.
+
+    Each block is stamped with its sequence number when the "DMA" starts writing it,
+    so a listener can check that every block it gets hasn't been overwritten, including
+    for one more block period while it is still being sent out by reference.
+*/
+
+#include <stdio.h>
+#include <stdlib.h>
+
+#include "ring.h"
+
+#define NBUFS 16
+#define RING_GUARD 3
+#define NSAMPLES 8
+#define NLISTENERS 5
+#define NTICKS 100000
+
+static uint32_t adc_buf[NBUFS][NSAMPLES];
+
+static void dma_fill(ring_t *ring, uint32_t seq)
+{
+    for (int i = 0; i < NSAMPLES; i++)
+    {
+        adc_buf[ring_slot(ring, seq)][i] = seq;
+    }
+}
+
+static int check_block(uint32_t *block, uint32_t seq)
+{
+    for (int i = 0; i < NSAMPLES; i++)
+    {
+        if (block[i] != seq)
+        {
+            return 0;
+        }
+    }
+
+    return 1;
+}
+
+// A listener skipping to the live edge: keeps the newest blocks asked for (which it then reads in
+// order), and counts the rest as dropped.
+static int check_skip(void)
+{
+    ring_t ring;
+    ring_cursor_t cursor;
+    uint32_t slot;
+    int failed = 0;
+
+    ring_init(&ring, NBUFS, NBUFS - RING_GUARD);
+    ring_cursor_open(&ring, &cursor);
+
+    for (uint32_t seq = 0; seq < 10; seq++)
+    {
+        dma_fill(&ring, seq);
+        ring_publish(&ring);
+    }
+
+    if (ring_skip(&ring, &cursor, 12) != 0 || ring_pending(&ring, &cursor) != 10)
+    {
+        printf("skip: skipped with fewer blocks waiting than kept\n");
+        failed = 1;
+    }
+
+    if (ring_skip(&ring, &cursor, 2) != 8 || ring_pending(&ring, &cursor) != 2 ||
+        cursor.drops != 8 || ring.drops != 8)
+    {
+        printf("skip: expected 8 blocks skipped and dropped, 2 waiting\n");
+        failed = 1;
+    }
+
+    for (uint32_t seq = 8; seq < 10; seq++)
+    {
+        if (!ring_next(&ring, &cursor, &slot) || !check_block(adc_buf[slot], seq))
+        {
+            printf("skip: expected block %u after skipping\n", seq);
+            failed = 1;
+        }
+    }
+
+    if (ring_skip(&ring, &cursor, 0) != 0 || ring_next(&ring, &cursor, &slot))
+    {
+        printf("skip: blocks left after reading up to the live edge\n");
+        failed = 1;
+    }
+
+    printf("skip: %s\n", failed ? "FAILED" : "passed");
+
+    return failed;
+}
+
+int main(void)
+{
+    ring_t ring;
+    ring_cursor_t cursors[NLISTENERS];
+
+    // number of ticks between fetches for each listener (one block is produced per tick)
+    const uint32_t periods[NLISTENERS] = {1, 1, 2, 3, 7};
+
+    uint32_t reads[NLISTENERS] = {0};
+    uint32_t last_seq[NLISTENERS];
+    uint32_t last_tick[NLISTENERS];
+    uint32_t *last_block[NLISTENERS] = {NULL};
+    uint32_t total_drops = 0;
+    uint32_t depth_max = 0;
+    int failed = 0;
+
+    ring_init(&ring, NBUFS, NBUFS - RING_GUARD);
+
+    // the ping-pong DMA channels are always writing to the next 2 blocks
+    dma_fill(&ring, 0);
+    dma_fill(&ring, 1);
+
+    for (int i = 0; i < NLISTENERS; i++)
+    {
+        ring_cursor_open(&ring, &cursors[i]);
+    }
+
+    for (uint32_t tick = 0; tick < NTICKS; tick++)
+    {
+        ring_publish(&ring);
+        dma_fill(&ring, ring.head + 1);
+
+        for (int i = 0; i < NLISTENERS; i++)
+        {
+            uint32_t slot;
+
+            if (last_block[i] && (last_tick[i] + 1 == tick) && !check_block(last_block[i], last_seq[i]))
+            {
+                printf("listener %d: block %u overwritten while in use\n", i, last_seq[i]);
+                failed = 1;
+            }
+
+            if ((tick % periods[i]) != 0)
+            {
+                continue;
+            }
+
+            // the fastest listeners drain everything, the rest only take one block per fetch
+            do
+            {
+                uint32_t seq = cursors[i].tail + (ring.head - cursors[i].tail > ring.lag_max ?
+                                                  ring.head - cursors[i].tail - ring.lag_max : 0);
+
+                if (!ring_next(&ring, &cursors[i], &slot))
+                {
+                    break;
+                }
+
+                if (!check_block(adc_buf[slot], seq))
+                {
+                    printf("listener %d: expected block %u in slot %u\n", i, seq, slot);
+                    failed = 1;
+                }
+
+                last_block[i] = adc_buf[slot];
+                last_seq[i] = seq;
+                last_tick[i] = tick;
+                reads[i]++;
+            } while (i == 0);
+        }
+    }
+
+    for (int i = 0; i < NLISTENERS; i++)
+    {
+        uint32_t pending = ring_pending(&ring, &cursors[i]);
+
+        printf("listener %d (1 fetch every %u blocks): %u read, %u dropped, %u pending, "
+               "%u at most\n", i, periods[i], reads[i], cursors[i].drops, pending,
+               cursors[i].depth_max);
+
+        total_drops += cursors[i].drops;
+        if (cursors[i].depth_max > depth_max)
+        {
+            depth_max = cursors[i].depth_max;
+        }
+
+        // a listener that keeps up only ever has the block just published waiting, while a slow
+        // one is dropped back to 'lag_max' blocks, and then falls behind until its next fetch
+        if (cursors[i].depth_max != (periods[i] == 1 ? 1 : ring.lag_max + periods[i] - 1))
+        {
+            printf("listener %d: unexpected max. depth\n", i);
+            failed = 1;
+        }
+
+        if (reads[i] + cursors[i].drops + pending != NTICKS)
+        {
+            printf("listener %d: blocks unaccounted for\n", i);
+            failed = 1;
+        }
+
+        if (periods[i] == 1 && cursors[i].drops != 0)
+        {
+            printf("listener %d: dropped blocks while keeping up\n", i);
+            failed = 1;
+        }
+
+        if (periods[i] > 1 && cursors[i].drops == 0)
+        {
+            printf("listener %d: never dropped blocks while falling behind\n", i);
+            failed = 1;
+        }
+    }
+
+    if (ring.drops != total_drops || ring.depth_max != depth_max)
+    {
+        printf("ring counters (%u dropped, %u at most) don't match the listeners'\n",
+               ring.drops, ring.depth_max);
+        failed = 1;
+    }
+
+    failed |= check_skip();
+
+    printf("ring_test: %s\n", failed ? "FAILED" : "passed");
+
+    return failed ? EXIT_FAILURE : EXIT_SUCCESS;
+}
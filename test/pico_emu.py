@@ -0,0 +1,95 @@
+#!/bin/python3
+
+# Host emulator of the whole app: runs the real 'PicoWebRadio.run' (the server, the Si4730
+# driver and the station database) on CPython, with the MicroPython modules it uses stood in for
+# by 'host/' (see 'host/mpyhost.py'):
+#   - WAVBuffer, capturing buffers (of silence) on the Pico's cadence (e.g. 3000 samples at 30 kHz
+#     by default, see 'PicoWebRadio.AUDIO_PROFILES'),
+#   - the Si4730 simulated on the I2C bus (see 'host/Si4730Sim.py'), taking as long as the real
+#     one to tune and seek,
+#   - machine, network and uasyncio.
+#
+# The web app is served from a copy of 'src/web' in a temporary directory, like 'run_test.sh'
+# does with the standalone mock servers, but through the real servers; browse to
+# http://localhost:8080 to use it. The station database is seeded with the simulated stations,
+# so no scan starts with the server (unless '--scan' is given). Also used by 'load_test.py'.
+#
+# Usage: pico_emu.py [HTML port] [--scan]
+
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_DIR, 'host'))
+
+import mpyhost
+mpyhost.install()
+
+import machine
+from Si4730Sim import Si4730Sim
+
+STATIONS = {
+    'FM': {8810: (30, 12), 9530: (45, 25), 10110: (40, 20), 10790: (25, 8)},
+    'AM': {680: (35, 10), 1010: (28, 6)},
+}
+
+SIM = Si4730Sim(STATIONS)
+machine.I2C.devices[0x63] = SIM
+
+import PicoWebRadio
+from StationDB import StationDB
+
+# the web app and the audio streams are served on this port
+HTML_PORT = 8080
+
+# AudioEvent waits on uasyncio's IO queue by yielding, see 'mpyhost.yielding'
+PicoWebRadio.AudioEvent.wait = mpyhost.yielding(PicoWebRadio.AudioEvent.wait)
+
+# Copy the web app to a temporary directory (the working directory from then on), with the
+# simulated stations in the station database unless 'scan', and return its path.
+def setup(scan=False):
+    web_dir = tempfile.mkdtemp()
+    shutil.copytree(os.path.join(TEST_DIR, '..', 'src', 'web'), web_dir, dirs_exist_ok=True)
+    os.chdir(web_dir)
+
+    if (not scan):
+        StationDB().set_bands({band: [(freq, rssi, snr) for freq, (rssi, snr) in stations.items()]
+                               for band, stations in STATIONS.items()}, time.time())
+
+    return web_dir
+
+def cleanup(web_dir):
+    os.chdir(TEST_DIR)
+    shutil.rmtree(web_dir)
+
+# Run the app in a background thread, returning once the server is listening (i.e. its port can't
+# be bound any more; connecting to check would count as a bad request).
+def start(html_port=HTML_PORT):
+    threading.Thread(target=PicoWebRadio.run, args=(html_port,), daemon=True).start()
+
+    while True:
+        with socket.socket() as sock:
+            try:
+                sock.bind(('0.0.0.0', html_port))
+            except OSError:
+                break
+        time.sleep(0.01)
+
+def main(html_port, scan):
+    web_dir = setup(scan)
+    print('Serving the web app on http://localhost:{}'.format(html_port))
+    try:
+        PicoWebRadio.run(html_port)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        cleanup(web_dir)
+
+if __name__ == '__main__':
+    args = [arg for arg in sys.argv[1:] if (arg != '--scan')]
+    main(int(args[0]) if args else HTML_PORT, '--scan' in sys.argv[1:])
@@ -0,0 +1,179 @@
+#!/bin/python3
+
+# Host comparison of the capture profiles (see 'AUDIO_PROFILES' in 'PicoWebRadio.py'), each run
+# in the host emulator (see 'pico_emu.py') in a process of its own, under the same load as
+# 'load_test.py': N listeners (of 8-bit PCM, so every buffer is the same size) and M control
+# clients. Reports per profile:
+#   - the buffer period and ring depth,
+#   - latency: from when a buffer started being captured to when it reached a listener (the
+#     emulated WAVBuffer stamps each buffer with its index, see 'WAVBuffer.capture_time'), so its
+#     oldest sample's, mean and p95,
+#   - DMA interrupts per second (one per buffer captured), and buffers dropped per listener,
+#   - the app's event loop lag and the CPU time it took (the emulator and clients run in the same
+#     process), as a share of the run.
+#
+# Then, with the default profile, compares how the audio streams wait for a buffer: on an
+# AudioEvent (see 'PicoWebRadio.AudioEvent'), against polling for one every ms as they did before
+# it (see 'PollingWait'), reporting the stream tasks' wakes (per buffer sent, and per second, from
+# '/metrics'), the event loop lag and CPU time. On the host the IO queue is itself polled every ms
+# (see 'host/uasyncio.py'), where the Pico's poller sleeps until the DMA interrupt's event, so the
+# wakes are what carries over to the Pico, more than the CPU time.
+#
+# Absolute numbers are those of the host, with the clients on the loopback interface; compare the
+# profiles against each other.
+#
+# Usage: profile_test.py [listeners] [control clients] [seconds]
+
+import asyncio
+import os
+import struct
+import subprocess
+import sys
+import time
+import urllib.request
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, TEST_DIR)
+
+import load_test
+import pico_emu
+import PicoWebRadio
+import WAVBuffer
+
+# The audio streams' wait for a buffer before AudioEvent, for comparison: waking up to check for
+# one every ms.
+class PollingWait:
+    def __init__(self, stream_id):
+        pass
+
+    async def wait(self):
+        await PicoWebRadio.asyncio.sleep_ms(1)
+
+# the app's counters from '/metrics' (those without labels), by name
+def metrics():
+    url = 'http://{}:{}/metrics'.format(load_test.HOST, load_test.HTML_PORT)
+    with urllib.request.urlopen(url) as response:
+        lines = response.read().decode().splitlines()
+    return {name: float(value) for name, value in
+            (line.split(' ') for line in lines if line and (line[0] != '#') and ('{' not in line))}
+
+async def listener(stop):
+    stats = {'latencies': [], 'buffers': 0, 'dropped': 0}
+
+    reader, writer = await asyncio.open_connection(load_test.HOST, load_test.HTML_PORT)
+    writer.write(b'GET /audio.wav HTTP/1.0\r\n\r\n')
+
+    status = int((await reader.readline()).split(b' ')[1])
+    assert status == 200, status
+    while (await reader.readline()) not in (b'\r\n', b''):
+        pass
+    await reader.readexactly(len(WAVBuffer.header(WAVBuffer.PCM)))
+
+    last_index = None
+    while (time.monotonic() < stop):
+        try:
+            buf = await asyncio.wait_for(reader.readexactly(WAVBuffer.NSAMPLES),
+                                         stop - time.monotonic())
+        except asyncio.TimeoutError:
+            break
+
+        now = time.monotonic()
+        index = struct.unpack_from('<I', buf, WAVBuffer.STAMP_OFFSET[WAVBuffer.PCM])[0]
+        if (last_index is not None):
+            stats['latencies'].append(now - WAVBuffer.capture_time(index))
+            stats['buffers'] += 1
+            stats['dropped'] += index - last_index - 1
+        last_index = index
+
+    writer.close()
+    return stats
+
+async def load(listeners, controls, duration):
+    await asyncio.sleep(load_test.WARMUP)
+    PicoWebRadio.loop_lag_max = 0
+
+    irqs = WAVBuffer.stats()[3]
+    before = await asyncio.to_thread(metrics)
+    cpu = time.process_time()
+    start = time.monotonic()
+    stop = start + duration
+    listener_stats, _ = await asyncio.gather(
+        asyncio.gather(*[listener(stop) for _ in range(listeners)]),
+        asyncio.gather(*[load_test.control_client(n, stop) for n in range(controls)]))
+    elapsed = time.monotonic() - start
+    cpu = (time.process_time() - cpu) / elapsed
+    after = await asyncio.to_thread(metrics)
+
+    wakes = after['pico_audio_wakes_total'] - before['pico_audio_wakes_total']
+    sent = after['pico_audio_sent_buffers_total'] - before['pico_audio_sent_buffers_total']
+    return (listener_stats, (WAVBuffer.stats()[3] - irqs) / elapsed, cpu,
+            (wakes / sent, wakes / elapsed))
+
+# Run one profile in this process (with the streams waiting on 'wait', if given, instead of
+# AudioEvent), and print its line of the report.
+def run_profile(profile, listeners, controls, duration, wait=None):
+    web_dir = pico_emu.setup()
+    WAVBuffer.STAMP = True
+    PicoWebRadio.AUDIO_PROFILE = profile
+    if (wait is not None):
+        PicoWebRadio.AudioEvent = wait
+    # (the control clients are those of 'load_test.py', on its port)
+    pico_emu.start(load_test.HTML_PORT)
+
+    try:
+        listener_stats, irq_rate, cpu, wakes = asyncio.run(load(listeners, controls, duration))
+    finally:
+        pico_emu.cleanup(web_dir)
+
+    latencies = [t for stats in listener_stats for t in stats['latencies']]
+    buffers = sum(stats['buffers'] for stats in listener_stats)
+    dropped = sum(stats['dropped'] for stats in listener_stats)
+    assert buffers > 0
+
+    if (wait is not None):
+        print('  {:12} {:6.1f} wakes per buffer, {:6.1f} wakes/s; loop lag max {:3} ms; '
+              'CPU {:4.1f}%'.format(wait.__name__, *wakes, PicoWebRadio.loop_lag_max, 100 * cpu))
+        return
+
+    print('  {:12} {:4.0f} ms x {:2} buffers: latency mean {:5.1f} ms, p95 {:5.1f} ms; '
+          '{:4.0f} irq/s; {:5.2f}% dropped; loop lag max {:3} ms; CPU {:4.1f}%'.format(
+          profile, 1000 * WAVBuffer.BUF_PERIOD, WAVBuffer.NBUFS,
+          1000 * sum(latencies) / len(latencies), 1000 * load_test.percentile(latencies, 0.95),
+          irq_rate, 100 * dropped / (buffers + dropped), PicoWebRadio.loop_lag_max, 100 * cpu))
+
+def main(listeners, controls, duration):
+    print('Profile test: {} listeners, {} control clients, {:g} s each'.format(listeners,
+                                                                             controls, duration))
+
+    # (a process per profile, as the emulated app can only be started once)
+    for profile in PicoWebRadio.AUDIO_PROFILES:
+        subprocess.run([sys.executable, __file__, '--profile', profile, str(listeners),
+                        str(controls), str(duration)], check=True)
+
+    print('Audio stream waits ({} profile):'.format(PicoWebRadio.AUDIO_PROFILE))
+    for wait in WAITS:
+        subprocess.run([sys.executable, __file__, '--wait', wait, str(listeners),
+                        str(controls), str(duration)], check=True)
+
+# the waits compared, by name
+WAITS = {'AudioEvent': None, 'PollingWait': PollingWait}
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    profile = None
+    wait = None
+    if (args[:1] == ['--profile']):
+        profile, args = args[1], args[2:]
+    elif (args[:1] == ['--wait']):
+        profile, wait, args = PicoWebRadio.AUDIO_PROFILE, args[1], args[2:]
+
+    listeners = int(args[0]) if len(args) > 0 else 4
+    controls = int(args[1]) if len(args) > 1 else 2
+    duration = float(args[2]) if len(args) > 2 else 10
+
+    if (wait):
+        run_profile(profile, listeners, controls, duration, WAITS[wait] or PicoWebRadio.AudioEvent)
+    elif (profile):
+        run_profile(profile, listeners, controls, duration)
+    else:
+        main(listeners, controls, duration)
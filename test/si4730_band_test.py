@@ -0,0 +1,84 @@
+#!/bin/python3
+
+# Host benchmark of switching bands with the Si4730 driver against a simulated Si4730 (see
+# 'host/Si4730Sim.py'), tuning alternately to AM and FM stations in each ITU region.
+#
+# Reports the band switch time (as measured by the driver) and the properties set per switch,
+# and checks that the simulated device ends up configured as the region's profile says, and
+# that scanning a band already selected doesn't power cycle the device.
+#
+# Usage: si4730_band_test.py [time scale]
+
+import os
+import sys
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_DIR, 'host'))
+
+import mpyhost
+mpyhost.install()
+
+import machine
+from Si4730Sim import Si4730Sim, POWER_UP_CMD, SET_PROPERTY_CMD
+import Si4730
+
+SWITCHES = 10
+
+STATIONS = {
+    'FM': {8810: (30, 12), 9530: (45, 25), 10110: (40, 20)},
+    'AM': {680: (35, 10), 1010: (28, 6)},
+}
+
+# stations to tune to in each band (within the limits of every region)
+TUNES = {'FM': (8810, 9530, 10110), 'AM': (680, 1010)}
+
+def check_profile(radio, sim, region):
+    # the simulated device's properties, with those never set at their defaults
+    for prop, val in radio._Si4730__profiles[sim.band].items():
+        assert sim.properties.get(prop, Si4730.PROPERTY_DEFAULTS[prop]) == val, hex(prop)
+    for prop, val in Si4730.REGION_PROPERTIES[region][sim.band]:
+        assert radio._Si4730__profiles[sim.band][prop] == val
+
+def bench(region, time_scale):
+    sim = Si4730Sim(STATIONS, time_scale)
+    machine.I2C.devices[0x63] = sim
+    radio = Si4730.Si4730(i2c=machine.I2C(0), rst_pin=22, addr=0x63, region=region)
+    stats = radio.get_band_switch_stats()
+
+    switches = stats['switches']
+    set_props = sim.commands.get(SET_PROPERTY_CMD, 0)
+    for i in range(SWITCHES):
+        band = ('AM', 'FM')[i % 2]
+        freq = TUNES[band][i % len(TUNES[band])]
+        assert radio.tune(band, freq)[0] == 1
+        assert sim.band == band and sim.freq == freq
+        check_profile(radio, sim, region)
+    switches = stats['switches'] - switches
+    set_props = sim.commands.get(SET_PROPERTY_CMD, 0) - set_props
+    assert switches == SWITCHES, switches
+
+    # no power cycle for scanning the band selected
+    power_ups = sim.commands.get(POWER_UP_CMD, 0)
+    assert radio.scan('FM') == sorted(STATIONS['FM'])
+    assert sim.commands.get(POWER_UP_CMD, 0) == power_ups
+
+    bottom, top = radio.get_band_limits('FM')
+    try:
+        radio.tune('FM', bottom - 5)
+        assert False, 'tuned below the bottom of the band'
+    except ValueError:
+        pass
+
+    assert sim.errors == 0, 'commands sent while the device was busy'
+
+    print('  ITU region {}: {:5.1f} ms mean, {:5.1f} ms max per switch, '
+          '{:4.1f} properties set per switch (FM {}-{})'.format(
+          region, stats['total_ms'] / stats['switches'], stats['max_ms'],
+          set_props / switches, bottom, top))
+
+if __name__ == '__main__':
+    time_scale = float(sys.argv[1]) if len(sys.argv) > 1 else 1.0
+    print('AM/FM band switches (simulated time x{}):'.format(time_scale))
+
+    for region in (1, 2, 3):
+        bench(region, time_scale)
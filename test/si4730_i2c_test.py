@@ -0,0 +1,96 @@
+#!/bin/python3
+
+# Host benchmark of the I2C traffic of the Si4730 driver against a simulated Si4730 (see
+# 'host/Si4730Sim.py'), comparing waits that poll the device with waits signalled by the
+# Si4730's interrupt pin (the driver's 'int_pin').
+#
+# Reports the I2C bytes moved (as counted by the driver) and time taken per tune and per scan
+# of the FM band, for both the blocking and awaitable commands. Polling costs grow with time
+# spent waiting, so the device runs in real time by default (a scan takes ~12 s).
+#
+# Usage: si4730_i2c_test.py [time scale]
+
+import asyncio
+import os
+import sys
+import time
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_DIR, 'host'))
+
+import mpyhost
+mpyhost.install()
+
+import machine
+from Si4730Sim import Si4730Sim
+from Si4730 import Si4730
+
+INT_PIN = 15
+TUNES = (8810, 9530, 10110, 10790, 9000)
+
+STATIONS = {
+    'FM': {8810: (30, 12), 9530: (45, 25), 10110: (40, 20), 10790: (25, 8)},
+    'AM': {680: (35, 10), 1010: (28, 6)},
+}
+
+def measure(radio, sim, fn):
+    stats = radio.get_i2c_stats()
+    reads, writes = stats['reads'], stats['writes']
+
+    t = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - t
+
+    assert sim.errors == 0, 'commands sent while the device was busy'
+    return result, elapsed, stats['reads'] - reads + stats['writes'] - writes
+
+def bench(name, int_pin, time_scale):
+    sim = Si4730Sim(STATIONS, time_scale, int_pin=INT_PIN)
+    machine.I2C.devices[0x63] = sim
+    radio = Si4730(i2c=machine.I2C(0), rst_pin=22, addr=0x63, int_pin=int_pin)
+    stats = radio.get_i2c_stats()
+
+    print(name + ':')
+
+    tune_bytes = tune_xfers = tune_time = 0
+    for freq in TUNES:
+        result, elapsed, xfers = measure(radio, sim, lambda: radio.tune('FM', freq))
+        assert result[0] == (freq in STATIONS['FM'])
+        tune_bytes += stats['last_tune']
+        tune_xfers += xfers
+        tune_time += elapsed
+    n = len(TUNES)
+    print('  tune:        {:6.0f} bytes, {:5.0f} transfers, {:6.1f} ms'.format(
+        tune_bytes / n, tune_xfers / n, 1000 * tune_time / n))
+
+    tune_bytes = tune_xfers = tune_time = 0
+    for freq in TUNES:
+        result, elapsed, xfers = measure(radio, sim,
+                                         lambda: asyncio.run(radio.tune_async('FM', freq)))
+        assert result[0] == (freq in STATIONS['FM'])
+        tune_bytes += stats['last_tune']
+        tune_xfers += xfers
+        tune_time += elapsed
+    print('  tune_async:  {:6.0f} bytes, {:5.0f} transfers, {:6.1f} ms'.format(
+        tune_bytes / n, tune_xfers / n, 1000 * tune_time / n))
+
+    channels, elapsed, xfers = measure(radio, sim, lambda: radio.scan('FM', full=True))
+    assert channels == sorted(STATIONS['FM']), channels
+    print('  scan FM:     {:6d} bytes, {:5d} transfers, {:6.0f} ms'.format(
+        stats['last_scan'], xfers, 1000 * elapsed))
+
+    channels, elapsed, xfers = measure(radio, sim, lambda: asyncio.run(radio.scan_async('FM', full=True)))
+    assert channels == sorted(STATIONS['FM']), channels
+    print('  scan_async:  {:6d} bytes, {:5d} transfers, {:6.0f} ms'.format(
+        stats['last_scan'], xfers, 1000 * elapsed))
+
+    if (int_pin is not None):
+        print('  interrupts:  {} raised, {} handled'.format(sim.interrupts, stats['irqs']))
+        assert stats['irqs'] > 0
+
+if __name__ == '__main__':
+    time_scale = float(sys.argv[1]) if len(sys.argv) > 1 else 1.0
+    print('I2C traffic per command (simulated time x{}):'.format(time_scale))
+
+    bench('Polling', None, time_scale)
+    bench('Interrupts', INT_PIN, time_scale)
@@ -0,0 +1,75 @@
+#!/bin/python3
+
+# Host benchmark of quick rescans against full scans with the Si4730 driver, on a simulated
+# Si4730 (see 'host/Si4730Sim.py') with a busy FM band.
+#
+# After a full scan finds the stations, the band is scanned again:
+#   - fully, seeking through every channel,
+#   - quickly, with no change to the stations (re-checking each one with a fast tune),
+#   - quickly, after some stations go off air and one moves (seeking only around those).
+# Reports the time taken and the I2C bytes moved (as counted by the driver) for each scan.
+#
+# Usage: si4730_rescan_test.py [time scale]
+
+import asyncio
+import os
+import sys
+import time
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_DIR, 'host'))
+
+import mpyhost
+mpyhost.install()
+
+import machine
+from Si4730Sim import Si4730Sim
+from Si4730 import Si4730
+
+# a station every 1 MHz or so across the FM band
+FM_STATIONS = {freq: (30 + freq % 20, 10 + freq % 15) for freq in range(8810, 10800, 110)}
+STATIONS = {'FM': FM_STATIONS, 'AM': {}}
+
+LOST = (9030, 9910)
+MOVED = (10350, 10370)
+
+def bench(name, sim, radio, fn, expected):
+    stats = radio.get_i2c_stats()
+
+    t = time.perf_counter()
+    channels = fn()
+    elapsed = time.perf_counter() - t
+
+    assert channels == expected, (channels, expected)
+    assert sim.errors == 0, 'commands sent while the device was busy'
+
+    print('  {:24s} {:6.0f} ms, {:6d} bytes, {:3d} stations'.format(
+        name + ':', 1000 * elapsed, stats['last_scan'], len(channels)))
+    return elapsed
+
+if __name__ == '__main__':
+    time_scale = float(sys.argv[1]) if len(sys.argv) > 1 else 1.0
+    print('FM scans of {} stations (simulated time x{}):'.format(len(FM_STATIONS), time_scale))
+
+    sim = Si4730Sim(STATIONS, time_scale)
+    machine.I2C.devices[0x63] = sim
+    radio = Si4730(i2c=machine.I2C(0), rst_pin=22, addr=0x63)
+    expected = sorted(FM_STATIONS)
+
+    # nothing known yet, so this is a full scan either way
+    bench('first scan', sim, radio, lambda: radio.scan('FM'), expected)
+
+    full = bench('full', sim, radio, lambda: radio.scan('FM', full=True), expected)
+    quick = bench('quick', sim, radio, lambda: radio.scan('FM'), expected)
+    bench('quick (async)', sim, radio, lambda: asyncio.run(radio.scan_async('FM')), expected)
+
+    for freq in LOST:
+        del FM_STATIONS[freq]
+    FM_STATIONS[MOVED[1]] = FM_STATIONS.pop(MOVED[0])
+    expected = sorted(FM_STATIONS)
+    changed = bench('quick, {} lost, 1 moved'.format(len(LOST)), sim, radio,
+                    lambda: radio.scan('FM'), expected)
+    bench('full, after changes', sim, radio, lambda: radio.scan('FM', full=True), expected)
+
+    print('  quick scan {:.1f}x faster than full ({:.1f}x with changes)'.format(
+        full / quick, full / changed))
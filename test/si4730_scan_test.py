@@ -0,0 +1,197 @@
+#!/bin/python3
+
+# Host test of the awaitable Si4730 commands and the background scan of the HTML server, running
+# the real driver and PicoWebRadio.HTMLServer on CPython against a simulated Si4730 (see
+# 'host/Si4730Sim.py', with its timing sped up by TIME_SCALE).
+#
+# The responsiveness of the event loop is measured by a task that sleeps for TICK_MS at a time,
+# recording how late it wakes up, while:
+#   - the blocking 'scan' runs (for comparison), then the awaitable 'scan_async' (during which
+#     a blocking command must fail with EBUSY, rather than wait),
+#   - the HTML server scans on start up, while the web app is fetched and the progress followed.
+#
+# Usage: si4730_scan_test.py [time scale]
+
+import asyncio
+import errno
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_DIR, 'host'))
+
+import mpyhost
+mpyhost.install()
+
+import machine
+from Si4730Sim import Si4730Sim
+
+TIME_SCALE = 0.05
+TICK_MS = 5
+
+STATIONS = {
+    'FM': {8810: (30, 12), 9530: (45, 25), 10110: (40, 20), 10790: (25, 8)},
+    'AM': {680: (35, 10), 1010: (28, 6)},
+}
+
+SIM = Si4730Sim(STATIONS, TIME_SCALE)
+machine.I2C.devices[0x63] = SIM
+
+import PicoWebRadio
+from Si4730 import Si4730
+
+# Measures how late a task sleeping TICK_MS at a time wakes up, i.e. how long the loop is blocked.
+class LoopLag:
+    def __init__(self):
+        self.max_lag = 0
+        self.__task = asyncio.create_task(self.__run())
+
+    async def __run(self):
+        while True:
+            t = time.perf_counter()
+            await asyncio.sleep(TICK_MS / 1000)
+            self.max_lag = max(self.max_lag, (time.perf_counter() - t) * 1000 - TICK_MS)
+
+    def stop(self):
+        self.__task.cancel()
+        return self.max_lag
+
+async def test_driver(radio):
+    expected = {band: sorted(STATIONS[band]) for band in STATIONS}
+
+    lag = LoopLag()
+    t = time.perf_counter()
+    await asyncio.sleep(0)
+    channels = {band: list(radio.scan(band, full=True)) for band in ('AM', 'FM')}
+    blocking_time = time.perf_counter() - t
+    await asyncio.sleep(0.02)
+    blocking_lag = lag.stop()
+    assert channels == expected, channels
+
+    fractions = []
+    lag = LoopLag()
+    t = time.perf_counter()
+    channels = {band: await radio.scan_async(band, lambda f, c: fractions.append(f), full=True)
+                for band in ('AM', 'FM')}
+    async_time = time.perf_counter() - t
+    async_lag = lag.stop()
+    assert channels == expected, channels
+    assert fractions[-1] == 1
+
+    # a blocking command fails while a task holds the device, leaving the task to finish
+    scan = asyncio.create_task(radio.scan_async('AM', full=True))
+    await asyncio.sleep(0.01)
+    try:
+        radio.tune('FM', 9530)
+        assert False, 'blocking tune during a scan'
+    except OSError as e:
+        assert e.errno == errno.EBUSY
+    assert (await scan) == expected['AM']
+
+    assert (await radio.tune_async('FM', 9530))[0] == 1
+    assert SIM.freq == 9530
+    assert (await radio.tune_async('AM', 700))[0] == 0
+    assert SIM.errors == 0, 'commands sent while the device was busy'
+
+    print('Driver scan of AM+FM (simulated time x{}):'.format(TIME_SCALE))
+    print('  blocking: {:6.0f} ms, max loop lag {:6.1f} ms'.format(1000 * blocking_time, blocking_lag))
+    print('  async:    {:6.0f} ms, max loop lag {:6.1f} ms'.format(1000 * async_time, async_lag))
+    assert async_lag < blocking_lag / 10
+
+async def request(port, method, path):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write('{} /{} HTTP/1.1\r\nConnection: close\r\n\r\n'.format(method, path).encode())
+    status_line = await reader.readline()
+    body = (await reader.read()).split(b'\r\n\r\n', 1)[1]
+    writer.close()
+    return int(status_line.split(b' ')[1]), body
+
+async def test_server(radio):
+    server = PicoWebRadio.HTMLServer(host='127.0.0.1', port=0, radio=radio)
+
+    lag = LoopLag()
+    run_task = asyncio.create_task(server.run())
+    while (not hasattr(server, 'server')):
+        await asyncio.sleep(0.001)
+    port = server.server.sockets[0].getsockname()[1]
+
+    # follow the scan started for the missing station list, while using the app
+    progress = []
+    page_times = []
+    tune_status = None
+    while True:
+        status, body = await request(port, 'GET', 'scan.json')
+        assert status == 200
+        scan = PicoWebRadio.json.loads(body)
+        if (scan['state'] != 'scanning'):
+            break
+        progress.append(scan['progress'])
+
+        t = time.perf_counter()
+        status, _ = await request(port, 'GET', '')
+        page_times.append(time.perf_counter() - t)
+        assert status == 200
+
+        if (tune_status is None):
+            tune_status, _ = await request(port, 'PATCH', 'tune/fm/10110')
+
+        await asyncio.sleep(0.02)
+
+    assert scan['state'] == 'done', scan
+    assert scan['found'] == sum(len(s) for s in STATIONS.values()), scan
+    assert progress == sorted(progress) and len(progress) > 10, progress
+    assert tune_status == 409
+
+    status, body = await request(port, 'GET', 'stations.xml')
+    assert status == 200
+    for band, stations in STATIONS.items():
+        for freq in stations:
+            assert 'tune/{}/{}'.format(band.lower(), freq).encode() in body
+
+    # quick and full scans requested from the app
+    for path, full in (('scan', False), ('scan/full', True)):
+        status, _ = await request(port, 'POST', path)
+        assert status == 202
+        await asyncio.sleep(0)
+        status, body = await request(port, 'GET', 'scan.json')
+        scan = PicoWebRadio.json.loads(body)
+        assert scan['state'] == 'scanning' and scan['full'] == full, scan
+        while (scan['state'] == 'scanning'):
+            await asyncio.sleep(0.05)
+            scan = PicoWebRadio.json.loads((await request(port, 'GET', 'scan.json'))[1])
+        assert scan['found'] == sum(len(s) for s in STATIONS.values()), scan
+
+    assert (await request(port, 'PATCH', 'tune/fm/10110'))[0] == 204
+    assert SIM.freq == 10110
+    assert (await request(port, 'PATCH', 'tune/fm/12000'))[0] == 400
+
+    run_task.cancel()
+    await server.close()
+
+    print('Server scan on start up ({} progress updates):'.format(len(progress)))
+    print('  page load during scan: max {:6.1f} ms, mean {:6.1f} ms'.format(
+        1000 * max(page_times), 1000 * sum(page_times) / len(page_times)))
+    print('  max loop lag {:6.1f} ms'.format(lag.stop()))
+
+async def main():
+    radio = Si4730(i2c=machine.I2C(0), rst_pin=22, addr=0x63)
+
+    await test_driver(radio)
+    await test_server(radio)
+
+if __name__ == '__main__':
+    if (len(sys.argv) > 1):
+        TIME_SCALE = SIM.time_scale = float(sys.argv[1])
+
+    web_dir = tempfile.mkdtemp()
+    shutil.copytree(os.path.join(TEST_DIR, '..', 'src', 'web'), web_dir, dirs_exist_ok=True)
+    os.chdir(web_dir)
+
+    try:
+        asyncio.run(main())
+    finally:
+        os.chdir(TEST_DIR)
+        shutil.rmtree(web_dir)
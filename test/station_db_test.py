@@ -0,0 +1,192 @@
+#!/bin/python3
+
+# Host test of the station database (see 'src/mpy/StationDB.py') and of the station list served
+# from it by the HTML server, running the real PicoWebRadio.HTMLServer on CPython.
+#
+# Checks that the database survives a reload (and a corrupt file is ignored), then that the
+# station list is served as XML and JSON with an ETag (answering a matching If-None-Match with a
+# 304), and is only rebuilt when the stations change, including when tuning to one updates its
+# signal (which shows in the list, with a new ETag, but is only saved later). Then compares the
+# latency of fetching the list from RAM against building it for each request, and against
+# reading it from a file (without the cache of static files, see 'AssetCache.py').
+#
+# Usage: station_db_test.py [number of requests]
+
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_DIR, 'host'))
+
+import mpyhost
+mpyhost.install()
+
+import machine
+from Si4730Sim import Si4730Sim
+
+# for the module-level radio in PicoWebRadio (the server is given the fake radio below)
+machine.I2C.devices[0x63] = Si4730Sim(time_scale=0)
+
+import PicoWebRadio
+import StationDB
+
+SCANNED = {'FM': [(8810, 30, 12), (9530, 45, 25), (10110, 40, 20)], 'AM': [(680, 35, 10)]}
+
+# a full list of stations, for the latency of fetching it
+BENCH_STATIONS = 40
+BENCH_BANDS = {'FM': [(8810 + 20 * i, 30, 12) for i in range(BENCH_STATIONS // 2)],
+               'AM': [(540 + 40 * i, 30, 8) for i in range(BENCH_STATIONS // 2)]}
+
+class FakeRadio:
+    def __init__(self):
+        self.channels = {}
+
+    async def tune_async(self, band, freq):
+        return [1, 50, 30]
+
+    def set_channels(self, band, channels):
+        self.channels[band] = channels
+
+def test_db(path):
+    db = StationDB.StationDB(path)
+    assert len(db) == 0 and db.version == 0
+
+    db.set_bands(SCANNED, 1000)
+    saved = open(path, 'rb').read()
+
+    # a signal update is a change, but only kept in RAM until flushed
+    assert db.update('FM', 9530, 44, 24, 2000)
+    assert not db.update('FM', 9000, 44, 24, 2000)
+    assert (open(path, 'rb').read() == saved) and (db.version == 2) and db.dirty
+    assert StationDB.StationDB(path).stations()[1] == ('FM', 9530, 45, 25, 1000)
+    db.flush()
+    assert not db.dirty
+
+    size = os.stat(path).st_size
+    assert size == StationDB.DB_HEADER_SIZE + 4 * StationDB.DB_RECORD_SIZE, size
+
+    reloaded = StationDB.StationDB(path)
+    assert reloaded.version == db.version == 2
+    assert reloaded.stations() == db.stations()
+    assert reloaded.stations()[1] == ('FM', 9530, 44, 24, 2000)
+    assert reloaded.channels('FM') == [8810, 9530, 10110]
+
+    with open(path, 'r+b') as f:
+        f.truncate(size - 1)
+    assert len(StationDB.StationDB(path)) == 0
+
+    print('Station database: {} stations in {} bytes'.format(len(db), size))
+
+async def request(reader, writer, method, path, headers=''):
+    writer.write('{} /{} HTTP/1.1\r\n{}\r\n'.format(method, path, headers).encode())
+    status = int((await reader.readline()).split(b' ')[1])
+    response_headers = {}
+    while ((line := await reader.readline()) != b'\r\n'):
+        key, _, value = line.decode().partition(':')
+        response_headers[key.strip().lower()] = value.strip()
+    body = await reader.readexactly(int(response_headers.get('content-length', 0)))
+    return status, response_headers, body
+
+async def test_server(n):
+    db = StationDB.StationDB('stations.db')
+    db.set_bands(SCANNED, 1000)
+
+    radio = FakeRadio()
+    server = PicoWebRadio.HTMLServer(host='127.0.0.1', port=0, radio=radio, stations=db)
+    assert radio.channels['FM'] == [8810, 9530, 10110]
+
+    server.server = await PicoWebRadio.asyncio.start_server(server.html_client, '127.0.0.1', 0, 5)
+    port = server.server.sockets[0].getsockname()[1]
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+
+    status, headers, body = await request(reader, writer, 'GET', 'stations.json')
+    assert status == 200 and headers['content-type'] == 'application/json'
+    stations = json.loads(body)
+    assert [(s['band'], s['freq'], s['rssi'], s['snr']) for s in stations] == \
+           [(band, freq, rssi, snr) for band in ('FM', 'AM') for freq, rssi, snr in SCANNED[band]]
+    assert stations[0]['name'] == '88.1 FM' and stations[0]['url'] == 'tune/fm/8810'
+    etag = headers['etag']
+
+    status, headers, body = await request(reader, writer, 'GET', 'stations.xml')
+    assert status == 200 and headers['content-type'] == 'text/xml'
+    assert b'<url>tune/am/680</url>' in body and b'<rssi>35</rssi>' in body
+
+    # built once per version of the database
+    station_lists = server._HTMLServer__station_lists
+    cached = station_lists['stations.json']
+    status, _, _ = await request(reader, writer, 'GET', 'stations.json',
+                                 'If-None-Match: {}\r\n'.format(etag))
+    assert status == 304
+    assert station_lists['stations.json'] is cached
+
+    # tuning to a known station updates its signal, which the list shows (with a new ETag), but
+    # the file isn't rewritten until the signal is saved (here on closing)
+    saved = open('stations.db', 'rb').read()
+    mtime = os.stat('stations.db').st_mtime_ns
+    status, _, _ = await request(reader, writer, 'PATCH', 'tune/fm/9530')
+    assert status == 204
+    assert db.stations()[1][2:4] == (50, 30)
+    assert open('stations.db', 'rb').read() == saved
+    assert os.stat('stations.db').st_mtime_ns == mtime
+    status, headers, body = await request(reader, writer, 'GET', 'stations.json',
+                                          'If-None-Match: {}\r\n'.format(etag))
+    assert status == 200 and headers['etag'] != etag
+    assert (json.loads(body)[1]['rssi'], json.loads(body)[1]['snr']) == (50, 30)
+    status, _, _ = await request(reader, writer, 'GET', 'stations.json',
+                                 'If-None-Match: {}\r\n'.format(headers['etag']))
+    assert status == 304
+
+    # the time the server takes to handle a request for a full list (of BENCH_STATIONS) from
+    # RAM vs. built for each request (as if the version changed every time) vs. read from a file
+    # (not kept in RAM by the cache of static files)
+    db.set_bands(BENCH_BANDS, 3000)
+    await request(reader, writer, 'GET', 'stations.xml')
+    with open('file_stations.xml', 'wb') as f:
+        f.write(station_lists['stations.xml'][1])
+    server._HTMLServer__assets.budget = 0
+
+    latency = {}
+    for name, path in (('ram', 'stations.xml'), ('built', 'stations.xml'),
+                       ('file', 'file_stations.xml')):
+        requests, request_us = server.requests, server.request_us
+        for _ in range(n):
+            if (name == 'built'):
+                station_lists.clear()
+            assert (await request(reader, writer, 'GET', path))[0] == 200
+        assert server.requests == requests + n
+        latency[name] = (server.request_us - request_us) / n / 1000000
+
+    # (and a signal update left in RAM is saved on closing)
+    assert (await request(reader, writer, 'PATCH', 'tune/fm/8810'))[0] == 204
+
+    writer.close()
+    await writer.wait_closed()
+    await asyncio.sleep(0.01)
+    await server.close()
+    reloaded = StationDB.StationDB('stations.db')
+    assert len(reloaded) == BENCH_STATIONS
+    assert reloaded.stations()[0][:4] == ('FM', 8810, 50, 30)
+
+    print('Station list of {} stations, handled by the server ({} requests):'.format(
+          BENCH_STATIONS, n))
+    print('  from RAM:  mean {:7.3f} ms'.format(1000 * latency['ram']))
+    print('  built:     mean {:7.3f} ms'.format(1000 * latency['built']))
+    print('  from file: mean {:7.3f} ms'.format(1000 * latency['file']))
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+
+    work_dir = tempfile.mkdtemp()
+    os.chdir(work_dir)
+
+    try:
+        test_db(os.path.join(work_dir, 'test.db'))
+        asyncio.run(test_server(n))
+    finally:
+        os.chdir(TEST_DIR)
+        shutil.rmtree(work_dir)
@@ -0,0 +1,187 @@
+#!/bin/python3
+
+# Build step for the web app, run by 'make build' to prepare the files to flash to the Pico W.
+#
+# Every file fetched over a fresh connection costs the Pico a TCP handshake and a trip through
+# its single-threaded server, so this:
+#   - concatenates and minifies the stylesheets and scripts referenced by 'index.html'
+#     into a single CSS and a single JS file, named after a hash of their content,
+#   - inlines small assets (e.g. 'title-logo.svg') into 'index.html' as data URIs,
+#   - writes a gzipped copy ('<file>.gz') of each text file next to it,
+#   - writes 'manifest.json', mapping the original files to the fingerprinted ones (or null if
+#     inlined), which the server uses to mark the fingerprinted files as cacheable forever,
+# and reports the size and request count of the first page load before and after.
+#
+# Usage: build_web.py <web source dir> <build dir>
+
+import base64
+import gzip
+import hashlib
+import json
+import os
+import re
+import sys
+import urllib.parse
+
+# assets at most this size are inlined into 'index.html'
+INLINE_MAX_SIZE = 16384
+
+TEXT_EXTS = ('.html', '.js', '.css', '.svg', '.xml', '.json')
+
+MIME_TYPES = {
+    '.svg': 'image/svg+xml',
+    '.png': 'image/png',
+    '.jpg': 'image/jpeg',
+}
+
+STYLESHEET_RE = re.compile(r'[ \t]*<link rel="stylesheet" href="([^"]+)">[ \t]*\n?')
+SCRIPT_RE = re.compile(r'[ \t]*<script type="text/javascript" src="([^"]+)" defer></script>[ \t]*\n?')
+OBJECT_DATA_RE = re.compile(r'(<object [^>]*data=")([^":]+)(")')
+
+
+# Remove comments from CSS/JS, leaving strings (and template literals) alone.
+def strip_comments(src):
+    out = []
+    i = 0
+    quote = None
+
+    while i < len(src):
+        c = src[i]
+
+        if quote:
+            out.append(c)
+            if c == '\\':
+                out.append(src[i+1])
+                i += 1
+            elif c == quote:
+                quote = None
+        elif c in '"\'`':
+            quote = c
+            out.append(c)
+        elif src.startswith('/*', i):
+            i = src.index('*/', i + 2) + 1
+        elif src.startswith('//', i) and (i == 0 or src[i-1] != ':'):
+            while i < len(src) and src[i] != '\n':
+                i += 1
+            continue
+        else:
+            out.append(c)
+
+        i += 1
+
+    return ''.join(out)
+
+# Conservative minification: drop comments, indentation and blank lines, but keep line breaks
+# so that JavaScript's automatic semicolon insertion still sees the same code.
+def minify(src):
+    lines = (line.strip() for line in strip_comments(src).splitlines())
+    return '\n'.join(line for line in lines if line) + '\n'
+
+# collapse the whitespace between the attributes and elements of an SVG
+def minify_svg(src):
+    return re.sub(r'>\s+<', '><', re.sub(r'\s+', ' ', src)).strip()
+
+def fingerprint(name, data):
+    root, ext = os.path.splitext(name)
+    return root + '.' + hashlib.sha1(data).hexdigest()[:8] + ext
+
+def write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as file:
+        file.write(data)
+
+def main(src_dir, build_dir):
+    with open(os.path.join(src_dir, 'index.html')) as file:
+        html = file.read()
+
+    manifest = {}
+    before = {'index.html': os.path.getsize(os.path.join(src_dir, 'index.html'))}
+    after = {}
+    outputs = {}
+
+    # bundle the stylesheets and scripts, in the order they're referenced
+    for regex, bundle_name, tag in ((STYLESHEET_RE, 'app.css', '<link rel="stylesheet" href="{}">'),
+                                    (SCRIPT_RE, 'app.js',
+                                     '<script type="text/javascript" src="{}" defer></script>')):
+        srcs = regex.findall(html)
+        if not srcs:
+            continue
+
+        bundle = ''
+        for src in srcs:
+            with open(os.path.join(src_dir, src)) as file:
+                text = file.read()
+            before[src] = len(text.encode())
+            bundle += minify(text)
+
+        data = bundle.encode()
+        name = fingerprint(bundle_name, data)
+        outputs[name] = data
+        for src in srcs:
+            manifest[src] = name
+
+        # replace the first reference with the bundle, and drop the rest
+        first = regex.search(html)
+        indent = re.match(r'[ \t]*', first.group(0)).group(0)
+        html = html[:first.start()] + indent + tag.format(name) + '\n' + regex.sub('', html[first.start():])
+
+    # inline small assets
+    def inline(match):
+        path = os.path.join(src_dir, match.group(2))
+        ext = os.path.splitext(path)[1]
+        if (ext not in MIME_TYPES) or (os.path.getsize(path) > INLINE_MAX_SIZE):
+            return match.group(0)
+
+        with open(path, 'rb') as file:
+            data = file.read()
+        before[match.group(2)] = len(data)
+        manifest[match.group(2)] = None
+
+        # text (i.e. SVG) is percent-encoded rather than base64'd, so it still gzips well
+        if ext in TEXT_EXTS:
+            uri = ',' + urllib.parse.quote(minify_svg(data.decode()), safe=' =:/;,.-')
+        else:
+            uri = ';base64,' + base64.b64encode(data).decode()
+
+        return match.group(1) + 'data:' + MIME_TYPES[ext] + uri + match.group(3)
+
+    html = OBJECT_DATA_RE.sub(inline, html)
+    outputs['index.html'] = html.encode()
+
+    # copy anything not bundled or inlined (e.g. files fetched by the scripts themselves)
+    for root, _, files in os.walk(src_dir):
+        for file_name in files:
+            rel = os.path.relpath(os.path.join(root, file_name), src_dir)
+            if (rel == 'index.html') or (rel in manifest):
+                continue
+
+            with open(os.path.join(root, file_name), 'rb') as file:
+                data = file.read()
+            if rel.endswith(('.js', '.css')):
+                data = minify(data.decode()).encode()
+            outputs[rel] = data
+
+    outputs['manifest.json'] = json.dumps(manifest, indent=1, sort_keys=True).encode()
+
+    for rel, data in outputs.items():
+        write(os.path.join(build_dir, rel), data)
+        if rel.endswith(TEXT_EXTS):
+            gz_data = gzip.compress(data, compresslevel=9, mtime=0)
+            if len(gz_data) < len(data):
+                write(os.path.join(build_dir, rel + '.gz'), gz_data)
+                data = gz_data
+        if (rel == 'index.html') or (rel in manifest.values()):
+            after[rel] = len(data)
+
+    print('Web app first page load (before -> after bundling):')
+    print('  requests: {} -> {}'.format(len(before), len(after)))
+    print('  bytes:    {} -> {} (gzipped)'.format(sum(before.values()), sum(after.values())))
+    for rel, size in sorted(after.items()):
+        print('    {:<24} {:>7}'.format(rel, size))
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print('Usage: ' + sys.argv[0] + ' <web source dir> <build dir>')
+        sys.exit(1)
+
+    main(sys.argv[1], sys.argv[2])
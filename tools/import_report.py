@@ -0,0 +1,26 @@
+# Run on the Pico W (e.g. with 'make import-report', right after a reset) to report the time and
+# heap taken to import the app, to compare deploying it as source ('make flash') with deploying it
+# precompiled ('make flash-mpy') or frozen into the firmware ('make firmware').
+#
+# The collector is disabled for the import, so that everything it allocates (the compiler's
+# working memory, for source, as well as the modules themselves) is counted rather than collected
+# along the way; what's kept is what's left after a collection. The time to the first response
+# after power-up is in '/metrics' once the app is running ('pico_http_first_response_ms').
+
+import gc
+import time
+
+gc.collect()
+free = gc.mem_free()
+gc.disable()
+start = time.ticks_ms()
+try:
+    import PicoWebRadio
+finally:
+    import_ms = time.ticks_diff(time.ticks_ms(), start)
+    allocated = free - gc.mem_free()
+    gc.enable()
+
+gc.collect()
+print('Imported PicoWebRadio at {} ms after power-up, in {} ms: {} bytes allocated, {} kept'
+      .format(start, import_ms, allocated, free - gc.mem_free()))
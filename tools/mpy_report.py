@@ -0,0 +1,65 @@
+#!/bin/python3
+
+# Reports, for each of the given modules, the size of its source and of its bytecode ('.mpy'),
+# and the heap needed to compile it: the smallest heap (in steps of 256 bytes) that the given
+# mpy-cross compiles it in, less what it needs for an empty module. The compiler is the same as
+# the one that runs on the Pico W when a module is imported as source, so that's about the heap
+# that the import needs on top of the module itself, which importing the bytecode does without
+# (see also 'import_report.py', which measures the import on the Pico W). Note that the compiler's
+# data structures are made of machine words, so an mpy-cross built for a 64-bit host needs up to
+# about twice the heap that the Pico W's 32-bit compiler does.
+#
+# Usage: mpy_report.py <mpy-cross> <module.py>...
+
+import os
+import subprocess
+import sys
+import tempfile
+
+HEAP_STEP = 256
+HEAP_MAX = 2 * 1024 * 1024
+
+MPY_CROSS_FLAGS = ('-march=armv6m',)
+
+# whether 'mpy_cross' compiles 'path' to 'out' within 'heap' bytes
+def compiles(mpy_cross, path, out, heap):
+    result = subprocess.run((mpy_cross,) + MPY_CROSS_FLAGS +
+                            ('-X', 'heapsize={}'.format(heap), '-o', out, path),
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return result.returncode == 0
+
+# the smallest heap that 'mpy_cross' compiles 'path' in
+def compile_heap(mpy_cross, path, out):
+    lo, hi = 0, HEAP_MAX
+    if (not compiles(mpy_cross, path, out, hi)):
+        raise RuntimeError('{} does not compile'.format(path))
+    while (hi - lo > HEAP_STEP):
+        mid = (lo + hi) // 2
+        if (compiles(mpy_cross, path, out, mid)):
+            hi = mid
+        else:
+            lo = mid
+    return hi
+
+def main(mpy_cross, paths):
+    with tempfile.TemporaryDirectory() as tmp:
+        out = os.path.join(tmp, 'module.mpy')
+        empty = os.path.join(tmp, 'empty.py')
+        open(empty, 'w').close()
+        base = compile_heap(mpy_cross, empty, out)
+
+        print('{:<20} {:>8} {:>8} {:>14}'.format('module', 'source', '.mpy', 'compile heap'))
+        totals = [0, 0]
+        for path in sorted(paths):
+            heap = compile_heap(mpy_cross, path, out)
+            compiles(mpy_cross, path, out, heap)
+            sizes = (os.path.getsize(path), os.path.getsize(out))
+            totals = [total + size for total, size in zip(totals, sizes)]
+            print('{:<20} {:>8} {:>8} {:>14}'.format(os.path.basename(path), *sizes, heap - base))
+        print('{:<20} {:>8} {:>8}'.format('total', *totals))
+        print('(compile heap over the {} bytes needed for an empty module)'.format(base))
+
+if __name__ == '__main__':
+    if (len(sys.argv) < 3):
+        sys.exit('Usage: mpy_report.py <mpy-cross> <module.py>...')
+    main(sys.argv[1], sys.argv[2:])